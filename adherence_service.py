@@ -0,0 +1,197 @@
+# File: adherence_service.py
+"""
+Incremental medication adherence counters.
+
+Adherence used to mean pulling medication_logs, medication_daily_tracking
+and tablet_tracking and comparing them by hand. ADHERENCE_COLLECTION now
+holds one bucket per patient, day and medication:
+
+    {_id: "<patient_id>:<YYYY-MM-DD>:<medication>", patient_id, date,
+     medication, medication_name, scheduled, taken, updated_at}
+
+- taken is incremented when a tablet is marked taken (save-tablet-taken,
+  save-tablet-tracking)
+- scheduled is incremented when a dose from the materialized dose schedule
+  (dosage_schedule_service) passes by ADHERENCE_GRACE_HOURS; AdherenceTracker
+  does this periodically, advancing each schedule's adherence_accounted_until
+  with a compare-and-set so several processes never count a dose twice
+- missed is max(0, scheduled - taken) per bucket; extra tablets on one day
+  do not make up for a missed dose on another
+
+A report reads the buckets of one patient in a date range (index on
+patient_id + date), so its cost grows with the window, not the history.
+"""
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from dosage_schedule_service import DOSE_SCHEDULE_VERSION, upcoming_dosages
+
+ADHERENCE_COLLECTION = os.getenv("ADHERENCE_COLLECTION", "medication_adherence")
+# A dose counts as scheduled (and missed unless taken) this long after its time
+ADHERENCE_GRACE_HOURS = float(os.getenv("ADHERENCE_GRACE_HOURS", "1"))
+ADHERENCE_ACCOUNT_INTERVAL_MINUTES = float(os.getenv("ADHERENCE_ACCOUNT_INTERVAL_MINUTES", "15"))
+ADHERENCE_MAX_WINDOW_DAYS = int(os.getenv("ADHERENCE_MAX_WINDOW_DAYS", "366"))
+
+
+def medication_key(name: str) -> str:
+    return (name or "").strip().lower()
+
+
+def bucket_id(patient_id: str, day: str, medication: str) -> str:
+    return f"{patient_id}:{day}:{medication_key(medication)}"
+
+
+def _percent(scheduled: int, missed: int) -> Optional[float]:
+    return round((scheduled - missed) * 100.0 / scheduled, 1) if scheduled else None
+
+
+def _period(day: str, group: str) -> str:
+    if group == "week":
+        year, week, _ = date.fromisoformat(day).isocalendar()
+        return f"{year}-W{week:02d}"
+    return day
+
+
+def summarize(rows: Iterable[Dict[str, Any]], group: str = "day") -> Dict[str, Any]:
+    """Overall, per-medication and per-period (day or ISO week) counts and percentages from daily buckets"""
+    totals = {"scheduled": 0, "taken": 0, "missed": 0}
+    medications: Dict[str, Dict[str, Any]] = {}
+    periods: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        scheduled, taken = row.get("scheduled", 0), row.get("taken", 0)
+        counts = {"scheduled": scheduled, "taken": taken, "missed": max(0, scheduled - taken)}
+        period = periods.setdefault(_period(row["date"], group), {
+            "scheduled": 0, "taken": 0, "missed": 0, "medications": {}
+        })
+        per_period = period["medications"].setdefault(row["medication"], {
+            "medication_name": row.get("medication_name", row["medication"]), "scheduled": 0, "taken": 0, "missed": 0
+        })
+        medication = medications.setdefault(row["medication"], {
+            "medication_name": row.get("medication_name", row["medication"]), "scheduled": 0, "taken": 0, "missed": 0
+        })
+        for key, value in counts.items():
+            totals[key] += value
+            period[key] += value
+            per_period[key] += value
+            medication[key] += value
+
+    def finish(counts):
+        return {**counts, "adherence_percent": _percent(counts["scheduled"], counts["missed"])}
+
+    return {
+        "overall": finish(totals),
+        "medications": sorted((finish(m) for m in medications.values()), key=lambda m: m["medication_name"]),
+        "periods": [
+            {"period": key, **finish({k: v for k, v in period.items() if k != "medications"}),
+             "medications": sorted((finish(m) for m in period["medications"].values()),
+                                   key=lambda m: m["medication_name"])}
+            for key, period in sorted(periods.items())
+        ],
+    }
+
+
+class AdherenceStore:
+    """Daily adherence buckets per patient and medication"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([("patient_id", 1), ("date", 1)])
+
+    def _increment(self, patient_id: str, day: str, medication_name: str, field: str, amount: int):
+        self.collection.update_one(
+            {"_id": bucket_id(patient_id, day, medication_name)},
+            {
+                "$inc": {field: amount},
+                "$set": {"medication_name": medication_name.strip(), "updated_at": datetime.now()},
+                "$setOnInsert": {"patient_id": patient_id, "date": day, "medication": medication_key(medication_name)},
+            },
+            upsert=True
+        )
+
+    def record_taken(self, patient_id: str, medication_name: str, day: str, count: int = 1):
+        self._increment(patient_id, day, medication_name, "taken", count)
+
+    def record_scheduled(self, patient_id: str, doses: Iterable[Tuple[str, str]]) -> int:
+        """Count passed doses given as (YYYY-MM-DD, medication_name); one update per bucket"""
+        grouped: Dict[Tuple[str, str], int] = {}
+        names: Dict[Tuple[str, str], str] = {}
+        for day, name in doses:
+            key = (day, medication_key(name))
+            grouped[key] = grouped.get(key, 0) + 1
+            names[key] = name
+        for key, count in grouped.items():
+            self._increment(patient_id, key[0], names[key], "scheduled", count)
+        return sum(grouped.values())
+
+    def buckets(self, patient_id: str, start: str, end: str) -> List[Dict[str, Any]]:
+        """Buckets with start <= date <= end (YYYY-MM-DD)"""
+        return list(self.collection.find({"patient_id": patient_id, "date": {"$gte": start, "$lte": end}}))
+
+    def report(self, patient_id: str, start: str, end: str, group: str = "day") -> Dict[str, Any]:
+        return {"patient_id": patient_id, "start": start, "end": end, "group": group,
+                **summarize(self.buckets(patient_id, start, end), group)}
+
+
+class AdherenceTracker:
+    """Counts doses from the dose schedule collection as scheduled once they pass"""
+
+    def __init__(self, schedules, store: AdherenceStore, now: Callable[[], datetime] = datetime.now,
+                 grace_hours: float = ADHERENCE_GRACE_HOURS,
+                 interval_minutes: float = ADHERENCE_ACCOUNT_INTERVAL_MINUTES):
+        self.schedules = schedules
+        self.store = store
+        self.now = now
+        self.grace = timedelta(hours=grace_hours)
+        self.interval = interval_minutes * 60
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.accounted = 0
+
+    def account(self) -> int:
+        """Count every dose that passed since each schedule was last accounted; returns the number of doses"""
+        cutoff = self.now() - self.grace
+        counted = 0
+        for schedule in self.schedules.find(
+            # Schedules of an older expansion wait for their rebuild, which keeps adherence_accounted_until
+            {"adherence_accounted_until": {"$lt": cutoff}, "dosages": {"$ne": []}, "version": DOSE_SCHEDULE_VERSION},
+            {"patient_id": 1, "dosages": 1, "adherence_accounted_until": 1}
+        ):
+            since = schedule["adherence_accounted_until"]
+            # Claim the interval first: whoever moves adherence_accounted_until counts these doses
+            claimed = self.schedules.update_one(
+                {"_id": schedule["_id"], "adherence_accounted_until": since},
+                {"$set": {"adherence_accounted_until": cutoff}}
+            )
+            if claimed.modified_count != 1:
+                continue
+            doses = upcoming_dosages(schedule, since, cutoff, include_taken=True)
+            counted += self.store.record_scheduled(
+                schedule["patient_id"], [(d["next_dose_time"][:10], d["medication_name"]) for d in doses]
+            )
+        self.accounted += counted
+        return counted
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                counted = self.account()
+                if counted:
+                    print(f"📊 Adherence: {counted} passed doses counted")
+            except Exception as e:
+                print(f"❌ Error in adherence tracker: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> threading.Thread:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="adherence-tracker", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 import pymongo
 import bcrypt
@@ -8,24 +8,17 @@ import json
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
 from dotenv import load_dotenv
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import atexit
 import random
 import string
 import re
 import jwt
 from functools import wraps
 from bson import ObjectId
-import asyncio
-import base64
-import tempfile
-# OCR and Document Processing imports
-try:
-    import fitz  # PyMuPDF for PDF processing
-    PYMUPDF_AVAILABLE = True
-except ImportError:
-    PYMUPDF_AVAILABLE = False
+from concurrent.futures import Future, ThreadPoolExecutor
+# OCR and Document Processing imports (PyMuPDF is used by pdf_extraction_service)
+from pdf_extraction_service import PYMUPDF_AVAILABLE
+if not PYMUPDF_AVAILABLE:
     print("⚠️ PyMuPDF not available. Install with: pip install PyMuPDF")
 
 try:
@@ -36,27 +29,119 @@ except ImportError:
     print("⚠️ PIL not available. Install with: pip install Pillow")
 
 # Quantum and LLM imports
-try:
-    from sentence_transformers import SentenceTransformer
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    SENTENCE_TRANSFORMERS_AVAILABLE = False
+# Embedding backends (SentenceTransformer / ONNX Runtime) are loaded lazily by embedding_service
+from embedding_service import (
+    create_embedding_backend,
+    check_embedding_parity,
+    EMBEDDING_PARITY_TEXTS,
+    SENTENCE_TRANSFORMERS_AVAILABLE,
+    ONNXRUNTIME_AVAILABLE,
+)
+if not SENTENCE_TRANSFORMERS_AVAILABLE:
     print("⚠️ SentenceTransformers not available. Install with: pip install sentence-transformers")
 
 try:
     from qdrant_client import QdrantClient
-    from qdrant_client.http.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, PayloadSchemaType
+    from qdrant_client.http.models import PointStruct, Filter, FieldCondition, MatchValue, PayloadSchemaType, SearchRequest
     QDRANT_AVAILABLE = True
 except ImportError:
     QDRANT_AVAILABLE = False
     print("⚠️ Qdrant client not available. Install with: pip install qdrant-client")
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+from openai_client_service import OPENAI_AVAILABLE, get_openai_registry
+if not OPENAI_AVAILABLE:
     print("⚠️ OpenAI client not available. Install with: pip install openai")
+from ocr_worker_pool import (
+    OCRWorkerPool,
+    OCRQueueFullError,
+    OCR_JOB_TIMEOUT_SEC,
+    TERMINAL_STATUSES as TERMINAL_OCR_JOB_STATUSES,
+)
+from ocr_cache_service import create_ocr_result_cache
+from nutrition_cache_service import create_nutrition_cache, analysis_key, build_analysis_prompt
+from food_composition_service import get_food_composition, estimate_items_with_llm
+from nutrition_rollup_service import (
+    NutritionRollupStore,
+    NUTRITION_ROLLUP_COLLECTION,
+    NUTRITION_ROLLUP_MAX_DAYS,
+    NUTRITION_ROLLUP_DEFAULT_WINDOW,
+)
+from audio_ingest_service import (
+    AudioSessionManager,
+    AudioSessionError,
+    read_audio_request,
+    transcribe_upload,
+)
+from transcription_service import create_transcription_router, LOCAL_WHISPER_PRELOAD
+from pdf_extraction_service import extract_pdf, iter_pdf_pages, count_pdf_pages, parse_page_range, start_page_pool
+from prescription_parser import (
+    parse_prescription,
+    parse_prescriptions,
+    needs_remote_parse,
+    to_extracted_info,
+    PRESCRIPTION_LOCAL_FIRST
+)
+from image_preprocessing_service import cache_namespace as ocr_cache_namespace
+from prescription_batch_service import (
+    process_documents,
+    merge_ocr_results,
+    PRESCRIPTION_BATCH_MAX_FILES,
+    PRESCRIPTION_BATCH_MAX_BYTES,
+    PRESCRIPTION_BATCH_CONCURRENCY
+)
+from medication_reminder_service import (
+    ReminderScheduleStore,
+    ReminderLedger,
+    SchedulerLease,
+    MedicationReminderScheduler,
+    nearest_dose_at,
+    REMINDER_SCHEDULE_COLLECTION,
+    REMINDER_LEDGER_COLLECTION,
+    SCHEDULER_LEASE_COLLECTION
+)
+from dosage_schedule_service import (
+    DoseScheduleStore,
+    upcoming_dosages as expand_upcoming_dosages,
+    parse_taken_date,
+    DOSE_SCHEDULE_COLLECTION,
+    UPCOMING_DOSAGES_DEFAULT_HOURS,
+    UPCOMING_DOSAGES_MAX_DAYS
+)
+from adherence_service import (
+    AdherenceStore,
+    AdherenceTracker,
+    ADHERENCE_COLLECTION,
+    ADHERENCE_MAX_WINDOW_DAYS
+)
+from async_loop_service import async_loop, run_async, close_http_sessions
+from email_delivery_service import create_email_delivery
+from webhook_outbox_service import (
+    create_webhook_outbox,
+    build_ocr_payload,
+    load_webhook_endpoints,
+    DELIVERY_STATUSES as WEBHOOK_DELIVERY_STATUSES
+)
+from upload_service import (
+    spool_file_storage,
+    UploadTooLargeError,
+    UPLOAD_MAX_BYTES,
+    AUDIO_UPLOAD_MAX_BYTES,
+    REQUEST_MAX_BYTES
+)
+from vector_reindex_service import (
+    VectorReindexJob,
+    REINDEX_BATCH_SIZE,
+    ensure_alias,
+    resolve_alias,
+    collection_vector_size,
+    load_embedding_config,
+)
+from semantic_cache_service import (
+    SemanticAnswerCache,
+    top_symptom_queries,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_WARM_SIZE,
+)
 
 # Load environment variables
 load_dotenv()
@@ -120,15 +205,23 @@ QDRANT_BATCH_SIZE = int(os.getenv("QDRANT_BATCH_SIZE", "64"))
 # Embeddings Configuration
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 VECTOR_SIZE = int(os.getenv("VECTOR_SIZE", "384"))
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")  # sentence-transformers | onnx | onnx-int8
+EMBEDDING_PARITY_CHECK = os.getenv("EMBEDDING_PARITY_CHECK", "false").lower() == "true"
+EMBEDDING_PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.99"))
 
 # LLM Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # optional OpenAI-compatible endpoint (e.g. local stub)
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 
 # Retrieval Configuration
 TOP_K = int(os.getenv("TOP_K", "5"))
 RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.70"))
 
+# Batch symptom triage configuration
+SYMPTOM_BATCH_MAX_ITEMS = int(os.getenv("SYMPTOM_BATCH_MAX_ITEMS", "500"))
+SYMPTOM_BATCH_LLM_CONCURRENCY = int(os.getenv("SYMPTOM_BATCH_LLM_CONCURRENCY", "8"))
+
 # User-visible text and prompts (dynamic via env)
 DISCLAIMER_TEXT = os.getenv(
     "DISCLAIMER_TEXT",
@@ -154,6 +247,50 @@ SUMMARY_SYSTEM_PROMPT = os.getenv(
 app = Flask(__name__)
 CORS(app)
 
+# Reject oversized bodies from Content-Length before anything is parsed;
+# uploads are streamed into size-bounded spools (upload_service) rather than read whole.
+# Endpoints that take several files get a larger body limit; every file is still capped at UPLOAD_MAX_BYTES
+REQUEST_BODY_LIMITS = {
+    'process_prescription_batch': PRESCRIPTION_BATCH_MAX_BYTES
+}
+app.config['MAX_CONTENT_LENGTH'] = max([REQUEST_MAX_BYTES] + list(REQUEST_BODY_LIMITS.values()))
+
+def request_body_limit():
+    return REQUEST_BODY_LIMITS.get(request.endpoint, REQUEST_MAX_BYTES)
+
+@app.before_request
+def reject_oversized_request():
+    limit = request_body_limit()
+    if request.content_length is not None and request.content_length > limit:
+        return jsonify({
+            'success': False,
+            'message': f'Request body exceeds the {limit // (1024 * 1024)} MB limit'
+        }), 413
+
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    return jsonify({
+        'success': False,
+        'message': f'Request body exceeds the {request_body_limit() // (1024 * 1024)} MB limit'
+    }), 413
+
+def spool_request_file(file, max_bytes=UPLOAD_MAX_BYTES):
+    """Spool an uploaded file for this request; its temp file is removed at teardown"""
+    upload = spool_file_storage(file, max_bytes=max_bytes)
+    g.setdefault('spooled_uploads', []).append(upload)
+    return upload
+
+def remove_spooled_file(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+@app.teardown_request
+def close_spooled_uploads(exc):
+    for upload in g.pop('spooled_uploads', []):
+        upload.close()
+
 # Database connection
 class Database:
     def __init__(self):
@@ -309,15 +446,15 @@ class MockN8NService:
             extracted_text = webhook_data.get('extracted_text', '')
             filename = webhook_data.get('filename', 'unknown')
             
-            # Simulate AI processing of prescription text
-            processed_result = self._simulate_ai_processing(extracted_text)
+            # Structured extraction with the local prescription parser
+            processed_result = self._simulate_ai_processing(extracted_text, webhook_data.get('parsed'))
             
             # Return structured N8N response
             return {
                 'success': True,
                 'message': 'Prescription processed by Mock N8N workflow',
                 'workflow_id': 'mock_prescription_processor_001',
-                'processing_time': '1.2s',
+                'processing_time': f"{processed_result['ai_analysis']['parse_time_ms']}ms",
                 'patient_id': patient_id,
                 'filename': filename,
                 'extracted_fields': processed_result['extracted_fields'],
@@ -334,51 +471,28 @@ class MockN8NService:
                 'step': 'mock_processing_error'
             }
     
-    def _simulate_ai_processing(self, text):
-        """Simulate AI extraction of prescription fields"""
-        text_lower = text.lower()
-        
-        # Extract medication information using pattern matching
-        extracted_fields = {}
-        
-        # Medication name patterns
-        if 'amoxicillin' in text_lower:
-            extracted_fields['medication_name'] = 'Amoxicillin'
-            extracted_fields['dosage'] = '500mg'
-            extracted_fields['frequency'] = 'Three times daily'
-            extracted_fields['duration'] = '7 days'
-        elif 'paracetamol' in text_lower:
-            extracted_fields['medication_name'] = 'Paracetamol'
-            extracted_fields['dosage'] = '500mg'
-            extracted_fields['frequency'] = 'Every 4-6 hours'
-            extracted_fields['duration'] = 'As needed'
-        elif 'vitamin' in text_lower:
-            extracted_fields['medication_name'] = 'Vitamin Supplement'
-            extracted_fields['dosage'] = '1 tablet'
-            extracted_fields['frequency'] = 'Once daily'
-            extracted_fields['duration'] = 'Ongoing'
-        else:
-            extracted_fields['medication_name'] = 'Unknown Medication'
-            extracted_fields['dosage'] = 'As prescribed'
-            extracted_fields['frequency'] = 'As prescribed'
-            extracted_fields['duration'] = 'As prescribed'
-        
-        # Extract doctor information
-        if 'dr.' in text_lower or 'doctor' in text_lower:
-            extracted_fields['prescribed_by'] = 'Dr. Smith'
-        else:
-            extracted_fields['prescribed_by'] = 'Unknown'
-        
-        # Extract patient information
-        if 'patient:' in text_lower:
-            extracted_fields['patient_name'] = 'Jane Doe'
+    def _simulate_ai_processing(self, text, parsed=None):
+        """Extract prescription fields with the local parser (pass `parsed` to reuse a parse)"""
+        parsed = parsed or parse_prescription(text)
+        info = to_extracted_info(parsed)
+        
+        extracted_fields = {
+            'medication_name': info['medication_name'] or 'Unknown Medication',
+            'dosage': info['dosage'] or 'As prescribed',
+            'frequency': info['frequency'] or 'As prescribed',
+            'duration': info['duration'] or 'As prescribed',
+            'prescribed_by': info['prescribed_by'] or 'Unknown',
+            'medications': parsed['medications']
+        }
         
         # Generate AI analysis
         ai_analysis = {
-            'text_complexity': 'medium',
-            'extraction_confidence': 0.85,
-            'key_phrases_found': len(extracted_fields),
-            'processing_notes': 'Successfully extracted prescription details using pattern matching'
+            'text_complexity': 'high' if len(parsed['medications']) > 2 else 'medium',
+            'extraction_confidence': parsed['confidence'],
+            'key_phrases_found': sum(len(m['field_confidence']) for m in parsed['medications']),
+            'medications_found': len(parsed['medications']),
+            'parse_time_ms': parsed['parse_time_ms'],
+            'processing_notes': 'Extracted prescription details with the local prescription parser'
         }
         
         # Generate recommendations
@@ -391,7 +505,7 @@ class MockN8NService:
         
         return {
             'extracted_fields': extracted_fields,
-            'confidence': 0.85,
+            'confidence': parsed['confidence'],
             'recommendations': recommendations,
             'ai_analysis': ai_analysis
         }
@@ -401,7 +515,9 @@ class MockN8NService:
 class OCRService:
     """OCR service for processing prescription documents, PDFs, and images"""
     
-    def __init__(self):
+    def __init__(self, page_ocr_pool=None):
+        # OCRWorkerPool for image-only PDF pages (None keeps the scanned-page placeholder)
+        self.page_ocr_pool = page_ocr_pool
         self.supported_formats = {
             'pdf': ['.pdf'],
             'text': ['.txt', '.doc', '.docx'],
@@ -454,13 +570,13 @@ class OCRService:
         file_type = self.get_file_type(filename)
         return file_type != 'unknown'
     
-    def process_file(self, file_content: bytes, filename: str) -> Dict[str, Any]:
+    def process_file(self, file_content: bytes, filename: str, page_spec: str = None) -> Dict[str, Any]:
         """Process any supported file type and return unified results"""
         try:
             file_type = self.get_file_type(filename)
             
             if file_type == 'pdf':
-                return self._process_pdf(file_content, filename)
+                return self._process_pdf(file_content, filename, page_spec=page_spec)
             elif file_type == 'text':
                 return self._process_text_file(file_content, filename)
             elif file_type == 'image':
@@ -480,8 +596,8 @@ class OCRService:
                 "filename": filename
             }
     
-    def _process_pdf(self, file_content: bytes, filename: str) -> Dict[str, Any]:
-        """Process PDF file (both native text and scanned pages)"""
+    def _process_pdf(self, file_content: bytes, filename: str, page_spec: str = None) -> Dict[str, Any]:
+        """Process PDF file page-parallel (native text in threads, scanned pages OCR'd in the worker pool)"""
         if not PYMUPDF_AVAILABLE:
             return {
                 "success": False,
@@ -489,56 +605,16 @@ class OCRService:
             }
         
         try:
-            # Open PDF with PyMuPDF
-            pdf_document = fitz.open(stream=file_content, filetype="pdf")
-            
-            results = []
-            total_pages = len(pdf_document)
-            native_text_pages = 0
-            ocr_pages = 0
-            
-            for page_num in range(total_pages):
-                page = pdf_document[page_num]
-                
-                # Try to extract native text first
-                text = page.get_text()
-                
-                if text.strip():
-                    # Native text available
-                    results.append({
-                        "page": page_num + 1,
-                        "text": text.strip(),
-                        "confidence": 1.0,
-                        "method": "native_text"
-                    })
-                    native_text_pages += 1
-                else:
-                    # No native text, might be scanned image
-                    results.append({
-                        "page": page_num + 1,
-                        "text": "[Scanned page - text extraction not available]",
-                        "confidence": 0.0,
-                        "method": "scanned_page"
-                    })
-                    ocr_pages += 1
-            
-            pdf_document.close()
-            
-            # Extract full text for prescription processing
-            full_text = "\n".join([result["text"] for result in results if result["method"] == "native_text"])
-            
+            ocr_submit = self.page_ocr_pool.submit if self.page_ocr_pool else None
+            return extract_pdf(file_content, filename, page_spec=page_spec, ocr_submit=ocr_submit)
+        except OCRQueueFullError as e:
+            # The document fails (and is not cached) rather than losing its scanned pages
+            print(f"⚠️ OCR pool busy, PDF {filename} not processed: {e}")
             return {
-                "success": True,
-                "filename": filename,
-                "file_type": "pdf",
-                "total_pages": total_pages,
-                "native_text_pages": native_text_pages,
-                "ocr_pages": ocr_pages,
-                "results": results,
-                "full_text": full_text,
-                "extracted_text": full_text if full_text else "No extractable text found"
+                "success": False,
+                "error": f"OCR queue is full, try again shortly: {str(e)}",
+                "filename": filename
             }
-            
         except Exception as e:
             print(f"❌ Error processing PDF {filename}: {e}")
             return {
@@ -550,6 +626,8 @@ class OCRService:
     def _process_text_file(self, file_content: bytes, filename: str) -> Dict[str, Any]:
         """Process text files (TXT, DOC, DOCX)"""
         try:
+            file_content = bytes(file_content)  # may be a memoryview of a spooled upload
+            
             # Try to decode as UTF-8 first
             try:
                 text = file_content.decode('utf-8')
@@ -630,6 +708,10 @@ class QuantumVectorService:
     def __init__(self):
         self.client = None
         self.embedding_model = None
+        self.embedding_backend = None
+        self.embedding_model_name = EMBEDDING_MODEL
+        self.vector_size = VECTOR_SIZE
+        self.parity_report = None
         self.initialize_services()
     
     def initialize_services(self):
@@ -646,48 +728,97 @@ class QuantumVectorService:
                 print(f"❌ Qdrant client initialization failed: {e}")
                 self.client = None
         
-        if SENTENCE_TRANSFORMERS_AVAILABLE:
+        # After a reindex the alias points at a collection built with the model recorded next to it
+        if self.client:
+            try:
+                active = load_embedding_config(self.client, QDRANT_COLLECTION)
+            except Exception as e:
+                print(f"⚠️ Could not read the active embedding model from Qdrant: {e}")
+                active = None
+            if active:
+                self.embedding_model_name = active['embedding_model']
+                self.vector_size = int(active['vector_size'])
+                if self.embedding_model_name != EMBEDDING_MODEL:
+                    print(f"ℹ️ {QDRANT_COLLECTION} was reindexed with {self.embedding_model_name} "
+                          f"({self.vector_size}-d); using it instead of EMBEDDING_MODEL")
+        
+        try:
+            self.embedding_model = create_embedding_backend(EMBEDDING_BACKEND, self.embedding_model_name)
+            self.embedding_backend = self.embedding_model.name
+            print(f"✅ Embedding model initialized successfully (backend: {self.embedding_backend})")
+        except Exception as e:
+            print(f"❌ Embedding backend '{EMBEDDING_BACKEND}' initialization failed: {e}")
+            self.embedding_model = None
+        
+        # Fall back to the PyTorch model if the requested backend could not load
+        if self.embedding_model is None and EMBEDDING_BACKEND != "sentence-transformers" and SENTENCE_TRANSFORMERS_AVAILABLE:
             try:
-                self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
-                print("✅ Embedding model initialized successfully")
+                self.embedding_model = create_embedding_backend("sentence-transformers", self.embedding_model_name)
+                self.embedding_backend = self.embedding_model.name
+                print("⚠️ Falling back to sentence-transformers embedding backend")
             except Exception as e:
                 print(f"❌ Embedding model initialization failed: {e}")
                 self.embedding_model = None
+        
+        if self.embedding_model is not None and EMBEDDING_PARITY_CHECK and self.embedding_backend != "sentence-transformers":
+            self.run_parity_check()
+    
+    def run_parity_check(self):
+        """Compare the active backend against the PyTorch model on the fixture set"""
+        try:
+            reference = create_embedding_backend("sentence-transformers", self.embedding_model_name)
+            self.parity_report = check_embedding_parity(
+                reference, self.embedding_model, min_cosine=EMBEDDING_PARITY_MIN_COSINE
+            )
+            del reference
+            
+            if self.parity_report.get("passed"):
+                print(f"✅ Embedding parity check passed (min cosine {self.parity_report['min_cosine']:.4f})")
+            else:
+                print(f"⚠️ Embedding parity check failed: {self.parity_report}")
+        except Exception as e:
+            print(f"⚠️ Embedding parity check could not run: {e}")
+            self.parity_report = {"passed": False, "error": str(e)}
+        return self.parity_report
     
     def ensure_collection(self):
-        """Ensure Qdrant collection exists with proper configuration"""
+        """Ensure the QDRANT_COLLECTION alias exists and points at a configured collection"""
         if not self.client:
             return False
         
         try:
-            collections = self.client.get_collections().collections
-            names = {c.name for c in collections}
-            
-            if QDRANT_COLLECTION not in names:
-                self.client.create_collection(
-                    collection_name=QDRANT_COLLECTION,
-                    vectors_config=VectorParams(
-                        size=VECTOR_SIZE,
-                        distance=Distance.COSINE,
-                    ),
-                )
-                print(f"✅ Created Qdrant collection: {QDRANT_COLLECTION}")
+            # All reads and writes go through the alias; the physical collection is versioned
+            physical_collection = ensure_alias(self.client, QDRANT_COLLECTION, self.vector_size)
             
             # Ensure payload indexes
             try:
                 self.client.create_payload_index(
-                    collection_name=QDRANT_COLLECTION,
+                    collection_name=physical_collection,
                     field_name="trimester",
                     field_schema=PayloadSchemaType.KEYWORD,
                 )
             except Exception:
                 pass  # Index might already exist
             
+            stored_size = collection_vector_size(self.client, physical_collection)
+            if stored_size and stored_size != self.vector_size:
+                print(f"⚠️ {physical_collection} stores {stored_size}-d vectors but VECTOR_SIZE is {self.vector_size}; "
+                      f"run POST /quantum/reindex after changing EMBEDDING_MODEL")
+            
             return True
         except Exception as e:
             print(f"❌ Collection setup failed: {e}")
             return False
     
+    def adopt_embedding_backend(self, backend, model_name: str, vector_size: int):
+        """Switch query embeddings to the model a reindexed collection was built with"""
+        self.embedding_model = backend
+        self.embedding_backend = getattr(backend, "name", self.embedding_backend)
+        self.embedding_model_name = model_name
+        self.vector_size = vector_size
+        self.parity_report = None
+        print(f"✅ Query embeddings now use {model_name} ({vector_size}-d)")
+    
     def embed_text(self, text: str) -> list:
         """Generate embeddings for text using sentence transformers"""
         if not self.embedding_model:
@@ -717,14 +848,15 @@ class QuantumVectorService:
             ]
         )
     
-    def search_knowledge(self, query_text: str, weeks_pregnant: int) -> list:
+    def search_knowledge(self, query_text: str, weeks_pregnant: int, query_vector: list = None) -> list:
         """Search pregnancy knowledge base using vector similarity"""
         if not self.client or not self.embedding_model:
             return []
         
         try:
-            # Generate query embedding
-            query_vector = self.embed_text(query_text)
+            # Generate query embedding (callers may pass one they already computed)
+            if query_vector is None:
+                query_vector = self.embed_text(query_text)
             if not query_vector:
                 return []
             
@@ -741,39 +873,85 @@ class QuantumVectorService:
                 score_threshold=RETRIEVAL_MIN_SCORE
             )
             
-            # Format results
-            suggestions = []
-            for hit in results:
-                payload = hit.payload or {}
-                suggestions.append({
-                    "id": str(hit.id),
-                    "text": payload.get("text", ""),
-                    "metadata": {
-                        "source": payload.get("source", ""),
-                        "tags": payload.get("tags", []),
-                        "triage": payload.get("triage", ""),
-                        "trimester": payload.get("trimester", ""),
-                    },
-                    "score": float(hit.score) if hit.score is not None else None,
-                })
-            
-            return suggestions
+            return self.format_hits(results)
         except Exception as e:
             print(f"❌ Knowledge search failed: {e}")
             return []
+    
+    def format_hits(self, results) -> list:
+        """Convert Qdrant hits into suggestion dictionaries"""
+        suggestions = []
+        for hit in results:
+            payload = hit.payload or {}
+            suggestions.append({
+                "id": str(hit.id),
+                "text": payload.get("text", ""),
+                "metadata": {
+                    "source": payload.get("source", ""),
+                    "tags": payload.get("tags", []),
+                    "triage": payload.get("triage", ""),
+                    "trimester": payload.get("trimester", ""),
+                },
+                "score": float(hit.score) if hit.score is not None else None,
+            })
+        return suggestions
+    
+    def embed_texts(self, texts: list) -> list:
+        """Generate embeddings for many texts in a single encode call"""
+        if not self.embedding_model or not texts:
+            return []
+        
+        try:
+            vectors = self.embedding_model.encode(list(texts), normalize_embeddings=True)
+            return [vector.tolist() for vector in vectors]
+        except Exception as e:
+            print(f"❌ Batch text embedding failed: {e}")
+            return []
+    
+    def search_knowledge_batch(self, query_texts: list, weeks_list: list) -> list:
+        """Search the knowledge base for many queries with one encode and one search_batch call"""
+        if not self.client or not self.embedding_model or not query_texts:
+            return [[] for _ in query_texts]
+        
+        try:
+            query_vectors = self.embed_texts(query_texts)
+            if len(query_vectors) != len(query_texts):
+                return [[] for _ in query_texts]
+            
+            requests_batch = [
+                SearchRequest(
+                    vector=vector,
+                    filter=self.build_trimester_filter(weeks),
+                    limit=TOP_K,
+                    with_payload=True,
+                    score_threshold=RETRIEVAL_MIN_SCORE,
+                )
+                for vector, weeks in zip(query_vectors, weeks_list)
+            ]
+            
+            batch_results = self.client.search_batch(
+                collection_name=QDRANT_COLLECTION,
+                requests=requests_batch
+            )
+            
+            return [self.format_hits(results) for results in batch_results]
+        except Exception as e:
+            print(f"❌ Batch knowledge search failed: {e}")
+            return [[] for _ in query_texts]
 
 class LLMService:
     """LLM service for symptom analysis and recommendations"""
     
     def __init__(self):
         self.client = None
+        self.registry = get_openai_registry()
         self.initialize_client()
     
     def initialize_client(self):
-        """Initialize OpenAI client"""
+        """Initialize the shared OpenAI client from the registry"""
         if OPENAI_AVAILABLE and OPENAI_API_KEY:
             try:
-                self.client = OpenAI(api_key=OPENAI_API_KEY)
+                self.client = self.registry.get_client()
                 print("✅ OpenAI client initialized successfully")
             except Exception as e:
                 print(f"❌ OpenAI client initialization failed: {e}")
@@ -807,7 +985,8 @@ class LLMService:
             try:
                 trimester = "first" if weeks_pregnant <= 13 else ("second" if weeks_pregnant <= 27 else "third")
                 
-                response = self.client.chat.completions.create(
+                response = self.registry.chat_completion(
+                    "chat",
                     model=LLM_MODEL,
                     messages=[
                         {"role": "system", "content": FALLBACK_SYSTEM_PROMPT},
@@ -863,7 +1042,8 @@ class LLMService:
                 for s in top_suggestions
             )
             
-            response = self.client.chat.completions.create(
+            response = self.registry.chat_completion(
+                "chat",
                 model=LLM_MODEL,
                 messages=[
                     {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
@@ -890,6 +1070,8 @@ class LLMService:
 # Initialize quantum and LLM services
 quantum_service = QuantumVectorService()
 llm_service = LLMService()
+semantic_cache = SemanticAnswerCache()
+reindex_job = None  # VectorReindexJob started through /quantum/reindex
 
 # User Activity Tracking System
 class UserActivityTracker:
@@ -1112,31 +1294,14 @@ def generate_otp():
     """Generate 6-digit OTP"""
     return ''.join(random.choices(string.digits, k=6))
 
-def send_email(to_email: str, subject: str, body: str) -> bool:
-    """Send email using Gmail SMTP"""
+# Outgoing mail is queued and sent over pooled, rate-limited SMTP connections; queued mail is sent on exit
+email_delivery = create_email_delivery()
+atexit.register(email_delivery.stop)
+
+def send_email(to_email: str, subject: str, body: str, kind: str = "generic", on_done=None) -> bool:
+    """Queue an email for the pooled SMTP workers (see email_delivery_service); False if the queue is full"""
     try:
-        sender_email = os.getenv("SENDER_EMAIL")
-        sender_password = os.getenv("SENDER_PASSWORD")
-        
-        if not sender_email or not sender_password:
-            print("Email configuration missing - using mock email")
-            return True  # Mock success for testing
-        
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        
-        text = msg.as_string()
-        server.sendmail(sender_email, to_email, text)
-        server.quit()
-        
-        return True
+        return email_delivery.enqueue(to_email, subject, body, kind=kind, on_done=on_done)
     except Exception as e:
         print(f"Email sending failed: {e}")
         return True  # Mock success for testing
@@ -1156,7 +1321,7 @@ def send_otp_email(email: str, otp: str) -> bool:
     Best regards,
     Patient Alert System Team
     """
-    return send_email(email, subject, body)
+    return send_email(email, subject, body, kind="otp")
 
 def send_patient_id_email(email: str, patient_id: str, username: str) -> bool:
     """Send Patient ID to user's email"""
@@ -1175,13 +1340,13 @@ Best regards,
 Patient Alert System Team
         """
         
-        return send_email(email, subject, body)
+        return send_email(email, subject, body, kind="patient_id")
     except Exception as e:
         print(f"Error sending Patient ID email: {e}")
         return False
 
-def send_medication_reminder_email(email: str, username: str, medication_name: str, dosage: str, time: str, frequency: str, special_instructions: str = "") -> bool:
-    """Send medication reminder email to user"""
+def send_medication_reminder_email(email: str, username: str, medication_name: str, dosage: str, time: str, frequency: str, special_instructions: str = "", on_done=None) -> bool:
+    """Send medication reminder email to user; on_done(sent) reports the SMTP result"""
     try:
         subject = f"Medication Reminder: {medication_name}"
         body = f"""
@@ -1201,75 +1366,60 @@ Please take your medication as prescribed by your doctor.
     Patient Alert System Team
     """
         
-        return send_email(email, subject, body)
+        return send_email(email, subject, body, kind="reminder", on_done=on_done)
     except Exception as e:
         print(f"Error sending medication reminder email: {e}")
         return False
 
+def send_scheduled_medication_reminder(row):
+    """
+    Email one reminder from the schedule collection (patient email/username looked up fresh).
+    Returns False, or a Future of the SMTP result once the email is queued (the ledger records it).
+    """
+    patient = db.patients_collection.find_one(
+        {"patient_id": row['patient_id']}, {"email": 1, "username": 1}
+    )
+    if not patient or not patient.get('email') or not patient.get('username'):
+        return False
+    
+    delivery = Future()
+    if send_medication_reminder_email(
+        email=patient['email'],
+        username=patient['username'],
+        medication_name=row.get('medication_name', 'Unknown'),
+        dosage=row.get('dosage', ''),
+        time=row.get('time', ''),
+        frequency=row.get('frequency', ''),
+        special_instructions=row.get('special_instructions', ''),
+        on_done=delivery.set_result
+    ):
+        print(f"✅ Medication reminder queued for {patient['email']} for {row.get('medication_name')} at {row.get('time')}")
+        return delivery
+    print(f"❌ Failed to queue medication reminder for {patient['email']}")
+    return False
+
 def check_and_send_medication_reminders():
-    """Check all patients for upcoming medication dosages and send email reminders"""
+    """Send reminders for every dose within 15 minutes of now (manual trigger; the scheduler fires on time)"""
     try:
         print("🔍 Checking for medication reminders...")
         
-        # Get all patients
-        patients = db.patients_collection.find({})
-        current_time = datetime.now()
+        if reminder_schedule is None:
+            print("⚠️ Reminder schedule not available (database not connected)")
+            return 0
         
+        # Indexed range query over the schedule collection instead of a scan of every patient
+        now = datetime.now()
         reminders_sent = 0
-        
-        for patient in patients:
+        for row in reminder_schedule.around(now, 15):
             try:
-                patient_id = patient.get('patient_id')
-                email = patient.get('email')
-                username = patient.get('username')
-                
-                if not all([patient_id, email, username]):
+                # Claim the dose in the ledger first so the scheduler or another trigger cannot send it again
+                dose_at = nearest_dose_at(row, now)
+                if not reminder_ledger.claim(row, dose_at):
                     continue
-                
-                # Get medication logs for this patient
-                medication_logs = patient.get('medication_logs', [])
-                
-                for log in medication_logs:
-                    if not log.get('is_prescription_mode', False):
-                        # Handle multiple dosages
-                        dosages = log.get('dosages', [])
-                        for dosage in dosages:
-                            if dosage.get('reminder_enabled', False):
-                                try:
-                                    time_str = dosage.get('time', '')
-                                    if time_str:
-                                        hour, minute = map(int, time_str.split(':'))
-                                        dose_time = current_time.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                                        
-                                        # Check if it's time to send reminder (within 15 minutes of dose time)
-                                        time_diff = abs((current_time - dose_time).total_seconds() / 60)
-                                        
-                                        if time_diff <= 15:  # Within 15 minutes
-                                            # Check if we already sent a reminder for this dose today
-                                            reminder_key = f"reminder_{patient_id}_{log['medication_name']}_{time_str}_{current_time.strftime('%Y-%m-%d')}"
-                                            
-                                            # For now, we'll send reminders every time (you can implement reminder tracking later)
-                                            if send_medication_reminder_email(
-                                                email=email,
-                                                username=username,
-                                                medication_name=log.get('medication_name', 'Unknown'),
-                                                dosage=dosage.get('dosage', ''),
-                                                time=time_str,
-                                                frequency=dosage.get('frequency', ''),
-                                                special_instructions=dosage.get('special_instructions', '')
-                                            ):
-                                                reminders_sent += 1
-                                                print(f"✅ Medication reminder sent to {email} for {log.get('medication_name')} at {time_str}")
-                                            else:
-                                                print(f"❌ Failed to send medication reminder to {email}")
-                                                
-                                except Exception as e:
-                                    print(f"⚠️ Error processing dosage reminder for patient {patient_id}: {e}")
-                                    continue
-                                    
+                if reminder_ledger.record(row, dose_at, send_scheduled_medication_reminder(row)):
+                    reminders_sent += 1
             except Exception as e:
-                print(f"⚠️ Error processing patient {patient.get('patient_id', 'unknown')}: {e}")
-                continue
+                print(f"⚠️ Error processing dosage reminder for patient {row.get('patient_id')}: {e}")
         
         print(f"✅ Medication reminder check completed. {reminders_sent} reminders sent.")
         return reminders_sent
@@ -1278,6 +1428,68 @@ def check_and_send_medication_reminders():
         print(f"❌ Error in medication reminder service: {e}")
         return 0
 
+def sync_medication_reminders(patient_id):
+    """Rewrite a patient's reminder schedule rows after a medication write and queue the upcoming ones"""
+    if reminder_schedule is None:
+        return
+    try:
+        patient = db.patients_collection.find_one(
+            {"patient_id": patient_id}, {"patient_id": 1, "medication_logs": 1}
+        )
+        if patient:
+            rows = reminder_schedule.sync_patient(patient)
+            reminder_scheduler.notify(rows)
+            print(f"⏰ Reminder schedule updated for {patient_id}: {len(rows)} enabled dosages")
+    except Exception as e:
+        print(f"⚠️ Could not update reminder schedule for {patient_id}: {e}")
+
+# Compact per-patient dose schedule behind /medication/get-upcoming-dosages (see dosage_schedule_service),
+# and daily adherence buckets fed by tablet-taken events and passed doses (see adherence_service)
+if db.patients_collection is not None:
+    dose_schedule = DoseScheduleStore(db.patients_collection.database[DOSE_SCHEDULE_COLLECTION])
+    adherence_store = AdherenceStore(db.patients_collection.database[ADHERENCE_COLLECTION])
+    adherence_tracker = AdherenceTracker(dose_schedule.collection, adherence_store)
+    try:
+        dose_schedule.ensure_indexes()
+        adherence_store.ensure_indexes()
+    except Exception as e:
+        print(f"⚠️ Dose schedule / adherence index creation failed: {e}")
+else:
+    dose_schedule = None
+    adherence_store = None
+    adherence_tracker = None
+
+def sync_dose_schedule(patient_id):
+    """Rebuild a patient's dose schedule after a medication log write"""
+    if dose_schedule is None:
+        return None
+    try:
+        patient = db.patients_collection.find_one({"patient_id": patient_id}, DoseScheduleStore.PATIENT_FIELDS)
+        return dose_schedule.rebuild(patient) if patient else None
+    except Exception as e:
+        print(f"⚠️ Could not update dose schedule for {patient_id}: {e}")
+        return None
+
+def sync_dose_schedule_taken(patient):
+    """Refresh the taken counts of a patient's dose schedule from their (already updated) tracking arrays"""
+    if dose_schedule is None:
+        return
+    try:
+        if not dose_schedule.update_taken(patient):
+            dose_schedule.rebuild(patient)
+    except Exception as e:
+        print(f"⚠️ Could not update taken doses for {patient.get('patient_id')}: {e}")
+
+def record_tablet_taken(patient_id, tablet_name, date_taken=None):
+    """Count a tablet-taken event in the patient's adherence bucket for that day"""
+    if adherence_store is None:
+        return
+    try:
+        day = parse_taken_date(date_taken) or datetime.now().strftime('%Y-%m-%d')
+        adherence_store.record_taken(patient_id, tablet_name, day)
+    except Exception as e:
+        print(f"⚠️ Could not record adherence for {patient_id}: {e}")
+
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
@@ -1341,6 +1553,15 @@ def root():
             "POST /medication/process-prescription-document - Process prescription document with PaddleOCR",
             "POST /medication/process-with-paddleocr - Process prescription with medication folder PaddleOCR service",
             "POST /medication/process-prescription-text - Process prescription text for structured extraction",
+            "POST /medication/process-prescription-document/stream - Stream PDF extraction page by page (optional pages range)",
+            "POST /medication/process-prescription-batch - OCR several prescription pages/documents concurrently and send one merged webhook",
+            "POST /medication/ocr-jobs - Queue a prescription document for OCR in the worker pool",
+            "GET /medication/ocr-jobs/<job_id> - Poll an OCR job status and result",
+            "GET /medication/ocr-jobs/<job_id>/stream - Stream OCR job status as server-sent events",
+            "GET /medication/ocr-cache/stats - OCR result cache statistics",
+            "GET /medication/webhook-deliveries - Webhook outbox statistics and recent deliveries (optional status filter)",
+            "GET /medication/webhook-deliveries/<message_id> - Delivery status of one queued webhook payload",
+            "POST /medication/webhook-deliveries/<delivery_id>/retry - Re-queue a dead-lettered webhook delivery",
             "POST /medication/save-tablet-tracking - Save tablet tracking in medication_daily_tracking array",
             "GET /medication/get-tablet-tracking-history/<patient_id> - Get tablet tracking history from medication_daily_tracking array",
             "GET /symptoms/health - Symptom service health check",
@@ -1349,14 +1570,28 @@ def root():
             "GET /quantum/collection-status/<name> - Get collection status",
             "POST /quantum/add-knowledge - Add knowledge to vector DB",
             "POST /quantum/search-knowledge - Search knowledge base",
+            "POST /quantum/reindex - Re-embed knowledge into a shadow collection and swap the alias",
+            "GET /quantum/reindex/status - Reindex job progress and recall check",
+            "POST /quantum/reindex/swap - Manually swap the collection alias to the reindexed collection",
             "GET /llm/health - LLM service health",
             "POST /llm/test - Test LLM functionality",
             "GET / - API information",
             "POST /medication/send-reminders - Manually trigger medication reminder check and send emails",
             "POST /medication/test-reminder/<patient_id> - Test medication reminder email for a specific patient",
+            "GET /medication/reminder-scheduler/stats - Reminder scheduler queue, fire counts and lease holder",
+            "GET /medication/adherence/<patient_id> - Adherence percentages per medication and day/week (?days=, ?start=&end=, ?group=)",
+            "GET /email/delivery-stats - Email queue and SMTP connection statistics",
             "GET /nutrition/health - Nutrition service health check",
-            "POST /nutrition/transcribe - Transcribe audio using Whisper AI",
+            "POST /nutrition/transcribe - Transcribe audio using Whisper AI (raw audio/* body, multipart 'audio' or base64 JSON)",
+            "POST /nutrition/transcribe/sessions - Start a chunked audio upload (mode: segments or stream)",
+            "PUT /nutrition/transcribe/sessions/<session_id>/chunks/<index> - Upload one audio chunk",
+            "POST /nutrition/transcribe/sessions/<session_id>/complete - Transcribe all chunks in order",
+            "DELETE /nutrition/transcribe/sessions/<session_id> - Cancel a chunked audio upload",
+            "GET /nutrition/transcribe/backends - Speech-to-text backends (remote Whisper, local faster-whisper) and their latency",
             "POST /nutrition/analyze-with-gpt4 - Analyze food using GPT-4",
+            "POST /nutrition/analyze-nutrition - Meal nutrients from the local food composition table",
+            "GET /nutrition/rollups/<user_id> - Daily nutrition totals and moving averages for a date range",
+            "GET /nutrition/cache-stats - Shared GPT-4 food analysis cache statistics",
             "POST /nutrition/save-food-entry - Save basic food entry",
             "GET /nutrition/get-food-entries/<user_id> - Get food entries from patient's food_data array",
             "GET /nutrition/debug-food-data/<user_id> - Debug food data structure"
@@ -2500,6 +2735,120 @@ def symptoms_health_check():
         'timestamp': datetime.now().isoformat()
     })
 
+def answer_symptom_query(symptom_text, weeks_pregnant, trimester):
+    """Retrieval + LLM answer for a symptom query, using the semantic cache when enabled"""
+    query_vector = None
+    if quantum_service.embedding_model:
+        query_vector = quantum_service.embed_text(symptom_text) or None
+    
+    if SEMANTIC_CACHE_ENABLED and query_vector:
+        cached = semantic_cache.lookup(query_vector, trimester)
+        if cached:
+            print(f"⚡ Semantic cache hit (similarity {cached['similarity']}) for '{cached['cached_query']}'")
+            cached['cache_hit'] = True
+            return cached
+    
+    # Try quantum vector search for knowledge base retrieval
+    suggestions = []
+    if quantum_service.client and query_vector:
+        print("🔬 Using quantum vector search...")
+        suggestions = quantum_service.search_knowledge(symptom_text, weeks_pregnant, query_vector=query_vector)
+        print(f"✅ Found {len(suggestions)} suggestions from knowledge base")
+    else:
+        print("⚠️ Quantum vector search not available")
+    
+    # Generate response based on search results
+    if suggestions:
+        # Use LLM to synthesize a summary from retrieved suggestions
+        print("🤖 Using LLM to synthesize recommendations...")
+        summary = llm_service.summarize_retrieval(symptom_text, weeks_pregnant, suggestions)
+        
+        if summary:
+            # Return synthesized summary
+            response_text = summary.get("text", "")
+            response_source = "quantum_llm_synthesis"
+            print("✅ LLM synthesis successful")
+        else:
+            # Fallback to safe guidance
+            print("⚠️ LLM synthesis failed, using safe fallback")
+            fallback = llm_service.generate_llm_fallback(symptom_text, weeks_pregnant)
+            response_text = fallback.get("suggestions", [{}])[0].get("text", "")
+            response_source = "quantum_safe_fallback"
+    else:
+        # No suggestions found, use LLM fallback
+        print("⚠️ No knowledge base suggestions, using LLM fallback")
+        fallback = llm_service.generate_llm_fallback(symptom_text, weeks_pregnant)
+        response_text = fallback.get("suggestions", [{}])[0].get("text", "")
+        response_source = "llm_fallback"
+    
+    answer = {
+        'primary_recommendation': response_text,
+        'analysis_method': response_source,
+        'knowledge_base_suggestions': len(suggestions),
+    }
+    
+    # Static fallback text means the LLM was unavailable; do not pin it in the cache
+    if SEMANTIC_CACHE_ENABLED and query_vector and response_text and response_text != FALLBACK_STATIC_TEXT:
+        semantic_cache.store(query_vector, trimester, symptom_text, answer)
+    
+    answer['cache_hit'] = False
+    return answer
+
+def warm_semantic_cache(limit=SEMANTIC_CACHE_WARM_SIZE):
+    """Pre-compute answers for the most frequent historical symptom queries"""
+    if not SEMANTIC_CACHE_ENABLED or not quantum_service.embedding_model:
+        return 0
+    
+    try:
+        queries = top_symptom_queries(db.patients_collection, limit)
+    except Exception as e:
+        print(f"⚠️ Could not load historical symptom queries for cache warm-up: {e}")
+        return 0
+    
+    warmed = 0
+    for query in queries:
+        try:
+            trimester = get_trimester_label(query['pregnancy_week'])
+            query_vector = quantum_service.embed_text(query['text'])
+            if not query_vector or semantic_cache.lookup(query_vector, trimester):
+                continue
+            answer = answer_symptom_query(query['text'], query['pregnancy_week'], trimester)
+            if not answer.get('cache_hit'):
+                warmed += 1
+        except Exception as e:
+            print(f"⚠️ Cache warm-up failed for '{query['text']}': {e}")
+    
+    semantic_cache.warmed += warmed
+    print(f"🔥 Semantic cache warmed with {warmed} of {len(queries)} frequent symptom queries")
+    return warmed
+
+def start_semantic_cache_warmup():
+    """Warm the semantic cache in a background thread so startup is not blocked"""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    warmup_thread = threading.Thread(target=warm_semantic_cache, daemon=True)
+    warmup_thread.start()
+    return warmup_thread
+
+@app.route('/symptoms/cache-stats', methods=['GET'])
+def symptoms_cache_stats():
+    """Semantic answer cache statistics (hit rate, entries per trimester)"""
+    return jsonify({
+        'success': True,
+        'semantic_cache': semantic_cache.get_stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/symptoms/cache-clear', methods=['POST'])
+def symptoms_cache_clear():
+    """Drop every cached symptom answer"""
+    semantic_cache.clear()
+    return jsonify({
+        'success': True,
+        'message': 'Semantic cache cleared',
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/symptoms/assist', methods=['POST'])
 def get_symptom_assistance():
     """Get pregnancy symptom assistance using quantum vector search and LLM analysis"""
@@ -2532,49 +2881,17 @@ def get_symptom_assistance():
                 print(f"⚠️ Error fetching pregnancy week: {e}")
         
         # Determine trimester
-        if weeks_pregnant <= 12:
-            trimester = "First Trimester"
-        elif weeks_pregnant <= 26:
-            trimester = "Second Trimester"
-        else:
-            trimester = "Third Trimester"
+        trimester = get_trimester_label(weeks_pregnant)
             
         print(f"🔍 Analyzing symptoms: '{symptom_text}' for week {weeks_pregnant} ({trimester})")
         
-        # Step 1: Try quantum vector search for knowledge base retrieval
-        suggestions = []
-        if quantum_service.client and quantum_service.embedding_model:
-            print("🔬 Using quantum vector search...")
-            suggestions = quantum_service.search_knowledge(symptom_text, weeks_pregnant)
-            print(f"✅ Found {len(suggestions)} suggestions from knowledge base")
-        else:
-            print("⚠️ Quantum vector search not available")
-        
-        # Step 2: Generate response based on search results
-        if suggestions:
-            # Use LLM to synthesize a summary from retrieved suggestions
-            print("🤖 Using LLM to synthesize recommendations...")
-            summary = llm_service.summarize_retrieval(symptom_text, weeks_pregnant, suggestions)
-            
-            if summary:
-                # Return synthesized summary
-                response_text = summary.get("text", "")
-                response_source = "quantum_llm_synthesis"
-                print("✅ LLM synthesis successful")
-            else:
-                # Fallback to safe guidance
-                print("⚠️ LLM synthesis failed, using safe fallback")
-                fallback = llm_service.generate_llm_fallback(symptom_text, weeks_pregnant)
-                response_text = fallback.get("suggestions", [{}])[0].get("text", "")
-                response_source = "quantum_safe_fallback"
-        else:
-            # No suggestions found, use LLM fallback
-            print("⚠️ No knowledge base suggestions, using LLM fallback")
-            fallback = llm_service.generate_llm_fallback(symptom_text, weeks_pregnant)
-            response_text = fallback.get("suggestions", [{}])[0].get("text", "")
-            response_source = "llm_fallback"
+        # Step 1-2: Retrieval + LLM answer, served from the semantic cache for close paraphrases
+        answer = answer_symptom_query(symptom_text, weeks_pregnant, trimester)
+        response_text = answer['primary_recommendation']
+        response_source = answer['analysis_method']
+        suggestions_count = answer['knowledge_base_suggestions']
         
-        # Step 3: Detect red flags for safety
+        # Step 3: Detect red flags for safety (always on the new text, never cached)
         red_flags = llm_service.detect_red_flags(symptom_text)
         
         # Step 4: Generate additional recommendations
@@ -2593,7 +2910,8 @@ def get_symptom_assistance():
                         "patient_id": patient_id,
                         "analysis_method": response_source,
                         "red_flags_detected": red_flags,
-                        "suggestions_count": len(suggestions)
+                        "suggestions_count": suggestions_count,
+                        "semantic_cache_hit": answer.get('cache_hit', False)
                     }
                 )
             except Exception as e:
@@ -2608,7 +2926,8 @@ def get_symptom_assistance():
             'primary_recommendation': response_text,
             'additional_recommendations': additional_recommendations,
             'red_flags_detected': red_flags,
-            'knowledge_base_suggestions': len(suggestions),
+            'knowledge_base_suggestions': suggestions_count,
+            'semantic_cache_hit': answer.get('cache_hit', False),
             'disclaimer': DISCLAIMER_TEXT,
             'timestamp': datetime.now().isoformat()
         }), 200
@@ -2726,6 +3045,201 @@ def generate_symptom_recommendations(symptom_text, weeks_pregnant, trimester):
     
     return unique_recommendations
 
+def get_trimester_label(weeks_pregnant):
+    """Trimester label used in symptom assistance responses"""
+    if weeks_pregnant <= 12:
+        return "First Trimester"
+    elif weeks_pregnant <= 26:
+        return "Second Trimester"
+    return "Third Trimester"
+
+def parse_pregnancy_week(value):
+    """Pregnancy week as an int in 1-42 (numeric strings accepted); ValueError otherwise"""
+    try:
+        week = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"weeks_pregnant must be a number, got {value!r}")
+    if not 1 <= week <= 42:
+        raise ValueError(f"weeks_pregnant must be between 1 and 42, got {value!r}")
+    return int(week)
+
+def normalize_symptom_text(text):
+    """Lowercased symptom text with whitespace collapsed, used to share summaries between identical reports"""
+    return " ".join(text.lower().split()).strip(" .!?")
+
+@app.route('/symptoms/assist-batch', methods=['POST'])
+def get_symptom_assistance_batch():
+    """Triage many symptom entries at once (one embedding call, one Qdrant search_batch, deduplicated LLM calls)"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'success': False,
+                'message': 'No data provided'
+            }), 400
+        
+        items = data.get('items', [])
+        stream = bool(data.get('stream', False))
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'message': 'items must be a non-empty list of {patient_id, text, weeks_pregnant}'
+            }), 400
+        
+        if len(items) > SYMPTOM_BATCH_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'message': f'Too many items: {len(items)} (maximum {SYMPTOM_BATCH_MAX_ITEMS})'
+            }), 400
+        
+        # Normalize items; accept both objects and [patient_id, text, weeks_pregnant] triples
+        entries = []
+        for index, item in enumerate(items):
+            if isinstance(item, (list, tuple)):
+                item = dict(zip(['patient_id', 'text', 'weeks_pregnant'], item))
+            if not isinstance(item, dict):
+                item = {}
+            entries.append({
+                'index': index,
+                'patient_id': item.get('patient_id'),
+                'symptom_text': str(item.get('text', '') or '').strip(),
+                'weeks_pregnant': item.get('weeks_pregnant'),
+            })
+        
+        # Fetch missing pregnancy weeks with one query instead of one per entry
+        missing_week_ids = list({e['patient_id'] for e in entries if not e['weeks_pregnant'] and e['patient_id']})
+        if missing_week_ids and db.patients_collection is not None:
+            try:
+                weeks_by_patient = {
+                    p['patient_id']: p.get('pregnancy_week')
+                    for p in db.patients_collection.find(
+                        {"patient_id": {"$in": missing_week_ids}},
+                        {"patient_id": 1, "pregnancy_week": 1}
+                    )
+                }
+                for entry in entries:
+                    if not entry['weeks_pregnant'] and entry['patient_id']:
+                        entry['weeks_pregnant'] = weeks_by_patient.get(entry['patient_id'])
+            except Exception as e:
+                print(f"⚠️ Error fetching pregnancy weeks for batch: {e}")
+        
+        # A bad week fails only its own entry, not the batch
+        for entry in entries:
+            entry['error'] = None if entry['symptom_text'] else 'Symptom description is required'
+            try:
+                entry['weeks_pregnant'] = parse_pregnancy_week(entry['weeks_pregnant'] or 1)
+                entry['trimester'] = get_trimester_label(entry['weeks_pregnant'])
+            except ValueError as e:
+                entry['error'] = entry['error'] or str(e)
+            if not entry['error']:
+                entry['red_flags'] = llm_service.detect_red_flags(entry['symptom_text'])
+        
+        valid_entries = [e for e in entries if not e['error']]
+        print(f"🔍 Batch symptom triage: {len(valid_entries)} valid of {len(entries)} entries")
+        
+        # Step 1: one encode call + one Qdrant search_batch for every entry
+        if valid_entries and quantum_service.client and quantum_service.embedding_model:
+            batch_suggestions = quantum_service.search_knowledge_batch(
+                [e['symptom_text'] for e in valid_entries],
+                [e['weeks_pregnant'] for e in valid_entries]
+            )
+        else:
+            batch_suggestions = [[] for _ in valid_entries]
+        
+        for entry, suggestions in zip(valid_entries, batch_suggestions):
+            entry['suggestions'] = suggestions
+        
+        # Step 2: dedupe identical reports (same symptom text, red flags, trimester and evidence) before
+        # summarization; the summary answers the patient's own words, so different texts never share one
+        def summary_key(entry):
+            text = normalize_symptom_text(entry['symptom_text'])
+            red_flags = tuple(sorted(entry['red_flags']))
+            if entry['suggestions']:
+                evidence_ids = tuple(s.get('id') for s in entry['suggestions'])
+                return ('summary', entry['trimester'], text, red_flags, evidence_ids)
+            return ('fallback', entry['trimester'], text, red_flags)
+        
+        def run_summary(entry):
+            if entry['suggestions']:
+                summary = llm_service.summarize_retrieval(entry['symptom_text'], entry['weeks_pregnant'], entry['suggestions'])
+                if summary:
+                    return summary.get("text", ""), "quantum_llm_synthesis"
+                fallback = llm_service.generate_llm_fallback(entry['symptom_text'], entry['weeks_pregnant'])
+                return fallback.get("suggestions", [{}])[0].get("text", ""), "quantum_safe_fallback"
+            fallback = llm_service.generate_llm_fallback(entry['symptom_text'], entry['weeks_pregnant'])
+            return fallback.get("suggestions", [{}])[0].get("text", ""), "llm_fallback"
+        
+        # Step 3: LLM calls with bounded concurrency, one per unique evidence set
+        executor = ThreadPoolExecutor(max_workers=max(1, SYMPTOM_BATCH_LLM_CONCURRENCY))
+        futures = {}
+        for entry in valid_entries:
+            key = summary_key(entry)
+            if key not in futures:
+                futures[key] = executor.submit(run_summary, entry)
+            entry['summary_future'] = futures[key]
+        executor.shutdown(wait=False)
+        
+        print(f"🤖 Batch triage: {len(futures)} unique LLM summaries for {len(valid_entries)} entries")
+        
+        def build_result(entry):
+            if entry['error']:
+                return {
+                    'index': entry['index'],
+                    'patient_id': entry['patient_id'],
+                    'success': False,
+                    'message': entry['error']
+                }
+            
+            try:
+                response_text, response_source = entry['summary_future'].result()
+            except Exception as e:
+                print(f"⚠️ Batch summary failed for entry {entry['index']}: {e}")
+                response_text, response_source = FALLBACK_STATIC_TEXT, "static_fallback"
+            
+            return {
+                'index': entry['index'],
+                'patient_id': entry['patient_id'],
+                'success': True,
+                'symptom_text': entry['symptom_text'],
+                'pregnancy_week': entry['weeks_pregnant'],
+                'trimester': entry['trimester'],
+                'analysis_method': response_source,
+                'primary_recommendation': response_text,
+                'additional_recommendations': generate_symptom_recommendations(
+                    entry['symptom_text'], entry['weeks_pregnant'], entry['trimester']
+                ),
+                'red_flags_detected': entry['red_flags'],
+                'knowledge_base_suggestions': len(entry['suggestions']),
+            }
+        
+        if stream:
+            # Newline-delimited JSON, emitted in request order as each summary completes
+            def generate():
+                for entry in entries:
+                    yield json.dumps(build_result(entry)) + "\n"
+            
+            return Response(generate(), mimetype='application/x-ndjson')
+        
+        results = [build_result(entry) for entry in entries]
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'total_items': len(entries),
+            'unique_summaries': len(futures),
+            'red_flag_items': sum(1 for r in results if r.get('red_flags_detected')),
+            'disclaimer': DISCLAIMER_TEXT,
+            'timestamp': datetime.now().isoformat()
+        }), 200
+        
+    except Exception as e:
+        print(f"Error in batch symptom assistance: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
 @app.route('/symptoms/save-symptom-log', methods=['POST'])
 def save_symptom_log():
     """Save symptom log to patient profile"""
@@ -3147,6 +3661,10 @@ def save_medication_log():
         )
         
         if result.modified_count > 0:
+            # Keep the reminder and dose schedules in step with the new dosages
+            sync_medication_reminders(patient_id)
+            sync_dose_schedule(patient_id)
+            
             # Log the medication activity
             activity_tracker.log_activity(
                 user_email=patient.get('email'),
@@ -3213,87 +3731,93 @@ def get_medication_history(patient_id):
 
 @app.route('/medication/get-upcoming-dosages/<patient_id>', methods=['GET'])
 def get_upcoming_dosages(patient_id):
-    """Get upcoming dosages and alerts for a patient"""
+    """Get upcoming dosages and alerts for a patient
+
+    Query parameters: hours (default 24) or days for the window, include_taken=true to keep doses already logged as taken.
+    """
     try:
         print(f"🔍 Getting upcoming dosages for patient ID: {patient_id}")
         
-        # Find patient by Patient ID
-        patient = db.patients_collection.find_one({"patient_id": patient_id})
-        if not patient:
-            return jsonify({'success': False, 'message': f'Patient not found with ID: {patient_id}'}), 404
+        if dose_schedule is None:
+            return jsonify({'success': False, 'message': 'Database not connected'}), 500
         
-        # Get medication logs from patient document
-        medication_logs = patient.get('medication_logs', [])
+        try:
+            if request.args.get('days'):
+                window = timedelta(days=float(request.args['days']))
+            else:
+                window = timedelta(hours=float(request.args.get('hours', UPCOMING_DOSAGES_DEFAULT_HOURS)))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'hours and days must be numbers'}), 400
+        if window <= timedelta(0):
+            return jsonify({'success': False, 'message': 'The window must be positive'}), 400
+        window = min(window, timedelta(days=UPCOMING_DOSAGES_MAX_DAYS))
+        include_taken = request.args.get('include_taken', 'false').lower() == 'true'
+        
+        # One _id lookup on the materialized schedule; built from the patient document on first use
+        schedule = dose_schedule.get(patient_id)
+        if schedule is None:
+            patient = db.patients_collection.find_one({"patient_id": patient_id}, DoseScheduleStore.PATIENT_FIELDS)
+            if not patient:
+                return jsonify({'success': False, 'message': f'Patient not found with ID: {patient_id}'}), 404
+            schedule = dose_schedule.rebuild(patient)
         
-        # Process dosages and create upcoming schedule
-        upcoming_dosages = []
         today = datetime.now()
+        upcoming = expand_upcoming_dosages(schedule, today, today + window, include_taken=include_taken)
+        prescription_medications = schedule.get('prescription_medications', [])
         
-        for log in medication_logs:
-            if not log.get('is_prescription_mode', False):
-                # Handle multiple dosages
-                dosages = log.get('dosages', [])
-                for dosage in dosages:
-                    if dosage.get('reminder_enabled', False):
-                        # Parse time and create schedule
-                        try:
-                            time_str = dosage.get('time', '')
-                            if time_str:
-                                hour, minute = map(int, time_str.split(':'))
-                                next_dose = today.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                                
-                                # If time has passed today, schedule for tomorrow
-                                if next_dose < today:
-                                    next_dose += timedelta(days=1)
-                                
-                                upcoming_dosages.append({
-                                    'medication_name': log.get('medication_name', 'Unknown'),
-                                    'dosage': dosage.get('dosage', ''),
-                                    'time': time_str,
-                                    'frequency': dosage.get('frequency', ''),
-                                    'next_dose_time': next_dose.isoformat(),
-                                    'special_instructions': dosage.get('special_instructions', ''),
-                                    'medication_type': log.get('medication_type', 'prescription'),
-                                    'prescribed_by': log.get('prescribed_by', ''),
-                                    'notes': log.get('notes', ''),
-                                    'urgency_level': 'normal'
-                                })
-                        except Exception as e:
-                            print(f"⚠️ Error parsing dosage time: {e}")
-                            continue
-        
-        # Sort by next dose time
-        upcoming_dosages.sort(key=lambda x: x.get('next_dose_time', ''))
-        
-        # Add prescription mode medications as general reminders
-        prescription_medications = []
-        for log in medication_logs:
-            if log.get('is_prescription_mode', False):
-                prescription_medications.append({
-                    'medication_name': log.get('medication_name', 'Unknown'),
-                    'type': 'prescription',
-                    'details': log.get('prescription_details', ''),
-                    'prescribed_by': log.get('prescribed_by', ''),
-                    'notes': log.get('notes', ''),
-                    'urgency_level': 'normal'
-                })
-        
-        print(f"✅ Retrieved {len(upcoming_dosages)} upcoming dosages and {len(prescription_medications)} prescription medications for patient: {patient_id}")
+        print(f"✅ Retrieved {len(upcoming)} upcoming dosages and {len(prescription_medications)} prescription medications for patient: {patient_id}")
         
         return jsonify({
             'success': True,
             'patientId': patient_id,
-            'upcoming_dosages': upcoming_dosages,
+            'upcoming_dosages': upcoming,
             'prescription_medications': prescription_medications,
-            'total_upcoming': len(upcoming_dosages),
+            'total_upcoming': len(upcoming),
             'total_prescriptions': len(prescription_medications),
-            'current_time': today.isoformat()
+            'current_time': today.isoformat(),
+            'window_end': (today + window).isoformat()
         }), 200
         
     except Exception as e:
         print(f"Error getting upcoming dosages: {e}")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+@app.route('/medication/adherence/<patient_id>', methods=['GET'])
+def get_medication_adherence(patient_id):
+    """Adherence (scheduled, taken, missed, percent) overall, per medication and per day or week
+
+    Query parameters: days (default 7, ending today) or start/end (YYYY-MM-DD), group=day|week.
+    """
+    try:
+        if adherence_store is None:
+            return jsonify({'success': False, 'message': 'Database not connected'}), 500
+        
+        group = request.args.get('group', 'day')
+        if group not in ('day', 'week'):
+            return jsonify({'success': False, 'message': 'group must be day or week'}), 400
+        
+        try:
+            end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+            if request.args.get('start'):
+                start = date.fromisoformat(request.args['start'])
+            else:
+                start = end - timedelta(days=int(request.args.get('days', 7)) - 1)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'start/end must be YYYY-MM-DD and days a number'}), 400
+        if start > end:
+            return jsonify({'success': False, 'message': 'start must not be after end'}), 400
+        if (end - start).days + 1 > ADHERENCE_MAX_WINDOW_DAYS:
+            return jsonify({'success': False, 'message': f'The window is limited to {ADHERENCE_MAX_WINDOW_DAYS} days'}), 400
+        
+        report = adherence_store.report(patient_id, start.isoformat(), end.isoformat(), group)
+        print(f"✅ Adherence for {patient_id} {start} - {end}: {report['overall']}")
+        
+        return jsonify({'success': True, 'patientId': patient_id, **report}), 200
+        
+    except Exception as e:
+        print(f"Error getting medication adherence: {e}")
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
 @app.route('/medication/save-tablet-taken', methods=['POST'])
 def save_tablet_taken():
     """Save daily tablet tracking for a patient"""
@@ -3342,6 +3866,8 @@ def save_tablet_taken():
         )
         
         if result.modified_count > 0:
+            sync_dose_schedule_taken(patient)
+            record_tablet_taken(patient_id, tablet_name, date_taken)
             print(f"✅ Tablet tracking saved successfully for patient: {patient_id}")
             return jsonify({
                 'success': True,
@@ -3562,8 +4088,12 @@ def process_prescription_document():
         print(f"🔍 Patient ID: {patient_id}")
         print(f"🔍 Medication Name: {medication_name}")
         
-        # Read file content
-        file_content = file.read()
+        # Stream the upload into a size-bounded spool instead of reading it into memory
+        try:
+            upload = spool_request_file(file)
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'message': str(e)}), 413
+        ocr_cache_hit = False
         
         # Use medication folder's enhanced OCR service if available, otherwise fallback to basic OCR
         if enhanced_ocr_service and OCR_SERVICES_AVAILABLE:
@@ -3576,23 +4106,16 @@ def process_prescription_document():
                     'message': f'Unsupported file type: {file.content_type}. Supported types: {enhanced_ocr_service.allowed_types}'
                 }), 400
             
-            # Process with enhanced OCR service from medication folder
-            import asyncio
+            # Process with enhanced OCR service from medication folder (in the OCR worker pool)
             try:
-                # Create event loop for async OCR service
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                ocr_result = loop.run_until_complete(
-                    enhanced_ocr_service.process_file(
-                        file_content=file_content,
-                        filename=file.filename
-                    )
+                # Identical documents are answered from the OCR result cache (single-flighted)
+                ocr_result, ocr_cache_hit = ocr_result_cache.get_or_compute(
+                    None, ENHANCED_OCR_CACHE_NAMESPACE,
+                    lambda: ocr_worker_pool.process(upload.path, file.filename, timeout=OCR_JOB_TIMEOUT_SEC),
+                    digest=upload.digest
                 )
                 
-                loop.close()
-                
-                print("✅ Medication folder OCR processing successful")
+                print(f"✅ Medication folder OCR processing successful (cache hit: {ocr_cache_hit})")
                 
                 # Extract full text content in the format expected by medication folder
                 if ocr_result.get('success'):
@@ -3612,10 +4135,15 @@ def process_prescription_document():
                     ocr_result['full_text_content'] = full_text_content
                     ocr_result['extracted_text'] = full_text_content  # For backward compatibility
                 
+            except OCRQueueFullError as e:
+                return jsonify({'success': False, 'message': str(e)}), 429, {'Retry-After': '5'}
             except Exception as e:
                 print(f"⚠️ Medication folder OCR service error, falling back to basic OCR: {e}")
                 if ocr_service:
-                    ocr_result = ocr_service.process_file(file_content, file.filename)
+                    ocr_result, ocr_cache_hit = ocr_result_cache.get_or_compute(
+                        None, "basic", lambda: ocr_service.process_file(upload.getbuffer(), file.filename),
+                        digest=upload.digest
+                    )
                 else:
                     return jsonify({'success': False, 'message': 'OCR service not available'}), 503
         elif ocr_service:
@@ -3628,7 +4156,10 @@ def process_prescription_document():
                     'message': f'Unsupported file type: {file.content_type}. Supported types: {list(ocr_service.supported_formats.keys())}'
                 }), 400
             
-            ocr_result = ocr_service.process_file(file_content, file.filename)
+            ocr_result, ocr_cache_hit = ocr_result_cache.get_or_compute(
+                None, "basic", lambda: ocr_service.process_file(upload.getbuffer(), file.filename),
+                digest=upload.digest
+            )
         else:
             return jsonify({'success': False, 'message': 'OCR service not available'}), 503
         
@@ -3663,7 +4194,8 @@ def process_prescription_document():
             'processing_details': {
                 'method': 'paddleocr_extraction' if enhanced_ocr_service and OCR_SERVICES_AVAILABLE else 'basic_ocr_extraction',
                 'confidence': ocr_result.get('results', [{}])[0].get('confidence', 0.0) if ocr_result.get('results') else 0.0,
-                'service_used': 'PaddleOCR Enhanced' if enhanced_ocr_service and OCR_SERVICES_AVAILABLE else 'Basic OCR'
+                'service_used': 'PaddleOCR Enhanced' if enhanced_ocr_service and OCR_SERVICES_AVAILABLE else 'Basic OCR',
+                'cache_hit': ocr_cache_hit
             }
         }), 200
         
@@ -3671,6 +4203,533 @@ def process_prescription_document():
         print(f"❌ Error processing prescription document: {e}")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+@app.route('/medication/process-prescription-document/stream', methods=['POST'])
+def stream_prescription_document():
+    """Extract a PDF page by page, streaming newline-delimited JSON as each page finishes"""
+    try:
+        if not PYMUPDF_AVAILABLE:
+            return jsonify({'success': False, 'message': 'PDF processing not available. Install PyMuPDF: pip install PyMuPDF'}), 503
+        
+        if 'file' not in request.files:
+            return jsonify({'success': False, 'message': 'No file provided'}), 400
+        
+        file = request.files['file']
+        if file.filename == '' or not file.filename.lower().endswith('.pdf'):
+            return jsonify({'success': False, 'message': 'A PDF file is required for streaming extraction'}), 400
+        
+        # Not tied to request teardown: the response generator closes the spool when done
+        try:
+            upload = spool_file_storage(file)
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'message': str(e)}), 413
+        filename = file.filename
+        
+        # Optional 1-based page range, e.g. "1-3,7"
+        try:
+            total_pages = count_pdf_pages(upload.path)
+            page_indexes = parse_page_range(request.form.get('pages') or request.args.get('pages'), total_pages)
+        except ValueError as e:
+            upload.close()
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception:
+            upload.close()
+            raise
+        
+        print(f"📄 Streaming {len(page_indexes)} of {total_pages} pages from {filename}")
+        
+        def generate():
+            start = time.time()
+            try:
+                yield json.dumps({
+                    'type': 'document',
+                    'filename': filename,
+                    'total_pages': total_pages,
+                    'requested_pages': [index + 1 for index in page_indexes]
+                }) + "\n"
+                
+                counts = {'native_text': 0, 'ocr': 0, 'scanned_page': 0}
+                failed_pages = []
+                ocr_submit = ocr_worker_pool.submit if ocr_worker_pool else None
+                try:
+                    # Workers open the spooled file themselves instead of receiving a copy of the PDF
+                    for page in iter_pdf_pages(upload.path, filename, page_indexes, ocr_submit=ocr_submit):
+                        counts[page['method']] = counts.get(page['method'], 0) + 1
+                        if page.get('error'):
+                            failed_pages.append(page['page'])
+                        yield json.dumps({'type': 'page', **page}) + "\n"
+                except Exception as e:
+                    print(f"❌ Streaming extraction of {filename} stopped: {e}")
+                    yield json.dumps({
+                        'type': 'summary',
+                        'success': False,
+                        'message': str(e),
+                        'retryable': isinstance(e, OCRQueueFullError),
+                        'timestamp': datetime.now().isoformat()
+                    }) + "\n"
+                    return
+                
+                yield json.dumps({
+                    'type': 'summary',
+                    'success': True,
+                    'partial': bool(failed_pages),
+                    'failed_pages': failed_pages,
+                    'processed_pages': len(page_indexes),
+                    'native_text_pages': counts['native_text'],
+                    'ocr_pages': counts['ocr'] + counts['scanned_page'],
+                    'processing_time_ms': round((time.time() - start) * 1000, 1),
+                    'timestamp': datetime.now().isoformat()
+                }) + "\n"
+            finally:
+                upload.close()
+        
+        return Response(generate(), mimetype='application/x-ndjson')
+        
+    except Exception as e:
+        print(f"❌ Error streaming prescription document: {e}")
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+def ocr_spooled_upload(upload, filename):
+    """OCR one spooled upload through the result cache: (ocr_result, cache_hit, service_used)"""
+    if enhanced_ocr_service and OCR_SERVICES_AVAILABLE and ocr_worker_pool:
+        try:
+            ocr_result, cache_hit = ocr_result_cache.get_or_compute(
+                None, ENHANCED_OCR_CACHE_NAMESPACE,
+                lambda: ocr_worker_pool.process(upload.path, filename, timeout=OCR_JOB_TIMEOUT_SEC),
+                digest=upload.digest
+            )
+            return ocr_result, cache_hit, 'PaddleOCR Enhanced'
+        except OCRQueueFullError:
+            raise
+        except Exception as e:
+            if not ocr_service:
+                raise
+            print(f"⚠️ Enhanced OCR failed for {filename}, falling back to basic OCR: {e}")
+    
+    if not ocr_service:
+        raise RuntimeError('OCR service not available')
+    ocr_result, cache_hit = ocr_result_cache.get_or_compute(
+        None, "basic", lambda: ocr_service.process_file(upload.getbuffer(), filename),
+        digest=upload.digest
+    )
+    return ocr_result, cache_hit, 'Basic OCR'
+
+@app.route('/medication/process-prescription-batch', methods=['POST'])
+def process_prescription_batch():
+    """OCR every page/document of one prescription concurrently and send a single merged webhook"""
+    try:
+        start = time.time()
+        files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+        if not files:
+            return jsonify({'success': False, 'message': 'No files provided (use the "files" field once per document)'}), 400
+        if len(files) > PRESCRIPTION_BATCH_MAX_FILES:
+            return jsonify({
+                'success': False,
+                'message': f'Too many files: {len(files)} (maximum {PRESCRIPTION_BATCH_MAX_FILES})'
+            }), 400
+        
+        if not (ocr_service or (enhanced_ocr_service and OCR_SERVICES_AVAILABLE)):
+            return jsonify({'success': False, 'message': 'OCR service not available'}), 503
+        
+        # Reject the whole batch before any OCR work if one document is unsupported
+        validator = enhanced_ocr_service if enhanced_ocr_service and OCR_SERVICES_AVAILABLE else ocr_service
+        for file in files:
+            if not validator.validate_file_type(file.content_type, file.filename):
+                return jsonify({
+                    'success': False,
+                    'message': f'Unsupported file type for {file.filename}: {file.content_type}'
+                }), 400
+        
+        try:
+            uploads = [(file.filename, spool_request_file(file)) for file in files]
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'message': str(e)}), 413
+        
+        patient_id = request.form.get('patient_id', '')
+        print(f"📚 Prescription batch: {len(uploads)} documents for patient {patient_id or '-'}")
+        
+        # Bounded parallelism: at most PRESCRIPTION_BATCH_CONCURRENCY documents in flight per request
+        outcomes = process_documents(
+            uploads, lambda item: ocr_spooled_upload(item[1], item[0]),
+            concurrency=PRESCRIPTION_BATCH_CONCURRENCY
+        )
+        if any(isinstance(error, OCRQueueFullError) for _, error in outcomes):
+            return jsonify({'success': False, 'message': 'OCR queue is full, retry the batch shortly'}), 429, {'Retry-After': '5'}
+        
+        documents = []
+        document_status = []
+        for (filename, upload), (outcome, error) in zip(uploads, outcomes):
+            ocr_result, cache_hit, service_used = outcome if outcome else (None, False, None)
+            if error:
+                print(f"❌ Batch OCR failed for {filename}: {error}")
+            documents.append((filename, ocr_result))
+            document_status.append({
+                'filename': filename,
+                'size': upload.size,
+                'success': bool(ocr_result and ocr_result.get('success')),
+                'cache_hit': cache_hit,
+                'service_used': service_used,
+                'error': str(error) if error else (ocr_result or {}).get('error')
+            })
+        
+        batch_name = ', '.join(filename for filename, _ in uploads)
+        combined = merge_ocr_results(documents, batch_name=batch_name)
+        for status, summary in zip(document_status, combined['documents']):
+            status['pages'] = summary['pages']
+            status['first_page'] = summary.get('first_page')
+        
+        if not combined['success']:
+            return jsonify({
+                'success': False,
+                'message': combined['error'],
+                'documents': document_status
+            }), 422
+        
+        # One webhook payload for the whole prescription
+        combined = normalize_ocr_full_text(combined)
+        combined['patient_id'] = patient_id
+        webhook_results = send_ocr_webhooks(combined, batch_name, metadata={'patient_id': patient_id})
+        
+        parsed = parse_prescription(combined['full_text_content'])
+        failed = sum(1 for status in document_status if not status['success'])
+        
+        return jsonify({
+            'success': True,
+            'message': f'Processed {len(uploads) - failed} of {len(uploads)} documents',
+            'total_documents': len(uploads),
+            'failed_documents': failed,
+            'total_pages': combined['total_pages'],
+            'documents': document_status,
+            'pages': combined['results'],
+            'extracted_text': combined['full_text_content'],
+            'medications': parsed['medications'],
+            'prescribed_by': parsed['prescribed_by'],
+            'parse_confidence': parsed['confidence'],
+            'webhook_delivery': webhook_delivery_info(webhook_results),
+            'processing_time_ms': round((time.time() - start) * 1000, 1),
+            'timestamp': datetime.now().isoformat()
+        }), 200
+        
+    except Exception as e:
+        print(f"❌ Error processing prescription batch: {e}")
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+def normalize_ocr_full_text(ocr_result):
+    """Fill full_text_content / extracted_text on a medication folder OCR result"""
+    if not ocr_result.get('success'):
+        print(f"🔍 Debug - OCR processing failed: {ocr_result.get('error', 'Unknown error')}")
+        return ocr_result
+    
+    # Get the full text content from the medication folder service
+    full_text_content = ocr_result.get('full_content', '')
+    
+    # If full_content is not available, extract from results
+    if not full_text_content and ocr_result.get('results'):
+        # Extract all text from results and combine them into one continuous string
+        extracted_texts = [result.get('text', '').strip() for result in ocr_result['results']]
+        full_text_content = ' '.join(text for text in extracted_texts if text)
+        
+        # If still no content, try alternative fields
+        if not full_text_content:
+            full_text_content = ocr_result.get('extracted_text', '') or ocr_result.get('text', '')
+    
+    # If we still don't have content, create a fallback
+    if not full_text_content:
+        full_text_content = "No text could be extracted from the document"
+    
+    # Update OCR result with full text content
+    ocr_result['full_text_content'] = full_text_content
+    ocr_result['extracted_text'] = full_text_content  # For backward compatibility
+    print(f"🔍 Debug - Final full_text_content length: {len(full_text_content)}")
+    return ocr_result
+
+def send_ocr_webhooks(ocr_result, filename, metadata=None):
+    """Queue a successful OCR result in the webhook outbox (inline delivery when the outbox is off)"""
+    webhook_results = []
+    if not ocr_result.get("success"):
+        return webhook_results
+    
+    if webhook_outbox:
+        if not webhook_outbox.is_configured():
+            return webhook_results
+        queued = webhook_outbox.enqueue(build_ocr_payload(ocr_result, filename, metadata))
+        print(f"📬 OCR result for {filename} queued for {len(queued['deliveries'])} webhook(s)")
+        return [
+            {
+                'success': None,
+                'status': delivery['status'],
+                'message_id': delivery['message_id'],
+                'delivery_id': delivery['id'],
+                'config_name': delivery['endpoint_name'],
+                'url': delivery['url']
+            } for delivery in queued['deliveries']
+        ]
+    
+    if not (webhook_service and webhook_service.is_configured()):
+        return webhook_results
+    
+    try:
+        print("🚀 Sending OCR results to webhook using medication folder service...")
+        
+        # Runs on the shared event loop so the service's HTTP session is reused
+        webhook_results = run_async(webhook_service.send_ocr_result(ocr_result, filename))
+        
+        # Log webhook delivery status
+        for webhook_result in webhook_results:
+            if webhook_result["success"]:
+                print(f"✅ Webhook sent successfully to {webhook_result['config_name']} ({webhook_result['url']})")
+            else:
+                print(f"❌ Webhook failed for {webhook_result['config_name']}: {webhook_result.get('error', 'Unknown error')}")
+        
+    except Exception as e:
+        print(f"❌ Error sending webhook: {e}")
+    
+    return webhook_results
+
+def webhook_delivery_info(webhook_results):
+    """The webhook_delivery block of OCR responses"""
+    info = {
+        'status': 'completed' if webhook_results else 'not_configured',
+        'results': webhook_results,
+        'timestamp': datetime.now().isoformat()
+    }
+    message_ids = {result['message_id'] for result in webhook_results if result.get('message_id')}
+    if message_ids:
+        message_id = message_ids.pop()
+        info.update({
+            'status': 'queued',
+            'message_id': message_id,
+            'status_url': f'/medication/webhook-deliveries/{message_id}'
+        })
+    return info
+
+def finalize_paddleocr_result(ocr_result, filename, cache_hit=False):
+    """Normalize text, deliver webhooks and build the /medication/process-with-paddleocr response"""
+    ocr_result = normalize_ocr_full_text(ocr_result)
+    webhook_results = send_ocr_webhooks(ocr_result, filename)
+    
+    # Return comprehensive result with full text content
+    return {
+        'success': True,
+        'message': 'Document processed successfully with medication folder OCR service',
+        'filename': filename,
+        'ocr_result': ocr_result,
+        'full_text_content': ocr_result.get('full_text_content', ''),
+        'webhook_delivery': webhook_delivery_info(webhook_results),
+        'service_used': 'Medication Folder Enhanced OCR',
+        'ocr_cache_hit': cache_hit,
+        'timestamp': datetime.now().isoformat()
+    }
+
+@app.route('/medication/ocr-jobs', methods=['POST'])
+def submit_ocr_job():
+    """Queue a prescription document for OCR and return a job ID immediately"""
+    try:
+        if not ocr_worker_pool:
+            return jsonify({
+                'success': False,
+                'message': 'PaddleOCR service not available (paddlepaddle not installed)'
+            }), 503
+        
+        if 'file' not in request.files:
+            return jsonify({'success': False, 'message': 'No file provided'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'success': False, 'message': 'No file selected'}), 400
+        
+        if not enhanced_ocr_service.validate_file_type(file.content_type, file.filename):
+            return jsonify({
+                'success': False,
+                'message': f'Unsupported file type: {file.content_type}. Supported types: {enhanced_ocr_service.allowed_types}'
+            }), 400
+        
+        metadata = {
+            'patient_id': request.form.get('patient_id', ''),
+            'medication_name': request.form.get('medication_name', '')
+        }
+        
+        try:
+            upload = spool_request_file(file)
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'message': str(e)}), 413
+        digest = upload.digest
+        
+        # Re-uploaded documents complete immediately from the OCR result cache
+        cached_result = ocr_result_cache.get(digest, ENHANCED_OCR_CACHE_NAMESPACE)
+        if cached_result is not None:
+            job_id = ocr_worker_pool.record_completed_job(
+                file.filename,
+                finalize_paddleocr_result(cached_result, file.filename, cache_hit=True),
+                metadata=metadata,
+                file_size=upload.size
+            )
+            print(f"⚡ OCR job {job_id} served from cache for {file.filename}")
+            return jsonify({
+                'success': True,
+                'message': 'OCR result served from cache',
+                'job_id': job_id,
+                'status': 'completed',
+                'status_url': f'/medication/ocr-jobs/{job_id}',
+                'stream_url': f'/medication/ocr-jobs/{job_id}/stream',
+                'timestamp': datetime.now().isoformat()
+            }), 200
+        
+        def complete_job(job, ocr_result):
+            ocr_result_cache.put(digest, ENHANCED_OCR_CACHE_NAMESPACE, ocr_result)
+            return finalize_paddleocr_result(ocr_result, job['filename'])
+        
+        try:
+            # Identical documents already in flight share one job; the job owns the
+            # spooled file from here and the pool deletes it once OCR has read it
+            document_path = upload.detach()
+            job_id = ocr_worker_pool.submit_job(
+                document_path,
+                file.filename,
+                metadata=metadata,
+                on_complete=complete_job,
+                dedupe_key=digest,
+                release_document=lambda: remove_spooled_file(document_path)
+            )
+        except OCRQueueFullError as e:
+            return jsonify({'success': False, 'message': str(e)}), 429, {'Retry-After': '5'}
+        
+        print(f"📥 Queued OCR job {job_id} for {file.filename}")
+        
+        return jsonify({
+            'success': True,
+            'message': 'OCR job queued',
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/medication/ocr-jobs/{job_id}',
+            'stream_url': f'/medication/ocr-jobs/{job_id}/stream',
+            'timestamp': datetime.now().isoformat()
+        }), 202
+        
+    except Exception as e:
+        print(f"❌ Error queuing OCR job: {e}")
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+@app.route('/medication/ocr-jobs', methods=['GET'])
+def list_ocr_jobs():
+    """Recent OCR jobs (without results) and pool statistics"""
+    if not ocr_worker_pool:
+        return jsonify({'success': False, 'message': 'PaddleOCR service not available'}), 503
+    
+    return jsonify({
+        'success': True,
+        'jobs': ocr_worker_pool.list_jobs(limit=int(request.args.get('limit', 50))),
+        'pool': ocr_worker_pool.get_stats(),
+        'cache': ocr_result_cache.get_stats(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@app.route('/medication/ocr-cache/stats', methods=['GET'])
+def ocr_cache_stats():
+    """OCR result cache statistics (hits, misses, single-flighted duplicates, size)"""
+    return jsonify({
+        'success': True,
+        'cache': ocr_result_cache.get_stats(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@app.route('/medication/webhook-deliveries', methods=['GET'])
+def list_webhook_deliveries():
+    """Webhook outbox statistics and the most recent deliveries, optionally filtered by status"""
+    if not webhook_outbox:
+        return jsonify({'success': False, 'message': 'Webhook outbox not enabled'}), 503
+    
+    status = request.args.get('status')
+    if status and status not in WEBHOOK_DELIVERY_STATUSES:
+        return jsonify({
+            'success': False,
+            'message': f'Unknown status: {status}. Use one of {list(WEBHOOK_DELIVERY_STATUSES)}'
+        }), 400
+    
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit must be an integer'}), 400
+    
+    return jsonify({
+        'success': True,
+        'stats': webhook_outbox.stats(),
+        'deliveries': webhook_outbox.list_deliveries(status=status, limit=limit),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@app.route('/medication/webhook-deliveries/<message_id>', methods=['GET'])
+def get_webhook_delivery_status(message_id):
+    """Delivery status of one queued webhook payload, per endpoint"""
+    if not webhook_outbox:
+        return jsonify({'success': False, 'message': 'Webhook outbox not enabled'}), 503
+    
+    message = webhook_outbox.message_status(message_id)
+    if not message:
+        return jsonify({'success': False, 'message': f'Webhook message not found: {message_id}'}), 404
+    
+    return jsonify({'success': True, **message}), 200
+
+@app.route('/medication/webhook-deliveries/<delivery_id>/retry', methods=['POST'])
+def retry_webhook_delivery(delivery_id):
+    """Re-queue a dead-lettered delivery with a fresh attempt budget"""
+    if not webhook_outbox:
+        return jsonify({'success': False, 'message': 'Webhook outbox not enabled'}), 503
+    
+    if not webhook_outbox.retry(delivery_id):
+        delivery = webhook_outbox.get_delivery(delivery_id)
+        if not delivery:
+            return jsonify({'success': False, 'message': f'Webhook delivery not found: {delivery_id}'}), 404
+        return jsonify({
+            'success': False,
+            'message': f"Only dead deliveries can be retried (status: {delivery['status']})"
+        }), 409
+    
+    return jsonify({
+        'success': True,
+        'message': 'Delivery re-queued',
+        'delivery': webhook_outbox.get_delivery(delivery_id)
+    }), 200
+
+@app.route('/medication/ocr-jobs/<job_id>', methods=['GET'])
+def get_ocr_job(job_id):
+    """Poll an OCR job; completed jobs include the same result as /medication/process-with-paddleocr"""
+    if not ocr_worker_pool:
+        return jsonify({'success': False, 'message': 'PaddleOCR service not available'}), 503
+    
+    job = ocr_worker_pool.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': f'OCR job not found: {job_id}'}), 404
+    
+    return jsonify({'success': True, 'job': job}), 200
+
+@app.route('/medication/ocr-jobs/<job_id>/stream', methods=['GET'])
+def stream_ocr_job(job_id):
+    """Server-sent events with the job status; the last event carries the result"""
+    if not ocr_worker_pool:
+        return jsonify({'success': False, 'message': 'PaddleOCR service not available'}), 503
+    
+    if not ocr_worker_pool.get_job(job_id, include_result=False):
+        return jsonify({'success': False, 'message': f'OCR job not found: {job_id}'}), 404
+    
+    def generate():
+        last_status = None
+        deadline = time.time() + OCR_JOB_TIMEOUT_SEC
+        while time.time() < deadline:
+            job = ocr_worker_pool.get_job(job_id)
+            if job is None:
+                break
+            if job['status'] != last_status:
+                last_status = job['status']
+                if last_status not in TERMINAL_OCR_JOB_STATUSES:
+                    job.pop('result', None)
+                yield f"event: status\ndata: {json.dumps(job, default=str)}\n\n"
+            if last_status in TERMINAL_OCR_JOB_STATUSES:
+                return
+            time.sleep(0.5)
+        yield f"event: timeout\ndata: {json.dumps({'job_id': job_id, 'status': last_status})}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
 @app.route('/medication/process-with-paddleocr', methods=['POST'])
 def process_with_paddleocr():
     """Process prescription document using medication folder's PaddleOCR service directly"""
@@ -3706,120 +4765,32 @@ def process_with_paddleocr():
                 'message': f'Unsupported file type: {file.content_type}. Supported types: {enhanced_ocr_service.allowed_types}'
             }), 400
         
-        # Read file content
-        file_content = file.read()       
-                    # Process with medication folder's enhanced OCR service
-            
+        # Stream the upload into a size-bounded spool instead of reading it into memory
         try:
-            # Create event loop for async OCR service
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            ocr_result = loop.run_until_complete(
-                enhanced_ocr_service.process_file(
-                    file_content=file_content,
-                    filename=file.filename
-                )
+            upload = spool_request_file(file)
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'message': str(e)}), 413
+        
+        try:
+            # Process with medication folder's enhanced OCR service in the OCR worker pool;
+            # identical documents are answered from the OCR result cache (single-flighted)
+            ocr_result, ocr_cache_hit = ocr_result_cache.get_or_compute(
+                None, ENHANCED_OCR_CACHE_NAMESPACE,
+                lambda: ocr_worker_pool.process(upload.path, file.filename, timeout=OCR_JOB_TIMEOUT_SEC),
+                digest=upload.digest
             )
             
-            loop.close()
-            
-            print("✅ Medication folder OCR processing successful")
+            print(f"✅ Medication folder OCR processing successful (cache hit: {ocr_cache_hit})")
             print(f"🔍 Debug - OCR result keys: {list(ocr_result.keys())}")
-            print(f"🔍 Debug - OCR result success: {ocr_result.get('success')}")
             
-            # Extract full text content in the format expected by medication folder
-            if ocr_result.get('success'):
-                # Get the full text content from the medication folder service
-                full_text_content = ocr_result.get('full_content', '')
-                print(f"🔍 Debug - full_content from OCR: '{full_text_content}'")
-                print(f"🔍 Debug - full_content length: {len(full_text_content)}")
-                
-                # If full_content is not available, extract from results
-                if not full_text_content and ocr_result.get('results'):
-                    print(f"🔍 Debug - Extracting from results: {len(ocr_result['results'])} results")
-                    # Extract all text from results and combine them
-                    extracted_texts = []
-                    for result in ocr_result['results']:
-                        text = result.get('text', '').strip()
-                        if text:  # Only add non-empty text
-                            extracted_texts.append(text)
-                    
-                    # Combine all extracted text into one continuous string
-                    full_text_content = ' '.join(extracted_texts)
-                    print(f"🔍 Debug - Combined text from results: '{full_text_content}'")
-                    
-                    # If still no content, try alternative fields
-                    if not full_text_content:
-                        full_text_content = ocr_result.get('extracted_text', '')
-                        print(f"🔍 Debug - Trying extracted_text: '{full_text_content}'")
-                    
-                    # If still no content, try the raw text field
-                    if not full_text_content:
-                        full_text_content = ocr_result.get('text', '')
-                        print(f"🔍 Debug - Trying text field: '{full_text_content}'")
-                
-                # If we still don't have content, create a fallback
-                if not full_text_content:
-                    full_text_content = "No text could be extracted from the document"
-                    print(f"🔍 Debug - Using fallback text")
-                
-                # Update OCR result with full text content
-                ocr_result['full_text_content'] = full_text_content
-                ocr_result['extracted_text'] = full_text_content  # For backward compatibility
-                print(f"🔍 Debug - Final full_text_content: '{full_text_content}'")
-                print(f"🔍 Debug - Final full_text_content length: {len(full_text_content)}")
-            else:
-                print(f"🔍 Debug - OCR processing failed: {ocr_result.get('error', 'Unknown error')}")
-            
-            # Send results to webhook if processing was successful
-            webhook_results = []
-            if ocr_result.get("success") and webhook_service and webhook_service.is_configured():
-                try:
-                    print("🚀 Sending OCR results to webhook using medication folder service...")
-                    
-                    # Create new event loop for webhook service
-                    webhook_loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(webhook_loop)
-                    
-                    webhook_results = webhook_loop.run_until_complete(
-                        webhook_service.send_ocr_result(ocr_result, file.filename)
-                    )
-                    
-                    webhook_loop.close()
-                    
-                    # Log webhook delivery status
-                    for webhook_result in webhook_results:
-                        if webhook_result["success"]:
-                            print(f"✅ Webhook sent successfully to {webhook_result['config_name']} ({webhook_result['url']})")
-                        else:
-                            print(f"❌ Webhook failed for {webhook_result['config_name']}: {webhook_result.get('error', 'Unknown error')}")
-                    
-                except Exception as e:
-                    print(f"❌ Error sending webhook: {e}")
+            final_response = finalize_paddleocr_result(ocr_result, file.filename, cache_hit=ocr_cache_hit)
             
-            # Return comprehensive result with full text content
-            final_response = {
-                'success': True,
-                'message': 'Document processed successfully with medication folder OCR service',
-                'filename': file.filename,
-                'ocr_result': ocr_result,
-                'full_text_content': ocr_result.get('full_text_content', ''),
-                'webhook_delivery': {
-                    'status': 'completed' if webhook_results else 'not_configured',
-                    'results': webhook_results,
-                    'timestamp': datetime.now().isoformat()
-                },
-                'service_used': 'Medication Folder Enhanced OCR',
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            print(f"🔍 Debug - Final response full_text_content: '{final_response['full_text_content']}'")
             print(f"🔍 Debug - Final response full_text_content length: {len(final_response['full_text_content'])}")
-            print(f"🔍 Debug - Final response keys: {list(final_response.keys())}")
             
             return jsonify(final_response), 200
         
+        except OCRQueueFullError as e:
+            return jsonify({'success': False, 'message': str(e)}), 429, {'Retry-After': '5'}
         except Exception as e:
             print(f"❌ PaddleOCR processing error: {e}")
             return jsonify({
@@ -3838,67 +4809,67 @@ def process_prescription_text():
         print("🔍 Processing prescription text for structured extraction...")
         
         data = request.get_json()
-        if not data or 'text' not in data:
+        if not data or ('text' not in data and 'texts' not in data):
             return jsonify({'success': False, 'message': 'Text content is required'}), 400
         
-        prescription_text = data['text']
         patient_id = data.get('patient_id', '')
         
+        # Batch of texts: one parse result per text, in order
+        if 'texts' in data:
+            texts = data['texts']
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                return jsonify({'success': False, 'message': 'texts must be a list of strings'}), 400
+            
+            start = time.perf_counter()
+            parsed_results = parse_prescriptions(texts)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"✅ Parsed {len(texts)} prescription texts in {elapsed_ms:.2f} ms")
+            
+            return jsonify({
+                'success': True,
+                'message': f'{len(texts)} prescription texts processed successfully',
+                'results': [
+                    {
+                        'extracted_info': to_extracted_info(parsed, text.strip()),
+                        'medications': parsed['medications'],
+                        'confidence': parsed['confidence'],
+                        'needs_review': needs_remote_parse(parsed)
+                    }
+                    for text, parsed in zip(texts, parsed_results)
+                ],
+                'processing_details': {
+                    'method': 'prescription_parser',
+                    'total_texts': len(texts),
+                    'processing_time_ms': round(elapsed_ms, 3)
+                }
+            }), 200
+        
+        prescription_text = data['text']
+        
         print(f"🔍 Processing text for patient: {patient_id}")
         print(f"🔍 Text length: {len(prescription_text)} characters")
         
         # Basic text processing and cleaning
         cleaned_text = prescription_text.strip()
         
-        # Extract potential medication information using simple patterns
-        # This is a basic implementation - in production, you'd use more sophisticated NLP
-        extracted_info = {
-            'medication_name': '',
-            'dosage': '',
-            'frequency': '',
-            'duration': '',
-            'instructions': '',
-            'prescribed_by': '',
-            'raw_text': cleaned_text
-        }
-        
-        # Simple pattern matching for common prescription formats
-        lines = cleaned_text.split('\n')
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # Look for medication name patterns
-            if any(keyword in line.lower() for keyword in ['tablet', 'capsule', 'syrup', 'injection', 'mg', 'ml']):
-                if not extracted_info['medication_name']:
-                    extracted_info['medication_name'] = line
-            
-            # Look for dosage patterns
-            elif any(keyword in line.lower() for keyword in ['mg', 'ml', 'tablet', 'capsule', 'dose']):
-                if not extracted_info['dosage']:
-                    extracted_info['dosage'] = line
-            
-            # Look for frequency patterns
-            elif any(keyword in line.lower() for keyword in ['daily', 'twice', 'three times', 'every', 'hour']):
-                if not extracted_info['frequency']:
-                    extracted_info['frequency'] = line
-            
-            # Look for duration patterns
-            elif any(keyword in line.lower() for keyword in ['days', 'weeks', 'months', 'until', 'course']):
-                if not extracted_info['duration']:
-                    extracted_info['duration'] = line
+        # Compiled grammars for dose, frequency, duration and route plus drug dictionary lookup
+        parsed = parse_prescription(cleaned_text)
+        extracted_info = to_extracted_info(parsed, cleaned_text)
+        extracted_info['medications'] = parsed['medications']
         
-        print(f"✅ Successfully processed prescription text")
+        print(f"✅ Successfully processed prescription text ({len(parsed['medications'])} medications, {parsed['parse_time_ms']} ms)")
         
         return jsonify({
             'success': True,
             'message': 'Prescription text processed successfully',
             'extracted_info': extracted_info,
             'processing_details': {
-                'method': 'text_analysis',
-                'confidence': 0.7,  # Basic pattern matching confidence
-                'total_lines_processed': len(lines)
+                'method': 'prescription_parser',
+                'confidence': parsed['confidence'],
+                'field_confidence': parsed['medications'][0]['field_confidence'] if parsed['medications'] else {},
+                'needs_review': needs_remote_parse(parsed),
+                'total_lines_processed': len(cleaned_text.split('\n')),
+                'processing_time_ms': parsed['parse_time_ms']
             }
         }), 200
         
@@ -3943,22 +4914,41 @@ def process_with_mock_n8n():
             }
         }
 
+        # Most prescriptions are answered by the local parser without an N8N round trip
+        local_parse = parse_prescription(extracted_text)
+        answered_locally = PRESCRIPTION_LOCAL_FIRST and not data.get('force_n8n') and not needs_remote_parse(local_parse)
+        
         # Use proper webhook service if available, otherwise fallback to mock
-        if webhook_service and webhook_service.is_configured():
+        if answered_locally:
+            print(f"⚡ Prescription parsed locally in {local_parse['parse_time_ms']} ms, skipping N8N")
+            n8n_result = mock_n8n_service.process_prescription_webhook({
+                'patient_id': patient_id,
+                'medication_name': medication_name,
+                'extracted_text': extracted_text,
+                'filename': filename,
+                'parsed': local_parse
+            })
+        elif webhook_outbox and webhook_outbox.is_configured():
+            # Acknowledge immediately; the outbox dispatcher delivers to N8N in the background
+            queued = webhook_outbox.enqueue(build_ocr_payload(ocr_data, filename, {
+                'patient_id': patient_id,
+                'medication_name': medication_name
+            }))
+            print(f"📬 Prescription queued for N8N webhook delivery ({queued['message_id']})")
+            n8n_result = {
+                'success': True,
+                'message': 'Prescription queued for N8N webhook delivery',
+                'message_id': queued['message_id'],
+                'delivery_status': queued['status'],
+                'status_url': f"/medication/webhook-deliveries/{queued['message_id']}",
+                'timestamp': datetime.now().isoformat()
+            }
+        elif webhook_service and webhook_service.is_configured():
             print("🚀 Using proper webhook service to send to N8N...")
             
-            # Send to N8N webhook using the proper service
-            import asyncio
+            # Send to N8N webhook using the proper service (on the shared event loop)
             try:
-                # Create event loop for async webhook service
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                webhook_results = loop.run_until_complete(
-                    webhook_service.send_ocr_result(ocr_data, filename)
-                )
-                
-                loop.close()
+                webhook_results = run_async(webhook_service.send_ocr_result(ocr_data, filename))
                 
                 # Check webhook results
                 n8n_success = any(result.get('success', False) for result in webhook_results)
@@ -4009,6 +4999,7 @@ def process_with_mock_n8n():
                 'total_pages': 1
             },
             'n8n_result': n8n_result,
+            'answered_locally': answered_locally,
             'webhook_data': {
                 'patient_id': patient_id,
                 'medication_name': medication_name,
@@ -4029,7 +5020,8 @@ def process_with_n8n_webhook():
     try:
         print("🚀 Processing prescription with N8N webhook using medication folder service...")
         
-        if not webhook_service or not webhook_service.is_configured():
+        use_outbox = bool(webhook_outbox and webhook_outbox.is_configured())
+        if not use_outbox and (not webhook_service or not webhook_service.is_configured()):
             return jsonify({
                 'success': False,
                 'message': 'Webhook service not available or not configured'
@@ -4067,18 +5059,35 @@ def process_with_n8n_webhook():
             }
         }
 
-        # Send to N8N webhook using the medication folder's webhook service
-        import asyncio
+        webhook_data = {
+            'patient_id': patient_id,
+            'medication_name': medication_name,
+            'filename': filename,
+            'extracted_text': extracted_text,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        # Persist in the outbox and return; delivery and retries happen in the background
+        if use_outbox:
+            queued = webhook_outbox.enqueue(build_ocr_payload(ocr_data, filename, {
+                'patient_id': patient_id,
+                'medication_name': medication_name
+            }))
+            print(f"📬 Prescription queued for N8N webhook delivery ({queued['message_id']})")
+            return jsonify({
+                'success': True,
+                'message': 'Prescription queued for N8N webhook delivery',
+                'message_id': queued['message_id'],
+                'delivery': queued,
+                'status_url': f"/medication/webhook-deliveries/{queued['message_id']}",
+                'ocr_data': ocr_data,
+                'webhook_data': webhook_data,
+                'timestamp': datetime.now().isoformat()
+            }), 202
+        
+        # Send to N8N webhook using the medication folder's webhook service (on the shared event loop)
         try:
-            # Create event loop for async webhook service
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            webhook_results = loop.run_until_complete(
-                webhook_service.send_ocr_result(ocr_data, filename)
-            )
-            
-            loop.close()
+            webhook_results = run_async(webhook_service.send_ocr_result(ocr_data, filename))
             
             # Check webhook results
             n8n_success = any(result.get('success', False) for result in webhook_results)
@@ -4128,12 +5137,123 @@ def quantum_health_check():
         'success': True,
         'qdrant_available': QDRANT_AVAILABLE,
         'qdrant_connected': quantum_service.client is not None,
-        'embedding_model_available': SENTENCE_TRANSFORMERS_AVAILABLE,
+        'embedding_model_available': SENTENCE_TRANSFORMERS_AVAILABLE or ONNXRUNTIME_AVAILABLE,
         'embedding_model_loaded': quantum_service.embedding_model is not None,
+        'embedding_backend': quantum_service.embedding_backend,
+        'embedding_parity': quantum_service.parity_report,
+        'embedding_model': quantum_service.embedding_model_name,
         'collection_status': quantum_service.ensure_collection(),
+        'collection_alias': QDRANT_COLLECTION,
+        'alias_target': resolve_alias(quantum_service.client, QDRANT_COLLECTION) if quantum_service.client else None,
+        'reindex_status': reindex_job.get_status()['status'] if reindex_job else None,
         'timestamp': datetime.now().isoformat()
     })
 
+def on_reindex_swapped(job):
+    """Serve queries with the new model once the alias points at the new collection"""
+    quantum_service.adopt_embedding_backend(job.embedding_backend, job.state['embedding_model'], job.vector_size)
+    semantic_cache.clear()
+
+@app.route('/quantum/reindex', methods=['POST'])
+def start_reindex():
+    """Re-embed the knowledge base into a shadow collection and swap the alias when verified"""
+    global reindex_job
+    
+    if not quantum_service.client or not quantum_service.embedding_model:
+        return jsonify({
+            'success': False,
+            'message': 'Quantum vector service not available'
+        }), 503
+    
+    if reindex_job is not None and reindex_job.is_running():
+        return jsonify({
+            'success': False,
+            'message': 'A reindex job is already running',
+            'status': reindex_job.get_status()
+        }), 409
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        model_name = data.get('embedding_model', EMBEDDING_MODEL)
+        backend_name = data.get('embedding_backend', EMBEDDING_BACKEND)
+        
+        quantum_service.ensure_collection()
+        
+        new_backend = create_embedding_backend(backend_name, model_name)
+        reindex_job = VectorReindexJob(
+            client=quantum_service.client,
+            alias=QDRANT_COLLECTION,
+            embedding_backend=new_backend,
+            model_name=model_name,
+            reference_backend=quantum_service.embedding_model,
+            vector_size=data.get('vector_size'),
+            batch_size=int(data.get('batch_size', REINDEX_BATCH_SIZE)),
+            verify_queries=EMBEDDING_PARITY_TEXTS,
+            auto_swap=bool(data.get('auto_swap', True)),
+            on_swap=on_reindex_swapped,
+        )
+        reindex_job.start(resume=bool(data.get('resume', True)))
+        
+        return jsonify({
+            'success': True,
+            'message': f'Reindex started with {model_name}',
+            'status': reindex_job.get_status(),
+            'timestamp': datetime.now().isoformat()
+        }), 202
+        
+    except Exception as e:
+        print(f"Error starting reindex: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@app.route('/quantum/reindex/status', methods=['GET'])
+def reindex_status():
+    """Progress of the current (or last) reindex job"""
+    if reindex_job is None:
+        return jsonify({
+            'success': True,
+            'status': None,
+            'message': 'No reindex job has been started',
+            'alias_target': resolve_alias(quantum_service.client, QDRANT_COLLECTION) if quantum_service.client else None
+        }), 200
+    
+    return jsonify({
+        'success': True,
+        'status': reindex_job.get_status(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@app.route('/quantum/reindex/swap', methods=['POST'])
+def reindex_swap():
+    """Swap the alias manually (e.g. auto_swap=false, or force after a recall check below threshold)"""
+    if reindex_job is None:
+        return jsonify({
+            'success': False,
+            'message': 'No reindex job has been started'
+        }), 404
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        reindex_job.swap_alias(force=bool(data.get('force', False)))
+        return jsonify({
+            'success': True,
+            'message': f"Alias {QDRANT_COLLECTION} now points at {reindex_job.state['target_collection']}",
+            'status': reindex_job.get_status()
+        }), 200
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 409
+    except Exception as e:
+        print(f"Error swapping reindex alias: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
 @app.route('/quantum/collections', methods=['GET'])
 def quantum_collections():
     """Get Qdrant collections information"""
@@ -4195,6 +5315,18 @@ def llm_health_check():
         'openai_configured': bool(OPENAI_API_KEY),
         'llm_client_connected': llm_service.client is not None,
         'model': LLM_MODEL,
+        'base_url': OPENAI_BASE_URL or 'https://api.openai.com/v1',
+        'timeouts': llm_service.registry.timeouts,
+        'max_retries': llm_service.registry.max_retries,
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/llm/metrics', methods=['GET'])
+def llm_metrics():
+    """Per-model latency and token counters for all OpenAI calls"""
+    return jsonify({
+        'success': True,
+        'metrics': llm_service.registry.get_metrics(),
         'timestamp': datetime.now().isoformat()
     })
 
@@ -4211,7 +5343,8 @@ def llm_test():
                 'message': 'LLM service not available'
             }), 503
         
-        response = llm_service.client.chat.completions.create(
+        response = llm_service.registry.chat_completion(
+            "test",
             model=LLM_MODEL,
             messages=[
                 {"role": "system", "content": "You are a helpful assistant. Respond briefly."},
@@ -4299,6 +5432,16 @@ def add_knowledge():
             points=[point]
         )
         
+        # Keep an in-flight reindex shadow collection up to date
+        if reindex_job is not None:
+            try:
+                reindex_job.mirror_upsert(point.id, point.payload)
+            except Exception as e:
+                print(f"⚠️ Could not mirror knowledge into reindex collection: {e}")
+        
+        # Cached answers were built from the old knowledge base
+        semantic_cache.clear()
+        
         return jsonify({
             'success': True,
             'message': 'Knowledge document added successfully',
@@ -4516,7 +5659,11 @@ def test_file_upload():
         print(f"🔍 File: {file.filename}")
         print(f"🔍 Patient ID: {patient_id}")
         print(f"🔍 Medication: {medication_name}")
-        print(f"🔍 File size: {len(file.read())} bytes")
+        try:
+            upload = spool_request_file(file)
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'message': str(e), 'test_type': 'file_upload_test'}), 413
+        print(f"🔍 File size: {upload.size} bytes")
         
         return jsonify({
             'success': True,
@@ -4949,6 +6096,9 @@ def save_tablet_tracking():
         )
         
         if result.modified_count > 0:
+            sync_dose_schedule_taken(patient)
+            if str(tablet_taken_today).strip().lower() not in ('false', 'no', '0'):
+                record_tablet_taken(patient_id, tablet_name, date_taken or timestamp)
             print(f"✅ Tablet tracking saved successfully in medication_daily_tracking array for patient: {patient_id}")
             return jsonify({
                 'success': True,
@@ -5013,6 +6163,28 @@ def send_medication_reminders():
         print(f"Error sending medication reminders: {e}")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+@app.route('/medication/reminder-scheduler/stats', methods=['GET'])
+def reminder_scheduler_stats():
+    """Reminder scheduler statistics (queued reminders, next fire time, fired/skipped counts)"""
+    if reminder_scheduler is None:
+        return jsonify({'success': False, 'message': 'Reminder scheduler not available'}), 503
+    return jsonify({
+        'success': True,
+        'scheduler': reminder_scheduler.get_stats(),
+        'lease': reminder_lease.holder(),
+        'scheduled_dosages': reminder_schedule.count(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@app.route('/email/delivery-stats', methods=['GET'])
+def email_delivery_stats():
+    """Email queue statistics (pending, sent, failed, dropped, SMTP connections opened)"""
+    return jsonify({
+        'success': True,
+        'email_delivery': email_delivery.stats(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
 @app.route('/medication/test-reminder/<patient_id>', methods=['POST'])
 def test_medication_reminder(patient_id):
     """Test medication reminder email for a specific patient"""
@@ -5122,30 +6294,92 @@ else:
     webhook_config_service = None
     print("⚠️ Using fallback services (PaddleOCR not available)")
 
+# Content-addressed OCR result cache (disk or Mongo, see OCR_CACHE_BACKEND)
+ocr_result_cache = create_ocr_result_cache(
+    mongo_database=db.patients_collection.database if db.patients_collection is not None else None
+)
+
+# OCR worker pool: workers load EnhancedOCRService once and serve every OCR request;
+# images are pre-processed in the workers (see OCR_PREPROCESS_* settings)
+ocr_worker_pool = OCRWorkerPool(extra_paths=[medication_path]) if enhanced_ocr_service else None
+if ocr_service:
+    # Scanned PDF pages are OCR'd in the same worker pool
+    ocr_service.page_ocr_pool = ocr_worker_pool
+
+# Results from different pre-processing settings are cached separately
+ENHANCED_OCR_CACHE_NAMESPACE = ocr_cache_namespace("enhanced")
+
+def outbox_webhook_endpoints():
+    """Enabled webhook configs, from the medication folder's config service when it is loaded"""
+    if webhook_config_service:
+        try:
+            return [
+                {
+                    'id': config.id,
+                    'name': config.name,
+                    'url': config.url,
+                    'method': str(getattr(getattr(config, 'method', 'POST'), 'value', getattr(config, 'method', 'POST'))),
+                    'headers': getattr(config, 'headers', None) or {},
+                    'timeout': getattr(config, 'timeout', None)
+                } for config in webhook_config_service.get_all_configs() if config.enabled
+            ]
+        except Exception as e:
+            print(f"⚠️ Could not read webhook configs from the config service: {e}")
+    return load_webhook_endpoints()
+
+# Durable webhook outbox: requests enqueue, a background dispatcher delivers with retries
+webhook_outbox = create_webhook_outbox(outbox_webhook_endpoints)
+
+# Async services run on one shared event loop; their HTTP sessions are closed on shutdown
+if webhook_service:
+    async_loop.register_cleanup(close_http_sessions(webhook_service))
+
 # ==================== MEDICATION REMINDER SCHEDULER ====================
 import threading
 import time
 
+# One row per enabled dosage with a precomputed next_fire_at (see medication_reminder_service).
+# The ledger lets each dose be emailed once; the lease lets one process at a time fire reminders.
+if db.patients_collection is not None:
+    reminder_db = db.patients_collection.database
+    reminder_schedule = ReminderScheduleStore(reminder_db[REMINDER_SCHEDULE_COLLECTION])
+    reminder_ledger = ReminderLedger(reminder_db[REMINDER_LEDGER_COLLECTION])
+    reminder_lease = SchedulerLease(reminder_db[SCHEDULER_LEASE_COLLECTION], "medication_reminders")
+    try:
+        reminder_schedule.ensure_indexes()
+        reminder_ledger.ensure_indexes()
+    except Exception as e:
+        print(f"⚠️ Reminder schedule index creation failed: {e}")
+    reminder_scheduler = MedicationReminderScheduler(
+        reminder_schedule, send_scheduled_medication_reminder, ledger=reminder_ledger, lease=reminder_lease
+    )
+else:
+    reminder_schedule = None
+    reminder_ledger = None
+    reminder_lease = None
+    reminder_scheduler = None
+
 def medication_reminder_scheduler():
-    """Background scheduler for medication reminders"""
-    while True:
-        try:
-            print("⏰ Medication reminder scheduler running...")
-            check_and_send_medication_reminders()
-            
-            # Wait for 15 minutes before next check
-            time.sleep(15 * 60)  # 15 minutes in seconds
-            
-        except Exception as e:
-            print(f"❌ Error in medication reminder scheduler: {e}")
-            # Wait 5 minutes before retrying on error
-            time.sleep(5 * 60)
+    """Backfill the reminder schedule on first run, then fire reminders from the in-memory heap while holding the lease"""
+    if reminder_schedule.count() == 0:
+        print("⏰ Building reminder schedule from existing medication logs...")
+        patients = db.patients_collection.find(
+            {"medication_logs.dosages.reminder_enabled": True}, {"patient_id": 1, "medication_logs": 1}
+        )
+        print(f"✅ Reminder schedule built: {reminder_schedule.rebuild(patients)} enabled dosages")
+    
+    print(f"⏰ Medication reminder scheduler running as {reminder_lease.owner} (fires while holding the lease)")
+    return reminder_scheduler.start()
 
 def start_medication_reminder_scheduler():
     """Start the medication reminder scheduler in a background thread"""
     try:
-        scheduler_thread = threading.Thread(target=medication_reminder_scheduler, daemon=True)
-        scheduler_thread.start()
+        if reminder_scheduler is None:
+            print("⚠️ Medication reminder scheduler not started (database not connected)")
+            return None
+        scheduler_thread = medication_reminder_scheduler()
+        # Hand the lease over on shutdown instead of making standbys wait for it to expire
+        atexit.register(reminder_scheduler.stop)
         print("✅ Medication reminder scheduler started successfully")
         return scheduler_thread
     except Exception as e:
@@ -5154,6 +6388,62 @@ def start_medication_reminder_scheduler():
 
 # ==================== NUTRITION BACKEND INTEGRATION ====================
 
+# GPT-4 food analyses shared across patients (memory LRU + Mongo/disk, see NUTRITION_CACHE_BACKEND)
+nutrition_cache = create_nutrition_cache(
+    mongo_database=db.patients_collection.database if db.patients_collection is not None else None
+)
+
+# Daily nutrition totals per patient, updated on every food_data write (see nutrition_rollup_service)
+if db.patients_collection is not None:
+    nutrition_rollups = NutritionRollupStore(db.patients_collection.database[NUTRITION_ROLLUP_COLLECTION])
+    try:
+        nutrition_rollups.ensure_indexes()
+    except Exception as e:
+        print(f"⚠️ Nutrition rollup index creation failed: {e}")
+else:
+    nutrition_rollups = None
+
+def record_food_rollup(user_id, food_entry):
+    """Add a saved food_data entry to the patient's daily rollup"""
+    if nutrition_rollups is None:
+        return
+    try:
+        nutrition_rollups.record_entry(user_id, food_entry)
+    except Exception as e:
+        print(f"⚠️ Could not update nutrition rollup for {user_id}: {e}")
+
+def load_patient_food_data(user_id):
+    return db.patients_collection.find_one({"patient_id": user_id}, {"patient_id": 1, "food_data": 1})
+
+def save_food_analysis_ref(user_id, food_input, cache_key, analysis_data, pregnancy_week):
+    """Append a gpt4_analysis entry to food_data holding the archived analysis reference, or the analysis itself"""
+    if not user_id:
+        return
+    try:
+        food_entry = {
+            'type': 'gpt4_analysis',
+            'food_input': food_input,
+            'analysis_ref': cache_key,
+            'nutritional_breakdown': analysis_data.get('nutritional_breakdown', {}),
+            'pregnancy_week': pregnancy_week,
+            'timestamp': datetime.now().isoformat(),
+            'created_at': datetime.now()
+        }
+        # The reference is only stored once the analysis is in the durable archive
+        if not nutrition_cache.pin(cache_key, analysis_data):
+            food_entry['analysis'] = analysis_data
+        result = db.patients_collection.update_one(
+            {"patient_id": user_id},
+            {"$push": {"food_data": food_entry}}
+        )
+        if result.matched_count:
+            # Not rolled up: the client saves the meal through save-food-entry, which is counted
+            print(f"✅ GPT-4 analysis saved to database for user: {user_id}")
+        else:
+            print(f"⚠️ Patient not found for user ID: {user_id}")
+    except Exception as e:
+        print(f"⚠️ Could not save to database: {e}")
+
 @app.route('/nutrition/health', methods=['GET'])
 def nutrition_health_check():
     """Nutrition service health check endpoint"""
@@ -5164,90 +6454,104 @@ def nutrition_health_check():
         'database_connected': db.patients_collection is not None
     })
 
+# Speech-to-text backends: remote Whisper API and local faster-whisper (TRANSCRIPTION_BACKEND, or 'backend' per request)
+transcription_router = create_transcription_router(get_openai_registry())
+if LOCAL_WHISPER_PRELOAD:
+    threading.Thread(target=transcription_router.warm_up, name="whisper-preload", daemon=True).start()
+
+def whisper_transcribe(path, language=None, backend=None):
+    """Transcribe an audio file on disk ('auto' detects the language); falls back between backends"""
+    return transcription_router.transcribe(path, language, backend=backend)
+
+# Chunked uploads for long recordings; segment chunks are transcribed (stream chunks transcoded) while
+# the rest uploads. Sessions live in this process: pin session requests to one worker when scaling out
+audio_sessions = AudioSessionManager(whisper_transcribe)
+atexit.register(audio_sessions.shutdown)
+
+def tamil_translation_note(transcription, language):
+    if language == 'auto' and transcription:
+        # Simple Tamil detection (you can enhance this)
+        tamil_keywords = ['நான்', 'நீங்கள்', 'உணவு', 'குடிக்க', 'சாப்பிட', 'வீடு', 'பள்ளி']
+        if any(keyword in transcription for keyword in tamil_keywords):
+            return "Tamil detected - consider translation"
+    return ""
+
+def whisper_unavailable_response(backend=None):
+    """Error response when no transcription backend can serve the request, None when one can"""
+    try:
+        if transcription_router.available(backend):
+            return None
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if not OPENAI_AVAILABLE:
+        message = 'OpenAI package not installed. Run: pip install openai'
+    else:
+        message = 'OpenAI API key not configured'
+    return jsonify({
+        'success': False,
+        'message': f'{message} (or pip install faster-whisper for local transcription)'
+    }), 500
+
 @app.route('/nutrition/transcribe', methods=['POST'])
 def transcribe_audio():
     """Transcribe audio using Whisper AI with Tamil language support"""
     try:
         print("🎤 Transcription request received")
         
-        # Get OpenAI API key
-        openai_api_key = os.getenv('OPENAI_API_KEY')
-        if not openai_api_key:
-            return jsonify({
-                'success': False,
-                'message': 'OpenAI API key not configured'
-            }), 500
-        
+        # Audio arrives as a raw audio/* body, a multipart 'audio' file or, for older
+        # clients, base64 in a JSON body; each is spooled in chunks, never held whole
         try:
-            from openai import OpenAI
-        except ImportError:
-            return jsonify({
-                'success': False,
-                'message': 'OpenAI package not installed. Run: pip install openai'
-            }), 500
-        
-        # Initialize OpenAI client
-        client = OpenAI(api_key=openai_api_key)
-        
-        data = request.get_json()
-        if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No data provided'
-            }), 400
-        
-        audio_data = data.get('audio')
-        language = data.get('language', 'auto')  # Default to auto-detect
-        method = data.get('method', 'whisper')
-        
-        if not audio_data:
+            upload, options = read_audio_request(request, max_bytes=AUDIO_UPLOAD_MAX_BYTES)
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'message': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        g.setdefault('spooled_uploads', []).append(upload)
+        
+        language = options.get('language', 'auto')  # Default to auto-detect
+        method = options.get('method', 'whisper')
+        backend = options.get('backend')
+        
+        unavailable = whisper_unavailable_response(backend)
+        if unavailable:
+            return unavailable
+        
+        if upload.size == 0:
             return jsonify({
                 'success': False,
                 'message': 'Audio data is required'
             }), 400
         
-        print(f"🔍 Processing audio with method: {method}, language: {language}")
+        print(f"🔍 Processing audio with method: {method}, language: {language}, size: {upload.size} bytes")
         
         try:
-            # Decode base64 audio data
-            audio_bytes = base64.b64decode(audio_data)
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                temp_file.write(audio_bytes)
-                temp_file_path = temp_file.name
-            
-            # Transcribe with Whisper
-            with open(temp_file_path, 'rb') as audio_file:
-                response = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language=language if language != 'auto' else None
-                )
-            
-            transcription = response.text.strip()
-            
-            # Clean up temporary file
-            os.unlink(temp_file_path)
-            
-            # Language detection and translation logic
-            translation_note = ""
-            if language == 'auto' and transcription:
-                # Simple Tamil detection (you can enhance this)
-                tamil_keywords = ['நான்', 'நீங்கள்', 'உணவு', 'குடிக்க', 'சாப்பிட', 'வீடு', 'பள்ளி']
-                detected_tamil = any(keyword in transcription for keyword in tamil_keywords)
-                
-                if detected_tamil:
-                    translation_note = "Tamil detected - consider translation"
+            # Transcoded to 16 kHz mono Opus first when that makes the upload to Whisper smaller
+            result = transcribe_upload(
+                upload,
+                lambda path, language: whisper_transcribe(path, language, backend=backend),
+                language,
+                options.get('transcode')
+            )
+            transcription = result['text']
             
-            print(f"✅ Transcription successful: {transcription[:50]}...")
+            print(f"✅ Transcription successful ({result['backend']}, {result['latency_ms']} ms): "
+                  f"{transcription[:50]}... ({result['bytes_received']} -> {result['bytes_sent']} bytes)")
             
             return jsonify({
                 'success': True,
                 'transcription': transcription,
                 'language': language,
                 'method': method,
-                'translation_note': translation_note,
+                'translation_note': tamil_translation_note(transcription, language),
+                'backend': result['backend'],
+                'detected_language': result.get('language'),
+                'latency_ms': result['latency_ms'],
+                'fallback_from': result['fallback_from'],
+                'audio': {
+                    'bytes_received': result['bytes_received'],
+                    'bytes_sent': result['bytes_sent'],
+                    'transcoded': result['transcoded']
+                },
                 'timestamp': datetime.now().isoformat()
             }), 200
             
@@ -5265,6 +6569,108 @@ def transcribe_audio():
             'message': f'Error: {str(e)}'
         }), 500
 
+@app.route('/nutrition/transcribe/sessions', methods=['POST'])
+def create_transcription_session():
+    """Start a chunked upload: mode 'segments' (each chunk a complete recording) or 'stream' (byte ranges)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        unavailable = whisper_unavailable_response(data.get('backend'))
+        if unavailable:
+            return unavailable
+        
+        session = audio_sessions.create(
+            mode=data.get('mode', 'segments'),
+            language=data.get('language', 'auto'),
+            filename=data.get('filename', ''),
+            transcode=data.get('transcode'),
+            backend=data.get('backend')
+        )
+        print(f"🎤 Transcription session {session.id} started ({session.mode})")
+        return jsonify({'success': True, **session.info()}), 201
+    
+    except AudioSessionError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    except Exception as e:
+        print(f"❌ Error starting transcription session: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@app.route('/nutrition/transcribe/sessions/<session_id>/chunks/<int:index>', methods=['PUT'])
+def upload_transcription_chunk(session_id, index):
+    """Upload chunk `index` as the raw request body (or a multipart 'audio' file); retries are idempotent"""
+    try:
+        if 'audio' in request.files:
+            storage = request.files['audio']
+            stream, filename, content_type = storage.stream, storage.filename, storage.mimetype
+        else:
+            stream, content_type = request.stream, request.mimetype
+            filename = request.headers.get('X-Audio-Filename', '')
+        
+        result = audio_sessions.add_chunk(session_id, index, stream, filename=filename, content_type=content_type)
+        return jsonify({'success': True, 'index': index, **result}), 200
+    
+    except AudioSessionError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    except UploadTooLargeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 413
+    except Exception as e:
+        print(f"❌ Error receiving audio chunk {index} for {session_id}: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@app.route('/nutrition/transcribe/sessions/<session_id>/complete', methods=['POST'])
+def complete_transcription_session(session_id):
+    """Finish a chunked upload and return the transcription of all chunks in order"""
+    try:
+        session = audio_sessions.get(session_id)
+        language = session.language
+        result = audio_sessions.complete(session_id)
+        transcription = result.pop('text')
+        
+        print(f"✅ Session {session_id} transcribed: {result['chunks']} chunks, "
+              f"{result['bytes_received']} -> {result['bytes_sent']} bytes")
+        
+        return jsonify({
+            'success': True,
+            'transcription': transcription,
+            'language': language,
+            'method': 'whisper',
+            'translation_note': tamil_translation_note(transcription, language),
+            'audio': result,
+            'timestamp': datetime.now().isoformat()
+        }), 200
+    
+    except AudioSessionError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    except Exception as e:
+        print(f"❌ Transcription error for session {session_id}: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Transcription failed: {str(e)}'
+        }), 500
+
+@app.route('/nutrition/transcribe/sessions/<session_id>', methods=['DELETE'])
+def cancel_transcription_session(session_id):
+    try:
+        audio_sessions.cancel(session_id)
+        return jsonify({'success': True, 'message': 'Transcription session cancelled'}), 200
+    except AudioSessionError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+
+@app.route('/nutrition/transcribe/backends', methods=['GET'])
+def transcription_backend_stats():
+    """Available speech-to-text backends, their latency, errors and fallbacks, and chunked upload sessions"""
+    return jsonify({
+        'success': True,
+        'transcription': transcription_router.get_stats(),
+        'sessions': audio_sessions.stats(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
 @app.route('/nutrition/analyze-with-gpt4', methods=['POST'])
 def analyze_food_with_gpt4():
     """Analyze food using GPT-4"""
@@ -5288,60 +6694,42 @@ def analyze_food_with_gpt4():
                 'message': 'Food input is required'
             }), 400
         
-        # Get OpenAI API key
-        openai_api_key = os.getenv('OPENAI_API_KEY')
-        if not openai_api_key:
+        # Shared across patients: same normalized food, week bucket and prompt version
+        cache_key, food_text, weeks = analysis_key(food_input, pregnancy_week)
+        analysis_data = nutrition_cache.get_analysis(cache_key)
+        if analysis_data is not None:
+            print(f"⚡ Nutrition cache hit for: {food_text[:50]}")
+            save_food_analysis_ref(user_id, food_input, cache_key, analysis_data, pregnancy_week)
             return jsonify({
-                'success': False,
-                'message': 'OpenAI API key not configured'
-            }), 500
+                'success': True,
+                'analysis': analysis_data,
+                'analysis_ref': cache_key,
+                'cache_hit': True,
+                'food_input': food_input,
+                'pregnancy_week': pregnancy_week,
+                'timestamp': datetime.now().isoformat()
+            }), 200
         
-        try:
-            from openai import OpenAI
-        except ImportError:
+        # Shared OpenAI client (pooled connections, timeouts and retries)
+        if not OPENAI_AVAILABLE:
             return jsonify({
                 'success': False,
                 'message': 'OpenAI package not installed. Run: pip install openai'
             }), 500
         
-        # Initialize OpenAI client
-        client = OpenAI(api_key=openai_api_key)
+        openai_registry = get_openai_registry()
+        if not openai_registry.is_configured():
+            return jsonify({
+                'success': False,
+                'message': 'OpenAI API key not configured'
+            }), 500
         
         # Create GPT-4 prompt
-        prompt = f"""
-        Analyze this food item for a pregnant woman at week {pregnancy_week}:
-        
-        Food: {food_input}
-        
-        Provide a detailed analysis in JSON format with the following structure:
-        {{
-            "nutritional_breakdown": {{
-                "estimated_calories": <number>,
-                "protein_grams": <number>,
-                "carbohydrates_grams": <number>,
-                "fat_grams": <number>,
-                "fiber_grams": <number>
-            }},
-            "pregnancy_benefits": {{
-                "nutrients_for_fetal_development": ["list of specific nutrients"],
-                "benefits_for_mother": ["list of benefits"],
-                "week_specific_advice": "specific advice for week {pregnancy_week}"
-            }},
-            "safety_considerations": {{
-                "food_safety_tips": ["list of safety tips"],
-                "cooking_recommendations": ["cooking guidelines"]
-            }},
-            "smart_recommendations": {{
-                "next_meal_suggestions": ["suggestions for next meal"],
-                "hydration_tips": "water intake advice"
-            }}
-        }}
-        
-        Focus on pregnancy-specific nutrition needs.
-        """
+        prompt = build_analysis_prompt(food_input, weeks)
         
         # Call GPT-4
-        response = client.chat.completions.create(
+        response = openai_registry.chat_completion(
+            "analysis",
             model="gpt-4",
             messages=[
                 {
@@ -5367,46 +6755,18 @@ def analyze_food_with_gpt4():
                 gpt_response = gpt_response.replace('```json', '').replace('```', '').strip()
             
             analysis_data = json.loads(gpt_response)
+            nutrition_cache.put(cache_key, analysis_data, food_text, weeks)
             
-            # Save to database if user_id provided
-            if user_id:
-                try:
-                    # Find patient
-                    patient = db.patients_collection.find_one({"patient_id": user_id})
-                    if patient:
-                        # Initialize food_data array if not exists
-                        if 'food_data' not in patient:
-                            patient['food_data'] = []
-                        
-                        # Add GPT-4 analysis to food_data
-                        food_entry = {
-                            'type': 'gpt4_analysis',
-                            'food_input': food_input,
-                            'analysis': analysis_data,
-                            'pregnancy_week': pregnancy_week,
-                            'timestamp': datetime.now().isoformat(),
-                            'created_at': datetime.now()
-                        }
-                        
-                        patient['food_data'].append(food_entry)
-                        
-                        # Update patient document
-                        db.patients_collection.update_one(
-                            {"patient_id": user_id},
-                            {"$set": {"food_data": patient['food_data']}}
-                        )
-                        
-                        print(f"✅ GPT-4 analysis saved to database for user: {user_id}")
-                    else:
-                        print(f"⚠️ Patient not found for user ID: {user_id}")
-                except Exception as e:
-                    print(f"⚠️ Could not save to database: {e}")
+            # Save a reference to the shared analysis in the patient's food_data
+            save_food_analysis_ref(user_id, food_input, cache_key, analysis_data, pregnancy_week)
             
             print(f"✅ GPT-4 analysis successful for: {food_input[:50]}...")
             
             return jsonify({
                 'success': True,
                 'analysis': analysis_data,
+                'analysis_ref': cache_key,
+                'cache_hit': False,
                 'food_input': food_input,
                 'pregnancy_week': pregnancy_week,
                 'timestamp': datetime.now().isoformat()
@@ -5418,13 +6778,7 @@ def analyze_food_with_gpt4():
             
             # Fallback analysis
             fallback_analysis = {
-                "nutritional_breakdown": {
-                    "estimated_calories": 0,
-                    "protein_grams": 0,
-                    "carbohydrates_grams": 0,
-                    "fat_grams": 0,
-                    "fiber_grams": 0
-                },
+                "nutritional_breakdown": get_food_composition().analyze(food_input)['nutritional_breakdown'],
                 "pregnancy_benefits": {
                     "nutrients_for_fetal_development": ["General nutrients"],
                     "benefits_for_mother": ["General benefits"],
@@ -5457,6 +6811,115 @@ def analyze_food_with_gpt4():
             'message': f'Error: {str(e)}'
         }), 500
 
+@app.route('/nutrition/analyze-nutrition', methods=['POST'])
+def analyze_nutrition():
+    """Nutrients for a meal from the local food composition table; GPT-4 only estimates unknown items"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'success': False,
+                'message': 'No data provided'
+            }), 400
+        
+        food_input = data.get('food_input', '')
+        pregnancy_week = data.get('pregnancy_week', 1)
+        
+        if not food_input:
+            return jsonify({
+                'success': False,
+                'message': 'Food input is required'
+            }), 400
+        
+        estimate_unknown = None
+        if OPENAI_AVAILABLE and data.get('estimate_unknown', True):
+            estimate_unknown = lambda items: estimate_items_with_llm(get_openai_registry(), items)
+        meal = get_food_composition().analyze(food_input, estimate_unknown=estimate_unknown)
+        estimated_calories = meal['nutritional_breakdown']['estimated_calories']
+        
+        print(f"✅ Nutrition analysis ({meal['source']}): {len(meal['items'])} items, "
+              f"{len(meal['unknown_items'])} unknown")
+        
+        return jsonify({
+            'success': True,
+            'nutritional_breakdown': meal['nutritional_breakdown'],
+            'food_items': meal['items'],
+            'unknown_items': meal['unknown_items'],
+            'nutrition_source': meal['source'],
+            'daily_calorie_tracking': {
+                'minimum_daily_calories': 1800,
+                'recommended_daily_calories': 2200,
+                'calories_contributed': estimated_calories,
+                'percentage_of_daily_needs': round((estimated_calories / 2200) * 100, 1)
+            },
+            'remaining_calories': {
+                'calories_remaining': max(0, 2200 - estimated_calories),
+                'meals_remaining': 4,
+                'calories_per_remaining_meal': max(0, (2200 - estimated_calories) // 4)
+            },
+            'pregnancy_week': pregnancy_week,
+            'timestamp': datetime.now().isoformat()
+        }), 200
+        
+    except Exception as e:
+        print(f"❌ Error analyzing nutrition: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@app.route('/nutrition/rollups/<user_id>', methods=['GET'])
+def get_nutrition_rollups(user_id):
+    """Daily nutrition totals, averages and moving averages for a date range, from the daily rollups
+
+    Query parameters: days (default 7, ending today) or start/end (YYYY-MM-DD),
+    window (moving average days, default 7), group=day|week.
+    """
+    try:
+        if nutrition_rollups is None:
+            return jsonify({'success': False, 'message': 'Database not connected'}), 500
+        
+        group = request.args.get('group', 'day')
+        if group not in ('day', 'week'):
+            return jsonify({'success': False, 'message': 'group must be day or week'}), 400
+        try:
+            end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+            if request.args.get('start'):
+                start = date.fromisoformat(request.args['start'])
+            else:
+                start = end - timedelta(days=int(request.args.get('days', 7)) - 1)
+            window = int(request.args.get('window', NUTRITION_ROLLUP_DEFAULT_WINDOW))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'start/end must be YYYY-MM-DD, days and window numbers'}), 400
+        if start > end or window < 1:
+            return jsonify({'success': False, 'message': 'start must not be after end and window must be positive'}), 400
+        if (end - start).days + window > NUTRITION_ROLLUP_MAX_DAYS:
+            return jsonify({'success': False, 'message': f'The range plus window is limited to {NUTRITION_ROLLUP_MAX_DAYS} days'}), 400
+        
+        if not nutrition_rollups.ensure_seeded(user_id, load_patient_food_data):
+            return jsonify({'success': False, 'message': f'Patient not found with ID: {user_id}'}), 404
+        
+        report = nutrition_rollups.report(user_id, start, end, window, group)
+        print(f"✅ Nutrition rollups for {user_id} {start} - {end}: {report['totals']}")
+        
+        return jsonify({'success': True, **report}), 200
+        
+    except Exception as e:
+        print(f"❌ Error getting nutrition rollups: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@app.route('/nutrition/cache-stats', methods=['GET'])
+def nutrition_cache_stats():
+    """Hit rates and size of the shared GPT-4 food analysis cache"""
+    return jsonify({
+        'success': True,
+        'cache': nutrition_cache.get_stats(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
 @app.route('/nutrition/save-food-entry', methods=['POST'])
 def save_food_entry():
     """Save basic food entry to patient's food_data array"""
@@ -5511,10 +6974,19 @@ def save_food_entry():
             'notes': data.get('notes', ''),
             'transcribed_text': data.get('transcribed_text', ''),
             'nutritional_breakdown': data.get('nutritional_breakdown', {}),
-            'gpt4_analysis': data.get('gpt4_analysis', {}),
             'timestamp': data.get('timestamp', datetime.now().isoformat()),
             'created_at': datetime.now()
         }
+        # Entries analysed through /nutrition/analyze-with-gpt4 reference the shared, archived analysis
+        # (older clients send the full analysis back; it is matched to its cache key). Anything that
+        # cannot be archived keeps its own copy.
+        gpt4_analysis = data.get('gpt4_analysis') or {}
+        analysis_ref = data.get('analysis_ref') or nutrition_cache.find_ref(food_input, pregnancy_week, gpt4_analysis)
+        if analysis_ref and nutrition_cache.pin(analysis_ref):
+            food_entry['analysis_ref'] = analysis_ref
+        else:
+            food_entry['gpt4_analysis'] = gpt4_analysis or (
+                nutrition_cache.get_analysis(analysis_ref) if analysis_ref else None) or {}
         
         # Add to food_data array
         patient['food_data'].append(food_entry)
@@ -5527,6 +6999,7 @@ def save_food_entry():
         
         if result.modified_count > 0:
             print(f"✅ Food entry saved successfully for user: {user_id}")
+            record_food_rollup(user_id, food_entry)
             return jsonify({
                 'success': True,
                 'message': 'Food entry saved successfully',
@@ -5566,6 +7039,9 @@ def get_food_entries(user_id):
         # Sort by timestamp (most recent first)
         food_data.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
         
+        # Entries hold a reference to the shared GPT-4 analysis
+        nutrition_cache.resolve_entries(food_data)
+        
         print(f"✅ Retrieved {len(food_data)} food entries for user: {user_id}")
         
         return jsonify({
@@ -5635,7 +7111,24 @@ if __name__ == '__main__':
     print("📱 API will be available at: http://localhost:5000")
     print("🌐 Web app can be accessed at: http://localhost:8080")
     
+    # Start OCR workers (loads OCR models once per worker) before serving requests;
+    # they come from a forkserver, so the threads started below are never forked
+    if ocr_worker_pool:
+        ocr_worker_pool.start()
+    
+    # PDF page extraction processes, created here rather than inside the first PDF request
+    if PYMUPDF_AVAILABLE:
+        start_page_pool()
+    
     # Start medication reminder scheduler
     scheduler_thread = start_medication_reminder_scheduler()
     
+    # Count passed doses into the adherence buckets
+    if adherence_tracker:
+        adherence_tracker.start()
+        atexit.register(adherence_tracker.stop)
+    
+    # Warm the symptom answer cache from frequent historical queries
+    start_semantic_cache_warmup()
+    
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
@@ -0,0 +1,171 @@
+# File: async_loop_service.py
+"""
+One long-lived asyncio event loop for the sync Flask app.
+
+Flask handlers used to create, install and close a fresh event loop around
+every call into an async service (the medication folder's WebhookService).
+That costs loop setup per request and, worse, makes any aiohttp session the
+service keeps unusable on the next request, because a session is bound to
+the loop it was created on.
+
+AsyncLoopThread runs a single loop in a daemon thread. Sync code hands it
+coroutines with run() (run_coroutine_threadsafe plus a timeout that cancels
+the coroutine) or submit() (a concurrent.futures.Future). Sessions created
+by the async services therefore live on that loop and are reused across
+requests. shutdown() runs registered cleanups on the loop (closing those
+sessions), cancels what is left, and stops the thread; it is registered with
+atexit.
+
+OCR worker processes keep their own per-process loop (see ocr_worker_pool).
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import inspect
+import os
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+# Covers the webhook configs' 30 s timeout with three retries
+ASYNC_CALL_TIMEOUT_SEC = float(os.getenv("ASYNC_CALL_TIMEOUT_SEC", "120"))
+ASYNC_SHUTDOWN_TIMEOUT_SEC = float(os.getenv("ASYNC_SHUTDOWN_TIMEOUT_SEC", "10"))
+
+
+class AsyncCallTimeout(TimeoutError):
+    """Raised by run() when a coroutine does not finish within its timeout"""
+
+
+class AsyncLoopThread:
+    """A dedicated thread running one asyncio event loop until shutdown()"""
+
+    def __init__(self, name: str = "asyncio-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._cleanups: List[Callable[[], Any]] = []
+        self._closed = False
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive() and self._loop and self._loop.is_running())
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self.start()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """Start the loop thread if needed (also done lazily by run/submit)"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Async loop has been shut down")
+            if self.running:
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def serve():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=serve, name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            print(f"✅ Shared asyncio loop started ({self.name})")
+            return loop
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """Schedule a coroutine on the shared loop; returns a concurrent.futures.Future"""
+        try:
+            loop = self.start()
+        except RuntimeError:
+            coro.close()
+            raise
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = ASYNC_CALL_TIMEOUT_SEC) -> Any:
+        """Run a coroutine on the shared loop and wait for its result (from sync code only)"""
+        if self.in_loop_thread():
+            # Blocking here would deadlock the loop this coroutine needs
+            coro.close()
+            raise RuntimeError("run() called from the event loop thread; await the coroutine instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise AsyncCallTimeout(f"Async call did not finish within {timeout}s")
+
+    def register_cleanup(self, cleanup: Callable[[], Any]):
+        """Call cleanup (sync or async) on the loop during shutdown, e.g. to close an aiohttp session"""
+        self._cleanups.append(cleanup)
+
+    async def _shutdown_tasks(self):
+        for cleanup in reversed(self._cleanups):
+            try:
+                result = cleanup()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"⚠️ Async cleanup {getattr(cleanup, '__name__', cleanup)} failed: {e}")
+
+        current = asyncio.current_task()
+        pending = [task for task in asyncio.all_tasks() if task is not current]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await self._loop.shutdown_asyncgens()
+
+    def shutdown(self, timeout: float = ASYNC_SHUTDOWN_TIMEOUT_SEC):
+        """Run cleanups, cancel outstanding tasks, stop the loop and join the thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            loop, thread = self._loop, self._thread
+
+        if loop is None or not self.running:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown_tasks(), loop).result(timeout)
+        except Exception as e:
+            print(f"⚠️ Async loop shutdown did not complete cleanly: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+        print(f"🛑 Shared asyncio loop stopped ({self.name})")
+
+
+def close_http_sessions(service: Any) -> Callable[[], Awaitable[None]]:
+    """Cleanup closing any aiohttp-style session an async service keeps on itself"""
+    async def close():
+        for attribute in ("session", "_session", "http_session", "client_session"):
+            session = getattr(service, attribute, None)
+            if session is not None and hasattr(session, "close") and not getattr(session, "closed", False):
+                result = session.close()
+                if inspect.isawaitable(result):
+                    await result
+        closer = getattr(service, "close", None)
+        if callable(closer):
+            result = closer()
+            if inspect.isawaitable(result):
+                await result
+
+    close.__name__ = f"close_{type(service).__name__}"
+    return close
+
+
+async_loop = AsyncLoopThread()
+atexit.register(async_loop.shutdown)
+
+
+def run_async(coro: Awaitable, timeout: Optional[float] = ASYNC_CALL_TIMEOUT_SEC) -> Any:
+    """Run a coroutine on the shared loop from sync code and return its result"""
+    return async_loop.run(coro, timeout=timeout)
@@ -0,0 +1,502 @@
+# File: audio_ingest_service.py
+"""
+Streaming audio ingest for voice food logging.
+
+Clients used to send the whole recording as base64 in a JSON field (a third
+larger on the wire, decoded in memory, then written to a temp file). Audio
+can now arrive as:
+
+- raw body:  POST with Content-Type audio/* or application/octet-stream;
+             language / method / transcode in the query string and the file
+             name (for its extension) in X-Audio-Filename
+- multipart: an 'audio' file part, options as form fields
+- base64:    the old JSON body, still accepted
+
+Everything is spooled in chunks through upload_service, never held whole.
+
+Before Whisper, recordings can be transcoded to 16 kHz mono Opus in Ogg
+(AUDIO_TRANSCODE=auto|always|never, needs ffmpeg). "auto" transcodes
+uncompressed or large uploads, and the result is kept only when it is
+smaller than the original.
+
+Long recordings can be uploaded in chunks through an AudioSessionManager
+session:
+
+- segments mode: every chunk is a self-contained recording (the app rolls
+  to a new file every N seconds). Each one is transcribed in a worker as
+  soon as it arrives, so transcription overlaps the rest of the upload, and
+  complete() joins the texts in order.
+- stream mode: chunks are consecutive byte ranges of one file. They are
+  appended in order (re-sent chunks are ignored). When the recording will be
+  transcoded (uncompressed audio, or AUDIO_TRANSCODE=always), every chunk is
+  also piped into a running ffmpeg, so the transcode overlaps the upload and
+  complete() only waits for the encoder to flush. Whisper needs the whole
+  file, so the transcription itself still runs on complete().
+
+Sessions idle for AUDIO_SESSION_TTL_SECONDS are discarded.
+
+Sessions (their chunks, encoders and pending transcriptions) live in the
+memory of the process that created them. Run the API as a single process, or
+pin /nutrition/transcribe/sessions/<id>/... requests to one worker (sticky
+routing on the session id); a request that reaches another process gets 404.
+"""
+import functools
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from upload_service import (
+    AUDIO_UPLOAD_MAX_BYTES,
+    SpooledUpload,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_TMP_DIR,
+    spool_base64,
+    spool_file_storage,
+    spool_stream,
+)
+
+FFMPEG_PATH = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+FFMPEG_AVAILABLE = bool(FFMPEG_PATH)
+AUDIO_TRANSCODE = os.getenv("AUDIO_TRANSCODE", "auto").lower()  # auto | always | never
+AUDIO_TRANSCODE_BITRATE = os.getenv("AUDIO_TRANSCODE_BITRATE", "24k")
+# "auto" also transcodes compressed uploads above this size
+AUDIO_TRANSCODE_MIN_KB = int(os.getenv("AUDIO_TRANSCODE_MIN_KB", "1024"))
+AUDIO_TRANSCODE_TIMEOUT_SEC = float(os.getenv("AUDIO_TRANSCODE_TIMEOUT_SEC", "120"))
+AUDIO_SESSION_TTL_SECONDS = int(os.getenv("AUDIO_SESSION_TTL_SECONDS", "900"))
+AUDIO_SESSION_MAX_MB = float(os.getenv("AUDIO_SESSION_MAX_MB", "200"))
+AUDIO_SESSION_MAX_CHUNKS = int(os.getenv("AUDIO_SESSION_MAX_CHUNKS", "512"))
+AUDIO_TRANSCRIBE_WORKERS = int(os.getenv("AUDIO_TRANSCRIBE_WORKERS", "4"))
+
+AUDIO_SESSION_MAX_BYTES = int(AUDIO_SESSION_MAX_MB * 1024 * 1024)
+SESSION_MODES = ("segments", "stream")
+RAW_AUDIO_TYPES = ("application/octet-stream",)
+CONTENT_TYPE_SUFFIXES = {
+    "audio/wav": ".wav", "audio/x-wav": ".wav", "audio/wave": ".wav", "audio/webm": ".webm",
+    "audio/ogg": ".ogg", "audio/opus": ".ogg", "audio/mpeg": ".mp3", "audio/mp3": ".mp3",
+    "audio/mp4": ".m4a", "audio/m4a": ".m4a", "audio/x-m4a": ".m4a", "audio/aac": ".m4a",
+    "audio/flac": ".flac",
+}
+UNCOMPRESSED_SUFFIXES = (".wav", ".flac", ".pcm")
+# Containers ffmpeg cannot read from a pipe (the index may be at the end of the file)
+UNSEEKABLE_SUFFIXES = (".m4a", ".mp4")
+
+
+class AudioSessionError(Exception):
+    """A chunked upload request that does not fit the session (unknown, expired, out of order, too large)"""
+
+    def __init__(self, message: str, status: int = 400):
+        self.status = status
+        super().__init__(message)
+
+
+def audio_filename(filename: str = "", content_type: str = "") -> str:
+    """A file name with an extension Whisper recognizes; the content type decides when the name has none"""
+    name = os.path.basename(filename or "")
+    if os.path.splitext(name)[1]:
+        return name
+    suffix = CONTENT_TYPE_SUFFIXES.get((content_type or "").split(";")[0].strip().lower(), ".wav")
+    return (name or "audio") + suffix
+
+
+def is_raw_audio(mimetype: str) -> bool:
+    return (mimetype or "").startswith("audio/") or mimetype in RAW_AUDIO_TYPES
+
+
+def read_audio_request(req, max_bytes: int = AUDIO_UPLOAD_MAX_BYTES,
+                       default_filename: str = "audio.wav") -> Tuple[SpooledUpload, Dict[str, Any]]:
+    """
+    Spool the audio of a Flask request (multipart 'audio', raw audio body, or
+    base64 JSON) and return it with its options (language, method, transcode).
+    Base64 bodies without a 'filename' are named default_filename.
+    Raises ValueError for a missing / invalid body and UploadTooLargeError.
+    """
+    if "audio" in req.files:
+        storage = req.files["audio"]
+        storage.filename = audio_filename(storage.filename, storage.mimetype)
+        return spool_file_storage(storage, max_bytes=max_bytes), dict(req.form)
+    if is_raw_audio(req.mimetype):
+        filename = audio_filename(req.headers.get("X-Audio-Filename", ""), req.mimetype)
+        return spool_stream(req.stream, filename, req.mimetype, max_bytes=max_bytes), dict(req.args)
+
+    data = req.get_json(silent=True)
+    if not data:
+        raise ValueError("No data provided")
+    if not data.get("audio"):
+        raise ValueError("Audio data is required")
+    filename = audio_filename(data.get("filename") or default_filename, data.get("content_type", ""))
+    upload = spool_base64(data["audio"], filename=filename, max_bytes=max_bytes)
+    return upload, {key: value for key, value in data.items() if key != "audio"}
+
+
+def should_transcode(filename: str, size: int, mode: Optional[str] = None) -> bool:
+    mode = (mode or AUDIO_TRANSCODE).lower()
+    if not FFMPEG_AVAILABLE or mode in ("never", "false", "0", "no"):
+        return False
+    if mode in ("always", "true", "1", "yes"):
+        return True
+    suffix = os.path.splitext(filename)[1].lower()
+    if suffix == ".ogg" and size <= AUDIO_TRANSCODE_MIN_KB * 1024:
+        return False
+    return suffix in UNCOMPRESSED_SUFFIXES or size > AUDIO_TRANSCODE_MIN_KB * 1024
+
+
+def transcode_to_opus(source_path: str, bitrate: str = AUDIO_TRANSCODE_BITRATE) -> Optional[str]:
+    """16 kHz mono Opus/Ogg copy of an audio file; None if ffmpeg is missing or fails"""
+    if not FFMPEG_AVAILABLE:
+        return None
+    handle, target = tempfile.mkstemp(prefix="audio_", suffix=".ogg", dir=UPLOAD_TMP_DIR)
+    os.close(handle)
+    command = [FFMPEG_PATH, "-nostdin", "-loglevel", "error", "-y", "-i", source_path,
+               "-vn", "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", bitrate,
+               "-application", "voip", target]
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=AUDIO_TRANSCODE_TIMEOUT_SEC)
+        if os.path.getsize(target) > 0:
+            return target
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"⚠️ Audio transcode failed, sending the original: {e}")
+    _remove(target)
+    return None
+
+
+def should_transcode_stream(filename: str, mode: Optional[str] = None) -> bool:
+    """Whether a stream session is piped into ffmpeg while it uploads (its final size is not known yet)"""
+    mode = (mode or AUDIO_TRANSCODE).lower()
+    if not FFMPEG_AVAILABLE or mode in ("never", "false", "0", "no"):
+        return False
+    suffix = os.path.splitext(filename)[1].lower()
+    if suffix in UNSEEKABLE_SUFFIXES:
+        return False
+    return mode in ("always", "true", "1", "yes") or suffix in UNCOMPRESSED_SUFFIXES
+
+
+class StreamTranscoder:
+    """An ffmpeg process fed chunk by chunk, writing 16 kHz mono Opus/Ogg to a temp file"""
+
+    def __init__(self, bitrate: str = AUDIO_TRANSCODE_BITRATE):
+        handle, self.path = tempfile.mkstemp(prefix="audio_", suffix=".ogg", dir=UPLOAD_TMP_DIR)
+        os.close(handle)
+        command = [FFMPEG_PATH, "-nostdin", "-loglevel", "error", "-y", "-i", "pipe:0",
+                   "-vn", "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", bitrate,
+                   "-application", "voip", self.path]
+        self.failed = False
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print(f"⚠️ Audio stream transcode not started: {e}")
+            self.process = None
+            self.failed = True
+
+    def write(self, data: bytes):
+        if self.failed:
+            return
+        try:
+            self.process.stdin.write(data)
+        except OSError as e:
+            print(f"⚠️ Audio stream transcode failed, sending the original: {e}")
+            self.failed = True
+
+    def finish(self, timeout: float = AUDIO_TRANSCODE_TIMEOUT_SEC) -> Optional[str]:
+        """Close the input and wait for ffmpeg; the transcoded file (now owned by the caller) or None"""
+        if not self.failed:
+            try:
+                self.process.stdin.close()
+                if self.process.wait(timeout) == 0 and os.path.getsize(self.path) > 0:
+                    path, self.path = self.path, None
+                    return path
+                print(f"⚠️ Audio stream transcode exited with {self.process.returncode}, sending the original")
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"⚠️ Audio stream transcode failed, sending the original: {e}")
+            self.failed = True
+        self.close()
+        return None
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        _remove(self.path)
+        self.path = None
+
+
+def _remove(path: Optional[str]):
+    if path:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def transcribe_upload(upload: SpooledUpload, transcribe: Callable[[str, Optional[str]], Any],
+                      language: Optional[str] = None, transcode: Optional[str] = None,
+                      transcoded: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Transcode when worthwhile, then transcribe; returns {text, bytes_received, bytes_sent, transcoded}.
+    `transcribe(path, language)` returns the text, or a dict with 'text' whose other keys
+    (backend, latency, ...) are passed through. `transcoded` is a copy already transcoded
+    by the caller; it is used instead of transcoding here and removed afterwards.
+    """
+    path = upload.path
+    if transcoded is None and should_transcode(upload.filename or path, upload.size, transcode):
+        transcoded = transcode_to_opus(path)
+        if transcoded and os.path.getsize(transcoded) >= upload.size:
+            _remove(transcoded)
+            transcoded = None
+    try:
+        sent = transcoded or path
+        output = transcribe(sent, language)
+        details = output if isinstance(output, dict) else {"text": output}
+        return {
+            **details,
+            "text": (details.get("text") or "").strip(),
+            "bytes_received": upload.size,
+            "bytes_sent": os.path.getsize(sent),
+            "transcoded": transcoded is not None,
+        }
+    finally:
+        _remove(transcoded)
+
+
+class TranscriptionSession:
+    """One chunked upload; see the module docstring for the two modes"""
+
+    def __init__(self, mode: str, language: Optional[str], filename: str, transcode: Optional[str],
+                 backend: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.language = language
+        self.filename = filename
+        self.transcode = transcode
+        self.backend = backend
+        self.backends_used = set()
+        self.created_at = time.time()
+        self.touched_at = self.created_at
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.transcoded_chunks = 0
+        self.lock = threading.Lock()
+        self.segments: Dict[int, Future] = {}
+        self.uploads: List[SpooledUpload] = []
+        self.stream: Optional[SpooledUpload] = None
+        self.encoder: Optional[StreamTranscoder] = None
+        self.next_index = 0
+        self.completed = False
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "mode": self.mode,
+            "chunks_received": len(self.segments) if self.mode == "segments" else self.next_index,
+            "chunks_transcribed": sum(1 for f in self.segments.values() if f.done()),
+            "bytes_received": self.bytes_received,
+            "expires_in_seconds": max(0, int(self.touched_at + AUDIO_SESSION_TTL_SECONDS - time.time())),
+        }
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if self.encoder is not None:
+            self.encoder.close()
+            self.encoder = None
+        for future in self.segments.values():
+            future.cancel()
+        for upload in self.uploads:
+            upload.close()  # segments whose transcription was cancelled before it started
+        self.uploads = []
+
+
+class AudioSessionManager:
+    """Chunked transcription sessions; segment chunks are transcribed by a worker pool while the upload continues"""
+
+    def __init__(self, transcribe: Callable[[str, Optional[str]], str], workers: int = AUDIO_TRANSCRIBE_WORKERS,
+                 ttl_seconds: int = AUDIO_SESSION_TTL_SECONDS, max_bytes: int = AUDIO_SESSION_MAX_BYTES,
+                 max_chunk_bytes: int = AUDIO_UPLOAD_MAX_BYTES):
+        self.transcribe = transcribe
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_chunk_bytes = max_chunk_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="audio-transcribe")
+        self._sessions: Dict[str, TranscriptionSession] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.completed = 0
+        self.expired = 0
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            stale = [s for s in self._sessions.values() if s.touched_at < cutoff]
+            for session in stale:
+                self._sessions.pop(session.id, None)
+        for session in stale:
+            session.close()
+        self.expired += len(stale)
+
+    def create(self, mode: str = "segments", language: Optional[str] = None, filename: str = "",
+               transcode: Optional[str] = None, backend: Optional[str] = None) -> TranscriptionSession:
+        """`backend`, when given, is passed to the transcribe callable as a keyword argument"""
+        if mode not in SESSION_MODES:
+            raise AudioSessionError(f"mode must be one of {', '.join(SESSION_MODES)}")
+        self._expire()
+        session = TranscriptionSession(mode, language, audio_filename(filename), transcode, backend)
+        with self._lock:
+            self._sessions[session.id] = session
+        self.created += 1
+        return session
+
+    def get(self, session_id: str) -> TranscriptionSession:
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None or session.touched_at < time.time() - self.ttl_seconds:
+            raise AudioSessionError("Unknown or expired transcription session", 404)
+        return session
+
+    def _transcribe(self, upload: SpooledUpload, session: TranscriptionSession,
+                    transcoded: Optional[str] = None, transcode: Optional[str] = None) -> str:
+        transcribe = self.transcribe
+        if session.backend:
+            transcribe = functools.partial(self.transcribe, backend=session.backend)
+        result = transcribe_upload(upload, transcribe, session.language, transcode or session.transcode, transcoded)
+        with session.lock:
+            session.bytes_sent += result["bytes_sent"]
+            session.transcoded_chunks += int(result["transcoded"])
+            if result.get("backend"):
+                session.backends_used.add(result["backend"])
+        return result["text"]
+
+    def _transcribe_segment(self, upload: SpooledUpload, session: TranscriptionSession) -> str:
+        try:
+            return self._transcribe(upload, session)
+        finally:
+            upload.close()
+
+    def add_chunk(self, session_id: str, index: int, stream: BinaryIO, filename: str = "",
+                  content_type: str = "") -> Dict[str, Any]:
+        """Receive chunk `index` (0-based); re-sending a received chunk is a no-op so clients can retry"""
+        session = self.get(session_id)
+        if session.completed:
+            raise AudioSessionError("Session already completed", 409)
+        if not 0 <= index < AUDIO_SESSION_MAX_CHUNKS:
+            raise AudioSessionError(f"Chunk index must be between 0 and {AUDIO_SESSION_MAX_CHUNKS - 1}")
+        remaining = self.max_bytes - session.bytes_received
+
+        if session.mode == "segments":
+            if index in session.segments:
+                return {**session.info(), "duplicate": True}
+            name = audio_filename(filename or f"segment{index}{os.path.splitext(session.filename)[1]}", content_type)
+            upload = spool_stream(stream, name, content_type, max_bytes=min(self.max_chunk_bytes, remaining))
+            with session.lock:
+                if index in session.segments:
+                    upload.close()
+                    return {**session.info(), "duplicate": True}
+                session.bytes_received += upload.size
+                session.uploads.append(upload)
+                session.segments[index] = self._executor.submit(self._transcribe_segment, upload, session)
+        else:
+            if index < session.next_index:
+                return {**session.info(), "duplicate": True}
+            # Spooled apart first so a failed or oversized chunk leaves the stream untouched
+            chunk = spool_stream(stream, session.filename, content_type, max_bytes=min(self.max_chunk_bytes, remaining))
+            try:
+                with session.lock:
+                    if index < session.next_index:
+                        return {**session.info(), "duplicate": True}
+                    if index > session.next_index:
+                        raise AudioSessionError(f"Expected chunk {session.next_index}, got {index}", 409)
+                    if session.stream is None:
+                        session.stream = SpooledUpload(session.filename, content_type)
+                        if should_transcode_stream(session.filename, session.transcode):
+                            session.encoder = StreamTranscoder()
+                    with chunk.open() as source:
+                        for data in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                            session.stream.write(data)
+                            if session.encoder is not None:
+                                session.encoder.write(data)
+                    session.bytes_received += chunk.size
+                    session.next_index += 1
+            finally:
+                chunk.close()
+        session.touched_at = time.time()
+        return {**session.info(), "duplicate": False}
+
+    def complete(self, session_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Wait for outstanding segment transcriptions (or transcribe the stream) and return the joined text"""
+        session = self.get(session_id)
+        with session.lock:
+            if session.completed:
+                raise AudioSessionError("Session already completed", 409)
+            if session.mode == "segments":
+                indexes = sorted(session.segments)
+                if not indexes:
+                    raise AudioSessionError("No audio chunks received")
+                missing = sorted(set(range(indexes[-1] + 1)) - set(indexes))
+                if missing:
+                    # The session stays open so the client can send the gap
+                    raise AudioSessionError(f"Missing chunks: {missing}", 409)
+            elif session.stream is None or session.stream.size == 0:
+                raise AudioSessionError("No audio chunks received")
+            session.completed = True
+        try:
+            if session.mode == "segments":
+                texts = [session.segments[i].result(timeout) for i in indexes]
+                text = " ".join(t for t in texts if t)
+                chunks = len(indexes)
+            elif session.encoder is not None:
+                # Transcoded while uploading; if that failed the original is sent as it is
+                text = self._transcribe(session.stream, session, session.encoder.finish(), "never")
+                chunks = session.next_index
+            else:
+                text = self._transcribe(session.stream, session)
+                chunks = session.next_index
+        except Exception:
+            self._discard(session)
+            raise
+        self._discard(session)
+        self.completed += 1
+        return {
+            "text": text,
+            "session_id": session.id,
+            "mode": session.mode,
+            "chunks": chunks,
+            "bytes_received": session.bytes_received,
+            "bytes_sent": session.bytes_sent,
+            "transcoded_chunks": session.transcoded_chunks,
+            "backends": sorted(session.backends_used),
+            "elapsed_seconds": round(time.time() - session.created_at, 3),
+        }
+
+    def _discard(self, session: TranscriptionSession):
+        with self._lock:
+            self._sessions.pop(session.id, None)
+        session.close()
+
+    def cancel(self, session_id: str):
+        self._discard(self.get(session_id))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = len(self._sessions)
+        return {
+            "active_sessions": active,
+            "created": self.created,
+            "completed": self.completed,
+            "expired": self.expired,
+            "ffmpeg_available": FFMPEG_AVAILABLE,
+            "transcode_mode": AUDIO_TRANSCODE,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+        self._executor.shutdown(wait=False)
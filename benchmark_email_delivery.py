@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark email delivery for a burst of medication reminders
+
+Sends a burst of reminder emails into the local SMTP sink (smtp_stub_server),
+which adds latency for the connection greeting, AUTH and each message so
+connection setup costs something like STARTTLS + login against Gmail, and
+reports per mode:
+- enqueue time: how long the caller (request handler / reminder scheduler) is blocked
+- drain time and throughput (messages accepted per second)
+- SMTP connections and logins used
+
+Modes:
+- per-message: what send_email did, a new connection + login + quit per
+               message on the calling thread (measured on --legacy-count
+               messages and extrapolated to the burst)
+- pooled:      email_delivery_service with --workers persistent connections
+               and the --rate token bucket (0 = unlimited)
+
+Usage:
+    python benchmark_email_delivery.py
+    python benchmark_email_delivery.py --count 10000 --workers 1 2 4 8 --connect-latency 0.1 --auth-latency 0.1
+    python benchmark_email_delivery.py --rate 20 --count 500
+"""
+
+import argparse
+import smtplib
+import time
+
+from email_delivery_service import EmailDeliveryService
+from smtp_stub_server import start_smtp_sink
+
+SENDER = "alerts@example.com"
+
+
+def reminder(n):
+    return (f"patient{n}@example.com", "Medication Reminder: Folic Acid",
+            "Hello,\n\nIt's time to take your medication!\n\nMedication: Folic Acid\nDosage: 5mg\nTime: 08:00\n")
+
+
+def run_per_message(port, count):
+    """The old send_email: connect, login, send, quit for every message"""
+    service = EmailDeliveryService(sender=SENDER, host="127.0.0.1", port=port, starttls=False)
+    start = time.perf_counter()
+    for n in range(count):
+        to_email, subject, body = reminder(n)
+        server = smtplib.SMTP("127.0.0.1", port, timeout=30)
+        server.login(SENDER, "app-password")
+        server.sendmail(SENDER, to_email, service.build_message(to_email, subject, body))
+        server.quit()
+    elapsed = time.perf_counter() - start
+    # The caller is blocked for the whole send
+    return elapsed, elapsed
+
+
+def run_pooled(port, count, workers, rate, burst, per_connection):
+    service = EmailDeliveryService(sender=SENDER, password="app-password", host="127.0.0.1", port=port,
+                                   starttls=False, workers=workers, queue_size=count + 1, rate_per_sec=rate,
+                                   burst=burst, messages_per_connection=per_connection, retry_delay=0.05)
+    service.start()
+    start = time.perf_counter()
+    for n in range(count):
+        service.enqueue(*reminder(n), kind="reminder")
+    enqueue_time = time.perf_counter() - start
+    service.flush()
+    elapsed = time.perf_counter() - start
+    service.stop()
+    return enqueue_time, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reminder email delivery against a local SMTP sink")
+    parser.add_argument("--count", type=int, default=10000, help="reminders in the burst")
+    parser.add_argument("--legacy-count", type=int, default=200, help="messages measured in per-message mode")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--rate", type=float, default=0, help="token bucket rate per second (0 = unlimited)")
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--per-connection", type=int, default=100, help="messages per SMTP connection")
+    parser.add_argument("--connect-latency", type=float, default=0.05, help="sink greeting delay (s)")
+    parser.add_argument("--auth-latency", type=float, default=0.05, help="sink AUTH delay (s)")
+    parser.add_argument("--message-latency", type=float, default=0.001, help="sink per-message delay (s)")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    print("🧪 Email Delivery Benchmark")
+    print("=" * 60)
+    print(f"🔍 SMTP sink: connect {args.connect_latency}s, auth {args.auth_latency}s, "
+          f"message {args.message_latency}s; burst of {args.count} reminders")
+
+    rows = []
+    modes = ([] if args.skip_legacy else [("per-message", None)]) + [("pooled", w) for w in args.workers]
+    for mode, workers in modes:
+        sink = start_smtp_sink(connect_latency=args.connect_latency, auth_latency=args.auth_latency,
+                               message_latency=args.message_latency, keep_messages=False)
+        port = sink.server_address[1]
+        if mode == "per-message":
+            count = min(args.count, args.legacy_count)
+            enqueue_time, elapsed = run_per_message(port, count)
+            label = "per-message"
+        else:
+            count = args.count
+            enqueue_time, elapsed = run_pooled(port, count, workers, args.rate, args.burst, args.per_connection)
+            label = f"pooled x{workers}"
+        stats = sink.state.snapshot()
+        sink.shutdown()
+        sink.server_close()
+
+        throughput = stats["accepted"] / elapsed if elapsed else 0.0
+        rows.append({
+            "mode": label,
+            "measured": count,
+            "enqueue_ms": enqueue_time * 1000 / count,
+            "throughput": throughput,
+            "burst_sec": args.count / throughput if throughput else 0.0,
+            "connections": stats["connections"],
+            "logins": stats["logins"],
+            "accepted": stats["accepted"],
+        })
+        print(f"   {label:<12} {stats['accepted']}/{count} accepted in {elapsed:.2f}s")
+
+    print(f"\n{'mode':<13}{'measured':>9}{'caller ms/msg':>15}{'msg/s':>9}{'burst s':>10}{'conns':>8}{'logins':>8}")
+    for r in rows:
+        print(f"{r['mode']:<13}{r['measured']:>9}{r['enqueue_ms']:>15.3f}{r['throughput']:>9.1f}"
+              f"{r['burst_sec']:>10.1f}{r['connections']:>8}{r['logins']:>8}")
+    print(f"\n(burst s = time to deliver all {args.count} reminders at the measured rate; "
+          f"per-message is extrapolated)")
+
+
+if __name__ == "__main__":
+    main()
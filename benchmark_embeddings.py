@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark embedding backends for /symptoms/assist
+
+Compares the PyTorch SentenceTransformer model against the ONNX Runtime exports
+(fp32 and int8) of EMBEDDING_MODEL:
+- parity: cosine agreement with the PyTorch vectors on the fixture set
+- latency: single-query encode time (p50 / p95)
+- throughput: texts per second for batched encodes
+- memory: RSS after loading the model and peak RSS during the run
+
+Each backend runs in its own subprocess so RSS numbers are not polluted by the others.
+
+Usage:
+    python benchmark_embeddings.py
+    python benchmark_embeddings.py --backends sentence-transformers onnx-int8 --queries 200
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from embedding_service import (
+    EMBEDDING_BACKENDS,
+    EMBEDDING_PARITY_TEXTS,
+    check_embedding_parity,
+    create_embedding_backend,
+)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+def current_rss_mb() -> float:
+    """Current resident set size in MB (Linux /proc, falls back to peak RSS)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(backend_name: str, queries: int, batch_size: int) -> dict:
+    """Measure one backend inside the current process"""
+    baseline_rss = current_rss_mb()
+
+    load_start = time.perf_counter()
+    backend = create_embedding_backend(backend_name, EMBEDDING_MODEL)
+    load_seconds = time.perf_counter() - load_start
+    loaded_rss = current_rss_mb()
+
+    texts = EMBEDDING_PARITY_TEXTS
+
+    # Warm-up
+    backend.encode(texts[:2], normalize_embeddings=True)
+
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        backend.encode([texts[i % len(texts)]], normalize_embeddings=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    batch_texts = (texts * ((batch_size * 8) // len(texts) + 1))[:batch_size * 8]
+    start = time.perf_counter()
+    backend.encode(batch_texts, normalize_embeddings=True, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "backend": backend_name,
+        "load_seconds": round(load_seconds, 2),
+        "latency_p50_ms": round(statistics.median(latencies), 2),
+        "latency_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "throughput_texts_per_sec": round(len(batch_texts) / batch_seconds, 1),
+        "rss_baseline_mb": round(baseline_rss, 1),
+        "rss_model_mb": round(loaded_rss - baseline_rss, 1),
+        "rss_peak_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_parity(backends: list) -> list:
+    """Cosine agreement of every non-PyTorch backend against the PyTorch vectors"""
+    reports = []
+    reference = create_embedding_backend("sentence-transformers", EMBEDDING_MODEL)
+    for backend_name in backends:
+        if backend_name == "sentence-transformers":
+            continue
+        candidate = create_embedding_backend(backend_name, EMBEDDING_MODEL)
+        report = check_embedding_parity(reference, candidate)
+        report["backend"] = backend_name
+        reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends")
+    parser.add_argument("--backends", nargs="+", default=EMBEDDING_BACKENDS, choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--queries", type=int, default=100, help="single-query encodes for latency")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--skip-parity", action="store_true")
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.queries, args.batch_size)))
+        return
+
+    print("🧪 Embedding Backend Benchmark")
+    print("=" * 60)
+    print(f"🔍 Model: {EMBEDDING_MODEL}")
+
+    if not args.skip_parity:
+        print("\n1️⃣ Parity check against PyTorch vectors...")
+        for report in run_parity(args.backends):
+            status = "✅ PASS" if report.get("passed") else "❌ FAIL"
+            print(f"{status} {report['backend']}: mean cosine {report.get('mean_cosine', 0):.5f}, "
+                  f"min cosine {report.get('min_cosine', 0):.5f}, "
+                  f"neighbour agreement {report.get('neighbour_agreement', 0):.2%}")
+
+    print("\n2️⃣ Latency, throughput and memory (one subprocess per backend)...")
+    results = []
+    for backend_name in args.backends:
+        completed = subprocess.run(
+            [sys.executable, __file__, "--worker", backend_name,
+             "--queries", str(args.queries), "--batch-size", str(args.batch_size)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(f"❌ {backend_name} failed: {completed.stderr.strip()[-300:]}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'backend':<22}{'p50 ms':>9}{'p95 ms':>9}{'texts/s':>10}{'model MB':>10}{'peak MB':>10}")
+    for r in results:
+        print(f"{r['backend']:<22}{r['latency_p50_ms']:>9}{r['latency_p95_ms']:>9}"
+              f"{r['throughput_texts_per_sec']:>10}{r['rss_model_mb']:>10}{r['rss_peak_mb']:>10}")
+
+
+if __name__ == "__main__":
+    main()
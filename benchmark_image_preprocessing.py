@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Benchmark image pre-processing ahead of prescription OCR
+
+Runs every fixture image through OCR twice, as uploaded and after
+image_preprocessing_service, and reports per mode:
+- pre-processing time
+- OCR time (mean / p95)
+- character accuracy against the ground-truth text (1 - edit distance / length)
+
+Fixtures are image files with a same-named .txt holding the expected text
+(--fixtures DIR). Without a directory a synthetic set is generated: printed
+prescriptions rendered as 12 MP phone-style JPEGs with EXIF rotation, colour
+cast, dark table borders and a few degrees of skew.
+
+OCR engines:
+- enhanced:  OCR_PROCESSOR_FACTORY (EnhancedOCRService from the medication folder)
+- tesseract: pytesseract, if installed
+
+Usage:
+    python benchmark_image_preprocessing.py
+    python benchmark_image_preprocessing.py --engine tesseract --fixtures fixtures/prescriptions --deskew
+"""
+
+import argparse
+import asyncio
+import importlib
+import inspect
+import io
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from PIL import Image, ImageDraw, ImageFont
+
+from image_preprocessing_service import IMAGE_EXTENSIONS, preprocess_image
+from ocr_worker_pool import OCR_PROCESSOR_FACTORY
+
+MEDICATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "medication", "medication")
+
+SYNTHETIC_PRESCRIPTIONS = [
+    "Dr. Meena Raghavan MD\nTab. Paracetamol 500mg\n1 tablet twice daily after food for 5 days",
+    "Tab. Folic Acid 5mg\nOnce daily in the morning\nContinue till 12 weeks",
+    "Cap. Ferrous Sulphate 200mg\nOne capsule daily after lunch\nReview after 4 weeks",
+    "Tab. Calcium Carbonate 500mg + Vitamin D3\nTwice daily\nAvoid with iron tablets",
+    "Syp. Ondansetron 4mg/5ml\n5 ml when required for vomiting\nMaximum three doses a day",
+    "Tab. Labetalol 100mg\nTwice daily\nCheck blood pressure every morning",
+]
+
+
+def load_font(size):
+    for name in ("DejaVuSans.ttf", "Arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def synthetic_fixture(text: str, index: int) -> bytes:
+    """Render a prescription the way a phone photo of it tends to arrive"""
+    page = Image.new("RGB", (1240, 1754), (250, 247, 238))
+    draw = ImageDraw.Draw(page)
+    font = load_font(44)
+    y = 160
+    for line in text.split("\n"):
+        draw.text((120, y), line, fill=(25, 25, 60), font=font)
+        y += 90
+
+    skew = (-4, -2, 0, 2, 3, -3)[index % 6]
+    page = page.rotate(skew, expand=True, resample=Image.BICUBIC, fillcolor=(250, 247, 238))
+
+    # 12 MP frame (4032 x 3024 portrait) with a dark table around the page
+    photo = Image.new("RGB", (3024, 4032), (70, 55, 45))
+    scaled = page.resize((int(page.width * 2.1), int(page.height * 2.1)), Image.BICUBIC)
+    photo.paste(scaled, ((photo.width - scaled.width) // 2, (photo.height - scaled.height) // 2))
+
+    # Stored sideways with EXIF orientation 6, as most phone cameras do
+    stored = photo.rotate(90, expand=True)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    output = io.BytesIO()
+    stored.save(output, format="JPEG", quality=90, exif=exif)
+    return output.getvalue()
+
+
+def load_fixtures(directory):
+    """[(name, image_bytes, expected_text)]"""
+    if not directory:
+        return [(f"synthetic_{i + 1}.jpg", synthetic_fixture(text, i), text)
+                for i, text in enumerate(SYNTHETIC_PRESCRIPTIONS)]
+
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        truth_path = os.path.join(directory, stem + ".txt")
+        if ext.lower() in IMAGE_EXTENSIONS and os.path.exists(truth_path):
+            with open(os.path.join(directory, name), "rb") as f, open(truth_path, encoding="utf-8") as t:
+                fixtures.append((name, f.read(), t.read()))
+    return fixtures
+
+
+def create_engine(engine_name):
+    """Callable (image_bytes, filename) -> recognised text"""
+    if engine_name == "tesseract":
+        import pytesseract
+
+        return lambda content, filename: pytesseract.image_to_string(Image.open(io.BytesIO(content)))
+
+    if MEDICATION_PATH not in sys.path:
+        sys.path.insert(0, MEDICATION_PATH)
+    module_name, attribute = OCR_PROCESSOR_FACTORY.split(":", 1)
+    processor = getattr(importlib.import_module(module_name), attribute)()
+    loop = asyncio.new_event_loop()
+
+    def run(content, filename):
+        result = processor.process_file(file_content=content, filename=filename)
+        if inspect.isawaitable(result):
+            result = loop.run_until_complete(result)
+        return result.get("full_content") or " ".join(r.get("text", "") for r in result.get("results", []))
+
+    return run
+
+
+def character_accuracy(expected: str, actual: str) -> float:
+    """1 - Levenshtein distance / expected length, on case- and whitespace-normalised text"""
+    a = " ".join(expected.lower().split())
+    b = " ".join((actual or "").lower().split())
+    if not a:
+        return 1.0 if not b else 0.0
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return max(0.0, 1 - previous[-1] / len(a))
+
+
+def run_mode(fixtures, engine, preprocess, settings):
+    prep_times, ocr_times, accuracies = [], [], []
+    for name, content, expected in fixtures:
+        filename = name
+        if preprocess:
+            content, info = preprocess_image(content, **settings)
+            filename = os.path.splitext(name)[0] + ".png"
+            prep_times.append(info["processing_time_ms"])
+
+        if engine is None:
+            continue
+        start = time.perf_counter()
+        text = engine(content, filename)
+        ocr_times.append((time.perf_counter() - start) * 1000)
+        accuracies.append(character_accuracy(expected, text))
+
+    ocr_times.sort()
+    return {
+        "prep_ms": round(statistics.mean(prep_times), 1) if prep_times else 0.0,
+        "ocr_mean_ms": round(statistics.mean(ocr_times), 1) if ocr_times else None,
+        "ocr_p95_ms": round(ocr_times[max(0, int(len(ocr_times) * 0.95) - 1)], 1) if ocr_times else None,
+        "char_accuracy": round(statistics.mean(accuracies), 4) if accuracies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image pre-processing for prescription OCR")
+    parser.add_argument("--engine", choices=["enhanced", "tesseract"], default="enhanced")
+    parser.add_argument("--fixtures", help="directory of images with same-named .txt ground truth")
+    parser.add_argument("--max-side", type=int)
+    parser.add_argument("--deskew", action="store_true", help="enable deskew for the pre-processed run")
+    parser.add_argument("--no-crop", action="store_true")
+    args = parser.parse_args()
+
+    settings = {"max_side": args.max_side, "deskew": True if args.deskew else None,
+                "crop_borders": False if args.no_crop else None}
+
+    print("🧪 Image Pre-processing Benchmark")
+    print("=" * 60)
+
+    fixtures = load_fixtures(args.fixtures)
+    print(f"🔍 Fixtures: {len(fixtures)} ({args.fixtures or 'synthetic 12 MP phone photos'})")
+
+    try:
+        engine = create_engine(args.engine)
+        print(f"🔍 OCR engine: {args.engine}")
+    except Exception as e:
+        engine = None
+        print(f"⚠️ OCR engine '{args.engine}' unavailable ({e}); reporting pre-processing time only")
+
+    results = {
+        "raw upload": run_mode(fixtures, engine, False, settings),
+        "pre-processed": run_mode(fixtures, engine, True, settings),
+    }
+
+    print(f"\n{'mode':<16}{'prep ms':>10}{'OCR mean ms':>13}{'OCR p95 ms':>12}{'char acc':>10}")
+    for mode, r in results.items():
+        print(f"{mode:<16}{r['prep_ms']:>10}{str(r['ocr_mean_ms']):>13}{str(r['ocr_p95_ms']):>12}"
+              f"{str(r['char_accuracy']):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark the local prescription parser
+
+Runs prescription_benchmark_corpus.json (prescription texts with the expected
+medication name, strength, frequency and duration of every medication) and
+reports:
+- field accuracy of prescription_parser against the old line-keyword heuristic
+- medication count accuracy
+- latency per text (mean / p95) and batch throughput
+
+Usage:
+    python benchmark_prescription_parser.py
+    python benchmark_prescription_parser.py --corpus my_corpus.json --repeat 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+from prescription_parser import needs_remote_parse, parse_prescription, parse_prescriptions
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prescription_benchmark_corpus.json")
+FIELDS = ("medication_name", "strength", "frequency", "duration")
+
+
+def legacy_keyword_parse(text):
+    """The previous /medication/process-prescription-text heuristic, for comparison"""
+    info = {'medication_name': '', 'dosage': '', 'frequency': '', 'duration': ''}
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if any(keyword in line.lower() for keyword in ['tablet', 'capsule', 'syrup', 'injection', 'mg', 'ml']):
+            if not info['medication_name']:
+                info['medication_name'] = line
+        elif any(keyword in line.lower() for keyword in ['mg', 'ml', 'tablet', 'capsule', 'dose']):
+            if not info['dosage']:
+                info['dosage'] = line
+        elif any(keyword in line.lower() for keyword in ['daily', 'twice', 'three times', 'every', 'hour']):
+            if not info['frequency']:
+                info['frequency'] = line
+        elif any(keyword in line.lower() for keyword in ['days', 'weeks', 'months', 'until', 'course']):
+            if not info['duration']:
+                info['duration'] = line
+    return [{'medication_name': info['medication_name'], 'strength': info['dosage'],
+             'frequency': info['frequency'], 'duration': info['duration']}]
+
+
+def field_accuracy(corpus, parse):
+    """Share of expected fields reproduced exactly (case-insensitive), per field"""
+    correct = {field: 0 for field in FIELDS}
+    total = 0
+    count_matches = 0
+    for item in corpus:
+        medications = parse(item["text"])
+        count_matches += len(medications) == len(item["expected"])
+        for index, expected in enumerate(item["expected"]):
+            total += 1
+            actual = medications[index] if index < len(medications) else {}
+            for field in FIELDS:
+                correct[field] += (actual.get(field) or "").strip().lower() == expected[field].strip().lower()
+    report = {field: round(correct[field] / total, 4) for field in FIELDS}
+    report["overall"] = round(sum(correct.values()) / (total * len(FIELDS)), 4)
+    report["medication_count"] = round(count_matches / len(corpus), 4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local prescription parser")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--repeat", type=int, default=100, help="passes over the corpus for timing")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+    texts = [item["text"] for item in corpus]
+
+    print("🧪 Prescription Parser Benchmark")
+    print("=" * 60)
+    print(f"🔍 Corpus: {len(corpus)} prescriptions, {sum(len(i['expected']) for i in corpus)} medications")
+
+    print("\n1️⃣ Field accuracy...")
+    results = {
+        "keyword heuristic": field_accuracy(corpus, legacy_keyword_parse),
+        "prescription_parser": field_accuracy(corpus, lambda text: parse_prescription(text)["medications"]),
+    }
+    print(f"\n{'parser':<22}" + "".join(f"{name:>17}" for name in (*FIELDS, "overall", "medication_count")))
+    for name, report in results.items():
+        print(f"{name:<22}" + "".join(f"{report[field]:>17.2%}" for field in (*FIELDS, "overall", "medication_count")))
+
+    local = sum(1 for text in texts if not needs_remote_parse(parse_prescription(text)))
+    print(f"\n⚡ Answerable locally (confidence above threshold): {local}/{len(texts)} ({local / len(texts):.0%})")
+
+    print("\n2️⃣ Latency and throughput...")
+    parse_prescriptions(texts)  # warm-up
+    latencies = []
+    for _ in range(args.repeat):
+        for text in texts:
+            start = time.perf_counter()
+            parse_prescription(text)
+            latencies.append((time.perf_counter() - start) * 1_000_000)
+    latencies.sort()
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        parse_prescriptions(texts)
+    batch_seconds = time.perf_counter() - start
+
+    print(f"   Mean latency: {statistics.mean(latencies):.1f} µs")
+    print(f"   p95 latency:  {latencies[int(len(latencies) * 0.95) - 1]:.1f} µs")
+    print(f"   Throughput:   {len(texts) * args.repeat / batch_seconds:,.0f} prescriptions/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark speech-to-text backends for /nutrition/transcribe
+
+Runs the clips listed in transcription_benchmark_clips.json (file, language and
+reference transcript) through remote Whisper and the local faster-whisper model
+and reports per backend and language:
+- word error rate against the reference (case and punctuation ignored)
+- latency per clip (p50 / p95), including the network round trip for remote
+- real-time factor (processing time / audio length) for the local model
+- model load time for the local model
+
+The clips are short voice food logs (English and Tamil). Record them as
+16 kHz mono audio into the clips directory; listed clips that are missing are
+skipped with a warning.
+
+Usage:
+    python benchmark_transcription.py
+    python benchmark_transcription.py --backends local --repeat 3 --clips-dir ~/clips
+    python benchmark_transcription.py --detect-language   # send language=auto instead of the clip's language
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from openai_client_service import get_openai_registry
+from transcription_service import (
+    LOCAL_WHISPER_COMPUTE_TYPE,
+    LOCAL_WHISPER_MODEL,
+    TRANSCRIPTION_BACKENDS,
+    create_transcription_router,
+    word_error_rate,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CLIPS_MANIFEST = os.path.join(BASE_DIR, "transcription_benchmark_clips.json")
+CLIPS_DIR = os.path.join(BASE_DIR, "transcription_benchmark_clips")
+
+
+def load_clips(manifest_path, clips_dir):
+    with open(manifest_path, encoding="utf-8") as f:
+        clips = json.load(f)
+    present = []
+    for clip in clips:
+        path = os.path.join(clips_dir, clip["file"])
+        if os.path.exists(path):
+            present.append({**clip, "path": path})
+        else:
+            print(f"⚠️ Missing clip {path}, skipped")
+    return present
+
+
+def run_backend(router, backend_name, clips, repeat, detect_language):
+    """Transcribe every clip `repeat` times with one backend (no fallback); one row per clip"""
+    engine = router.backends[backend_name]
+    load_seconds = None
+    if backend_name == "local":
+        start = time.perf_counter()
+        engine.load()
+        load_seconds = time.perf_counter() - start
+
+    rows = []
+    for clip in clips:
+        language = None if detect_language else clip["language"]
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = engine.transcribe(clip["path"], language)
+            latencies.append((time.perf_counter() - start) * 1000)
+        rows.append({
+            "clip": clip["file"],
+            "language": clip["language"],
+            "detected_language": result.get("language"),
+            "wer": word_error_rate(clip["reference"], result["text"]),
+            "latency_ms": latencies,
+            "audio_seconds": result.get("audio_seconds"),
+            "text": result["text"],
+        })
+    return {"backend": backend_name, "load_seconds": load_seconds, "rows": rows}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(report, language=None):
+    rows = [r for r in report["rows"] if language is None or r["language"] == language]
+    if not rows:
+        return None
+    latencies = [ms for r in rows for ms in r["latency_ms"]]
+    timed = [(statistics.mean(r["latency_ms"]) / 1000, r["audio_seconds"]) for r in rows if r["audio_seconds"]]
+    return {
+        "clips": len(rows),
+        "wer": round(statistics.mean(r["wer"] for r in rows), 3),
+        "latency_p50_ms": round(percentile(latencies, 0.5), 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95), 1),
+        "real_time_factor": round(sum(t for t, _ in timed) / sum(a for _, a in timed), 3) if timed else None,
+        "language_errors": sum(1 for r in rows if r["detected_language"] not in (None, "auto", r["language"])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speech-to-text backends")
+    parser.add_argument("--backends", nargs="+", default=TRANSCRIPTION_BACKENDS, choices=TRANSCRIPTION_BACKENDS)
+    parser.add_argument("--manifest", default=CLIPS_MANIFEST)
+    parser.add_argument("--clips-dir", default=CLIPS_DIR)
+    parser.add_argument("--repeat", type=int, default=1, help="transcriptions per clip for latency")
+    parser.add_argument("--detect-language", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="print every transcript")
+    args = parser.parse_args()
+
+    print("🧪 Speech-to-Text Backend Benchmark")
+    print("=" * 60)
+    print(f"🔍 Local model: {LOCAL_WHISPER_MODEL} ({LOCAL_WHISPER_COMPUTE_TYPE}), remote: whisper-1")
+
+    clips = load_clips(args.manifest, os.path.expanduser(args.clips_dir))
+    if not clips:
+        print(f"❌ No clips found in {args.clips_dir}")
+        return
+
+    router = create_transcription_router(get_openai_registry(), fallback=False)
+    reports = []
+    for backend_name in args.backends:
+        if not router.backends[backend_name].is_available():
+            print(f"⚠️ {backend_name} not available (faster-whisper not installed or OpenAI key missing), skipped")
+            continue
+        print(f"\n⏱️ Running {backend_name} on {len(clips)} clips x {args.repeat}...")
+        try:
+            report = run_backend(router, backend_name, clips, args.repeat, args.detect_language)
+        except Exception as e:
+            print(f"❌ {backend_name} failed: {e}")
+            continue
+        reports.append(report)
+        if args.verbose:
+            for row in report["rows"]:
+                print(f"   {row['clip']:<24} WER {row['wer']:.2f}  {row['text']}")
+
+    print(f"\n{'backend':<10}{'lang':>6}{'clips':>7}{'WER':>8}{'p50 ms':>10}{'p95 ms':>10}{'RTF':>8}{'lang err':>10}")
+    for report in reports:
+        for language in [None] + sorted({c["language"] for c in clips}):
+            summary = summarize(report, language)
+            if summary is None:
+                continue
+            rtf = summary["real_time_factor"] if summary["real_time_factor"] is not None else "-"
+            print(f"{report['backend']:<10}{language or 'all':>6}{summary['clips']:>7}{summary['wer']:>8}"
+                  f"{summary['latency_p50_ms']:>10}{summary['latency_p95_ms']:>10}{rtf:>8}"
+                  f"{summary['language_errors']:>10}")
+        if report["load_seconds"] is not None:
+            print(f"{'':<10}model load {report['load_seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Benchmark webhook delivery of OCR results to n8n
+
+Pushes OCR results at increasing rates (open loop: a message every 1/rate
+seconds whether or not earlier ones finished) into a local n8n stand-in
+(n8n_stub_server) and reports, per delivery mode and rate:
+- request cost: how long the Flask handler is blocked per message (p50 / p99)
+- end-to-end delivery latency: message created -> accepted by n8n (p50 / p95 / p99)
+- delivery throughput (accepted messages per second) and dead/failed messages
+- retry amplification: HTTP requests n8n received per message
+
+Delivery modes:
+- inline: what send_ocr_result did per request, one POST with the
+          webhook_configs.json retry policy (timeout, retry_attempts,
+          retry_delay) on the request thread, up to --inline-threads at once
+- outbox: webhook_outbox_service (enqueue, background dispatcher with
+          backoff and per-endpoint concurrency)
+
+Usage:
+    python benchmark_webhook_delivery.py
+    python benchmark_webhook_delivery.py --rates 20 50 100 200 --latency 0.2 --jitter 0.3 --error-rate 0.05 --rate-429 0.05
+    python benchmark_webhook_delivery.py --modes outbox --endpoint-concurrency 4 8 16
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from n8n_stub_server import sink_url, start_sink_server
+from webhook_outbox_service import DEAD, DELIVERED, WebhookOutbox, backoff_delay, build_ocr_payload, \
+    load_webhook_endpoints
+
+SAMPLE_OCR_RESULT = {
+    "success": True,
+    "filename": "prescription.jpg",
+    "results": [{"text": "Tab. Folic Acid 5mg once daily for 12 weeks", "confidence": 0.97, "bbox": [0, 0, 100, 20]}],
+    "full_content": "Dr. Meena Raghavan MD\nTab. Folic Acid 5mg once daily for 12 weeks\nCap. Ferrous Sulphate 200mg OD",
+    "text_count": 1,
+}
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(len(ordered) * share)) - 1))]
+
+
+def webhook_policy():
+    """timeout / retry_attempts / retry_delay of the first configured webhook (the inline baseline)"""
+    endpoints = load_webhook_endpoints()
+    config = endpoints[0] if endpoints else {}
+    return {
+        "timeout": float(config.get("timeout", 30)),
+        "retry_attempts": int(config.get("retry_attempts", 3)),
+        "retry_delay": float(config.get("retry_delay", 1)),
+    }
+
+
+def open_loop(rate, duration, send):
+    """Call send(index) every 1/rate seconds for `duration` seconds; returns the number sent"""
+    count = int(rate * duration)
+    start = time.perf_counter()
+    for index in range(count):
+        delay = start + index / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        send(index)
+    return count
+
+
+def run_inline(url, rate, duration, policy, threads):
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=threads))
+    request_ms, delivered_ms = [], []
+    failed = [0]
+    lock = threading.Lock()
+
+    def deliver(index, created):
+        ok = False
+        for attempt in range(policy["retry_attempts"]):
+            try:
+                response = session.post(url, json=build_ocr_payload(SAMPLE_OCR_RESULT, f"rx{index}.jpg"),
+                                        headers={"Idempotency-Key": f"inline-{rate}-{index}"},
+                                        timeout=policy["timeout"])
+                if response.ok:
+                    ok = True
+                    break
+            except requests.RequestException:
+                pass
+            if attempt + 1 < policy["retry_attempts"]:
+                time.sleep(policy["retry_delay"])
+        elapsed = (time.perf_counter() - created) * 1000
+        with lock:
+            # The Flask request is held for the whole send, so both latencies are the same
+            request_ms.append(elapsed)
+            if ok:
+                delivered_ms.append(elapsed)
+            else:
+                failed[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        sent = open_loop(rate, duration, lambda i: executor.submit(deliver, i, time.perf_counter()))
+    elapsed = time.perf_counter() - start
+    return sent, request_ms, delivered_ms, failed[0], elapsed
+
+
+def run_outbox(url, rate, duration, endpoint_concurrency, workers, backoff_base, max_attempts, drain_timeout):
+    endpoints = [{"id": "stub", "name": "n8n stub", "url": url, "timeout": 30}]
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = WebhookOutbox(
+            path=os.path.join(tmp, "outbox.sqlite3"),
+            endpoint_loader=lambda: endpoints,
+            endpoint_concurrency=endpoint_concurrency,
+            workers=workers,
+            max_attempts=max_attempts,
+            backoff=lambda attempts: backoff_delay(attempts, base=backoff_base),
+        )
+        outbox.start()
+        request_ms = []
+
+        def enqueue(index):
+            started = time.perf_counter()
+            outbox.enqueue(build_ocr_payload(SAMPLE_OCR_RESULT, f"rx{index}.jpg"))
+            request_ms.append((time.perf_counter() - started) * 1000)
+
+        start = time.perf_counter()
+        sent = open_loop(rate, duration, enqueue)
+        deadline = time.time() + drain_timeout
+        while time.time() < deadline:
+            counts = outbox.stats()["counts"]
+            if counts[DELIVERED] + counts[DEAD] >= sent:
+                break
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+
+        rows = outbox._query("SELECT status, created_at, delivered_at FROM webhook_deliveries")
+        delivered_ms = [(r["delivered_at"] - r["created_at"]) * 1000 for r in rows if r["status"] == DELIVERED]
+        failed = sum(1 for r in rows if r["status"] != DELIVERED)
+        outbox.close()
+    return sent, request_ms, delivered_ms, failed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark webhook delivery to a local n8n stand-in")
+    parser.add_argument("--modes", nargs="+", choices=["inline", "outbox"], default=["inline", "outbox"])
+    parser.add_argument("--rates", nargs="+", type=float, default=[10, 25, 50, 100], help="messages per second")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per rate")
+    parser.add_argument("--latency", type=float, default=0.1, help="n8n stand-in latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="extra uniform latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--rate-429", type=float, default=0.03)
+    parser.add_argument("--sink-concurrency", type=int, default=0, help="stand-in answers 429 above this")
+    parser.add_argument("--inline-threads", type=int, default=16, help="Flask request threads for inline mode")
+    parser.add_argument("--endpoint-concurrency", nargs="+", type=int, default=[8])
+    parser.add_argument("--dispatch-workers", type=int, default=32)
+    parser.add_argument("--backoff-base", type=float, default=0.2, help="outbox backoff base (s)")
+    parser.add_argument("--max-attempts", type=int, default=8)
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    policy = webhook_policy()
+    print("🧪 Webhook Delivery Benchmark")
+    print("=" * 60)
+    print(f"🔍 n8n stand-in: {args.latency}s + up to {args.jitter}s, {args.error_rate:.0%} errors, "
+          f"{args.rate_429:.0%} 429s, concurrency limit {args.sink_concurrency or 'none'}")
+    print(f"🔍 Inline policy (webhook_configs.json): {policy}")
+
+    rows = []
+    for mode in args.modes:
+        settings = [None] if mode == "inline" else args.endpoint_concurrency
+        for setting in settings:
+            for rate in args.rates:
+                sink = start_sink_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                         rate_429=args.rate_429, max_concurrency=args.sink_concurrency,
+                                         seed=args.seed)
+                url = sink_url(sink)
+                if mode == "inline":
+                    label = f"inline x{args.inline_threads}"
+                    sent, request_ms, delivered_ms, failed, elapsed = run_inline(
+                        url, rate, args.duration, policy, args.inline_threads)
+                else:
+                    label = f"outbox c={setting}"
+                    sent, request_ms, delivered_ms, failed, elapsed = run_outbox(
+                        url, rate, args.duration, setting, args.dispatch_workers, args.backoff_base,
+                        args.max_attempts, args.drain_timeout)
+                stats = sink.state.snapshot()
+                sink.shutdown()
+                sink.server_close()
+
+                rows.append({
+                    "mode": label,
+                    "rate": rate,
+                    "sent": sent,
+                    "request_p50": percentile(request_ms, 0.50),
+                    "request_p99": percentile(request_ms, 0.99),
+                    "delivery_p50": percentile(delivered_ms, 0.50),
+                    "delivery_p95": percentile(delivered_ms, 0.95),
+                    "delivery_p99": percentile(delivered_ms, 0.99),
+                    "throughput": len(delivered_ms) / elapsed if elapsed else 0.0,
+                    "failed": failed,
+                    "amplification": stats["requests"] / sent if sent else 0.0,
+                    "duplicates": stats["duplicates"],
+                })
+                r = rows[-1]
+                print(f"   {label:<14} {rate:>6.0f}/s: {len(delivered_ms)}/{sent} delivered, "
+                      f"mean request {statistics.mean(request_ms) if request_ms else 0:.1f} ms")
+
+    print(f"\n{'mode':<15}{'rate/s':>7}{'req p50':>9}{'req p99':>9}{'dlv p50':>9}{'dlv p95':>9}{'dlv p99':>9}"
+          f"{'msg/s':>8}{'failed':>8}{'amp':>6}{'dups':>6}")
+    for r in rows:
+        print(f"{r['mode']:<15}{r['rate']:>7.0f}{r['request_p50']:>9.1f}{r['request_p99']:>9.1f}"
+              f"{r['delivery_p50']:>9.1f}{r['delivery_p95']:>9.1f}{r['delivery_p99']:>9.1f}"
+              f"{r['throughput']:>8.1f}{r['failed']:>8}{r['amplification']:>6.2f}{r['duplicates']:>6}")
+    print("\n(latencies in ms; amp = HTTP requests per message; dups = repeated Idempotency-Keys accepted)")
+
+
+if __name__ == "__main__":
+    main()
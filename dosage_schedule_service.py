@@ -0,0 +1,187 @@
+# File: dosage_schedule_service.py
+"""
+Materialized per-patient dosage schedule for /medication/get-upcoming-dosages.
+
+The endpoint used to load the whole patient document and re-derive the next
+dose of every enabled dosage on every poll. Each patient now has one compact
+document in DOSE_SCHEDULE_COLLECTION, keyed by patient_id:
+
+    {_id: patient_id, dosages: [{medication_name, dosage, time, times,
+     interval_days, anchor_date, ...}], prescription_medications: [...],
+     taken: [{date, name, count}], updated_at}
+
+- dosages: reminder-enabled dosages, expanded exactly as the reminder
+  scheduler expands them (medication_reminder_service.expand_dosages): one
+  dose at the entry's own time per dosing day, every 7 days from the log
+  date for weekly frequencies
+- taken: recent tablet-taken counts per medication and day, from
+  medication_daily_tracking and tablet_tracking
+
+It is rebuilt when a medication log is saved and its taken list is rewritten
+when a tablet is marked taken. A read is one _id lookup; occurrences in the
+requested window are expanded in memory, and on each day the first N doses
+of a medication are treated as taken when N tablets were logged that day.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from medication_reminder_service import expand_dosages, is_dosing_day, parse_date as parse_taken_date
+
+DOSE_SCHEDULE_COLLECTION = os.getenv("DOSE_SCHEDULE_COLLECTION", "medication_dose_schedule")
+UPCOMING_DOSAGES_DEFAULT_HOURS = float(os.getenv("UPCOMING_DOSAGES_DEFAULT_HOURS", "24"))
+UPCOMING_DOSAGES_MAX_DAYS = int(os.getenv("UPCOMING_DOSAGES_MAX_DAYS", "31"))
+# Taken counts older than this many days are dropped from the schedule document
+DOSE_SCHEDULE_TAKEN_DAYS = int(os.getenv("DOSE_SCHEDULE_TAKEN_DAYS", "2"))
+# Bumped when the dosage expansion changes; documents of another version are rebuilt before use
+DOSE_SCHEDULE_VERSION = 2
+
+
+def _was_taken(entry: Dict[str, Any]) -> bool:
+    flag = entry.get("tablet_taken_today", True)
+    if isinstance(flag, str):
+        return flag.strip().lower() not in ("", "false", "no", "0")
+    return bool(flag)
+
+
+def taken_counts(patient: Dict[str, Any], since: datetime) -> List[Dict[str, Any]]:
+    """[{date, name, count}] of tablets logged as taken on or after `since` (names lowercased)"""
+    counts: Dict[Tuple[str, str], int] = {}
+    first_day = since.strftime("%Y-%m-%d")
+    for entry in (patient.get("medication_daily_tracking") or []) + (patient.get("tablet_tracking") or []):
+        if not _was_taken(entry):
+            continue
+        day = parse_taken_date(entry.get("date_taken")) or parse_taken_date(entry.get("timestamp"))
+        name = (entry.get("tablet_name") or "").strip().lower()
+        if day and name and day >= first_day:
+            counts[(day, name)] = counts.get((day, name), 0) + 1
+    return [{"date": day, "name": name, "count": count} for (day, name), count in sorted(counts.items())]
+
+
+def build_dose_schedule(patient: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """The compact schedule document for one patient"""
+    now = now or datetime.now()
+    prescriptions = [{
+        "medication_name": log.get("medication_name", "Unknown"),
+        "type": "prescription",
+        "details": log.get("prescription_details", ""),
+        "prescribed_by": log.get("prescribed_by", ""),
+        "notes": log.get("notes", ""),
+        "urgency_level": "normal",
+    } for log in patient.get("medication_logs") or [] if log.get("is_prescription_mode", False)]
+
+    dosages = []
+    for item in expand_dosages(patient, now):
+        log, dosage = item["log"], item["dosage"]
+        dosages.append({
+            "medication_name": log.get("medication_name", "Unknown"),
+            "dosage": dosage.get("dosage", ""),
+            "time": dosage.get("time", ""),
+            "frequency": dosage.get("frequency", ""),
+            "special_instructions": dosage.get("special_instructions", ""),
+            "medication_type": log.get("medication_type", "prescription"),
+            "prescribed_by": log.get("prescribed_by", ""),
+            "notes": log.get("notes", ""),
+            "times": [f"{item['hour']:02d}:{item['minute']:02d}"],
+            "interval_days": item["interval_days"],
+            "anchor_date": item["anchor_date"],
+        })
+    return {
+        "_id": patient.get("patient_id"),
+        "patient_id": patient.get("patient_id"),
+        "version": DOSE_SCHEDULE_VERSION,
+        "dosages": dosages,
+        "prescription_medications": prescriptions,
+        "taken": taken_counts(patient, now - timedelta(days=DOSE_SCHEDULE_TAKEN_DAYS)),
+        "updated_at": now,
+    }
+
+
+def upcoming_dosages(schedule: Dict[str, Any], start: datetime, end: datetime,
+                     include_taken: bool = False) -> List[Dict[str, Any]]:
+    """Dose occurrences in [start, end) sorted by time; doses already logged as taken are left out unless asked for"""
+    taken = {(t["date"], t["name"]): t["count"] for t in schedule.get("taken") or []}
+    occurrences = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        date_key = day.strftime("%Y-%m-%d")
+        todays = []
+        for index, dosage in enumerate(schedule.get("dosages") or []):
+            if not is_dosing_day(day, dosage.get("interval_days", 1), dosage.get("anchor_date")):
+                continue
+            for slot, time_str in enumerate(dosage["times"]):
+                hour, minute = map(int, time_str.split(":"))
+                todays.append((day.replace(hour=hour, minute=minute), index, slot, dosage))
+        todays.sort(key=lambda item: item[0])
+        per_day: Dict[str, int] = {}
+        for _, _, _, dosage in todays:
+            name = dosage["medication_name"].strip().lower()
+            per_day[name] = per_day.get(name, 0) + 1
+
+        # The first N doses of a medication on a day count as taken when N tablets were logged that day
+        seen: Dict[str, int] = {}
+        for at, index, slot, dosage in todays:
+            name = dosage["medication_name"].strip().lower()
+            seen[name] = seen.get(name, 0) + 1
+            already_taken = seen[name] <= taken.get((date_key, name), 0)
+            if not start <= at < end or (already_taken and not include_taken):
+                continue
+            occurrences.append({
+                "medication_name": dosage["medication_name"],
+                "dosage": dosage["dosage"],
+                "time": dosage["time"],
+                "dose_time": dosage["times"][slot],
+                "dose_number": seen[name],
+                "doses_per_day": per_day[name],
+                "frequency": dosage["frequency"],
+                "next_dose_time": at.isoformat(),
+                "special_instructions": dosage["special_instructions"],
+                "medication_type": dosage["medication_type"],
+                "prescribed_by": dosage["prescribed_by"],
+                "notes": dosage["notes"],
+                "already_taken": already_taken,
+                "urgency_level": "normal",
+            })
+        day += timedelta(days=1)
+    return occurrences
+
+
+class DoseScheduleStore:
+    """DOSE_SCHEDULE_COLLECTION: one compact schedule document per patient, keyed by patient_id"""
+
+    PATIENT_FIELDS = {"patient_id": 1, "medication_logs": 1, "medication_daily_tracking": 1, "tablet_tracking": 1}
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index("adherence_accounted_until")
+
+    def rebuild(self, patient: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Rewrite the schedule; adherence accounting (adherence_service) resumes where it stopped"""
+        schedule = build_dose_schedule(patient, now)
+        fields = {key: value for key, value in schedule.items() if key != "_id"}
+        self.collection.update_one(
+            {"_id": schedule["_id"]},
+            {"$set": fields, "$setOnInsert": {"adherence_accounted_until": schedule["updated_at"]}},
+            upsert=True
+        )
+        return schedule
+
+    def rebuild_all(self, patients: Iterable[Dict[str, Any]]) -> int:
+        return sum(1 for patient in patients if self.rebuild(patient))
+
+    def update_taken(self, patient: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+        """Rewrite only the taken counts after a tablet-taken event; False if the patient has no schedule yet"""
+        now = now or datetime.now()
+        result = self.collection.update_one(
+            {"_id": patient.get("patient_id")},
+            {"$set": {"taken": taken_counts(patient, now - timedelta(days=DOSE_SCHEDULE_TAKEN_DAYS)),
+                      "updated_at": now}}
+        )
+        return result.modified_count == 1
+
+    def get(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """The patient's schedule, or None when it is missing or was built by an older expansion"""
+        schedule = self.collection.find_one({"_id": patient_id})
+        return schedule if schedule and schedule.get("version") == DOSE_SCHEDULE_VERSION else None
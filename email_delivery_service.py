@@ -0,0 +1,289 @@
+# File: email_delivery_service.py
+"""
+Pooled, rate-limited email delivery.
+
+send_email used to open a fresh SMTP connection (TCP, STARTTLS, login) for
+every message, inside the signup / OTP request or the reminder loop. Now
+callers only enqueue; a few worker threads drain a bounded priority queue,
+each holding one persistent authenticated SMTP connection:
+
+- up to EMAIL_MESSAGES_PER_CONNECTION messages go over a connection before
+  it is recycled; idle connections close after EMAIL_IDLE_TIMEOUT_SEC
+- a token bucket (EMAIL_RATE_PER_SEC, EMAIL_BURST) shared by all workers
+  keeps the send rate under the provider's limits
+- disconnects and temporary (4xx) failures reconnect and retry with backoff,
+  up to EMAIL_MAX_ATTEMPTS; permanent (5xx) rejections are not retried
+- OTP mail jumps ahead of reminder bursts (PRIORITIES)
+
+A full queue makes enqueue() return False, which the handlers already treat
+as "email could not be sent". Callers that need the real outcome pass
+on_done, which a worker calls with True / False once SMTP accepted or gave up
+on the message. Without SENDER_EMAIL or SENDER_PASSWORD the service stays in
+the old mock mode: messages are logged as sent and dropped.
+"""
+import itertools
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Callable, Dict, Optional
+
+EMAIL_SMTP_HOST = os.getenv("EMAIL_SMTP_HOST", "smtp.gmail.com")
+EMAIL_SMTP_PORT = int(os.getenv("EMAIL_SMTP_PORT", "587"))
+EMAIL_SMTP_STARTTLS = os.getenv("EMAIL_SMTP_STARTTLS", "true").lower() == "true"
+EMAIL_SMTP_TIMEOUT_SEC = float(os.getenv("EMAIL_SMTP_TIMEOUT_SEC", "30"))
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "20000"))
+EMAIL_RATE_PER_SEC = float(os.getenv("EMAIL_RATE_PER_SEC", "10"))  # 0 disables rate limiting
+EMAIL_BURST = int(os.getenv("EMAIL_BURST", "20"))
+EMAIL_MESSAGES_PER_CONNECTION = int(os.getenv("EMAIL_MESSAGES_PER_CONNECTION", "100"))
+EMAIL_IDLE_TIMEOUT_SEC = float(os.getenv("EMAIL_IDLE_TIMEOUT_SEC", "30"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "3"))
+EMAIL_RETRY_DELAY_SEC = float(os.getenv("EMAIL_RETRY_DELAY_SEC", "1"))
+
+# Lower is sent first
+PRIORITIES = {"otp": 0, "patient_id": 1, "generic": 1, "reminder": 2}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` saved up"""
+
+    def __init__(self, rate: float, capacity: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.clock = clock
+        self.tokens = float(self.capacity)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token and return 0, or return the seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class EmailDeliveryService:
+    """Bounded queue of outgoing mail drained by workers with persistent SMTP connections"""
+
+    def __init__(self, sender: Optional[str], password: Optional[str] = None, username: Optional[str] = None,
+                 host: str = EMAIL_SMTP_HOST, port: int = EMAIL_SMTP_PORT, starttls: bool = EMAIL_SMTP_STARTTLS,
+                 workers: int = EMAIL_WORKERS, queue_size: int = EMAIL_QUEUE_SIZE,
+                 rate_per_sec: float = EMAIL_RATE_PER_SEC, burst: int = EMAIL_BURST,
+                 messages_per_connection: int = EMAIL_MESSAGES_PER_CONNECTION,
+                 idle_timeout: float = EMAIL_IDLE_TIMEOUT_SEC, max_attempts: int = EMAIL_MAX_ATTEMPTS,
+                 retry_delay: float = EMAIL_RETRY_DELAY_SEC, timeout: float = EMAIL_SMTP_TIMEOUT_SEC,
+                 smtp_factory: Callable[..., smtplib.SMTP] = smtplib.SMTP):
+        self.sender = sender
+        self.username = username or sender
+        self.password = password
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.workers = max(1, workers)
+        self.messages_per_connection = max(1, messages_per_connection)
+        self.idle_timeout = idle_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+        self.bucket = TokenBucket(rate_per_sec, burst)
+        self.queue: "queue.PriorityQueue" = queue.PriorityQueue(maxsize=queue_size)
+        self._seq = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.counters = {"queued": 0, "sent": 0, "failed": 0, "dropped": 0, "retries": 0, "connections": 0,
+                         "mocked": 0}
+
+    def is_configured(self) -> bool:
+        return bool(self.sender and self.password)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def build_message(self, to_email: str, subject: str, body: str) -> str:
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        return msg.as_string()
+
+    def enqueue(self, to_email: str, subject: str, body: str, kind: str = "generic",
+                on_done: Optional[Callable[[bool], None]] = None) -> bool:
+        """
+        Queue a message for delivery; False only when the queue is full.
+        `on_done(sent)` is called from a worker once the message was sent or failed
+        (not called when the message is not queued).
+        """
+        if not self.is_configured():
+            print("Email configuration missing - using mock email")
+            self._count("mocked")
+            if on_done:
+                on_done(True)
+            return True  # Mock success for testing
+        if not self._threads:
+            self.start()
+        item = (PRIORITIES.get(kind, PRIORITIES["generic"]), next(self._seq),
+                {"to": to_email, "subject": subject, "body": body, "kind": kind, "queued_at": time.time(),
+                 "on_done": on_done})
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self._count("dropped")
+            print(f"❌ Email queue full ({self.queue.maxsize}), dropped {kind} email to {to_email}")
+            return False
+        self._count("queued")
+        return True
+
+    def _connect(self) -> smtplib.SMTP:
+        server = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+            server.ehlo()
+        if self.password:
+            server.login(self.username, self.password)
+        self._count("connections")
+        return server
+
+    @staticmethod
+    def _close(server: Optional[smtplib.SMTP]):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _send(self, server: Optional[smtplib.SMTP], message: Dict[str, Any], sent_on_connection: int):
+        """Send one message, reconnecting and retrying on transient failures; returns (server, count, ok)"""
+        data = self.build_message(message["to"], message["subject"], message["body"])
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._count("retries")
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                if server is None or sent_on_connection >= self.messages_per_connection:
+                    self._close(server)
+                    server, sent_on_connection = None, 0
+                    server = self._connect()
+                self.bucket.acquire()
+                server.sendmail(self.sender, [message["to"]], data)
+                return server, sent_on_connection + 1, True
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code >= 500:
+                    print(f"❌ Email to {message['to']} rejected: {e.smtp_code} {e.smtp_error!r}")
+                    return server, sent_on_connection, False
+                if e.smtp_code == 421:
+                    # Service closing the channel: start over on a fresh connection
+                    self._close(server)
+                    server = None
+                last_error = e
+            except smtplib.SMTPRecipientsRefused as e:
+                print(f"❌ Email to {message['to']} refused: {e.recipients}")
+                return server, sent_on_connection, False
+            except (smtplib.SMTPException, OSError) as e:
+                self._close(server)
+                server = None
+                last_error = e
+        print(f"❌ Email sending failed after {self.max_attempts} attempts to {message['to']}: {last_error}")
+        return server, sent_on_connection, False
+
+    def _worker(self):
+        server = None
+        sent_on_connection = 0
+        while True:
+            try:
+                _, _, message = self.queue.get(timeout=self.idle_timeout if server is not None else None)
+            except queue.Empty:
+                self._close(server)  # idle: let the connection go instead of waiting for the server to drop it
+                server, sent_on_connection = None, 0
+                continue
+            try:
+                if message is None:
+                    self._close(server)
+                    return
+                ok = False
+                server, sent_on_connection, ok = self._send(server, message, sent_on_connection)
+                self._count("sent" if ok else "failed")
+            except Exception as e:
+                print(f"❌ Email worker error: {e}")
+                self._count("failed")
+            finally:
+                if message is not None and message.get("on_done"):
+                    try:
+                        message["on_done"](ok)
+                    except Exception as e:
+                        print(f"⚠️ Email delivery callback failed: {e}")
+                self.queue.task_done()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"email-delivery-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"📧 Email delivery started: {self.workers} SMTP connections to {self.host}:{self.port}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message has been sent or has failed"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 30.0):
+        """Send what is queued (up to `timeout`), then close the connections"""
+        if not self._threads:
+            return
+        self.flush(timeout)
+        for _ in self._threads:
+            # Sentinels sort after every real message
+            self.queue.put((len(PRIORITIES) + 99, next(self._seq), None))
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "pending": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "workers": len(self._threads),
+            "rate_per_sec": self.bucket.rate,
+            "configured": self.is_configured(),
+        }
+
+
+def create_email_delivery() -> EmailDeliveryService:
+    """Delivery service for SENDER_EMAIL / SENDER_PASSWORD; workers start with the first message"""
+    return EmailDeliveryService(sender=os.getenv("SENDER_EMAIL"), password=os.getenv("SENDER_PASSWORD"))
@@ -0,0 +1,298 @@
+# File: embedding_service.py
+"""
+Pluggable embedding backends for the pregnancy knowledge vector search.
+
+QuantumVectorService only needs an object with an ``encode(texts, normalize_embeddings=True)``
+method, so every backend here mirrors the SentenceTransformer API.
+
+Backends (selected with the EMBEDDING_BACKEND env var):
+- sentence-transformers : PyTorch SentenceTransformer model (default)
+- onnx                  : ONNX Runtime export of EMBEDDING_MODEL (fp32)
+- onnx-int8             : ONNX Runtime export with dynamic int8 weight quantization
+"""
+import importlib.util
+import inspect
+import os
+import re
+import time
+from typing import List, Dict, Any, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# sentence_transformers pulls in PyTorch, so it is only imported when that backend is used
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+try:
+    from tokenizers import Tokenizer
+    TOKENIZERS_AVAILABLE = True
+except ImportError:
+    TOKENIZERS_AVAILABLE = False
+
+EMBEDDING_BACKENDS = ["sentence-transformers", "onnx", "onnx-int8"]
+
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".onnx_models"))
+ONNX_MAX_SEQ_LENGTH = int(os.getenv("ONNX_MAX_SEQ_LENGTH", "256"))
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))  # 0 = let ONNX Runtime decide
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+# Fixture set used for parity checks between backends
+EMBEDDING_PARITY_TEXTS = [
+    "I feel sick every morning and can't keep breakfast down",
+    "morning nausea and vomiting in the first trimester",
+    "sharp pain in my lower back when I stand up",
+    "my feet and ankles are swollen at the end of the day",
+    "I have a headache and my vision is blurry",
+    "baby is moving less than usual today",
+    "burning feeling in my chest after eating",
+    "light spotting after intercourse at 10 weeks",
+    "constant tiredness, I sleep but still feel exhausted",
+    "high fever and chills since last night",
+    "leg cramps wake me up at night",
+    "constipation and bloating for three days",
+    "itchy skin on my belly and palms",
+    "shortness of breath when climbing stairs",
+    "contractions every ten minutes at 34 weeks",
+    "dizzy when I get up quickly from bed",
+]
+
+
+def _model_cache_name(model_name: str) -> str:
+    """Filesystem-safe directory name for a model id"""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+def _l2_normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SentenceTransformerBackend:
+    """PyTorch SentenceTransformer backend (original behaviour)"""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str):
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise ImportError("SentenceTransformers not available. Install with: pip install sentence-transformers")
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, batch_size: int = EMBEDDING_BATCH_SIZE):
+        return self.model.encode(texts, normalize_embeddings=normalize_embeddings, batch_size=batch_size)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+
+class OnnxEmbeddingBackend:
+    """ONNX Runtime backend with optional int8 dynamic quantization.
+
+    The model is exported once from the Hugging Face checkpoint and cached under
+    ONNX_CACHE_DIR; later starts only need onnxruntime and tokenizers (no PyTorch).
+    Pooling is mean pooling over the attention mask, which is what the
+    sentence-transformers MiniLM/MPNet family uses. Run check_embedding_parity
+    before switching a model with a different pooling head.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = True, cache_dir: str = ONNX_CACHE_DIR,
+                 max_seq_length: int = ONNX_MAX_SEQ_LENGTH):
+        if not ONNXRUNTIME_AVAILABLE:
+            raise ImportError("ONNX Runtime not available. Install with: pip install onnxruntime")
+        if not TOKENIZERS_AVAILABLE:
+            raise ImportError("tokenizers not available. Install with: pip install tokenizers")
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy not available. Install with: pip install numpy")
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.max_seq_length = max_seq_length
+        self.model_dir = os.path.join(cache_dir, _model_cache_name(model_name))
+        self.fp32_path = os.path.join(self.model_dir, "model.onnx")
+        self.int8_path = os.path.join(self.model_dir, "model.int8.onnx")
+        self.tokenizer_path = os.path.join(self.model_dir, "tokenizer.json")
+
+        self.ensure_exported()
+
+        self.tokenizer = Tokenizer.from_file(self.tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding()
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_INTRA_OP_THREADS > 0:
+            session_options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        model_path = self.int8_path if quantize else self.fp32_path
+        self.session = ort.InferenceSession(model_path, sess_options=session_options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def ensure_exported(self):
+        """Export (and quantize) the model into the cache directory if missing"""
+        target = self.int8_path if self.quantize else self.fp32_path
+        if os.path.exists(target) and os.path.exists(self.tokenizer_path):
+            return
+
+        os.makedirs(self.model_dir, exist_ok=True)
+
+        if not os.path.exists(self.fp32_path) or not os.path.exists(self.tokenizer_path):
+            print(f"🔍 Exporting {self.model_name} to ONNX (one-time)...")
+            export_onnx_model(self.model_name, self.fp32_path, self.model_dir)
+            print(f"✅ ONNX export written to {self.fp32_path}")
+
+        if self.quantize and not os.path.exists(self.int8_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            print("🔍 Quantizing ONNX model to int8...")
+            quantize_dynamic(self.fp32_path, self.int8_path, weight_type=QuantType.QInt8)
+            print(f"✅ Quantized model written to {self.int8_path}")
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, batch_size: int = EMBEDDING_BATCH_SIZE):
+        if isinstance(texts, str):
+            texts = [texts]
+
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real (non-padding) tokens
+            mask = attention_mask[..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled = summed / counts
+
+            outputs.append(_l2_normalize(pooled) if normalize_embeddings else pooled)
+
+        if not outputs:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.vstack(outputs).astype(np.float32)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.dimension)
+
+
+def export_onnx_model(model_name: str, onnx_path: str, tokenizer_dir: str, opset: int = 14):
+    """Export a Hugging Face encoder to ONNX with dynamic batch/sequence axes.
+
+    Needs torch and transformers at export time only.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["export sample sentence"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _EncoderWrapper(torch.nn.Module):
+        """Fixes the positional input order and returns only token embeddings"""
+
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, *inputs):
+            outputs = self.encoder(**dict(zip(input_names, inputs)))
+            return outputs[0]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    export_kwargs = {}
+    # Newer torch releases default to the dynamo exporter; the TorchScript path
+    # handles dynamic_axes for these encoders without extra dependencies.
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _EncoderWrapper(model),
+            tuple(sample[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+            **export_kwargs,
+        )
+
+    # Fast tokenizer JSON lets the runtime path skip transformers entirely
+    tokenizer.save_pretrained(tokenizer_dir)
+
+
+def create_embedding_backend(backend_name: str, model_name: str):
+    """Build the embedding backend selected by name"""
+    backend_name = (backend_name or "sentence-transformers").strip().lower()
+
+    if backend_name in ("sentence-transformers", "torch", "pytorch"):
+        return SentenceTransformerBackend(model_name)
+    if backend_name == "onnx":
+        return OnnxEmbeddingBackend(model_name, quantize=False)
+    if backend_name in ("onnx-int8", "onnx_int8", "onnx-quantized"):
+        return OnnxEmbeddingBackend(model_name, quantize=True)
+
+    raise ValueError(f"Unknown embedding backend '{backend_name}'. Supported backends: {EMBEDDING_BACKENDS}")
+
+
+def check_embedding_parity(reference, candidate, texts: Optional[List[str]] = None,
+                           min_cosine: float = 0.99) -> Dict[str, Any]:
+    """Compare two backends on a fixture set using per-text cosine similarity"""
+    texts = texts or EMBEDDING_PARITY_TEXTS
+
+    ref_vectors = np.asarray(reference.encode(texts, normalize_embeddings=True), dtype=np.float32)
+    cand_vectors = np.asarray(candidate.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+    if ref_vectors.shape != cand_vectors.shape:
+        return {
+            "passed": False,
+            "error": f"Dimension mismatch: {ref_vectors.shape} vs {cand_vectors.shape}",
+        }
+
+    cosines = np.sum(_l2_normalize(ref_vectors) * _l2_normalize(cand_vectors), axis=1)
+
+    # Nearest-neighbour agreement: does each text retrieve the same neighbour in both spaces?
+    ref_sim = ref_vectors @ ref_vectors.T
+    cand_sim = cand_vectors @ cand_vectors.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(cand_sim, -np.inf)
+    neighbour_agreement = float(np.mean(ref_sim.argmax(axis=1) == cand_sim.argmax(axis=1)))
+
+    worst = int(np.argmin(cosines))
+    return {
+        "passed": bool(cosines.min() >= min_cosine),
+        "min_cosine_threshold": min_cosine,
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "worst_text": texts[worst],
+        "neighbour_agreement": neighbour_agreement,
+        "texts_checked": len(texts),
+    }
+
+
+def time_encode(backend, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> float:
+    """Wall-clock seconds for a single encode call"""
+    start = time.perf_counter()
+    backend.encode(texts, normalize_embeddings=True, batch_size=batch_size)
+    return time.perf_counter() - start
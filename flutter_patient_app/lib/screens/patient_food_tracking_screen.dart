@@ -50,6 +50,7 @@ class _PatientFoodTrackingScreenState extends State<PatientFoodTrackingScreen> {
   // Analysis related variables
   bool _isAnalyzing = false;
   Map<String, dynamic>? _nutritionAnalysis;
+  String? _analysisRef; // Shared GPT-4 analysis saved by reference instead of a full copy
   String _userId = '';
   
   bool _isSaving = false;
@@ -512,6 +513,7 @@ class _PatientFoodTrackingScreenState extends State<PatientFoodTrackingScreen> {
       setState(() {
         _isAnalyzing = true;
         _nutritionAnalysis = null;
+        _analysisRef = null;
       });
 
       print('🍎 Analyzing nutrition for: $foodInput');
@@ -609,6 +611,7 @@ class _PatientFoodTrackingScreenState extends State<PatientFoodTrackingScreen> {
         
         // Store the analysis result
         _nutritionAnalysis = analysis; // Update _nutritionAnalysis to show in UI
+        _analysisRef = response['analysis_ref'];
         
         ScaffoldMessenger.of(context).showSnackBar(
           SnackBar(
@@ -837,7 +840,8 @@ class _PatientFoodTrackingScreenState extends State<PatientFoodTrackingScreen> {
         'notes': _notesController.text.trim(),
         'transcribed_text': _transcribedText,
         'nutritional_breakdown': _nutritionAnalysis?['nutritional_breakdown'] ?? {},
-        'gpt4_analysis': _nutritionAnalysis, // Include full GPT-4 analysis
+        // GPT-4 analyses are stored once on the server; send the reference, not a copy
+        if (_analysisRef != null) 'analysis_ref': _analysisRef else 'gpt4_analysis': _nutritionAnalysis,
         'timestamp': DateTime.now().toIso8601String(),
       };
 
@@ -869,6 +873,7 @@ class _PatientFoodTrackingScreenState extends State<PatientFoodTrackingScreen> {
           _notesController.clear();
           setState(() {
             _nutritionAnalysis = null;
+            _analysisRef = null;
           });
           
           print('✅ Food entry saved successfully for current user: $_username');
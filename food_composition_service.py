@@ -0,0 +1,312 @@
+# File: food_composition_service.py
+"""
+Offline food composition lookups for the nutrition routes.
+
+analyze-nutrition used to estimate calories as len(food_input) * 2, and real
+numbers always needed GPT-4. FOOD_COMPOSITION_PATH (food_composition.csv)
+holds per-100 g calories, protein, carbohydrate, fat and fibre plus a typical
+serving for common foods, South Indian dishes included. It is loaded once
+into numpy columns:
+
+- nutrients: float32 matrix, one row per food (NUTRIENT_FIELDS order)
+- serving_grams / serving_unit: the default portion ("idli" -> 1 piece, 40 g)
+
+Food names and aliases go in a trigram index. An item is matched by exact
+name, then fuzzily: trigram overlap picks the candidates, edit-distance
+similarity (rapidfuzz when installed) must reach FOOD_MATCH_THRESHOLD. A
+sub-phrase is tried last, only when the other words merely describe the
+food ("hot idli for breakfast", not "egg fried rice").
+
+A meal ("2 idli, sambar and a cup of coffee") is split into items and each
+item's quantity and unit are parsed into grams. Totals are one matrix
+product over the matched rows. Items that match nothing are returned as
+unknown_items and can be estimated by the LLM (estimate_items_with_llm).
+"""
+import csv
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from nutrition_cache_service import FILLER_WORDS, NUMBER_WORDS, TOKEN_RE, UNITS, parse_quantity
+
+try:
+    from rapidfuzz.distance import Levenshtein as _rapidfuzz_levenshtein
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+FOOD_COMPOSITION_PATH = os.getenv(
+    "FOOD_COMPOSITION_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "food_composition.csv")
+)
+FOOD_MATCH_THRESHOLD = float(os.getenv("FOOD_MATCH_THRESHOLD", "0.8"))
+FOOD_MATCH_CANDIDATES = int(os.getenv("FOOD_MATCH_CANDIDATES", "8"))
+MATCH_MEMO_SIZE = 4096
+
+NUTRIENT_FIELDS = ("estimated_calories", "protein_grams", "carbohydrates_grams", "fat_grams", "fiber_grams")
+CSV_COLUMNS = ("calories", "protein_g", "carbs_g", "fat_g", "fiber_g")
+
+# Grams per household unit when it is not the food's own serving unit
+UNIT_GRAMS = {"g": 1, "kg": 1000, "ml": 1, "l": 1000, "cup": 200, "bowl": 150, "plate": 300,
+              "glass": 250, "slice": 30, "tbsp": 15, "tsp": 5, "piece": 50}
+
+ITEM_SPLIT_RE = re.compile(r"[,;\n+&]|\band\b|\bwith\b")
+MAX_PHRASE_WORDS = 6
+# Words that may surround a food name without changing which food it is
+DESCRIPTOR_WORDS = {"hot", "cold", "warm", "fresh", "homemade", "home", "made", "small", "big", "large",
+                    "medium", "plain", "cooked", "boiled", "steamed", "little", "full", "breakfast", "lunch",
+                    "dinner", "snack", "morning", "evening", "night", "today", "in", "at"}
+
+
+def _trigrams(text: str) -> List[str]:
+    padded = f"  {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def edit_similarity(a: str, b: str) -> float:
+    """1 - Levenshtein distance / longer length"""
+    if RAPIDFUZZ_AVAILABLE:
+        return _rapidfuzz_levenshtein.normalized_similarity(a, b)
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return 1.0 - previous[-1] / max(len(a), len(b))
+
+
+def parse_item(text: str) -> Tuple[Optional[float], str, str]:
+    """(quantity or None, unit, food words) for one meal item, e.g. "half a cup of dal" -> (0.5, "cup", "dal")"""
+    quantity, unit, words = None, "", []
+    for token in TOKEN_RE.findall((text or "").lower()):
+        value = parse_quantity(token)
+        if value is not None and not words:
+            quantity = value * quantity if quantity is not None and not unit else value
+        elif token in UNITS and quantity is not None and not words and not unit:
+            unit = UNITS[token]
+        elif token in FILLER_WORDS or (token in NUMBER_WORDS and words):
+            continue
+        else:
+            words.append(token)
+    return quantity, unit, " ".join(words)
+
+
+def split_meal(food_input: str) -> List[str]:
+    return [part.strip() for part in ITEM_SPLIT_RE.split((food_input or "").lower()) if part.strip()]
+
+
+class FoodCompositionTable:
+    """Column-oriented food composition table with a trigram fuzzy-match index over names and aliases"""
+
+    def __init__(self, rows: Sequence[Dict[str, str]]):
+        self.names = [row["name"].strip().lower() for row in rows]
+        self.nutrients = np.array([[float(row[c] or 0) for c in CSV_COLUMNS] for row in rows], dtype=np.float32)
+        self.serving_grams = np.array([float(row["serving_grams"]) for row in rows], dtype=np.float32)
+        self.serving_unit = [UNITS.get(row["serving_unit"].strip().lower(), "piece") for row in rows]
+
+        # Every name and alias is a searchable label pointing at its food row
+        self.labels: List[str] = []
+        label_food: List[int] = []
+        for food_id, row in enumerate(rows):
+            for label in [row["name"]] + (row.get("aliases") or "").split("|"):
+                label = " ".join(label.strip().lower().split())
+                if label:
+                    self.labels.append(label)
+                    label_food.append(food_id)
+        self.label_food = np.array(label_food, dtype=np.int32)
+        self.exact = {label: food_id for label, food_id in zip(self.labels, label_food)}
+
+        postings: Dict[str, List[int]] = {}
+        for label_id, label in enumerate(self.labels):
+            for gram in set(_trigrams(label)):
+                postings.setdefault(gram, []).append(label_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.label_trigrams = np.array([len(set(_trigrams(label))) for label in self.labels], dtype=np.float32)
+        self._matched: Dict[str, Tuple[Optional[int], float]] = {}
+
+    @classmethod
+    def from_csv(cls, path: str = FOOD_COMPOSITION_PATH) -> "FoodCompositionTable":
+        with open(path, newline="", encoding="utf-8") as f:
+            return cls(list(csv.DictReader(f)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _lookup_exact(self, text: str) -> Optional[int]:
+        food_id = self.exact.get(text)
+        if food_id is None and len(text) > 3 and text.endswith("s"):
+            food_id = self.exact.get(text[:-1])  # "idlis", "dosas"
+        return food_id
+
+    def _fuzzy(self, text: str) -> Tuple[Optional[int], float]:
+        grams = set(_trigrams(text))
+        hits = [self.postings[g] for g in grams if g in self.postings]
+        if not hits:
+            return None, 0.0
+        overlap = np.bincount(np.concatenate(hits), minlength=len(self.labels)).astype(np.float32)
+        dice = 2 * overlap / (len(grams) + self.label_trigrams)
+        candidates = np.argsort(-dice)[:FOOD_MATCH_CANDIDATES]
+        best_label, best_score = None, 0.0
+        for label_id in candidates:
+            if overlap[label_id] == 0:
+                break
+            score = edit_similarity(text, self.labels[label_id])
+            if score > best_score:
+                best_label, best_score = int(label_id), score
+        if best_label is None or best_score < FOOD_MATCH_THRESHOLD:
+            return None, best_score
+        return int(self.label_food[best_label]), best_score
+
+    def match(self, text: str) -> Tuple[Optional[int], float]:
+        """(food row, score) for food words: exact, fuzzy, then a sub-phrase when the other words only
+        describe the food ("hot idli for breakfast"); (None, best score) when unknown"""
+        text = " ".join(text.split())
+        matched = self._matched.get(text)
+        if matched is None:
+            matched = self._match(text)
+            if len(self._matched) >= MATCH_MEMO_SIZE:
+                self._matched.clear()
+            self._matched[text] = matched
+        return matched
+
+    def _match(self, text: str) -> Tuple[Optional[int], float]:
+        if not text:
+            return None, 0.0
+        food_id = self._lookup_exact(text)
+        if food_id is not None:
+            return food_id, 1.0
+        best_id, best_score = self._fuzzy(text)
+        if best_id is not None:
+            return best_id, best_score
+
+        words = text.split()[:MAX_PHRASE_WORDS]
+        phrases = [
+            " ".join(words[i:i + n])
+            for n in range(len(words) - 1, 0, -1) for i in range(len(words) - n + 1)
+            if all(w in DESCRIPTOR_WORDS or w in UNITS or w in FILLER_WORDS for w in words[:i] + words[i + n:])
+        ]
+        for phrase in phrases:
+            food_id = self._lookup_exact(phrase)
+            if food_id is not None:
+                return food_id, 1.0
+        for phrase in phrases:
+            food_id, score = self._fuzzy(phrase)
+            if food_id is not None:
+                return food_id, score
+        return None, best_score
+
+    def grams(self, food_id: int, quantity: Optional[float], unit: str) -> float:
+        count = quantity if quantity is not None else 1.0
+        if not unit or unit == self.serving_unit[food_id]:
+            return count * float(self.serving_grams[food_id])
+        return count * UNIT_GRAMS.get(unit, float(self.serving_grams[food_id]))
+
+    def analyze(self, food_input: str,
+                estimate_unknown: Optional[Callable[[List[str]], Optional[List[Dict[str, Any]]]]] = None
+                ) -> Dict[str, Any]:
+        """Per-item and total nutrients for a meal description; unknown items go to `estimate_unknown` if given"""
+        items, unknown, food_ids, grams = [], [], [], []
+        for part in split_meal(food_input):
+            quantity, unit, words = parse_item(part)
+            if not words:
+                continue
+            food_id, score = self.match(words)
+            if food_id is None:
+                unknown.append(part)
+                continue
+            items.append({"input": part, "food": self.names[food_id], "match_score": round(score, 3),
+                          "quantity": quantity if quantity is not None else 1,
+                          "unit": unit or self.serving_unit[food_id]})
+            food_ids.append(food_id)
+            grams.append(self.grams(food_id, quantity, unit))
+
+        totals = np.zeros(len(NUTRIENT_FIELDS), dtype=np.float64)
+        if food_ids:
+            grams_column = np.asarray(grams, dtype=np.float32)[:, None]
+            per_item = grams_column * self.nutrients[np.asarray(food_ids)] / 100.0
+            totals += per_item.sum(axis=0)
+            for item, weight, values in zip(items, grams, per_item):
+                item["grams"] = round(weight, 1)
+                item["nutritional_breakdown"] = _breakdown(values)
+
+        source = "local"
+        estimated = []
+        if unknown and estimate_unknown is not None:
+            estimated = estimate_unknown(unknown) or []
+            for part, breakdown in zip(unknown, estimated):
+                values = np.array([float(breakdown.get(field) or 0) for field in NUTRIENT_FIELDS])
+                totals += values
+                items.append({"input": part, "food": part, "source": "llm",
+                              "nutritional_breakdown": _breakdown(values)})
+            if estimated:
+                source = "local+llm" if food_ids else "llm"
+            unknown = unknown[len(estimated):]
+
+        return {
+            "items": items,
+            "unknown_items": unknown,
+            "nutritional_breakdown": _breakdown(totals),
+            "source": source,
+        }
+
+
+def _breakdown(values) -> Dict[str, Any]:
+    breakdown = {field: round(float(value), 1) for field, value in zip(NUTRIENT_FIELDS, values)}
+    breakdown["estimated_calories"] = int(round(breakdown["estimated_calories"]))
+    return breakdown
+
+
+def estimate_items_with_llm(registry, items: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """GPT-4 nutrient estimates for foods the table does not know, in input order; None on failure"""
+    if not items or registry is None or not registry.is_configured():
+        return None
+    prompt = (
+        "Estimate the nutrients of each food item as eaten (use a typical portion when no quantity is given). "
+        "Reply with only a JSON array, one object per item in the same order, with the keys "
+        f"{', '.join(NUTRIENT_FIELDS)}.\n\nItems:\n" + "\n".join(f"- {item}" for item in items)
+    )
+    try:
+        response = registry.chat_completion(
+            "analysis",
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": "You are a nutrition expert. Reply with JSON only."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0,
+            max_tokens=100 + 80 * len(items)
+        )
+        content = response.choices[0].message.content.strip()
+        if content.startswith("```"):
+            content = content.strip("`").removeprefix("json").strip()
+        estimates = json.loads(content)
+    except Exception as e:
+        print(f"⚠️ LLM nutrient estimate failed: {e}")
+        return None
+    if not isinstance(estimates, list):
+        return None
+    return [estimate if isinstance(estimate, dict) else {} for estimate in estimates[:len(items)]]
+
+
+_table: Optional[FoodCompositionTable] = None
+_table_lock = threading.Lock()
+
+
+def get_food_composition() -> FoodCompositionTable:
+    """Process-wide table, loaded from FOOD_COMPOSITION_PATH on first use"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = FoodCompositionTable.from_csv()
+                print(f"✅ Food composition table loaded ({len(_table)} foods, {len(_table.labels)} names)")
+    return _table
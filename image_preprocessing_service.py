@@ -0,0 +1,195 @@
+# File: image_preprocessing_service.py
+"""
+Pillow pre-processing for prescription photos ahead of OCR.
+
+Phone photos arrive as ~12 MP JPEGs, often rotated via EXIF, in colour and
+with table or paper margins around the text. Before OCR every image is:
+
+1. decoded at reduced scale where the format allows it (JPEG draft mode)
+2. rotated upright from its EXIF orientation
+3. converted to grayscale
+4. downscaled so the long side is at most OCR_PREPROCESS_MAX_SIDE pixels
+5. cropped to the content, dropping uniform borders
+6. optionally deskewed (projection-profile search within +/- max_skew degrees)
+
+and re-encoded as PNG. Each step is configurable through the environment or
+per call; settings_tag() identifies a configuration so cached OCR results from
+different settings are kept apart.
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import time
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+try:
+    from PIL import Image, ImageChops, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+OCR_PREPROCESS_ENABLED = os.getenv("OCR_PREPROCESS_ENABLED", "true").lower() == "true"
+OCR_PREPROCESS_MAX_SIDE = int(os.getenv("OCR_PREPROCESS_MAX_SIDE", "2048"))
+OCR_PREPROCESS_GRAYSCALE = os.getenv("OCR_PREPROCESS_GRAYSCALE", "true").lower() == "true"
+OCR_PREPROCESS_CROP_BORDERS = os.getenv("OCR_PREPROCESS_CROP_BORDERS", "true").lower() == "true"
+OCR_PREPROCESS_DESKEW = os.getenv("OCR_PREPROCESS_DESKEW", "false").lower() == "true"
+OCR_PREPROCESS_MAX_SKEW_DEG = float(os.getenv("OCR_PREPROCESS_MAX_SKEW_DEG", "5"))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp')
+
+# Work on small copies when searching for borders and skew
+_ANALYSIS_SIDE = 800
+_BORDER_THRESHOLD = 40
+
+
+def preprocess_settings(**overrides) -> Dict[str, Any]:
+    """Environment defaults merged with per-call overrides"""
+    settings = {
+        "max_side": OCR_PREPROCESS_MAX_SIDE,
+        "grayscale": OCR_PREPROCESS_GRAYSCALE,
+        "crop_borders": OCR_PREPROCESS_CROP_BORDERS,
+        "deskew": OCR_PREPROCESS_DESKEW,
+        "max_skew": OCR_PREPROCESS_MAX_SKEW_DEG,
+    }
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    return settings
+
+
+def settings_tag(**overrides) -> str:
+    """Short stable identifier of the effective settings"""
+    payload = json.dumps(preprocess_settings(**overrides), sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:8]
+
+
+def cache_namespace(base: str) -> str:
+    """OCR cache namespace that changes whenever pre-processing settings change"""
+    return f"{base}-pp{settings_tag()}" if OCR_PREPROCESS_ENABLED else base
+
+
+def is_image_file(filename: str) -> bool:
+    return os.path.splitext(filename or "")[1].lower() in IMAGE_EXTENSIONS
+
+
+def _content_bbox(image: "Image.Image") -> Tuple[int, int, int, int]:
+    """Bounding box of everything that differs from the corner (background) colour"""
+    scale = min(1.0, _ANALYSIS_SIDE / max(image.size))
+    small = image.convert("L")
+    if scale < 1.0:
+        small = small.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.BILINEAR)
+
+    corners = [small.getpixel(p) for p in ((0, 0), (small.width - 1, 0), (0, small.height - 1), (small.width - 1, small.height - 1))]
+    background = Image.new("L", small.size, int(np.median(corners)))
+    mask = ImageChops.difference(small, background).point(lambda p: 255 if p > _BORDER_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return (0, 0, image.width, image.height)
+
+    left, top, right, bottom = bbox
+    return (int(left / scale), int(top / scale),
+            min(image.width, math.ceil(right / scale)), min(image.height, math.ceil(bottom / scale)))
+
+
+def estimate_skew(image: "Image.Image", max_skew: float = OCR_PREPROCESS_MAX_SKEW_DEG, step: float = 0.5) -> float:
+    """
+    Angle (degrees, counter-clockwise) that makes text lines horizontal: the one
+    whose horizontal projection profile is sharpest
+    """
+    small = image.convert("L")
+    scale = min(1.0, _ANALYSIS_SIDE / max(small.size))
+    if scale < 1.0:
+        small = small.resize((max(1, int(small.width * scale)), max(1, int(small.height * scale))), Image.BILINEAR)
+    # Ignore the outer 10% so page edges and leftover borders do not dominate the profile
+    inset_x, inset_y = small.width // 10, small.height // 10
+    small = small.crop((inset_x, inset_y, small.width - inset_x, small.height - inset_y))
+    ink = ImageOps.invert(ImageOps.autocontrast(small)).point(lambda p: 255 if p > 128 else 0)
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_skew, max_skew + step / 2, step):
+        rotated = np.asarray(ink.rotate(float(angle), resample=Image.NEAREST, fillcolor=0), dtype=np.float32)
+        profile = rotated.sum(axis=1)
+        score = float(np.sum(np.diff(profile) ** 2))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return round(best_angle, 2)
+
+
+def preprocess_image(image_bytes: bytes, **overrides) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Return (png_bytes, info) for an uploaded image. `overrides` replace the
+    environment settings (max_side, grayscale, crop_borders, deskew, max_skew).
+    """
+    start = time.perf_counter()
+    settings = preprocess_settings(**overrides)
+    max_side = settings["max_side"]
+    steps = []
+
+    image = Image.open(io.BytesIO(bytes(image_bytes)))
+    original_size = image.size
+
+    # JPEG can decode directly at 1/2, 1/4 or 1/8 scale, skipping most of the work
+    if image.format == "JPEG" and max_side and max(image.size) > max_side:
+        ratio = max_side / max(image.size)
+        image.draft("L" if settings["grayscale"] else "RGB",
+                    (int(image.width * ratio) + 1, int(image.height * ratio) + 1))
+        if image.size != original_size:
+            steps.append("draft_decode")
+
+    upright = ImageOps.exif_transpose(image)
+    if upright is not image:
+        steps.append("exif_orientation")
+    image = upright
+
+    if settings["grayscale"]:
+        image = image.convert("L")
+        steps.append("grayscale")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=2.0)
+        steps.append("downscale")
+
+    if settings["crop_borders"]:
+        bbox = _content_bbox(image)
+        if (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) < 0.98 * image.width * image.height:
+            image = image.crop(bbox)
+            steps.append("crop_borders")
+
+    skew_angle = 0.0
+    if settings["deskew"]:
+        skew_angle = estimate_skew(image, settings["max_skew"])
+        if skew_angle:
+            fill = 255 if image.mode == "L" else (255, 255, 255)
+            image = image.rotate(skew_angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+            steps.append("deskew")
+
+    output = io.BytesIO()
+    image.save(output, format="PNG", compress_level=1)
+    return output.getvalue(), {
+        "original_size": list(original_size),
+        "output_size": list(image.size),
+        "steps": steps,
+        "skew_angle": skew_angle,
+        "settings_tag": settings_tag(**overrides),
+        "processing_time_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def prepare_for_ocr(file_content: bytes, filename: str, **overrides) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Pre-process image uploads for OCR; other documents pass through unchanged.
+    Returns (content, filename, info) with the filename switched to .png when
+    the image was re-encoded. Unreadable images are passed through as they are.
+    """
+    if not PIL_AVAILABLE or not is_image_file(filename):
+        return file_content, filename, {}
+    try:
+        processed, info = preprocess_image(file_content, **overrides)
+    except Exception as e:
+        print(f"⚠️ Image pre-processing skipped for {filename}: {e}")
+        return file_content, filename, {"error": str(e)}
+    return processed, os.path.splitext(filename)[0] + ".png", info
@@ -0,0 +1,556 @@
+# File: medication_reminder_service.py
+"""
+Next-fire-time indexed medication reminders.
+
+The old scheduler loaded every patient document every 15 minutes and parsed
+every dosage time in Python. Reminders now live in their own collection,
+one row per enabled dosage, each holding a precomputed ``next_fire_at``:
+
+    {_id, patient_id, medication_name, dosage, time, hour, minute, frequency,
+     special_instructions, next_fire_at, last_fired_at, updated_at}
+
+Dosages are expanded by expand_dosages(), which the dose schedule and
+adherence (dosage_schedule_service) share: every reminder-enabled dosage
+entry is one dose at its own time on each dosing day. Weekly frequencies dose
+every 7 days from the log date; all others daily. The frequency text ("Twice
+daily") never multiplies an entry, since patients add one entry per dose time.
+
+Rows are rewritten for a patient whenever a medication log is saved
+(ReminderScheduleStore.sync_patient). MedicationReminderScheduler keeps the
+rows due within the next MEDICATION_REMINDER_LOOKAHEAD_HOURS in a min-heap
+and sleeps until the earliest one, so a reminder goes out seconds after its
+time and the database only sees an indexed range query per refresh. After a
+reminder fires, the row's next_fire_at moves to the next day with a
+compare-and-set update, which stops two schedulers from advancing the same
+row twice.
+
+Two more collections make reminders safe with several app processes:
+- ReminderLedger: one document per sent dose, unique on (patient_id,
+  medication_name, dose_time, dose_date). A reminder is claimed with an
+  insert before it is emailed, so a dose is emailed at most once however
+  many schedulers or manual triggers reach it. A sender can return a Future
+  (queued email): the dose is then "queued" until the Future resolves to the
+  real SMTP result, "sent" or "failed".
+- SchedulerLease: a renewable lease document. Every process runs the
+  scheduler thread but only the lease holder fires reminders; the others
+  stand by and take over once the holder stops renewing.
+"""
+import heapq
+import os
+import re
+import socket
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from prescription_parser import parse_frequency
+
+MEDICATION_REMINDER_LOOKAHEAD_HOURS = float(os.getenv("MEDICATION_REMINDER_LOOKAHEAD_HOURS", "24"))
+MEDICATION_REMINDER_REFRESH_MINUTES = float(os.getenv("MEDICATION_REMINDER_REFRESH_MINUTES", "30"))
+MEDICATION_REMINDER_LEAD_MINUTES = int(os.getenv("MEDICATION_REMINDER_LEAD_MINUTES", "0"))
+# Reminders missed by at most this much (e.g. during a restart) are still sent
+MEDICATION_REMINDER_GRACE_MINUTES = int(os.getenv("MEDICATION_REMINDER_GRACE_MINUTES", "15"))
+REMINDER_SCHEDULE_COLLECTION = os.getenv("REMINDER_SCHEDULE_COLLECTION", "medication_reminder_schedule")
+REMINDER_LEDGER_COLLECTION = os.getenv("REMINDER_LEDGER_COLLECTION", "medication_reminder_ledger")
+MEDICATION_REMINDER_LEDGER_RETENTION_DAYS = int(os.getenv("MEDICATION_REMINDER_LEDGER_RETENTION_DAYS", "35"))
+SCHEDULER_LEASE_COLLECTION = os.getenv("SCHEDULER_LEASE_COLLECTION", "scheduler_leases")
+# A standby process takes over at most this long after the lease holder dies
+MEDICATION_REMINDER_LEASE_SECONDS = float(os.getenv("MEDICATION_REMINDER_LEASE_SECONDS", "60"))
+
+CLAIMED = "claimed"
+QUEUED = "queued"
+SENT = "sent"
+FAILED = "failed"
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+
+TIME_RE = re.compile(r"^\s*(\d{1,2})[:.](\d{2})(?::\d{2})?\s*([AaPp]\.?[Mm]\.?)?\s*$")
+
+
+def parse_dose_time(value: Any) -> Optional[Tuple[int, int]]:
+    """(hour, minute) from "08:30", "8.30", "20:30:00" or "8:30 PM"; None if unparseable"""
+    match = TIME_RE.match(str(value or ""))
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2)), match.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem[0].lower() == "p" else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+
+def parse_date(value: Any) -> Optional[str]:
+    """YYYY-MM-DD from an ISO date/datetime or a dd/mm/yyyy date; None if unparseable"""
+    text = str(value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text[:10], fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def dosing_interval_days(frequency: str) -> int:
+    """Days between dosing days: 7 for weekly frequencies, otherwise 1 (unknown text included)"""
+    parsed = parse_frequency(frequency or "") or {}
+    return 7 if "weekly" in parsed.get("normalized", "").lower() else 1
+
+
+def is_dosing_day(day: datetime, interval_days: int = 1, anchor_date: Optional[str] = None) -> bool:
+    if interval_days <= 1 or not anchor_date:
+        return True
+    anchor = datetime.strptime(anchor_date, "%Y-%m-%d")
+    return (day.replace(hour=0, minute=0, second=0, microsecond=0) - anchor).days % interval_days == 0
+
+
+def expand_dosages(patient: Dict[str, Any], now: datetime) -> List[Dict[str, Any]]:
+    """
+    Reminder-enabled dosages of a patient, one dose each per dosing day (see the module docstring):
+    [{log_index, log, dosage_index, dosage, hour, minute, interval_days, anchor_date}]
+    """
+    expanded = []
+    for log_index, log in enumerate(patient.get("medication_logs") or []):
+        if log.get("is_prescription_mode", False):
+            continue
+        anchor_date = parse_date(log.get("timestamp")) or now.strftime("%Y-%m-%d")
+        for dosage_index, dosage in enumerate(log.get("dosages") or []):
+            if not dosage.get("reminder_enabled", False):
+                continue
+            parsed = parse_dose_time(dosage.get("time"))
+            if not parsed:
+                continue
+            expanded.append({
+                "log_index": log_index,
+                "log": log,
+                "dosage_index": dosage_index,
+                "dosage": dosage,
+                "hour": parsed[0],
+                "minute": parsed[1],
+                "interval_days": dosing_interval_days(dosage.get("frequency", "")),
+                "anchor_date": anchor_date,
+            })
+    return expanded
+
+
+def next_fire_at(hour: int, minute: int, after: datetime, lead_minutes: int = MEDICATION_REMINDER_LEAD_MINUTES,
+                 interval_days: int = 1, anchor_date: Optional[str] = None) -> datetime:
+    """First reminder time strictly after `after` for a dose at hour:minute on each dosing day"""
+    dose_at = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    while dose_at - timedelta(minutes=lead_minutes) <= after or not is_dosing_day(dose_at, interval_days, anchor_date):
+        dose_at += timedelta(days=1)
+    return dose_at - timedelta(minutes=lead_minutes)
+
+
+def row_next_fire_at(row: Dict[str, Any], after: datetime, lead_minutes: int = MEDICATION_REMINDER_LEAD_MINUTES) -> datetime:
+    return next_fire_at(row["hour"], row["minute"], after, lead_minutes,
+                        row.get("interval_days", 1), row.get("anchor_date"))
+
+
+def schedule_rows(patient: Dict[str, Any], now: datetime,
+                  lead_minutes: int = MEDICATION_REMINDER_LEAD_MINUTES) -> List[Dict[str, Any]]:
+    """One schedule row per reminder-enabled dosage in a patient's medication_logs"""
+    patient_id = patient.get("patient_id")
+    rows = []
+    for item in expand_dosages(patient, now):
+        log, dosage = item["log"], item["dosage"]
+        log_key = log.get("timestamp") or str(item["log_index"])
+        row = {
+            "_id": f"{patient_id}:{log_key}:{item['dosage_index']}",
+            "patient_id": patient_id,
+            "medication_name": log.get("medication_name", "Unknown"),
+            "dosage": dosage.get("dosage", ""),
+            "time": dosage.get("time", ""),
+            "hour": item["hour"],
+            "minute": item["minute"],
+            "frequency": dosage.get("frequency", ""),
+            "interval_days": item["interval_days"],
+            "anchor_date": item["anchor_date"],
+            "special_instructions": dosage.get("special_instructions", ""),
+            "updated_at": now,
+        }
+        row["next_fire_at"] = row_next_fire_at(row, now, lead_minutes)
+        rows.append(row)
+    return rows
+
+
+def nearest_dose_at(row: Dict[str, Any], now: datetime) -> datetime:
+    """The dose closest to now on a dosing day (yesterday's, today's or tomorrow's time)"""
+    today = now.replace(hour=row["hour"], minute=row["minute"], second=0, microsecond=0)
+    candidates = [today + timedelta(days=d) for d in (-1, 0, 1)]
+    dosing = [at for at in candidates if is_dosing_day(at, row.get("interval_days", 1), row.get("anchor_date"))]
+    return min(dosing or candidates, key=lambda at: abs(at - now))
+
+
+def reminder_key(row: Dict[str, Any], dose_at: datetime) -> Dict[str, str]:
+    """Ledger key of one dose: patient, medication, dose time and date"""
+    return {
+        "patient_id": row["patient_id"],
+        "medication_name": row.get("medication_name", "Unknown"),
+        "dose_time": f"{dose_at.hour:02d}:{dose_at.minute:02d}",
+        "dose_date": dose_at.strftime("%Y-%m-%d"),
+    }
+
+
+class ReminderScheduleStore:
+    """The reminder schedule collection: one row per enabled dosage, indexed on next_fire_at"""
+
+    def __init__(self, collection, lead_minutes: int = MEDICATION_REMINDER_LEAD_MINUTES):
+        self.collection = collection
+        self.lead_minutes = lead_minutes
+
+    def ensure_indexes(self):
+        self.collection.create_index("next_fire_at")
+        self.collection.create_index("patient_id")
+        self.collection.create_index("updated_at")
+
+    def sync_patient(self, patient: Dict[str, Any], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Rewrite a patient's rows from their medication_logs; rows whose dose time is unchanged keep their state"""
+        now = now or datetime.now()
+        rows = schedule_rows(patient, now, self.lead_minutes)
+        existing = {row["_id"]: row for row in self.collection.find({"patient_id": patient.get("patient_id")})}
+        for row in rows:
+            previous = existing.get(row["_id"])
+            if previous and all(previous.get(k) == row[k] for k in ("hour", "minute", "interval_days", "anchor_date")):
+                # Same dose time: keep the pending fire time so a re-save does not skip or repeat today's reminder
+                row["next_fire_at"] = previous["next_fire_at"]
+                if previous.get("last_fired_at"):
+                    row["last_fired_at"] = previous["last_fired_at"]
+            self.collection.replace_one({"_id": row["_id"]}, row, upsert=True)
+        self.collection.delete_many({
+            "patient_id": patient.get("patient_id"),
+            "_id": {"$nin": [row["_id"] for row in rows]}
+        })
+        return rows
+
+    def rebuild(self, patients: Iterable[Dict[str, Any]], now: Optional[datetime] = None) -> int:
+        """Backfill the schedule from existing patient documents (one pass, first start only)"""
+        return sum(len(self.sync_patient(patient, now)) for patient in patients)
+
+    def due_before(self, until: datetime) -> List[Dict[str, Any]]:
+        return list(self.collection.find({"next_fire_at": {"$lte": until}}))
+
+    def around(self, now: datetime, minutes: int) -> List[Dict[str, Any]]:
+        """Rows with a dose time within +/- minutes of now (fired recently or about to fire)"""
+        window = timedelta(minutes=minutes)
+        return list(self.collection.find({"$or": [
+            {"next_fire_at": {"$gte": now - window, "$lte": now + window}},
+            {"last_fired_at": {"$gte": now - window}},
+        ]}))
+
+    def changed_since(self, since: datetime) -> List[Dict[str, Any]]:
+        """Rows rewritten by sync_patient after `since` (possibly in another process)"""
+        return list(self.collection.find({"updated_at": {"$gte": since}}))
+
+    def get(self, schedule_id: str) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({"_id": schedule_id})
+
+    def advance(self, row: Dict[str, Any], fired_at: datetime, next_time: datetime) -> bool:
+        """Compare-and-set next_fire_at; False when another scheduler or a re-save moved the row first"""
+        result = self.collection.update_one(
+            {"_id": row["_id"], "next_fire_at": row["next_fire_at"]},
+            {"$set": {"next_fire_at": next_time, "last_fired_at": fired_at}}
+        )
+        return result.modified_count == 1
+
+    def count(self) -> int:
+        return self.collection.count_documents({})
+
+
+class ReminderLedger:
+    """Sent-reminder ledger; the unique index makes claim() succeed once per dose"""
+
+    def __init__(self, collection, owner: Optional[str] = None,
+                 retention_days: int = MEDICATION_REMINDER_LEDGER_RETENTION_DAYS):
+        self.collection = collection
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.retention_days = retention_days
+
+    def ensure_indexes(self):
+        self.collection.create_index(
+            [("patient_id", 1), ("medication_name", 1), ("dose_time", 1), ("dose_date", 1)],
+            unique=True, name="one_reminder_per_dose"
+        )
+        self.collection.create_index("claimed_at", expireAfterSeconds=self.retention_days * 86400)
+
+    def claim(self, row: Dict[str, Any], dose_at: datetime) -> bool:
+        """Record the dose as being sent; False when it was already claimed"""
+        key = reminder_key(row, dose_at)
+        try:
+            self.collection.insert_one({
+                **key,
+                "reminder_key": "reminder_" + "_".join(key.values()),
+                "schedule_id": row.get("_id"),
+                "status": CLAIMED,
+                "owner": self.owner,
+                "claimed_at": datetime.now(),
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def mark(self, row: Dict[str, Any], dose_at: datetime, sent: bool, error: Optional[str] = None):
+        update = {"status": SENT if sent else FAILED, "finished_at": datetime.now()}
+        if error:
+            update["error"] = error
+        self.collection.update_one(reminder_key(row, dose_at), {"$set": update})
+
+    def record(self, row: Dict[str, Any], dose_at: datetime, result: Any, error: Optional[str] = None) -> bool:
+        """
+        Mark what send_reminder returned: a bool, or a Future of one for email that
+        is only queued. The dose stays "queued" until the Future resolves.
+        """
+        if not isinstance(result, Future):
+            self.mark(row, dose_at, bool(result), error)
+            return bool(result)
+        self.collection.update_one(
+            {**reminder_key(row, dose_at), "status": CLAIMED},
+            {"$set": {"status": QUEUED, "queued_at": datetime.now()}}
+        )
+
+        def delivered(future: Future):
+            try:
+                failure = future.exception()
+                self.mark(row, dose_at, failure is None and bool(future.result()),
+                          str(failure) if failure else None)
+            except Exception as e:
+                print(f"⚠️ Could not record reminder delivery for {row.get('patient_id')}: {e}")
+
+        result.add_done_callback(delivered)
+        return True
+
+
+class SchedulerLease:
+    """Mongo lease document: {_id: name, owner, expires_at}; one holder at a time"""
+
+    def __init__(self, collection, name: str, owner: Optional[str] = None,
+                 ttl_seconds: float = MEDICATION_REMINDER_LEASE_SECONDS, now: Callable[[], datetime] = datetime.now):
+        self.collection = collection
+        self.name = name
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.now = now
+        self.held = False
+
+    def acquire(self) -> bool:
+        """Take the lease if it is free or expired, or renew it if we hold it"""
+        now = self.now()
+        try:
+            # No match means someone else holds a live lease: the upsert then collides on _id
+            self.collection.update_one(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + self.ttl, "renewed_at": now}},
+                upsert=True
+            )
+            self.held = True
+        except DuplicateKeyError:
+            self.held = False
+        return self.held
+
+    def release(self):
+        if self.held:
+            self.collection.delete_one({"_id": self.name, "owner": self.owner})
+            self.held = False
+
+    def holder(self) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({"_id": self.name})
+
+
+class MedicationReminderScheduler:
+    """Min-heap of upcoming reminders; sleeps until the earliest one is due
+
+    With a lease only the holder fires; with a ledger each dose is claimed before it is sent.
+    send_reminder(row) returns whether the reminder went out, or a Future of that (see ReminderLedger.record).
+    """
+
+    def __init__(self, store: ReminderScheduleStore, send_reminder: Callable[[Dict[str, Any]], bool],
+                 now: Callable[[], datetime] = datetime.now,
+                 lookahead_hours: float = MEDICATION_REMINDER_LOOKAHEAD_HOURS,
+                 refresh_minutes: float = MEDICATION_REMINDER_REFRESH_MINUTES,
+                 grace_minutes: int = MEDICATION_REMINDER_GRACE_MINUTES,
+                 ledger: Optional[ReminderLedger] = None, lease: Optional[SchedulerLease] = None,
+                 poll_seconds: Optional[float] = None):
+        self.store = store
+        self.send_reminder = send_reminder
+        self.now = now
+        self.lookahead = timedelta(hours=lookahead_hours)
+        self.refresh_interval = timedelta(minutes=refresh_minutes)
+        self.grace = timedelta(minutes=grace_minutes)
+        self.ledger = ledger
+        self.lease = lease
+        # Lease renewal and pickup of schedule rows written by other processes
+        if poll_seconds is None:
+            poll_seconds = lease.ttl.total_seconds() / 3 if lease else 20
+        self.poll_interval = timedelta(seconds=poll_seconds)
+        self.leader = lease is None
+        self._heap: List[Tuple[datetime, str]] = []
+        self._cond = threading.Condition()
+        self._next_refresh = datetime.min
+        self._next_poll = datetime.min
+        self._last_poll = datetime.min
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.fired = 0
+        self.skipped_late = 0
+        self.stale = 0
+        self.already_sent = 0
+
+    def refresh(self):
+        """Reload the heap with every row due within the lookahead window (one indexed range query)"""
+        now = self.now()
+        rows = self.store.due_before(now + self.lookahead)
+        with self._cond:
+            self._heap = [(row["next_fire_at"], row["_id"]) for row in rows]
+            heapq.heapify(self._heap)
+            self._next_refresh = now + self.refresh_interval
+            self._last_poll = now
+            self._cond.notify()
+        return len(rows)
+
+    def poll_changes(self) -> int:
+        """Queue rows other processes rewrote since the last poll (the heap drops duplicates when popped)"""
+        now = self.now()
+        # Overlap the window a little so rows written with a slightly behind clock are not missed
+        rows = self.store.changed_since(self._last_poll - timedelta(seconds=5))
+        self._last_poll = now
+        self.notify(rows)
+        return len(rows)
+
+    def hold_lease(self) -> bool:
+        """Renew or take the lease; on losing it the heap is dropped until it is taken again"""
+        was_leader = self.leader
+        self.leader = self.lease.acquire()
+        if self.leader and not was_leader:
+            print(f"👑 Medication reminder scheduler lease taken by {self.lease.owner}")
+            self._next_refresh = datetime.min
+        elif was_leader and not self.leader:
+            print(f"⏸️ Medication reminder scheduler lease lost by {self.lease.owner}, standing by")
+            with self._cond:
+                self._heap = []
+        return self.leader
+
+    def notify(self, rows: Iterable[Dict[str, Any]]):
+        """Add rows written by sync_patient; entries superseded by a re-save are dropped when popped"""
+        horizon = self.now() + self.lookahead
+        with self._cond:
+            for row in rows:
+                if row["next_fire_at"] <= horizon:
+                    heapq.heappush(self._heap, (row["next_fire_at"], row["_id"]))
+            self._cond.notify()
+
+    def seconds_until_next(self) -> Optional[float]:
+        with self._cond:
+            return (self._heap[0][0] - self.now()).total_seconds() if self._heap else None
+
+    def run_pending(self) -> int:
+        """Fire every reminder whose time has come; returns the number sent"""
+        sent = 0
+        while True:
+            now = self.now()
+            with self._cond:
+                if not self._heap or self._heap[0][0] > now:
+                    return sent
+                fire_at, schedule_id = heapq.heappop(self._heap)
+
+            row = self.store.get(schedule_id)
+            if not row or row["next_fire_at"] != fire_at:
+                self.stale += 1  # deleted or rescheduled since it was queued
+                continue
+
+            next_time = row_next_fire_at(row, max(now, fire_at), self.store.lead_minutes)
+            if not self.store.advance(row, now, next_time):
+                self.stale += 1
+                continue
+
+            dose_at = fire_at + timedelta(minutes=self.store.lead_minutes)
+            if now - fire_at > self.grace:
+                self.skipped_late += 1
+                print(f"⚠️ Skipped reminder for {row['medication_name']} ({row['patient_id']}), "
+                      f"missed by {(now - fire_at).total_seconds() / 60:.0f} min")
+            elif self.ledger is not None and not self.ledger.claim(row, dose_at):
+                self.already_sent += 1
+            else:
+                result, error = False, None
+                try:
+                    result = self.send_reminder(row)
+                except Exception as e:
+                    error = str(e)
+                    print(f"❌ Error sending reminder {schedule_id}: {e}")
+                if self.ledger is not None:
+                    self.ledger.record(row, dose_at, result, error)
+                if result:
+                    sent += 1
+                    self.fired += 1
+
+            if next_time <= now + self.lookahead:
+                with self._cond:
+                    heapq.heappush(self._heap, (next_time, schedule_id))
+
+    def tick(self) -> int:
+        """One scheduler pass: renew the lease and pick up schedule changes when due, then fire"""
+        now = self.now()
+        if now >= self._next_poll:
+            self._next_poll = now + self.poll_interval
+            if self.lease is not None and not self.hold_lease():
+                return 0
+            if now >= self._next_refresh:
+                self.refresh()
+            else:
+                self.poll_changes()
+        return self.run_pending() if self.leader else 0
+
+    def _wait_seconds(self) -> float:
+        now = self.now()
+        wait = (self._next_poll - now).total_seconds()
+        if self._heap:
+            wait = min(wait, (self._heap[0][0] - now).total_seconds())
+        return max(0.0, wait)
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                self.tick()
+                with self._cond:
+                    if not self._stopping:
+                        self._cond.wait(self._wait_seconds())
+            except Exception as e:
+                print(f"❌ Error in medication reminder scheduler: {e}")
+                with self._cond:
+                    self._cond.wait(60)
+
+    def start(self) -> threading.Thread:
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="medication-reminders", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+        if self.lease is not None:
+            self.lease.release()
+            self.leader = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            upcoming = self._heap[0][0].isoformat() if self._heap else None
+            queued = len(self._heap)
+        return {
+            "queued": queued,
+            "next_fire_at": upcoming,
+            "fired": self.fired,
+            "skipped_late": self.skipped_late,
+            "stale": self.stale,
+            "already_sent": self.already_sent,
+            "leader": self.leader,
+            "owner": self.lease.owner if self.lease else None,
+            "running": bool(self._thread and self._thread.is_alive()),
+        }
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Local n8n webhook sink for load-testing the prescription -> n8n path
+
+Accepts POST on any path (e.g. /webhook/<id>) and answers like an n8n webhook
+node. Behaviour is configurable so timeouts, retries and concurrency can be
+sized without touching the real n8n host in webhook_configs.json:
+- latency: fixed seconds plus uniform jitter per request
+- error rate: share of requests answered 500
+- 429 rate: share of requests answered 429 with Retry-After
+- max concurrency: requests above it are answered 429 (like a busy worker)
+
+GET /stats returns request, status and connection counters, plus how many
+requests were repeats of an Idempotency-Key already accepted.
+
+Usage:
+    python n8n_stub_server.py --port 5678 --latency 0.15 --jitter 0.1 --error-rate 0.02 --rate-429 0.05
+    # point the app at it with a copy of webhook_configs.json whose url is http://127.0.0.1:5678/webhook/prescription
+    WEBHOOK_CONFIGS_PATH=/tmp/stub_webhook_configs.json python app_simple.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class SinkState:
+    """Behaviour settings and counters shared by all request handlers"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_429: float = 0.0, max_concurrency: int = 0, retry_after: int = 1, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.statuses = {}
+        self.accepted_keys = {}  # Idempotency-Key -> arrival time of the accepted request
+        self.duplicates = 0
+
+    def admit(self, key: str):
+        """Pick the response status and latency for one request"""
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            roll = self.random.random()
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+            if self.max_concurrency and self.in_flight > self.max_concurrency:
+                status = 429
+            elif roll < self.rate_429:
+                status = 429
+            elif roll < self.rate_429 + self.error_rate:
+                status = 500
+            else:
+                status = 200
+        return status, delay
+
+    def finish(self, status: int, key: str):
+        with self.lock:
+            self.in_flight -= 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status == 200 and key:
+                if key in self.accepted_keys:
+                    self.duplicates += 1
+                else:
+                    self.accepted_keys[key] = time.time()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "peak_in_flight": self.peak_in_flight,
+                "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+                "accepted": len(self.accepted_keys),
+                "duplicates": self.duplicates,
+            }
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    state = None  # set by create_sink_server
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.state.snapshot())
+        else:
+            self._send_json(404, {"message": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        key = self.headers.get("Idempotency-Key") or self.headers.get("X-Webhook-Delivery-Id") or ""
+
+        status, delay = self.state.admit(key)
+        try:
+            if delay:
+                time.sleep(delay)
+            if status == 429:
+                self._send_json(429, {"message": "Too many requests"}, {"Retry-After": str(self.state.retry_after)})
+            elif status == 500:
+                self._send_json(500, {"message": "Workflow execution failed (stub injected failure)"})
+            else:
+                self._send_json(200, {"message": "Workflow was started"})
+        finally:
+            self.state.finish(status, key)
+
+
+def create_sink_server(host: str = "127.0.0.1", port: int = 0, **state_kwargs):
+    """Create (but do not start) a sink; port 0 picks a free port"""
+    state = SinkState(**state_kwargs)
+    handler = type("BoundSinkHandler", (SinkHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 256
+    server.state = state
+    return server
+
+
+def start_sink_server(**kwargs):
+    """Start a sink in a background thread and return it"""
+    server = create_sink_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def sink_url(server, path: str = "/webhook/prescription") -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}{path}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local n8n webhook sink")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5678)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 500")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="answer 429 above this many in flight")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server = create_sink_server(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                                error_rate=args.error_rate, rate_429=args.rate_429,
+                                max_concurrency=args.max_concurrency, seed=args.seed)
+    print(f"🚀 n8n stub listening on {sink_url(server)} (stats: http://{args.host}:{args.port}/stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n👋 n8n stub stopped: {json.dumps(server.state.snapshot())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,19 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import pymongo
 import os
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
+from openai_client_service import OPENAI_AVAILABLE, get_openai_registry
+from audio_ingest_service import read_audio_request, transcribe_upload
+from transcription_service import create_transcription_router
+from upload_service import UploadTooLargeError
+from food_composition_service import get_food_composition, estimate_items_with_llm
+from nutrition_rollup_service import (
+    NutritionRollupStore,
+    NUTRITION_ROLLUP_COLLECTION,
+    NUTRITION_ROLLUP_MAX_DAYS,
+    NUTRITION_ROLLUP_DEFAULT_WINDOW,
+)
 import json
 
 # Load environment variables
@@ -49,6 +60,31 @@ class NutritionDatabase:
 # Initialize database
 db = NutritionDatabase()
 
+# Daily nutrition totals per patient, updated on every food_data write (see nutrition_rollup_service)
+if db.patients_collection is not None:
+    nutrition_rollups = NutritionRollupStore(db.patients_collection.database[NUTRITION_ROLLUP_COLLECTION])
+    try:
+        nutrition_rollups.ensure_indexes()
+    except Exception as e:
+        print(f"⚠️ Nutrition rollup index creation failed: {e}")
+else:
+    nutrition_rollups = None
+
+# Remote Whisper API or local faster-whisper for /transcribe (TRANSCRIPTION_BACKEND, or 'backend' per request)
+transcription_router = create_transcription_router(get_openai_registry())
+
+def record_food_rollup(user_id, food_entry):
+    """Add a saved food_data entry to the patient's daily rollup"""
+    if nutrition_rollups is None:
+        return
+    try:
+        nutrition_rollups.record_entry(user_id, food_entry)
+    except Exception as e:
+        print(f"⚠️ Could not update nutrition rollup for {user_id}: {e}")
+
+def load_patient_food_data(user_id):
+    return db.patients_collection.find_one({"patient_id": user_id}, {"patient_id": 1, "food_data": 1})
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -193,6 +229,7 @@ def save_food_entry():
         
         if result.modified_count > 0:
             print(f"✅ Food entry saved in patients_v2 for user: {data['userId']}")
+            record_food_rollup(data['userId'], food_entry)
             return jsonify({
                 'success': True,
                 'message': 'Food entry saved successfully in patients_v2',
@@ -455,55 +492,26 @@ def get_daily_calorie_summary(user_id):
                 'message': 'Database not available'
             }), 500
         
-        # Find the patient by patient_id
-        patient = db.patients_collection.find_one({"patient_id": user_id})
-        if not patient:
+        # Today's totals come from the daily rollup instead of scanning food_data
+        if not nutrition_rollups.ensure_seeded(user_id, load_patient_food_data):
             return jsonify({
                 'success': False,
                 'message': f'Patient not found with ID: {user_id}'
             }), 404
         
-        # Get today's date
         today = datetime.now().date()
-        
-        # Get food entries for today from the patient's food_data array
-        all_food_data = patient.get('food_data', [])
-        
-        # Filter for today's entries
-        today_entries = []
-        for entry in all_food_data:
-            if 'created_at' in entry:
-                entry_date = entry['created_at']
-                if isinstance(entry_date, datetime):
-                    if entry_date.date() == today:
-                        today_entries.append(entry)
-                elif isinstance(entry_date, str):
-                    try:
-                        entry_date_obj = datetime.fromisoformat(entry_date.replace('Z', '+00:00'))
-                        if entry_date_obj.date() == today:
-                            today_entries.append(entry)
-                    except:
-                        continue
-        
-        # Calculate summary
-        total_calories = 0
-        total_protein = 0
-        total_carbs = 0
-        total_fat = 0
-        meals_eaten = len(today_entries)
-        
-        for entry in today_entries:
-            nutritional = entry.get('nutritional_breakdown', {})
-            total_calories += nutritional.get('estimated_calories', 0)
-            total_protein += nutritional.get('protein_grams', 0)
-            total_carbs += nutritional.get('carbohydrates_grams', 0)
-            total_fat += nutritional.get('fat_grams', 0)
+        today_totals = nutrition_rollups.day(user_id, today)
+        total_calories = today_totals['calories']
+        total_protein = today_totals['protein_grams']
+        total_carbs = today_totals['carbohydrates_grams']
+        total_fat = today_totals['fat_grams']
+        meals_eaten = today_totals['meals']
         
         # Mock recommendations (in real app, these would come from nutrition database)
         recommended_calories = 2200  # Example for pregnant woman
         calories_remaining = max(0, recommended_calories - total_calories)
         meals_remaining = max(0, 5 - meals_eaten)  # Assuming 5 meals per day
-        calories_per_remaining_meal = calories_remaining // meals_remaining if meals_remaining > 0 else 0
+        calories_per_remaining_meal = int(calories_remaining // meals_remaining) if meals_remaining > 0 else 0
         percentage_of_daily_needs = (total_calories / recommended_calories * 100) if recommended_calories > 0 else 0
         
         daily_summary = {
@@ -544,6 +552,56 @@ def get_daily_calorie_summary(user_id):
             'message': f'Error: {str(e)}'
         }), 500
 
+@app.route('/nutrition/rollups/<user_id>', methods=['GET'])
+def get_nutrition_rollups(user_id):
+    """Daily nutrition totals, averages and moving averages for a date range, from the daily rollups
+
+    Query parameters: days (default 7, ending today) or start/end (YYYY-MM-DD),
+    window (moving average days, default 7), group=day|week.
+    """
+    try:
+        if nutrition_rollups is None:
+            return jsonify({
+                'success': False,
+                'message': 'Database not available'
+            }), 500
+        
+        group = request.args.get('group', 'day')
+        if group not in ('day', 'week'):
+            return jsonify({'success': False, 'message': 'group must be day or week'}), 400
+        try:
+            end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+            if request.args.get('start'):
+                start = date.fromisoformat(request.args['start'])
+            else:
+                start = end - timedelta(days=int(request.args.get('days', 7)) - 1)
+            window = int(request.args.get('window', NUTRITION_ROLLUP_DEFAULT_WINDOW))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'start/end must be YYYY-MM-DD, days and window numbers'}), 400
+        if start > end or window < 1:
+            return jsonify({'success': False, 'message': 'start must not be after end and window must be positive'}), 400
+        if (end - start).days + window > NUTRITION_ROLLUP_MAX_DAYS:
+            return jsonify({
+                'success': False,
+                'message': f'The range plus window is limited to {NUTRITION_ROLLUP_MAX_DAYS} days'
+            }), 400
+        
+        if not nutrition_rollups.ensure_seeded(user_id, load_patient_food_data):
+            return jsonify({
+                'success': False,
+                'message': f'Patient not found with ID: {user_id}'
+            }), 404
+        
+        report = nutrition_rollups.report(user_id, start, end, window, group)
+        return jsonify({'success': True, **report}), 200
+        
+    except Exception as e:
+        print(f"Error getting nutrition rollups: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
 @app.route('/nutrition/analyze-with-gpt4', methods=['POST'])
 def analyze_food_with_gpt4():
     """Analyze food using GPT-4 for detailed nutritional insights"""
@@ -573,16 +631,14 @@ def analyze_food_with_gpt4():
                 'message': 'OpenAI API key not configured'
             }), 500
         
-        try:
-            from openai import OpenAI
-        except ImportError:
+        if not OPENAI_AVAILABLE:
             return jsonify({
                 'success': False,
                 'message': 'OpenAI package not installed. Run: pip install openai'
             }), 500
         
-        # Initialize OpenAI client
-        client = OpenAI(api_key=openai_api_key)
+        # Shared OpenAI client (pooled connections, timeouts and retries)
+        openai_registry = get_openai_registry()
         
         # Create comprehensive GPT-4 prompt for food analysis
         prompt = f"""
@@ -642,7 +698,8 @@ def analyze_food_with_gpt4():
         """
         
         # Call GPT-4 for analysis
-        response = client.chat.completions.create(
+        response = openai_registry.chat_completion(
+            "analysis",
             model="gpt-4",
             messages=[
                 {
@@ -693,6 +750,7 @@ def analyze_food_with_gpt4():
                 )
                 
                 if result.modified_count > 0:
+                    # Not rolled up: the client saves the meal through save-food-entry, which is counted
                     print(f"✅ Food data with GPT-4 analysis stored in patients_v2 for user: {user_id}")
                     analysis_data['analysis_id'] = f"analysis_{datetime.now().timestamp()}"
                 else:
@@ -713,13 +771,7 @@ def analyze_food_with_gpt4():
             
             # Fallback to structured response
             fallback_analysis = {
-                'nutritional_breakdown': {
-                    'estimated_calories': len(food_input) * 2,
-                    'protein_grams': max(10, len(food_input)),
-                    'carbohydrates_grams': max(20, len(food_input)),
-                    'fat_grams': max(5, len(food_input)),
-                    'fiber_grams': max(3, len(food_input))
-                },
+                'nutritional_breakdown': get_food_composition().analyze(food_input)['nutritional_breakdown'],
                 'pregnancy_benefits': {
                     'week_specific_advice': f'At week {pregnancy_week}, focus on balanced nutrition',
                     'note': 'GPT-4 response parsing failed, using fallback analysis'
@@ -802,21 +854,13 @@ def analyze_nutrition():
                 'message': 'Food input is required'
             }), 400
         
-        # Mock nutrition analysis (in real app, this would use AI/ML models)
-        # This is a simplified example
-        estimated_calories = len(food_input) * 2  # Rough estimate
-        protein_grams = max(10, estimated_calories // 20)
-        carbs_grams = max(20, estimated_calories // 15)
-        fat_grams = max(5, estimated_calories // 25)
-        fiber_grams = max(3, estimated_calories // 30)
-        
-        nutritional_breakdown = {
-            'estimated_calories': estimated_calories,
-            'protein_grams': protein_grams,
-            'carbohydrates_grams': carbs_grams,
-            'fat_grams': fat_grams,
-            'fiber_grams': fiber_grams
-        }
+        # Known foods come from the local composition table; GPT-4 only estimates the unknown items
+        meal = get_food_composition().analyze(
+            food_input,
+            estimate_unknown=lambda items: estimate_items_with_llm(get_openai_registry(), items)
+        )
+        nutritional_breakdown = meal['nutritional_breakdown']
+        estimated_calories = nutritional_breakdown['estimated_calories']
         
         # Mock daily calorie tracking
         daily_calorie_tracking = {
@@ -856,6 +900,9 @@ def analyze_nutrition():
         return jsonify({
             'success': True,
             'nutritional_breakdown': nutritional_breakdown,
+            'food_items': meal['items'],
+            'unknown_items': meal['unknown_items'],
+            'nutrition_source': meal['source'],
             'daily_calorie_tracking': daily_calorie_tracking,
             'remaining_calories': remaining_calories,
             'smart_tips_for_today': smart_tips_for_today,
@@ -876,106 +923,63 @@ def analyze_nutrition():
 def transcribe_audio():
     """Transcribe audio using OpenAI Whisper API"""
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No data provided'
-            }), 400
-        
-        audio_base64 = data.get('audio', '')
-        language = data.get('language', 'en')
-        method = data.get('method', 'whisper')
-        
-        if not audio_base64:
-            return jsonify({
-                'success': False,
-                'message': 'Audio data is required'
-            }), 400
-        
-        # Get OpenAI API key from environment
-        openai_api_key = os.getenv('OPENAI_API_KEY')
-        if not openai_api_key:
-            return jsonify({
-                'success': False,
-                'message': 'OpenAI API key not configured'
-            }), 500
-        
-        # Import OpenAI client
+        # Raw audio/* body, multipart 'audio' file or base64 JSON, spooled in chunks
         try:
-            from openai import OpenAI
-        except ImportError:
-            return jsonify({
-                'success': False,
-                'message': 'OpenAI package not installed. Run: pip install openai'
-            }), 500
-        
-        # Initialize OpenAI client
-        client = OpenAI(api_key=openai_api_key)
-        
-        # Convert base64 to bytes
-        import base64
-        import tempfile
-        
-        try:
-            audio_bytes = base64.b64decode(audio_base64)
-        except Exception as e:
-            return jsonify({
-                'success': False,
-                'message': f'Invalid base64 audio data: {str(e)}'
-            }), 400
-        
-        # Create a temporary file for the audio
-        # Try different file extensions based on the audio format
-        file_extensions = ['.webm', '.wav', '.mp3', '.m4a', '.ogg']
-        temp_file_path = None
-        
-        for ext in file_extensions:
-            try:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp_file:
-                    temp_file.write(audio_bytes)
-                    temp_file_path = temp_file.name
-                break
-            except Exception as e:
-                print(f"Failed to create temp file with {ext}: {e}")
-                continue
-        
-        if not temp_file_path:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to create temporary audio file'
-            }), 500
-        
-        try:
-            # Transcribe using OpenAI Whisper
-            with open(temp_file_path, 'rb') as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language=language
-                )
+            upload, options = read_audio_request(request, default_filename="audio.webm")
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'message': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        with upload:
+            language = options.get('language', 'en')
+            method = options.get('method', 'whisper')
+            backend = options.get('backend')
             
-            # Clean up temporary file
-            os.unlink(temp_file_path)
-            
-            return jsonify({
-                'success': True,
-                'transcription': transcript.text,
-                'language': language,
-                'method': method
-            }), 200
+            if upload.size == 0:
+                return jsonify({
+                    'success': False,
+                    'message': 'Audio data is required'
+                }), 400
             
-        except Exception as e:
-            # Clean up temporary file on error
+            # Remote Whisper needs an OpenAI key; local faster-whisper does not
             try:
-                os.unlink(temp_file_path)
-            except:
-                pass
+                available = transcription_router.available(backend)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            if not available:
+                return jsonify({
+                    'success': False,
+                    'message': 'OpenAI API key not configured (or pip install faster-whisper for local transcription)'
+                }), 500
             
-            return jsonify({
-                'success': False,
-                'message': f'Transcription failed: {str(e)}'
-            }), 500
+            def whisper(path, language):
+                return transcription_router.transcribe(path, language, backend=backend)
+            
+            try:
+                # Transcribe (16 kHz mono Opus first when that is smaller), falling back between backends
+                result = transcribe_upload(upload, whisper, language, options.get('transcode'))
+                
+                return jsonify({
+                    'success': True,
+                    'transcription': result['text'],
+                    'language': language,
+                    'method': method,
+                    'backend': result['backend'],
+                    'latency_ms': result['latency_ms'],
+                    'fallback_from': result['fallback_from'],
+                    'audio': {
+                        'bytes_received': result['bytes_received'],
+                        'bytes_sent': result['bytes_sent'],
+                        'transcoded': result['transcoded']
+                    }
+                }), 200
+                
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'message': f'Transcription failed: {str(e)}'
+                }), 500
         
     except Exception as e:
         print(f"Error transcribing audio: {e}")
@@ -8,10 +8,11 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import pymongo
 import os
-import base64
-import tempfile
 from datetime import datetime
 from dotenv import load_dotenv
+from openai_client_service import OPENAI_AVAILABLE, get_openai_registry
+from audio_ingest_service import read_audio_request, transcribe_upload
+from upload_service import UploadTooLargeError
 import json
 
 # Load environment variables
@@ -76,91 +77,74 @@ def transcribe_audio():
                 'message': 'OpenAI API key not configured'
             }), 500
         
-        try:
-            from openai import OpenAI
-        except ImportError:
+        if not OPENAI_AVAILABLE:
             return jsonify({
                 'success': False,
                 'message': 'OpenAI package not installed. Run: pip install openai'
             }), 500
         
-        # Initialize OpenAI client
-        client = OpenAI(api_key=openai_api_key)
-        
-        data = request.get_json()
-        if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No data provided'
-            }), 400
-        
-        audio_data = data.get('audio')
-        language = data.get('language', 'auto')  # Default to auto-detect
-        method = data.get('method', 'whisper')
-        
-        if not audio_data:
-            return jsonify({
-                'success': False,
-                'message': 'No audio data provided'
-            }), 400
+        # Shared OpenAI client (pooled connections, timeouts and retries)
+        openai_registry = get_openai_registry()
         
-        print(f"🔍 Audio data length: {len(audio_data)}")
-        
-        # Decode base64 audio
+        # Raw audio/* body, multipart 'audio' file or base64 JSON, spooled in chunks
         try:
-            audio_bytes = base64.b64decode(audio_data)
-            print(f"✅ Audio decoded: {len(audio_bytes)} bytes")
-        except Exception as e:
-            return jsonify({
-                'success': False,
-                'message': f'Invalid audio data: {str(e)}'
-            }), 400
+            upload, options = read_audio_request(request, default_filename="audio.webm")
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'message': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as temp_file:
-            temp_file.write(audio_bytes)
-            temp_file_path = temp_file.name
-            print(f"📁 Temporary file created: {temp_file_path}")
+        language = options.get('language', 'auto')  # Default to auto-detect
+        method = options.get('method', 'whisper')
         
-        try:
-            # Transcribe with Whisper
-            if method == 'whisper':
-                # Auto-detect language if not specified
-                if language == 'auto':
-                    # Try Tamil first, then English
-                    try:
-                        # First attempt with Tamil
-                        result = client.audio.transcriptions.create(
-                            model="whisper-1",
-                            file=open(temp_file_path, "rb"),
-                            language="ta",  # Tamil
-                            response_format="text"
-                        )
-                        transcription = result
-                        detected_language = "ta"
-                        print("🔤 Detected Tamil language")
-                    except Exception as tamil_error:
-                        print(f"⚠️ Tamil detection failed, trying English: {tamil_error}")
-                        # Fallback to English
-                        result = client.audio.transcriptions.create(
+        with upload:
+            if upload.size == 0:
+                return jsonify({
+                    'success': False,
+                    'message': 'No audio data provided'
+                }), 400
+            
+            print(f"✅ Audio received: {upload.size} bytes")
+            
+            if method != 'whisper':
+                return jsonify({
+                    'success': False,
+                    'message': f'Unsupported method: {method}'
+                }), 400
+            
+            detected = {}
+            
+            def whisper(path, language):
+                def attempt(code):
+                    with open(path, "rb") as audio_file:
+                        return openai_registry.transcription(
                             model="whisper-1",
-                            file=open(temp_file_path, "rb"),
-                            language="en",  # English
+                            file=audio_file,
+                            language=code,
                             response_format="text"
                         )
-                        transcription = result
-                        detected_language = "en"
-                        print("🔤 Detected English language")
-                else:
-                    # Use specified language
-                    result = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=open(temp_file_path, "rb"),
-                        language=language,
-                        response_format="text"
-                    )
-                    transcription = result
-                    detected_language = language
+                
+                # Auto-detect language if not specified
+                if language != 'auto':
+                    detected['language'] = language
+                    return attempt(language)
+                # Try Tamil first, then English
+                try:
+                    text = attempt("ta")
+                    detected['language'] = "ta"
+                    print("🔤 Detected Tamil language")
+                except Exception as tamil_error:
+                    print(f"⚠️ Tamil detection failed, trying English: {tamil_error}")
+                    text = attempt("en")
+                    detected['language'] = "en"
+                    print("🔤 Detected English language")
+                return text
+            
+            try:
+                # Transcoded once to 16 kHz mono Opus when smaller, then shared by both attempts
+                result = transcribe_upload(upload, whisper, language, options.get('transcode'))
+                transcription = result['text']
+                detected_language = detected.get('language', language)
                 
                 print(f"✅ Transcription successful: {transcription}")
                 
@@ -175,28 +159,20 @@ def transcribe_audio():
                     'language': detected_language,
                     'method': method,
                     'translation_note': translation_note,
+                    'audio': {
+                        'bytes_received': result['bytes_received'],
+                        'bytes_sent': result['bytes_sent'],
+                        'transcoded': result['transcoded']
+                    },
                     'timestamp': datetime.now().isoformat()
                 }), 200
-            else:
+                    
+            except Exception as e:
+                print(f"❌ Error in transcription: {e}")
                 return jsonify({
                     'success': False,
-                    'message': f'Unsupported method: {method}'
-                }), 400
-                
-        except Exception as e:
-            print(f"❌ Error in transcription: {e}")
-            return jsonify({
-                'success': False,
-                'message': f'Transcription failed: {str(e)}'
-            }), 500
-            
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_file_path)
-                print(f"🧹 Temporary file cleaned up: {temp_file_path}")
-            except Exception as cleanup_error:
-                print(f"⚠️ Failed to clean up temp file: {cleanup_error}")
+                    'message': f'Transcription failed: {str(e)}'
+                }), 500
                 
     except Exception as e:
         print(f"❌ Error in transcription: {e}")
@@ -236,16 +212,14 @@ def analyze_food_with_gpt4():
                 'message': 'OpenAI API key not configured'
             }), 500
         
-        try:
-            from openai import OpenAI
-        except ImportError:
+        if not OPENAI_AVAILABLE:
             return jsonify({
                 'success': False,
                 'message': 'OpenAI package not installed. Run: pip install openai'
             }), 500
         
-        # Initialize OpenAI client
-        client = OpenAI(api_key=openai_api_key)
+        # Shared OpenAI client (pooled connections, timeouts and retries)
+        openai_registry = get_openai_registry()
         
         # Create GPT-4 prompt
         prompt = f"""
@@ -281,7 +255,8 @@ def analyze_food_with_gpt4():
         """
         
         # Call GPT-4
-        response = client.chat.completions.create(
+        response = openai_registry.chat_completion(
+            "analysis",
             model="gpt-4",
             messages=[
                 {
@@ -0,0 +1,389 @@
+# File: nutrition_cache_service.py
+"""
+Shared GPT-4 food analysis cache for /nutrition/analyze-with-gpt4.
+
+"idli with sambar" at week 20 gets the same analysis for every patient, so
+analyses are cached across patients by:
+
+- the food text normalized: lowercased, filler words dropped ("with", "of",
+  ...), quantities canonicalized and attached to the food they count
+  ("two idlis" -> "2*idlis", "200 grams rice" -> "200g*rice", "an apple" ->
+  "apple") and the items sorted, so "Sambar with 2 idli" == "2 idli and sambar"
+- the pregnancy-week bucket (NUTRITION_CACHE_WEEK_BUCKET weeks; the prompt
+  asks for advice for the whole bucket)
+- NUTRITION_PROMPT_VERSION, bumped whenever the prompt changes
+
+Lookups go through an in-memory LRU (NUTRITION_CACHE_MEMORY_SIZE entries),
+then a persistent store reused from ocr_cache_service: Mongo
+(nutrition_analysis_cache, TTL index on last use) or JSON files on disk
+(size-bounded LRU). Patients' food_data entries keep the analysis_ref and
+the nutritional breakdown instead of a full copy of the analysis.
+
+The cache evicts, but a food log must not lose its analysis, so every
+analysis a food_data entry references is first pinned in the archive: the
+Mongo nutrition_analyses collection, which has no TTL and is never pruned.
+Without Mongo there is nothing durable to point at and entries keep their
+own copy of the analysis, as before.
+"""
+import hashlib
+import os
+import re
+import threading
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from ocr_cache_service import DiskOCRStore, MongoOCRStore
+
+NUTRITION_CACHE_BACKEND = os.getenv("NUTRITION_CACHE_BACKEND", "mongo").lower()  # mongo | disk | none
+NUTRITION_CACHE_DIR = os.getenv(
+    "NUTRITION_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".nutrition_cache")
+)
+NUTRITION_CACHE_MAX_MB = float(os.getenv("NUTRITION_CACHE_MAX_MB", "100"))
+NUTRITION_CACHE_TTL_DAYS = int(os.getenv("NUTRITION_CACHE_TTL_DAYS", "90"))
+NUTRITION_CACHE_MEMORY_SIZE = int(os.getenv("NUTRITION_CACHE_MEMORY_SIZE", "2048"))
+NUTRITION_CACHE_WEEK_BUCKET = max(1, int(os.getenv("NUTRITION_CACHE_WEEK_BUCKET", "4")))
+NUTRITION_PROMPT_VERSION = os.getenv("NUTRITION_PROMPT_VERSION", "1")
+
+MAX_PREGNANCY_WEEK = 42
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "dozen": 12,
+    "half": 0.5, "quarter": 0.25,
+}
+UNITS = {
+    "g": "g", "gm": "g", "gms": "g", "gram": "g", "grams": "g", "gr": "g",
+    "kg": "kg", "kgs": "kg", "kilogram": "kg", "kilograms": "kg",
+    "ml": "ml", "millilitre": "ml", "milliliter": "ml", "millilitres": "ml", "milliliters": "ml",
+    "l": "l", "litre": "l", "liter": "l", "litres": "l", "liters": "l",
+    "cup": "cup", "cups": "cup", "bowl": "bowl", "bowls": "bowl", "katori": "bowl", "katoris": "bowl",
+    "plate": "plate", "plates": "plate", "glass": "glass", "glasses": "glass",
+    "piece": "piece", "pieces": "piece", "pc": "piece", "pcs": "piece",
+    "slice": "slice", "slices": "slice",
+    "tbsp": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "tsp": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+}
+FILLER_WORDS = {"with", "and", "of", "some", "the", "plus", "also", "along", "had", "ate", "i", "my", "for"}
+
+TOKEN_RE = re.compile(r"\d+(?:[./]\d+)?|[^\s\d.,;:!?()\[\]/&+\-\"']+")
+
+
+def parse_quantity(token: str) -> Optional[float]:
+    if token in NUMBER_WORDS:
+        return float(NUMBER_WORDS[token])
+    try:
+        if "/" in token:
+            numerator, denominator = token.split("/")
+            return float(numerator) / float(denominator)
+        return float(token)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def normalize_food_text(text: str) -> str:
+    """Canonical, order-independent form of a food description (see module docstring)"""
+    items = []
+    quantity, unit = None, ""
+
+    def flush_bare_quantity():
+        if quantity is not None and (quantity != 1 or unit):
+            items.append(f"{quantity:g}{unit}")
+
+    for token in TOKEN_RE.findall((text or "").lower()):
+        value = parse_quantity(token)
+        if value is not None:
+            if quantity is not None and not unit:
+                value *= quantity  # "half a cup", "2 dozen"
+            elif quantity is not None:
+                flush_bare_quantity()
+            quantity, unit = value, ""
+        elif token in UNITS and quantity is not None:
+            unit = UNITS[token]
+        elif token in FILLER_WORDS:
+            continue
+        else:
+            if quantity is None or (quantity == 1 and not unit):
+                items.append(token)
+            else:
+                items.append(f"{quantity:g}{unit}*{token}")
+            quantity, unit = None, ""
+    flush_bare_quantity()
+    return " ".join(sorted(items))
+
+
+def week_bucket(pregnancy_week: Any, size: int = NUTRITION_CACHE_WEEK_BUCKET) -> Tuple[int, int]:
+    """(first week, last week) of the bucket holding a pregnancy week; unparseable weeks count as week 1"""
+    try:
+        week = int(float(pregnancy_week))
+    except (TypeError, ValueError):
+        week = 1
+    week = min(max(week, 1), MAX_PREGNANCY_WEEK)
+    first = (week - 1) // size * size + 1
+    return first, min(first + size - 1, MAX_PREGNANCY_WEEK)
+
+
+def week_label(weeks: Tuple[int, int]) -> str:
+    return f"week {weeks[0]}" if weeks[0] == weeks[1] else f"weeks {weeks[0]}-{weeks[1]}"
+
+
+def analysis_key(food_input: str, pregnancy_week: Any) -> Tuple[str, str, Tuple[int, int]]:
+    """(cache key, normalized food text, week bucket); the key is empty when nothing is left to cache on"""
+    normalized = normalize_food_text(food_input)
+    weeks = week_bucket(pregnancy_week)
+    if not normalized:
+        return "", normalized, weeks
+    digest = hashlib.sha256(
+        f"{NUTRITION_PROMPT_VERSION}|{weeks[0]}-{weeks[1]}|{normalized}".encode("utf-8")
+    ).hexdigest()
+    return f"nutrition:v{NUTRITION_PROMPT_VERSION}:{digest}", normalized, weeks
+
+
+def build_analysis_prompt(food_input: str, weeks: Tuple[int, int]) -> str:
+    """The GPT-4 prompt for a food; changing it means bumping NUTRITION_PROMPT_VERSION"""
+    label = week_label(weeks)
+    return f"""
+        Analyze this food item for a pregnant woman at {label}:
+
+        Food: {food_input}
+
+        Provide a detailed analysis in JSON format with the following structure:
+        {{
+            "nutritional_breakdown": {{
+                "estimated_calories": <number>,
+                "protein_grams": <number>,
+                "carbohydrates_grams": <number>,
+                "fat_grams": <number>,
+                "fiber_grams": <number>
+            }},
+            "pregnancy_benefits": {{
+                "nutrients_for_fetal_development": ["list of specific nutrients"],
+                "benefits_for_mother": ["list of benefits"],
+                "week_specific_advice": "specific advice for {label}"
+            }},
+            "safety_considerations": {{
+                "food_safety_tips": ["list of safety tips"],
+                "cooking_recommendations": ["cooking guidelines"]
+            }},
+            "smart_recommendations": {{
+                "next_meal_suggestions": ["suggestions for next meal"],
+                "hydration_tips": "water intake advice"
+            }}
+        }}
+
+        Focus on pregnancy-specific nutrition needs.
+        """
+
+
+class MongoAnalysisArchive:
+    """Analyses referenced from food_data, keyed by analysis_ref; no TTL, never evicted"""
+
+    name = "mongo"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        document = self.collection.find_one({"_id": key}, projection={"entry": 1})
+        return document["entry"] if document else None
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        # First writer wins: a reference always resolves to the analysis it was saved with
+        self.collection.update_one(
+            {"_id": key},
+            {"$setOnInsert": {"entry": json.loads(json.dumps(entry, default=str)), "created_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "archive_collection": self.collection.name,
+            "archived_analyses": self.collection.estimated_document_count(),
+        }
+
+
+class NutritionAnalysisCache:
+    """In-memory LRU in front of an optional persistent store (Mongo or disk), plus the durable archive"""
+
+    def __init__(self, store=None, memory_size: int = NUTRITION_CACHE_MEMORY_SIZE, archive=None):
+        self.store = store
+        self.archive = archive
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+        self.pinned = 0
+        self.archive_hits = 0
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        if self.memory_size <= 0:
+            return
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached entry {analysis, food_text, weeks, prompt_version, cached_at} or None"""
+        if not key:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+        entry = None
+        if self.store is not None:
+            try:
+                entry = self.store.get(key)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Nutrition cache read failed: {e}")
+        if entry is None:
+            self.misses += 1
+            return None
+        self.store_hits += 1
+        self._remember(key, entry)
+        return entry
+
+    def get_analysis(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.get(key)
+        return entry["analysis"] if entry else None
+
+    def put(self, key: str, analysis: Dict[str, Any], food_text: str, weeks: Tuple[int, int]):
+        if not key or not analysis:
+            return
+        entry = {
+            "analysis": analysis,
+            "food_text": food_text,
+            "weeks": list(weeks),
+            "prompt_version": NUTRITION_PROMPT_VERSION,
+            "cached_at": time.time(),
+        }
+        self._remember(key, entry)
+        self.stores += 1
+        if self.store is not None:
+            try:
+                self.store.put(key, entry)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Nutrition cache write failed: {e}")
+
+    def _archived(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.archive is None or not key:
+            return None
+        try:
+            entry = self.archive.get(key)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Nutrition analysis archive read failed: {e}")
+            return None
+        if entry is None:
+            return None
+        self.archive_hits += 1
+        return entry["analysis"]
+
+    def pin(self, key: str, analysis: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Archive the analysis behind `key` so a food_data entry can reference it.
+        False when there is no archive, the key is unknown or the write failed:
+        the caller must then store the analysis itself.
+        """
+        if not key or self.archive is None:
+            return False
+        if analysis is None:
+            analysis = self.get_analysis(key)
+            if analysis is None:
+                return self._archived(key) is not None
+        try:
+            self.archive.put(key, {"analysis": analysis, "prompt_version": NUTRITION_PROMPT_VERSION,
+                                   "archived_at": time.time()})
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Nutrition analysis archive write failed: {e}")
+            return False
+        self.pinned += 1
+        return True
+
+    def find_ref(self, food_input: str, pregnancy_week: Any, analysis: Optional[Dict[str, Any]]) -> str:
+        """The cache key of an analysis a client sent back in full, or "" when it is not the cached one"""
+        if not analysis:
+            return ""
+        key, _, _ = analysis_key(food_input, pregnancy_week)
+        return key if key and self.get_analysis(key) == analysis else ""
+
+    def resolve_entries(self, food_data: Iterable[Dict[str, Any]]) -> int:
+        """Fill 'analysis' on food_data entries that only hold an analysis_ref; returns how many were resolved"""
+        resolved = 0
+        for entry in food_data:
+            key = entry.get("analysis_ref")
+            if not key or entry.get("analysis"):
+                continue
+            analysis = self.get_analysis(key) or self._archived(key)
+            if analysis is None:
+                entry["analysis_expired"] = True
+                continue
+            entry["analysis"] = analysis
+            resolved += 1
+        return resolved
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.store_hits + self.misses
+        stats = {
+            "backend": self.store.name if self.store else "memory",
+            "prompt_version": NUTRITION_PROMPT_VERSION,
+            "week_bucket": NUTRITION_CACHE_WEEK_BUCKET,
+            "memory_entries": len(self._memory),
+            "memory_size": self.memory_size,
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "errors": self.errors,
+            "archive": self.archive.name if self.archive else None,
+            "pinned": self.pinned,
+            "archive_hits": self.archive_hits,
+            "hit_rate": round((self.memory_hits + self.store_hits) / lookups, 4) if lookups else 0.0,
+        }
+        if self.store is not None:
+            try:
+                stats.update(self.store.stats())
+            except Exception as e:
+                stats["store_error"] = str(e)
+        if self.archive is not None:
+            try:
+                stats.update(self.archive.stats())
+            except Exception as e:
+                stats["archive_error"] = str(e)
+        return stats
+
+
+def create_nutrition_cache(backend: str = NUTRITION_CACHE_BACKEND, mongo_database=None) -> NutritionAnalysisCache:
+    """Build the cache for NUTRITION_CACHE_BACKEND; falls back to disk when Mongo is unavailable"""
+    store = None
+    try:
+        if backend == "mongo" and mongo_database is not None:
+            store = MongoOCRStore(mongo_database["nutrition_analysis_cache"], ttl_days=NUTRITION_CACHE_TTL_DAYS)
+        elif backend in ("mongo", "disk"):
+            if backend == "mongo":
+                print("⚠️ MongoDB not available for the nutrition cache, using the disk cache")
+            store = DiskOCRStore(NUTRITION_CACHE_DIR, max_bytes=int(NUTRITION_CACHE_MAX_MB * 1024 * 1024))
+    except Exception as e:
+        print(f"⚠️ Nutrition cache persistent store disabled: {e}")
+        store = None
+
+    # Referenced analyses outlive the cache; without Mongo, food_data entries keep full copies
+    archive = MongoAnalysisArchive(mongo_database["nutrition_analyses"]) if mongo_database is not None else None
+
+    print(f"✅ Nutrition analysis cache enabled ({store.name if store else 'memory only'}, "
+          f"{'analyses archived' if archive else 'no archive, entries keep full analyses'})")
+    return NutritionAnalysisCache(store, archive=archive)
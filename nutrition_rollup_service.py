@@ -0,0 +1,288 @@
+# File: nutrition_rollup_service.py
+"""
+Per-patient daily nutrition rollups.
+
+/daily-calorie-summary used to scan the whole food_data array and parse every
+created_at on each call, and trends over weeks or months meant scanning
+everything. NUTRITION_ROLLUP_COLLECTION holds one document per patient and
+day:
+
+    {_id: "<patient_id>:<YYYY-MM-DD>", patient_id, date, calories,
+     protein_grams, carbohydrates_grams, fat_grams, fiber_grams, meals,
+     seed: {...same counters}, post: {...same counters}, updated_at}
+
+- every food_data write ($push) increments the day of its created_at with
+  the entry's nutritional_breakdown and one meal
+- GPT-4 analysis records (type gpt4_analysis, entry_type gpt4_analyzed*)
+  are not meals: the client analyses a meal and then saves it through
+  save-food-entry, so only the saved entry is counted
+- a patient's existing history is rolled up once, on the first read
+  (ensure_seeded). The "<patient_id>:seeded" marker is inserted first
+  ($setOnInsert) and fixes a cutoff. Only entries created before the cutoff
+  are read from food_data, into the day's `seed` counters; entries created
+  after it go to `post`. Seeding never touches `post`, so a meal saved while
+  seeding runs is not overwritten, and seeding is safe to repeat (concurrent
+  readers, or a retry after a crash, since the marker stays "seeding" until
+  it finishes). A day with `seed` counts seed + post; the top-level counters
+  are what was recorded before the patient was seeded, which the seed
+  replaces.
+- ranges read the days in the window (index on patient_id + date); missing
+  days count as zero, and moving averages are computed over the days read
+"""
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+NUTRITION_ROLLUP_COLLECTION = os.getenv("NUTRITION_ROLLUP_COLLECTION", "nutrition_daily_rollups")
+NUTRITION_ROLLUP_MAX_DAYS = int(os.getenv("NUTRITION_ROLLUP_MAX_DAYS", "366"))
+NUTRITION_ROLLUP_DEFAULT_WINDOW = int(os.getenv("NUTRITION_ROLLUP_DEFAULT_WINDOW", "7"))
+
+# Rollup field -> key in a food entry's nutritional_breakdown
+ROLLUP_FIELDS = {
+    "calories": "estimated_calories",
+    "protein_grams": "protein_grams",
+    "carbohydrates_grams": "carbohydrates_grams",
+    "fat_grams": "fat_grams",
+    "fiber_grams": "fiber_grams",
+}
+COUNTER_FIELDS = tuple(ROLLUP_FIELDS) + ("meals",)
+
+# food_data entries written by analyze-with-gpt4 itself; the meal is counted when it is saved
+ANALYSIS_ENTRY_TYPES = ("gpt4_analysis",)
+ANALYSIS_ENTRY_KINDS = ("gpt4_analyzed", "gpt4_analyzed_fallback")
+
+SEEDING = "seeding"
+SEEDED = "seeded"
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def entry_created_at(entry: Dict[str, Any]) -> Optional[datetime]:
+    """A food_data entry's created_at (datetime or ISO string) as a naive local time; None if missing or unparseable"""
+    created_at = entry.get("created_at")
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(created_at, datetime):
+        return None
+    return created_at.astimezone().replace(tzinfo=None) if created_at.tzinfo else created_at
+
+
+def entry_day(entry: Dict[str, Any]) -> Optional[str]:
+    """YYYY-MM-DD of a food_data entry's created_at; None if missing or unparseable"""
+    created_at = entry_created_at(entry)
+    return created_at.date().isoformat() if created_at else None
+
+
+def is_meal_entry(entry: Dict[str, Any]) -> bool:
+    """False for the analysis records analyze-with-gpt4 stores next to the saved meal"""
+    return entry.get("type") not in ANALYSIS_ENTRY_TYPES and entry.get("entry_type") not in ANALYSIS_ENTRY_KINDS
+
+
+def entry_counts(entry: Dict[str, Any]) -> Dict[str, float]:
+    """Rollup increments for one food_data entry; GPT-4 entries without a top-level breakdown use the analysis's"""
+    breakdown = entry.get("nutritional_breakdown")
+    if not breakdown:
+        analysis = entry.get("gpt4_analysis") or entry.get("analysis") or {}
+        breakdown = analysis.get("nutritional_breakdown") if isinstance(analysis, dict) else None
+    breakdown = breakdown if isinstance(breakdown, dict) else {}
+    counts = {field: _number(breakdown.get(key)) for field, key in ROLLUP_FIELDS.items()}
+    counts["meals"] = 1
+    return counts
+
+
+def rollup_id(patient_id: str, day: str) -> str:
+    return f"{patient_id}:{day}"
+
+
+def day_totals(row: Dict[str, Any]) -> Dict[str, float]:
+    """Counters of one rollup document: the seed (or, before seeding, the live counters) plus post-seed entries"""
+    base = row.get("seed") if isinstance(row.get("seed"), dict) else row
+    post = row.get("post") if isinstance(row.get("post"), dict) else {}
+    return {field: _number(base.get(field)) + _number(post.get(field)) for field in COUNTER_FIELDS}
+
+
+def _period(day: str, group: str) -> str:
+    if group == "week":
+        year, week, _ = date.fromisoformat(day).isocalendar()
+        return f"{year}-W{week:02d}"
+    return day
+
+
+def _rounded(values) -> Dict[str, Any]:
+    result = {field: round(float(v), 1) for field, v in zip(COUNTER_FIELDS, values)}
+    result["calories"] = int(round(result["calories"]))
+    result["meals"] = int(round(result["meals"]))
+    return result
+
+
+def summarize_days(rows: Iterable[Dict[str, Any]], start: date, end: date,
+                   window: int = NUTRITION_ROLLUP_DEFAULT_WINDOW, group: str = "day") -> Dict[str, Any]:
+    """Totals, daily averages and a series (per day with trailing moving averages, or per ISO week) for
+    start..end. `rows` may reach back window - 1 days before start so the first averages are complete."""
+    window = max(1, window)
+    first = start - timedelta(days=window - 1)
+    span = (end - first).days + 1
+    values = np.zeros((span, len(COUNTER_FIELDS)), dtype=np.float64)
+    for row in rows:
+        offset = (date.fromisoformat(row["date"]) - first).days
+        if 0 <= offset < span:
+            values[offset] = [_number(row.get(field)) for field in COUNTER_FIELDS]
+
+    # Trailing moving average over `window` days, from a cumulative sum
+    cumulative = np.vstack([np.zeros(len(COUNTER_FIELDS)), np.cumsum(values, axis=0)])
+    moving = (cumulative[window:] - cumulative[:-window]) / window
+    in_range = values[window - 1:]
+    days = [start + timedelta(days=i) for i in range(len(in_range))]
+
+    totals = in_range.sum(axis=0)
+    if group == "week":
+        weeks: Dict[str, np.ndarray] = {}
+        for day, vector in zip(days, in_range):
+            key = _period(day.isoformat(), "week")
+            weeks[key] = weeks.get(key, 0) + vector
+        series = [{"period": key, **_rounded(vector)} for key, vector in sorted(weeks.items())]
+    else:
+        series = [
+            {"date": day.isoformat(), **_rounded(vector),
+             "moving_average": {field: round(float(v), 1) for field, v in zip(COUNTER_FIELDS, average)}}
+            for day, vector, average in zip(days, in_range, moving)
+        ]
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": len(days),
+        "group": group,
+        "window": window,
+        "totals": _rounded(totals),
+        "daily_average": {field: round(float(v), 1) for field, v in zip(COUNTER_FIELDS, totals / len(days))},
+        "series": series,
+    }
+
+
+class NutritionRollupStore:
+    """Daily nutrition totals per patient, kept up to date on every food_data write"""
+
+    def __init__(self, collection, now: Callable[[], datetime] = datetime.now):
+        self.collection = collection
+        self.now = now
+        self._seeded = set()
+        self._cutoffs: Dict[str, Optional[datetime]] = {}
+
+    def ensure_indexes(self):
+        self.collection.create_index([("patient_id", 1), ("date", 1)])
+
+    def _seed_cutoff(self, patient_id: str) -> Optional[datetime]:
+        """Cutoff of the patient's seeding marker; None before seeding (and for markers that predate cutoffs)"""
+        if patient_id in self._cutoffs:
+            return self._cutoffs[patient_id]
+        marker = self.collection.find_one({"_id": rollup_id(patient_id, "seeded")})
+        if marker is None:
+            return None
+        self._cutoffs[patient_id] = marker.get("cutoff")
+        return marker.get("cutoff")
+
+    def record_entry(self, patient_id: str, entry: Dict[str, Any]) -> bool:
+        """Add one food_data entry to its day; analysis records are skipped (returns False)"""
+        if not is_meal_entry(entry):
+            return False
+        created_at = entry_created_at(entry)
+        day = created_at.date().isoformat() if created_at else date.today().isoformat()
+        counts = entry_counts(entry)
+        cutoff = self._seed_cutoff(patient_id)
+        if cutoff is not None and (created_at is None or created_at >= cutoff):
+            # After the seeding cutoff: kept apart from the seed so seeding cannot overwrite it
+            counts = {f"post.{field}": value for field, value in counts.items()}
+        self.collection.update_one(
+            {"_id": rollup_id(patient_id, day)},
+            {
+                "$inc": counts,
+                "$set": {"updated_at": datetime.now()},
+                "$setOnInsert": {"patient_id": patient_id, "date": day},
+            },
+            upsert=True
+        )
+        return True
+
+    def rebuild(self, patient: Dict[str, Any], cutoff: Optional[datetime] = None) -> int:
+        """
+        Set the `seed` counters of every day from the patient's food_data entries
+        (only those created before `cutoff`, if given); returns the number of days.
+        Counters of later entries (`post`) are left alone, so this can be repeated.
+        """
+        patient_id = patient.get("patient_id")
+        days: Dict[str, Dict[str, float]] = {}
+        for entry in patient.get("food_data") or []:
+            if not is_meal_entry(entry):
+                continue
+            created_at = entry_created_at(entry)
+            if created_at is None or (cutoff is not None and created_at >= cutoff):
+                continue
+            totals = days.setdefault(created_at.date().isoformat(), {field: 0.0 for field in COUNTER_FIELDS})
+            for field, value in entry_counts(entry).items():
+                totals[field] += value
+        now = datetime.now()
+        for day, totals in days.items():
+            self.collection.update_one(
+                {"_id": rollup_id(patient_id, day)},
+                {"$set": {"seed": totals, "updated_at": now},
+                 "$setOnInsert": {"patient_id": patient_id, "date": day}},
+                upsert=True
+            )
+        return len(days)
+
+    def ensure_seeded(self, patient_id: str, load_patient: Callable[[str], Optional[Dict[str, Any]]]) -> bool:
+        """Roll up a patient's existing food_data once; False if the patient does not exist"""
+        if patient_id in self._seeded:
+            return True
+        marker_id = rollup_id(patient_id, "seeded")
+        marker = self.collection.find_one({"_id": marker_id})
+        # Markers without a state were written by full rebuilds and are complete
+        if marker is not None and marker.get("state", SEEDED) == SEEDED:
+            self._seeded.add(patient_id)
+            return True
+        if marker is None:
+            # The marker (and its cutoff) exists before food_data is read: entries saved from now on go to `post`
+            self.collection.update_one(
+                {"_id": marker_id},
+                {"$setOnInsert": {"patient_id": patient_id, "cutoff": self.now(), "state": SEEDING}},
+                upsert=True
+            )
+            marker = self.collection.find_one({"_id": marker_id})
+        self._cutoffs[patient_id] = marker["cutoff"]
+
+        patient = load_patient(patient_id)
+        if not patient:
+            return False
+        days = self.rebuild(patient, marker["cutoff"])
+        self.collection.update_one(
+            {"_id": marker_id},
+            {"$set": {"state": SEEDED, "seeded_at": datetime.now(), "days": days}}
+        )
+        self._seeded.add(patient_id)
+        print(f"📊 Nutrition rollups seeded for {patient_id}: {days} days")
+        return True
+
+    def days(self, patient_id: str, start: date, end: date) -> List[Dict[str, Any]]:
+        rows = self.collection.find(
+            {"patient_id": patient_id, "date": {"$gte": start.isoformat(), "$lte": end.isoformat()}}
+        )
+        return [{"date": row["date"], **day_totals(row)} for row in rows]
+
+    def day(self, patient_id: str, day: date) -> Dict[str, Any]:
+        row = self.collection.find_one({"_id": rollup_id(patient_id, day.isoformat())}) or {}
+        return _rounded(list(day_totals(row).values()))
+
+    def report(self, patient_id: str, start: date, end: date, window: int = NUTRITION_ROLLUP_DEFAULT_WINDOW,
+               group: str = "day") -> Dict[str, Any]:
+        rows = self.days(patient_id, start - timedelta(days=max(1, window) - 1), end)
+        return {"patient_id": patient_id, **summarize_days(rows, start, end, window, group)}
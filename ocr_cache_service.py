@@ -0,0 +1,284 @@
+# File: ocr_cache_service.py
+"""
+Content-addressed cache for OCR results.
+
+Uploaded documents are keyed by the SHA-256 of their bytes plus a namespace
+naming the processor that produced the result ("enhanced" PaddleOCR or the
+"basic" OCRService), so re-uploads of the same prescription return the stored
+result instead of running OCR again. Two stores are available:
+
+- disk:  one JSON file per document under OCR_CACHE_DIR; least recently used
+         files are evicted once the directory exceeds OCR_CACHE_MAX_MB
+- mongo: an ``ocr_result_cache`` collection with a TTL index on last use
+
+Concurrent uploads of the same document are single-flighted: the first caller
+runs OCR, the others wait for its result. Only complete, successful results
+are stored (see is_cacheable).
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, Tuple
+
+OCR_CACHE_BACKEND = os.getenv("OCR_CACHE_BACKEND", "disk").lower()  # disk | mongo | none
+OCR_CACHE_DIR = os.getenv(
+    "OCR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ocr_cache")
+)
+OCR_CACHE_MAX_MB = float(os.getenv("OCR_CACHE_MAX_MB", "200"))
+OCR_CACHE_TTL_DAYS = int(os.getenv("OCR_CACHE_TTL_DAYS", "30"))
+OCR_CACHE_WAIT_SEC = float(os.getenv("OCR_CACHE_WAIT_SEC", "600"))
+
+
+def document_digest(file_content: bytes) -> str:
+    return hashlib.sha256(file_content).hexdigest()
+
+
+def is_cacheable(result: Optional[Dict[str, Any]]) -> bool:
+    """Successful and complete: PDFs with pages whose OCR failed report partial=True"""
+    return bool(result) and bool(result.get("success")) and not result.get("partial")
+
+
+class DiskOCRStore:
+    """JSON files on local disk, evicted least-recently-used once over the size budget"""
+
+    name = "disk"
+
+    def __init__(self, directory: str = OCR_CACHE_DIR, max_bytes: int = int(OCR_CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key.replace(":", "_") + ".json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mtime doubles as last-used time for LRU eviction
+        except OSError:
+            pass
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        path = self._path(key)
+        payload = json.dumps(result, default=str).encode("utf-8")
+        if len(payload) > self.max_bytes:
+            return
+
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        with self._lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._total_bytes += len(payload) - previous
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries:
+            if self._total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._total_bytes -= size
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+        }
+
+
+class MongoOCRStore:
+    """Mongo collection keyed by digest, expired by a TTL index on last use"""
+
+    name = "mongo"
+
+    def __init__(self, collection, ttl_days: int = OCR_CACHE_TTL_DAYS):
+        self.collection = collection
+        self.ttl_days = ttl_days
+        try:
+            self.collection.create_index("last_used_at", expireAfterSeconds=ttl_days * 86400)
+        except Exception as e:
+            print(f"⚠️ OCR cache TTL index creation failed: {e}")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        document = self.collection.find_one_and_update(
+            {"_id": key},
+            {"$set": {"last_used_at": datetime.utcnow()}, "$inc": {"hits": 1}},
+            projection={"result": 1}
+        )
+        return document["result"] if document else None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"result": json.loads(json.dumps(result, default=str)), "last_used_at": now},
+             "$setOnInsert": {"created_at": now, "hits": 0}},
+            upsert=True
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "collection": self.collection.name,
+            "documents": self.collection.estimated_document_count(),
+            "ttl_days": self.ttl_days,
+        }
+
+
+class OCRResultCache:
+    """Digest-keyed OCR result lookups with single-flight computation"""
+
+    def __init__(self, store=None, wait_seconds: float = OCR_CACHE_WAIT_SEC):
+        self.store = store
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    @staticmethod
+    def make_key(digest: str, namespace: str) -> str:
+        return f"{namespace}:{digest}"
+
+    def get(self, digest: str, namespace: str) -> Optional[Dict[str, Any]]:
+        """Stored result for a document digest, or None"""
+        if self.store is None:
+            return None
+        try:
+            result = self.store.get(self.make_key(digest, namespace))
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ OCR cache read failed: {e}")
+            return None
+        if result is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return result
+
+    def put(self, digest: str, namespace: str, result: Dict[str, Any]):
+        """Store a successful result for a document digest"""
+        if self.store is None or not is_cacheable(result):
+            return
+        try:
+            self.store.put(self.make_key(digest, namespace), result)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ OCR cache write failed: {e}")
+
+    def get_or_compute(self, file_content: Optional[bytes], namespace: str,
+                       compute: Callable[[], Dict[str, Any]], digest: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Return (result, cache_hit). Only one caller per document runs `compute`;
+        concurrent callers for the same bytes wait for that result. Pass `digest`
+        instead of the bytes when it is already known (e.g. from a spooled upload).
+        """
+        if self.store is None:
+            return compute(), False
+
+        key = self.make_key(digest or document_digest(file_content), namespace)
+        try:
+            cached = self.store.get(key)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ OCR cache read failed: {e}")
+            cached = None
+        if cached is not None:
+            self.hits += 1
+            return cached, True
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {"event": threading.Event(), "result": None, "error": None}
+                self._inflight[key] = flight
+
+        if not leader:
+            self.coalesced += 1
+            if not flight["event"].wait(self.wait_seconds):
+                raise TimeoutError("Timed out waiting for identical OCR request")
+            if flight["error"] is not None:
+                raise flight["error"]
+            return copy.deepcopy(flight["result"]), True
+
+        self.misses += 1
+        try:
+            result = compute()
+            # Followers copy this snapshot, so the leader may go on to modify its own result
+            flight["result"] = copy.deepcopy(result)
+            if is_cacheable(result):
+                try:
+                    self.store.put(key, result)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"⚠️ OCR cache write failed: {e}")
+            return result, False
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight["event"].set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = {
+            "backend": self.store.name if self.store else "none",
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "inflight": len(self._inflight),
+        }
+        if self.store is not None:
+            try:
+                stats.update(self.store.stats())
+            except Exception as e:
+                stats["store_error"] = str(e)
+        return stats
+
+
+def create_ocr_result_cache(backend: str = OCR_CACHE_BACKEND, mongo_database=None) -> OCRResultCache:
+    """Build the cache for OCR_CACHE_BACKEND; falls back to disk when Mongo is unavailable"""
+    store = None
+    try:
+        if backend == "mongo" and mongo_database is not None:
+            store = MongoOCRStore(mongo_database["ocr_result_cache"])
+        elif backend in ("mongo", "disk"):
+            if backend == "mongo":
+                print("⚠️ MongoDB not available for the OCR cache, using the disk cache")
+            store = DiskOCRStore()
+    except Exception as e:
+        print(f"⚠️ OCR result cache disabled: {e}")
+        store = None
+
+    if store is not None:
+        print(f"✅ OCR result cache enabled ({store.name})")
+    return OCRResultCache(store)
@@ -0,0 +1,360 @@
+# File: ocr_worker_pool.py
+"""
+Persistent OCR worker pool with an in-memory job table.
+
+OCR used to run inside the Flask request thread, with a fresh asyncio event
+loop per request and no shared model state. This module keeps a process pool
+whose workers construct the OCR processor (EnhancedOCRService from the
+medication folder by default) once, in the pool initializer, together with
+one event loop per worker. Every OCR call is then a cheap task submission.
+
+- submit_job() returns a job ID immediately; get_job() reports
+  queued / processing / completed / failed and the result.
+- process() submits and waits, for the existing synchronous endpoints.
+- Documents may be passed as bytes or as the path of a spooled upload on
+  local disk, which the worker reads itself.
+- Image documents go through image_preprocessing_service (EXIF orientation,
+  grayscale, downscale, border crop, optional deskew) inside the worker.
+- At most OCR_WORKERS jobs run and OCR_MAX_QUEUE more may wait; beyond that
+  OCRQueueFullError is raised so the API can answer 429.
+
+Workers start from a forkserver by default (OCR_WORKER_START_METHOD). Forking
+the API process directly is unsafe once its scheduler, email, outbox and
+pymongo threads run: a child can inherit a lock another thread held and hang.
+The forkserver is a fresh process that preloads only WORKER_PRELOAD_MODULES,
+never app_simple. "spawn" is used where forkserver is missing; it re-imports
+the main module in every worker.
+"""
+import asyncio
+import importlib
+import inspect
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, Union
+
+from image_preprocessing_service import OCR_PREPROCESS_ENABLED, prepare_for_ocr
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", "16"))
+OCR_JOB_TIMEOUT_SEC = int(os.getenv("OCR_JOB_TIMEOUT_SEC", "300"))
+OCR_JOB_RETENTION_SEC = int(os.getenv("OCR_JOB_RETENTION_SEC", "3600"))
+OCR_WORKER_START_METHOD = os.getenv(
+    "OCR_WORKER_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+# Imported once by the forkserver; its default ('__main__') would re-run app_simple's startup
+WORKER_PRELOAD_MODULES = ["ocr_worker_pool", "pdf_extraction_service"]
+OCR_PROCESSOR_FACTORY = os.getenv("OCR_PROCESSOR_FACTORY", "app.services.enhanced_ocr_service:EnhancedOCRService")
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class OCRQueueFullError(Exception):
+    """Raised when the OCR pool already has its maximum number of pending jobs"""
+
+
+def worker_context(start_method: str):
+    """multiprocessing context for the OCR and PDF page pools"""
+    context = multiprocessing.get_context(start_method)
+    if start_method == "forkserver":
+        context.set_forkserver_preload(WORKER_PRELOAD_MODULES)
+    return context
+
+
+# ---- worker process side ----
+
+_worker_processor = None
+_worker_loop = None
+_worker_preprocess_images = False
+
+
+def _init_worker(factory_path: str, extra_paths: list, preprocess_images: bool = False):
+    """Pool initializer: load the OCR processor and an event loop once per worker"""
+    global _worker_processor, _worker_loop, _worker_preprocess_images
+    for path in extra_paths:
+        if path and path not in sys.path:
+            sys.path.insert(0, path)
+
+    module_name, attribute = factory_path.split(":", 1)
+    factory = getattr(importlib.import_module(module_name), attribute)
+    _worker_processor = factory()
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+    _worker_preprocess_images = preprocess_images
+    print(f"✅ OCR worker {os.getpid()} loaded {factory_path}")
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+def _run_ocr_job(file_content: Union[bytes, str], filename: str) -> Dict[str, Any]:
+    """
+    Run the preloaded processor (sync or async process_file) inside a worker.
+    A str is the path of a spooled upload, read here so the document is never
+    copied through the parent process. Images are pre-processed first when the
+    pool was created with preprocess_images.
+    """
+    if isinstance(file_content, str):
+        with open(file_content, "rb") as f:
+            file_content = f.read()
+    preprocessing = None
+    if _worker_preprocess_images:
+        file_content, filename, preprocessing = prepare_for_ocr(file_content, filename)
+    result = _worker_processor.process_file(file_content=file_content, filename=filename)
+    if inspect.isawaitable(result):
+        result = _worker_loop.run_until_complete(result)
+    if preprocessing and isinstance(result, dict):
+        result["preprocessing"] = preprocessing
+    return result
+
+
+# ---- parent process side ----
+
+class OCRWorkerPool:
+    """Process pool plus job table for OCR work"""
+
+    def __init__(self, workers: int = OCR_WORKERS, max_queue: int = OCR_MAX_QUEUE,
+                 factory_path: str = OCR_PROCESSOR_FACTORY, extra_paths: Optional[list] = None,
+                 start_method: str = OCR_WORKER_START_METHOD, retention_seconds: int = OCR_JOB_RETENTION_SEC,
+                 preprocess_images: bool = OCR_PREPROCESS_ENABLED):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.factory_path = factory_path
+        self.extra_paths = list(extra_paths or [])
+        self.start_method = start_method
+        self.retention_seconds = retention_seconds
+        self.preprocess_images = preprocess_images
+
+        self._executor = None
+        self._completion_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ocr-complete")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pending = 0
+        self.completed_jobs = 0
+        self.failed_jobs = 0
+        self.rejected_jobs = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=worker_context(self.start_method),
+                    initializer=_init_worker,
+                    initargs=(self.factory_path, self.extra_paths, self.preprocess_images),
+                )
+            return self._executor
+
+    def start(self, warm: bool = True, timeout: float = 120) -> bool:
+        """Create the pool; with warm=True wait until every worker has loaded its models"""
+        executor = self._get_executor()
+        if not warm:
+            return True
+        try:
+            futures = [executor.submit(_worker_ping) for _ in range(self.workers)]
+            pids = {future.result(timeout=timeout) for future in futures}
+            print(f"✅ OCR worker pool ready ({len(pids)} of {self.workers} workers answered)")
+            return True
+        except Exception as e:
+            print(f"❌ OCR worker pool failed to start: {e}")
+            return False
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected_jobs += 1
+                raise OCRQueueFullError(
+                    f"OCR queue is full ({self._pending} jobs pending, limit {self.workers + self.max_queue})"
+                )
+            self._pending += 1
+
+    def _release_slot(self):
+        with self._lock:
+            self._pending = max(0, self._pending - 1)
+
+    def _submit(self, file_content: Union[bytes, str], filename: str):
+        self._reserve_slot()
+        try:
+            future = self._get_executor().submit(_run_ocr_job, file_content, filename)
+        except Exception:
+            self._release_slot()
+            raise
+        # The slot is held until the worker finishes, even if a waiting caller times out
+        future.add_done_callback(lambda _: self._release_slot())
+        return future
+
+    def submit(self, file_content: Union[bytes, str], filename: str):
+        """Queue one OCR call and return its Future (raises OCRQueueFullError when full)"""
+        return self._submit(file_content, filename)
+
+    def process(self, file_content: Union[bytes, str], filename: str, timeout: float = OCR_JOB_TIMEOUT_SEC) -> Dict[str, Any]:
+        """Run one OCR call in the pool and wait for the processor's result"""
+        future = self._submit(file_content, filename)
+        try:
+            return future.result(timeout=timeout)
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise
+
+    def submit_job(self, file_content: Union[bytes, str], filename: str, metadata: Optional[Dict[str, Any]] = None,
+                   on_complete: Optional[Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]] = None,
+                   dedupe_key: Optional[str] = None, release_document: Optional[Callable[[], None]] = None) -> str:
+        """
+        Queue an OCR job and return its ID. `on_complete(job, ocr_result)` runs in the
+        parent process (off the pool's manager thread) and its return value becomes
+        the job result. While a job with the same `dedupe_key` (e.g. the document's
+        SHA-256) is unfinished, its ID is returned instead of queuing the work again.
+        `release_document()` is called once the pool no longer needs the document
+        (e.g. to delete a spooled upload passed by path).
+        """
+        self._prune_jobs()
+        file_size = os.path.getsize(file_content) if isinstance(file_content, str) else len(file_content)
+        try:
+            if dedupe_key:
+                with self._lock:
+                    for existing in self._jobs.values():
+                        if existing["_dedupe_key"] == dedupe_key and existing["_finished_at"] is None:
+                            if release_document:
+                                release_document()
+                            return existing["job_id"]
+
+            future = self._submit(file_content, filename)
+        except Exception:
+            if release_document:
+                release_document()
+            raise
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "filename": filename,
+            "file_size": file_size,
+            "metadata": metadata or {},
+            "created_at": datetime.now().isoformat(),
+            "completed_at": None,
+            "error": None,
+            "result": None,
+            "_future": future,
+            "_dedupe_key": dedupe_key,
+            "_finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+
+        if release_document:
+            future.add_done_callback(lambda _: release_document())
+        future.add_done_callback(
+            lambda done: self._completion_executor.submit(self._finish_job, job, done, on_complete)
+        )
+        return job_id
+
+    def record_completed_job(self, filename: str, result: Dict[str, Any],
+                             metadata: Optional[Dict[str, Any]] = None, file_size: int = 0) -> str:
+        """Add an already-finished job (e.g. served from the OCR result cache) to the job table"""
+        self._prune_jobs()
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "completed",
+                "filename": filename,
+                "file_size": file_size,
+                "metadata": metadata or {},
+                "created_at": now,
+                "completed_at": now,
+                "error": None,
+                "result": result,
+                "_future": None,
+                "_dedupe_key": None,
+                "_finished_at": time.time(),
+            }
+            self.completed_jobs += 1
+        return job_id
+
+    def _finish_job(self, job: Dict[str, Any], future, on_complete):
+        try:
+            ocr_result = future.result()
+            result = on_complete(job, ocr_result) if on_complete else ocr_result
+            job["result"] = result
+            job["status"] = "completed"
+            self.completed_jobs += 1
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._reset_executor()
+            job["status"] = "failed"
+            job["error"] = str(e) or type(e).__name__
+            self.failed_jobs += 1
+            print(f"❌ OCR job {job['job_id']} failed: {job['error']}")
+        finally:
+            job["completed_at"] = datetime.now().isoformat()
+            job["_finished_at"] = time.time()
+
+    def _reset_executor(self):
+        """Drop a broken pool (a worker crashed); the next submission starts a fresh one"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            print("⚠️ OCR worker pool was broken and will be recreated")
+
+    def _prune_jobs(self):
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["_finished_at"] is not None and job["_finished_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    @staticmethod
+    def _public(job: Dict[str, Any], include_result: bool = True) -> Dict[str, Any]:
+        status = job["status"]
+        if status == "queued" and job["_future"] is not None and job["_future"].running():
+            status = "processing"
+        public = {key: value for key, value in job.items() if not key.startswith("_")}
+        public["status"] = status
+        if not include_result:
+            public.pop("result", None)
+        return public
+
+    def get_job(self, job_id: str, include_result: bool = True) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return self._public(job, include_result) if job else None
+
+    def list_jobs(self, limit: int = 50) -> list:
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+        return [self._public(job, include_result=False) for job in reversed(jobs)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "pending_jobs": self._pending,
+                "tracked_jobs": len(self._jobs),
+                "completed_jobs": self.completed_jobs,
+                "failed_jobs": self.failed_jobs,
+                "rejected_jobs": self.rejected_jobs,
+                "processor": self.factory_path,
+                "preprocess_images": self.preprocess_images,
+                "start_method": self.start_method,
+                "started": self._executor is not None,
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+        self._completion_executor.shutdown(wait=wait)
@@ -0,0 +1,261 @@
+# File: openai_client_service.py
+"""
+Shared, pooled OpenAI client registry.
+
+One OpenAI client (and one underlying httpx connection pool) is created per
+process and reused by LLMService and the nutrition routes, so HTTP keep-alive
+connections survive across requests. Every call goes through the registry,
+which applies a per-call-type timeout, bounded retries with jittered
+exponential backoff, and records per-model latency and token counts.
+
+Set OPENAI_BASE_URL to point the registry at any OpenAI-compatible server
+(for example openai_stub_server.py during tests).
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+try:
+    import httpx
+    from openai import OpenAI
+    import openai
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+
+# Per-call-type timeouts in seconds
+OPENAI_TIMEOUTS = {
+    "chat": float(os.getenv("OPENAI_CHAT_TIMEOUT_SEC", "30")),
+    "analysis": float(os.getenv("OPENAI_ANALYSIS_TIMEOUT_SEC", "60")),
+    "transcription": float(os.getenv("OPENAI_TRANSCRIPTION_TIMEOUT_SEC", "120")),
+    "test": float(os.getenv("OPENAI_TEST_TIMEOUT_SEC", "15")),
+}
+OPENAI_CONNECT_TIMEOUT_SEC = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SEC", "5"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_BACKOFF_BASE_SEC = float(os.getenv("OPENAI_BACKOFF_BASE_SEC", "0.5"))
+OPENAI_BACKOFF_MAX_SEC = float(os.getenv("OPENAI_BACKOFF_MAX_SEC", "8"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+
+LATENCY_WINDOW = 200  # recent samples kept per model for percentiles
+
+
+def _retryable_errors():
+    """OpenAI exceptions worth retrying (transient network / server side)"""
+    return (
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+class ModelMetrics:
+    """Latency and token counters for one model"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.recent_latencies = deque(maxlen=LATENCY_WINDOW)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.recent_latencies)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_latency_ms": round(self.total_latency_ms / self.calls, 1) if self.calls else 0.0,
+            "p95_latency_ms": round(recent[max(int(len(recent) * 0.95) - 1, 0)], 1) if recent else 0.0,
+            "max_latency_ms": round(self.max_latency_ms, 1),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+        }
+
+
+class OpenAIClientRegistry:
+    """Process-wide OpenAI client with pooled connections, timeouts, retries and metrics"""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_retries: int = OPENAI_MAX_RETRIES, timeouts: Optional[Dict[str, float]] = None,
+                 backoff_base: float = OPENAI_BACKOFF_BASE_SEC, backoff_max: float = OPENAI_BACKOFF_MAX_SEC):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+        self.max_retries = max_retries
+        self.timeouts = dict(OPENAI_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._client = None
+        self._typed_clients = {}
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+    def is_configured(self) -> bool:
+        return OPENAI_AVAILABLE and bool(self.api_key)
+
+    def get_client(self):
+        """Shared OpenAI client (created lazily, one connection pool per process)"""
+        if not self.is_configured():
+            return None
+
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    http_client = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=OPENAI_MAX_CONNECTIONS,
+                            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                        ),
+                        timeout=httpx.Timeout(self.timeouts["chat"], connect=OPENAI_CONNECT_TIMEOUT_SEC),
+                    )
+                    # Retries are handled here (with jitter and metrics), not by the SDK
+                    self._client = OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=http_client,
+                        max_retries=0,
+                    )
+        return self._client
+
+    def client_for(self, call_type: str):
+        """Client view with the timeout for a call type; shares the same connection pool"""
+        client = self.get_client()
+        if client is None:
+            return None
+
+        typed = self._typed_clients.get(call_type)
+        if typed is None:
+            timeout = self.timeouts.get(call_type, self.timeouts["chat"])
+            typed = client.with_options(
+                timeout=httpx.Timeout(timeout, connect=OPENAI_CONNECT_TIMEOUT_SEC),
+                max_retries=0,
+            )
+            self._typed_clients[call_type] = typed
+        return typed
+
+    def _backoff_delay(self, attempt: int, error=None) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when the server sends one"""
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(0, cap)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _call_with_retries(self, model: str, call):
+        metrics = self._get_metrics(model)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = call()
+                self._record_success(metrics, (time.perf_counter() - start) * 1000, response)
+                return response
+            except _retryable_errors() as e:
+                if attempt >= self.max_retries:
+                    self._record_error(metrics)
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                print(f"⚠️ OpenAI {model} call failed ({type(e).__name__}), retrying in {delay:.2f}s "
+                      f"(attempt {attempt + 1}/{self.max_retries})")
+                with self._metrics_lock:
+                    metrics.retries += 1
+                time.sleep(delay)
+                attempt += 1
+            except Exception:
+                self._record_error(metrics)
+                raise
+
+    def chat_completion(self, call_type: str = "chat", **kwargs):
+        """chat.completions.create with the call type's timeout and retry policy"""
+        client = self.client_for(call_type)
+        if client is None:
+            raise RuntimeError("OpenAI client not configured")
+        model = kwargs.get("model", "unknown")
+        return self._call_with_retries(model, lambda: client.chat.completions.create(**kwargs))
+
+    def transcription(self, call_type: str = "transcription", **kwargs):
+        """audio.transcriptions.create; the file is rewound before each retry"""
+        client = self.client_for(call_type)
+        if client is None:
+            raise RuntimeError("OpenAI client not configured")
+        model = kwargs.get("model", "whisper-1")
+        audio_file = kwargs.get("file")
+
+        def call():
+            if hasattr(audio_file, "seek"):
+                audio_file.seek(0)
+            return client.audio.transcriptions.create(**kwargs)
+
+        return self._call_with_retries(model, call)
+
+    def _get_metrics(self, model: str) -> ModelMetrics:
+        with self._metrics_lock:
+            if model not in self._metrics:
+                self._metrics[model] = ModelMetrics()
+            return self._metrics[model]
+
+    def _record_success(self, metrics: ModelMetrics, latency_ms: float, response):
+        usage = getattr(response, "usage", None)
+        with self._metrics_lock:
+            metrics.calls += 1
+            metrics.total_latency_ms += latency_ms
+            metrics.max_latency_ms = max(metrics.max_latency_ms, latency_ms)
+            metrics.recent_latencies.append(latency_ms)
+            if usage is not None:
+                metrics.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+                metrics.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+                metrics.total_tokens += getattr(usage, "total_tokens", 0) or 0
+
+    def _record_error(self, metrics: ModelMetrics):
+        with self._metrics_lock:
+            metrics.calls += 1
+            metrics.errors += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            return {model: m.to_dict() for model, m in self._metrics.items()}
+
+    def reset_metrics(self):
+        with self._metrics_lock:
+            self._metrics = {}
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._typed_clients = {}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_openai_registry() -> OpenAIClientRegistry:
+    """Process-wide registry shared by every OpenAI caller"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = OpenAIClientRegistry()
+    return _registry
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub server for testing without the real API
+
+Implements the endpoints the backend uses:
+- POST /v1/chat/completions
+- POST /v1/audio/transcriptions
+
+It can inject latency and transient failures (500 / 429) and counts TCP
+connections so connection reuse can be verified.
+
+Usage:
+    python openai_stub_server.py --port 8765 --latency 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python app_simple.py
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    """Mutable behaviour and counters shared by all request handlers"""
+
+    def __init__(self, latency: float = 0.0, fail_next: int = 0, fail_status: int = 500):
+        self.latency = latency
+        self.fail_next = fail_next
+        self.fail_status = fail_status
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def take_failure(self):
+        with self.lock:
+            self.requests += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return self.fail_status
+        return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    state = None  # set by create_stub_server
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw_body = self.rfile.read(length) if length else b""
+
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        failure = self.state.take_failure()
+        if failure:
+            headers = {"Retry-After": "0"} if failure == 429 else {}
+            self._send_json(failure, {"error": {"message": "stub injected failure", "type": "server_error"}}, headers)
+            return
+
+        if self.path.endswith("/chat/completions"):
+            request_body = json.loads(raw_body or b"{}")
+            messages = request_body.get("messages", [])
+            prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+            content = "Urgency level: mild\nStub response from local OpenAI-compatible server"
+            completion_tokens = len(content.split())
+            self._send_json(200, {
+                "id": f"chatcmpl-stub-{self.state.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request_body.get("model", "stub-model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+        elif self.path.endswith("/audio/transcriptions"):
+            self._send_json(200, {"text": "two idli with sambar and a glass of milk"})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+def create_stub_server(host: str = "127.0.0.1", port: int = 0, **state_kwargs):
+    """Create (but do not start) a stub server; port 0 picks a free port"""
+    state = StubState(**state_kwargs)
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def start_stub_server(**kwargs):
+    """Start a stub server in a background thread and return it"""
+    server = create_stub_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--fail-next", type=int, default=0, help="fail the first N requests")
+    parser.add_argument("--fail-status", type=int, default=500, choices=[429, 500, 502, 503])
+    args = parser.parse_args()
+
+    server = create_stub_server(args.host, args.port, latency=args.latency,
+                                fail_next=args.fail_next, fail_status=args.fail_status)
+    print(f"🚀 OpenAI stub server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stub server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# File: pdf_extraction_service.py
+"""
+Page-parallel PDF text extraction.
+
+PyMuPDF is not thread-safe, even with one Document per thread, so pages are
+split into small contiguous chunks and extracted in a process pool (shared,
+PDF_PAGE_WORKERS processes); every task opens its own document. Like the OCR
+pool, its processes come from a forkserver by default, never a fork of the
+threaded API; start_page_pool() creates it at startup. Pass the
+path of a spooled upload instead of bytes to avoid copying the PDF into each
+task. Pages with native text are returned straight away. Image-only pages are
+rasterized and, when an OCR submitter is given (the OCR worker pool), sent to
+OCR in that process pool; otherwise they keep the old "[Scanned page ...]"
+placeholder.
+
+When the OCR pool is full, scanned pages wait for a slot (up to
+PDF_OCR_QUEUE_WAIT_SEC without progress) and OCRQueueFullError is raised
+after that: the document fails instead of losing pages. Pages whose OCR
+failed are marked and make extract_pdf() report partial=True, which the OCR
+result cache never stores.
+
+iter_pdf_pages() yields page results in completion order so callers can
+stream them; extract_pdf() collects them into the OCRService result shape.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, Callable, Iterator, List, Tuple, Union
+
+from ocr_worker_pool import OCRQueueFullError, worker_context
+
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+
+PDF_PAGE_WORKERS = int(os.getenv("PDF_PAGE_WORKERS", "4"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "2"))
+PDF_RASTER_DPI = int(os.getenv("PDF_RASTER_DPI", "200"))
+PDF_OCR_QUEUE_WAIT_SEC = float(os.getenv("PDF_OCR_QUEUE_WAIT_SEC", "60"))
+PDF_OCR_RETRY_SEC = 0.25
+PDF_WORKER_START_METHOD = os.getenv(
+    "PDF_WORKER_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+SCANNED_PAGE_PLACEHOLDER = "[Scanned page - text extraction not available]"
+
+PdfSource = Union[bytes, str]
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(
+                max_workers=max(1, PDF_PAGE_WORKERS),
+                mp_context=worker_context(PDF_WORKER_START_METHOD),
+            )
+        return _page_pool
+
+
+def _reset_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=False, cancel_futures=True)
+            _page_pool = None
+
+
+def start_page_pool():
+    """Create the page pool and its processes now instead of inside the first PDF request"""
+    executor = _get_page_pool()
+    for future in [executor.submit(os.getpid) for _ in range(max(1, PDF_PAGE_WORKERS))]:
+        future.result()
+
+
+def shutdown_page_pool():
+    _reset_page_pool()
+
+
+def _open(source: PdfSource):
+    """A PyMuPDF document from a file path or the PDF bytes"""
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _portable(source) -> PdfSource:
+    """Paths pass through; memoryviews (spooled uploads) become bytes so they can be sent to a process"""
+    return source if isinstance(source, (str, bytes)) else bytes(source)
+
+
+def count_pdf_pages(file_content: PdfSource) -> int:
+    document = _open(_portable(file_content))
+    try:
+        return len(document)
+    finally:
+        document.close()
+
+
+def parse_page_range(spec: Optional[str], total_pages: int) -> List[int]:
+    """
+    Zero-based page indexes for a 1-based range spec such as "1-3,7" or "5-".
+    An empty spec selects every page; pages beyond the document are ignored.
+    """
+    if not spec or not str(spec).strip():
+        return list(range(total_pages))
+
+    selected = set()
+    for part in str(spec).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start = int(start_text) if start_text.strip() else 1
+            end = int(end_text) if end_text.strip() else total_pages
+        else:
+            start = end = int(part)
+        if start < 1 or end < start:
+            raise ValueError(f"Invalid page range: {part}")
+        selected.update(range(start - 1, min(end, total_pages)))
+    return sorted(selected)
+
+
+def ocr_text_from_result(ocr_result: Dict[str, Any]) -> Tuple[str, float]:
+    """Text and mean confidence from an OCR processor result"""
+    results = ocr_result.get("results") or []
+    text = ocr_result.get("full_content") or " ".join(
+        r.get("text", "").strip() for r in results if r.get("text", "").strip()
+    ) or ocr_result.get("extracted_text", "")
+    confidences = [r.get("confidence", 0.0) for r in results if isinstance(r.get("confidence"), (int, float))]
+    return text.strip(), (sum(confidences) / len(confidences) if confidences else 0.0)
+
+
+def _extract_chunk(source: PdfSource, page_indexes: List[int], rasterize: bool, dpi: int) -> List[Dict[str, Any]]:
+    """Extract a run of pages in a page pool process, with a document opened by this task"""
+    document = _open(source)
+    try:
+        pages = []
+        for index in page_indexes:
+            page = document[index]
+            text = page.get_text()
+            if text.strip():
+                pages.append({"page": index + 1, "text": text.strip(), "confidence": 1.0, "method": "native_text"})
+            else:
+                image = page.get_pixmap(dpi=dpi).tobytes("png") if rasterize else None
+                pages.append({"page": index + 1, "image": image})
+        return pages
+    finally:
+        document.close()
+
+
+def _scanned_page(page_number: int, error: Optional[str] = None) -> Dict[str, Any]:
+    page = {"page": page_number, "text": SCANNED_PAGE_PLACEHOLDER, "confidence": 0.0, "method": "scanned_page"}
+    if error:
+        page["error"] = error
+    return page
+
+
+def iter_pdf_pages(file_content: PdfSource, filename: str, page_indexes: Optional[List[int]] = None,
+                   ocr_submit: Optional[Callable] = None, max_workers: int = PDF_PAGE_WORKERS,
+                   pages_per_task: int = PDF_PAGES_PER_TASK, dpi: int = PDF_RASTER_DPI,
+                   ocr_queue_wait: float = PDF_OCR_QUEUE_WAIT_SEC) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one result per page as soon as it is ready (not in page order).
+    `file_content` is the PDF bytes or a path to it. `ocr_submit(png_bytes, name)`
+    must return a concurrent.futures.Future of an OCR processor result; image-only
+    pages use it when given. Raises OCRQueueFullError when the OCR pool has had
+    no free slot for `ocr_queue_wait` seconds.
+    """
+    source = _portable(file_content)
+    if page_indexes is None:
+        page_indexes = list(range(count_pdf_pages(source)))
+    if not page_indexes:
+        return
+
+    base_name = os.path.splitext(filename)[0]
+    chunks = deque(page_indexes[i:i + pages_per_task] for i in range(0, len(page_indexes), max(1, pages_per_task)))
+    executor = _get_page_pool()
+    pending = {}
+    waiting = deque()  # scanned pages waiting for an OCR slot
+    blocked_since = None
+
+    def submit_chunk():
+        if chunks:
+            future = executor.submit(_extract_chunk, source, chunks.popleft(), ocr_submit is not None, dpi)
+            pending[future] = ("chunk", None)
+
+    def submit_waiting_pages():
+        nonlocal blocked_since
+        while waiting:
+            page = waiting[0]
+            try:
+                ocr_future = ocr_submit(page["image"], f"{base_name}_page{page['page']}.png")
+            except OCRQueueFullError:
+                if blocked_since is None:
+                    blocked_since = time.monotonic()
+                elif time.monotonic() - blocked_since > ocr_queue_wait:
+                    raise OCRQueueFullError(
+                        f"OCR queue stayed full for {ocr_queue_wait:.0f}s; {len(waiting)} pages of {filename} not OCR'd"
+                    )
+                return
+            waiting.popleft()
+            blocked_since = None
+            pending[ocr_future] = ("ocr", page["page"])
+
+    try:
+        for _ in range(max(1, max_workers)):
+            submit_chunk()
+        while pending or waiting:
+            submit_waiting_pages()
+            if not pending:
+                time.sleep(PDF_OCR_RETRY_SEC)
+                continue
+            done, _ = wait(pending, timeout=PDF_OCR_RETRY_SEC if waiting else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, page_number = pending.pop(future)
+
+                if kind == "chunk":
+                    submit_chunk()
+                    try:
+                        pages = future.result()
+                    except BrokenProcessPool:
+                        _reset_page_pool()
+                        raise
+                    for page in pages:
+                        if "text" in page:
+                            yield page
+                        elif ocr_submit is None:
+                            yield _scanned_page(page["page"])
+                        else:
+                            waiting.append(page)
+                    continue
+
+                try:
+                    text, confidence = ocr_text_from_result(future.result())
+                    yield {"page": page_number, "text": text, "confidence": round(confidence, 4), "method": "ocr"}
+                except Exception as e:
+                    print(f"⚠️ OCR failed for page {page_number} of {filename}: {e}")
+                    yield _scanned_page(page_number, str(e))
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def extract_pdf(file_content: PdfSource, filename: str, page_spec: Optional[str] = None,
+                ocr_submit: Optional[Callable] = None, **kwargs) -> Dict[str, Any]:
+    """Collect iter_pdf_pages() into the OCRService._process_pdf result dictionary"""
+    start = time.perf_counter()
+    file_content = _portable(file_content)
+    total_pages = count_pdf_pages(file_content)
+    page_indexes = parse_page_range(page_spec, total_pages)
+
+    results = sorted(
+        iter_pdf_pages(file_content, filename, page_indexes, ocr_submit=ocr_submit, **kwargs),
+        key=lambda page: page["page"]
+    )
+    native_text_pages = sum(1 for r in results if r["method"] == "native_text")
+    failed_pages = [r["page"] for r in results if r.get("error")]
+
+    # Extract full text for prescription processing
+    full_text = "\n".join(r["text"] for r in results if r["method"] in ("native_text", "ocr") and r["text"])
+
+    return {
+        "success": True,
+        "filename": filename,
+        "file_type": "pdf",
+        "total_pages": total_pages,
+        "processed_pages": len(results),
+        "native_text_pages": native_text_pages,
+        "ocr_pages": len(results) - native_text_pages,
+        "failed_pages": failed_pages,
+        # Pages whose OCR failed; partial results are returned but never cached
+        "partial": bool(failed_pages),
+        "results": results,
+        "full_text": full_text,
+        "extracted_text": full_text if full_text else "No extractable text found",
+        "processing_time_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
@@ -0,0 +1,113 @@
+# File: prescription_batch_service.py
+"""
+Multi-document prescription batches.
+
+A prescription often arrives as several photos or PDFs (one per page). The
+batch endpoint OCRs them concurrently with a bounded thread pool, each thread
+handing its document to the OCR worker pool or the basic OCR service, and
+then merges the per-document results into one OCR result in page order:
+upload order first, then page order inside each document. The merged result
+has the same shape as a single-document result, so it goes through the
+existing webhook and parsing code as one payload.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from pdf_extraction_service import SCANNED_PAGE_PLACEHOLDER, ocr_text_from_result
+from upload_service import UPLOAD_MAX_BYTES
+
+PRESCRIPTION_BATCH_MAX_FILES = int(os.getenv("PRESCRIPTION_BATCH_MAX_FILES", "10"))
+PRESCRIPTION_BATCH_CONCURRENCY = int(os.getenv("PRESCRIPTION_BATCH_CONCURRENCY", "4"))
+# Whole batch request body: every file at the per-file limit plus form fields
+PRESCRIPTION_BATCH_MAX_BYTES = PRESCRIPTION_BATCH_MAX_FILES * UPLOAD_MAX_BYTES + 1024 * 1024
+
+
+def process_documents(documents: Sequence[Any], process: Callable[[Any], Any],
+                      concurrency: Optional[int] = None) -> List[Tuple[Any, Optional[Exception]]]:
+    """Run process() over documents with at most `concurrency` in flight.
+
+    Returns (result, error) per document in input order; a failing document
+    does not stop the others.
+    """
+    if not documents:
+        return []
+    workers = max(1, min(concurrency or PRESCRIPTION_BATCH_CONCURRENCY, len(documents)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rx-batch") as executor:
+        futures = [executor.submit(process, document) for document in documents]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append((future.result(), None))
+            except Exception as e:
+                outcomes.append((None, e))
+    return outcomes
+
+
+def document_pages(ocr_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per-page text of one OCR result, in page order.
+
+    PDF results carry a "page" on every result; image results are a list of
+    text regions that together make up a single page.
+    """
+    results = ocr_result.get("results") or []
+    if results and all("page" in r for r in results):
+        pages = []
+        for r in sorted(results, key=lambda r: r["page"]):
+            text = (r.get("text") or "").strip()
+            if text == SCANNED_PAGE_PLACEHOLDER:
+                text = ""
+            pages.append({
+                "source_page": r["page"],
+                "text": text,
+                "confidence": r.get("confidence", 0.0),
+                "method": r.get("method", "ocr"),
+            })
+        return pages
+
+    text, confidence = ocr_text_from_result(ocr_result)
+    return [{"source_page": 1, "text": text, "confidence": round(confidence, 4), "method": "ocr"}]
+
+
+def merge_ocr_results(documents: Sequence[Tuple[str, Optional[Dict[str, Any]]]],
+                      batch_name: str = "prescription_batch") -> Dict[str, Any]:
+    """Merge [(filename, ocr_result)] into one OCR result, pages numbered across the batch.
+
+    Failed or missing results are skipped; their documents still appear in
+    "documents" with success False.
+    """
+    pages: List[Dict[str, Any]] = []
+    summaries = []
+    for index, (filename, ocr_result) in enumerate(documents, 1):
+        if not ocr_result or not ocr_result.get("success"):
+            summaries.append({"document": index, "filename": filename, "success": False, "pages": 0})
+            continue
+
+        document = document_pages(ocr_result)
+        first_page = len(pages) + 1
+        for page in document:
+            pages.append({"page": len(pages) + 1, "document": index, "filename": filename, **page})
+        summaries.append({
+            "document": index,
+            "filename": filename,
+            "success": True,
+            "pages": len(document),
+            "first_page": first_page,
+        })
+
+    full_content = "\n".join(page["text"] for page in pages if page["text"])
+    confidences = [page["confidence"] for page in pages if page["text"]]
+
+    return {
+        "success": bool(full_content),
+        "filename": batch_name,
+        "file_type": "batch",
+        "total_documents": len(documents),
+        "total_pages": len(pages),
+        "documents": summaries,
+        "results": pages,
+        "full_content": full_content,
+        "extracted_text": full_content,
+        "confidence": round(sum(confidences) / len(confidences), 4) if confidences else 0.0,
+        **({} if full_content else {"error": "No text could be extracted from the documents"}),
+    }
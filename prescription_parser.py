@@ -0,0 +1,530 @@
+# File: prescription_parser.py
+"""
+Local structured extraction for prescription text.
+
+Replaces the line-keyword heuristics (first line containing "mg" became the
+medication name) and the three hard-coded drugs of the mock n8n workflow.
+Every grammar is compiled once at import:
+
+- drug names:  dictionary of generic names, spellings and common brands
+- form:        Tab. / Cap. / Syp. / Inj. / ...
+- strength:    500mg, 5 mg/5 ml, 0.5%, 1000 IU (combinations like 500mg + 125mg);
+               a bare number right after a known drug ("Pan 40") is its strength
+               in the drug's usual unit
+- dose:        1 tab, 2 capsules, 5 ml, half tablet
+- frequency:   OD / BD / TDS / QID / HS / SOS / STAT, q6h, "1-0-1", "twice daily"
+- duration:    x 5 days, for 2 weeks, 5/7, till delivery
+- route:       oral, IV, IM, SC, topical, vaginal, ... (inferred from form when absent)
+- timing:      before / after food, at bedtime, empty stomach
+
+A medication starts at a line naming a drug (or "Tab. Something"); following
+lines without a new drug add their fields to it. Each field carries its own
+confidence, lower when it was inferred or taken from a continuation line.
+Parsing a typical prescription takes well under a millisecond, so callers
+only need the n8n/LLM path when needs_remote_parse() says so.
+"""
+import json
+import os
+import re
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+PRESCRIPTION_PARSER_MIN_CONFIDENCE = float(os.getenv("PRESCRIPTION_PARSER_MIN_CONFIDENCE", "0.6"))
+PRESCRIPTION_DRUG_DICTIONARY_PATH = os.getenv("PRESCRIPTION_DRUG_DICTIONARY_PATH", "")
+# Answer from the local parse and skip the n8n round trip when it is confident enough
+PRESCRIPTION_LOCAL_FIRST = os.getenv("PRESCRIPTION_LOCAL_FIRST", "true").lower() == "true"
+
+# Generic name -> other spellings and common brands (lowercase)
+DRUG_DICTIONARY = {
+    "Paracetamol": ["acetaminophen", "dolo", "crocin", "calpol", "pcm", "tylenol"],
+    "Ibuprofen": ["brufen", "advil", "combiflam"],
+    "Aspirin": ["ecosprin", "disprin", "acetylsalicylic acid"],
+    "Amoxicillin": ["amoxycillin", "amox", "mox", "novamox"],
+    "Amoxicillin + Clavulanic Acid": ["augmentin", "co-amoxiclav", "amoxiclav", "clavam"],
+    "Azithromycin": ["azithral", "azee", "zithromax"],
+    "Cefixime": ["taxim-o", "zifi"],
+    "Cephalexin": ["cefalexin", "sporidex"],
+    "Nitrofurantoin": ["niftran", "macrobid"],
+    "Metronidazole": ["flagyl", "metrogyl"],
+    "Clotrimazole": ["candid", "canesten"],
+    "Fluconazole": ["forcan", "diflucan"],
+    "Folic Acid": ["folate", "folvite", "folic"],
+    "Ferrous Sulphate": ["ferrous sulfate", "iron", "fefol"],
+    "Ferrous Ascorbate": ["orofer", "ferrous ascorbate"],
+    "Iron Sucrose": ["orofer-s", "venofer"],
+    "Calcium Carbonate": ["calcium", "shelcal", "calcimax", "cipcal"],
+    "Vitamin D3": ["cholecalciferol", "d-rise", "uprise-d3", "calcirol", "vit d3", "vitamin d"],
+    "Vitamin B12": ["methylcobalamin", "cyanocobalamin", "mecobalamin"],
+    "Vitamin B Complex": ["becosules", "neurobion", "b complex"],
+    "Multivitamin": ["prenatal vitamins", "vitamin supplement", "multivitamins", "supradyn"],
+    "Doxylamine + Pyridoxine": ["doxinate", "diclegis", "doxylamine", "pyridoxine"],
+    "Ondansetron": ["emeset", "ondem", "zofran"],
+    "Metoclopramide": ["perinorm", "reglan"],
+    "Domperidone": ["domstal", "motilium"],
+    "Ranitidine": ["rantac", "aciloc", "zantac"],
+    "Famotidine": ["famocid", "pepcid"],
+    "Pantoprazole": ["pan", "pantocid", "pan-d", "protonix"],
+    "Omeprazole": ["omez", "prilosec"],
+    "Antacid": ["gelusil", "digene", "mucaine"],
+    "Lactulose": ["duphalac", "looz"],
+    "Isabgol": ["psyllium husk", "ispaghula", "sat-isabgol"],
+    "Labetalol": ["labebet", "trandate"],
+    "Nifedipine": ["nicardia", "adalat", "depin"],
+    "Methyldopa": ["aldomet", "alphadopa"],
+    "Metformin": ["glycomet", "glucophage"],
+    "Insulin": ["human insulin", "insulin aspart", "insulin glargine", "actrapid", "mixtard", "lantus", "novorapid"],
+    "Levothyroxine": ["thyroxine", "eltroxin", "thyronorm", "synthroid"],
+    "Progesterone": ["susten", "duphaston", "dydrogesterone", "utrogestan", "gestofit"],
+    "Enoxaparin": ["clexane", "lovenox"],
+    "Heparin": ["unfractionated heparin"],
+    "Magnesium Sulphate": ["magnesium sulfate", "mgso4"],
+    "Betamethasone": ["celestone", "betnesol"],
+    "Dexamethasone": ["decadron", "dexona"],
+    "Cetirizine": ["cetzine", "zyrtec", "alerid"],
+    "Levocetirizine": ["levocet", "xyzal"],
+    "Chlorpheniramine": ["cpm", "piriton"],
+    "Salbutamol": ["albuterol", "asthalin", "ventolin"],
+    "Budesonide": ["budecort", "pulmicort"],
+    "Montelukast": ["montair", "singulair"],
+    "Hyoscine Butylbromide": ["buscopan"],
+    "Drotaverine": ["drotin", "no-spa"],
+    "Tranexamic Acid": ["trapic", "cyklokapron"],
+    "Oxytocin": ["pitocin", "syntocinon"],
+    "Misoprostol": ["cytotec", "misoprost"],
+    "Anti-D Immunoglobulin": ["rhogam", "anti d", "rhoclone"],
+    "Tetanus Toxoid": ["tt injection", "tdap", "td vaccine"],
+    "Omega-3 Fatty Acids": ["dha", "omega 3", "maxepa"],
+    "Zinc": ["zinc sulphate", "zincovit"],
+    "Oral Rehydration Salts": ["ors", "electral"],
+    "Clindamycin": ["dalacin"],
+    "Cefuroxime": ["ceftum", "zinacef"],
+    "Ceftriaxone": ["monocef", "rocephin"],
+    "Acyclovir": ["aciclovir", "zovirax"],
+    "Prednisolone": ["wysolone", "omnacortil"],
+    "Loratadine": ["lorfast", "claritin"],
+    "Simethicone": ["gas-x", "colicaid"],
+}
+
+# Unit of a bare strength written after the drug name ("Pan 40", "Dolo 650"): mg unless listed here.
+# None where a bare number is not a strength (combination products, powders)
+DRUG_STRENGTH_UNITS = {
+    "Vitamin D3": "iu", "Insulin": "iu", "Heparin": "iu", "Oxytocin": "iu",
+    "Vitamin B12": "mcg", "Levothyroxine": "mcg", "Anti-D Immunoglobulin": "mcg",
+    "Multivitamin": None, "Vitamin B Complex": None, "Antacid": None, "Isabgol": None,
+    "Oral Rehydration Salts": None, "Tetanus Toxoid": None,
+}
+
+FORMS = {
+    "tab": "tablet", "tabs": "tablet", "tablet": "tablet", "tablets": "tablet",
+    "cap": "capsule", "caps": "capsule", "capsule": "capsule", "capsules": "capsule",
+    "syp": "syrup", "syr": "syrup", "syrup": "syrup",
+    "susp": "suspension", "suspension": "suspension",
+    "inj": "injection", "injection": "injection",
+    "oint": "ointment", "ointment": "ointment", "cream": "cream", "gel": "gel",
+    "drop": "drops", "drops": "drops", "sachet": "sachet", "inhaler": "inhaler",
+    "pessary": "pessary", "supp": "suppository", "suppository": "suppository",
+}
+
+# Abbreviation -> (normalised text, times per day)
+FREQUENCY_CODES = {
+    "od": ("Once daily", 1), "qd": ("Once daily", 1), "qam": ("Once daily in the morning", 1),
+    "bd": ("Twice daily", 2), "bid": ("Twice daily", 2),
+    "tds": ("Three times daily", 3), "tid": ("Three times daily", 3),
+    "qid": ("Four times daily", 4), "qds": ("Four times daily", 4),
+    "hs": ("At bedtime", 1), "qhs": ("At bedtime", 1),
+    "sos": ("As needed", None), "prn": ("As needed", None),
+    "stat": ("Immediately, once", None),
+}
+
+FREQUENCY_WORDS = {
+    "once": 1, "one time": 1, "twice": 2, "two times": 2, "thrice": 3, "three times": 3, "four times": 4,
+}
+
+ROUTES = {
+    "oral": "oral", "orally": "oral", "po": "oral", "by mouth": "oral",
+    "iv": "intravenous", "intravenous": "intravenous", "im": "intramuscular", "intramuscular": "intramuscular",
+    "sc": "subcutaneous", "s/c": "subcutaneous", "subcut": "subcutaneous", "subcutaneous": "subcutaneous",
+    "topical": "topical", "locally": "topical", "l/a": "topical", "pv": "vaginal", "vaginal": "vaginal",
+    "per vaginum": "vaginal", "sl": "sublingual", "sublingual": "sublingual",
+    "inhalation": "inhalation", "inhaled": "inhalation", "nasal": "nasal", "rectal": "rectal", "pr": "rectal",
+}
+
+FORM_ROUTES = {
+    "tablet": "oral", "capsule": "oral", "syrup": "oral", "suspension": "oral", "sachet": "oral",
+    "ointment": "topical", "cream": "topical", "gel": "topical", "inhaler": "inhalation",
+    "pessary": "vaginal", "suppository": "rectal",
+}
+
+DURATION_UNIT_DAYS = {"day": 1, "d": 1, "week": 7, "wk": 7, "w": 7, "month": 30, "mo": 30, "m": 30}
+
+WORD_NUMBERS = {"half": 0.5, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "ten": 10}
+
+# ---- compiled grammars ----
+
+_NUM = r"\d+(?:\.\d+)?"
+
+FORM_RE = re.compile(r"\b(" + "|".join(sorted(map(re.escape, FORMS), key=len, reverse=True)) + r")\b\.?", re.I)
+STRENGTH_RE = re.compile(
+    rf"(?<![\w/])({_NUM})\s*(mg|mcg|µg|g|gm|iu|%)(?:\s*/\s*({_NUM})?\s*(ml|g|tab))?"
+    rf"(?:\s*\+\s*({_NUM})\s*(mg|mcg|iu|g))?(?![a-z])",
+    re.I
+)
+# A unitless number that is not a dose ("1 tab"), schedule ("1-0-1"), duration ("5 days", "5/7") or "2 times a day"
+BARE_STRENGTH_RE = re.compile(
+    rf"\s*({_NUM})(?![\w.%/\-])(?!\s*(?:-|/|%|mg|mcg|µg|gm?\b|iu\b|ml\b|tab|cap|puff|drop|tsp|teaspoon|sachet|unit"
+    r"|days?\b|d\b|weeks?\b|wks?\b|w\b|months?\b|mo\b|m\b|(?:times|x)\s*(?:a|per|in a)?\s*(?:day|daily|week)))",
+    re.I
+)
+DOSE_RE = re.compile(
+    r"(?<![/\d.])\b(\d+(?:\.\d+)?|1/2|½|half|one|two|three)\s*"
+    r"(tab(?:let)?s?|cap(?:sule)?s?|ml|puffs?|drops?|tsp|teaspoons?|sachets?|units?)\b",
+    re.I
+)
+PATTERN_RE = re.compile(r"(?<![\d/.])([0-2](?:\.5|½)?)\s*-\s*([0-2](?:\.5|½)?)\s*-\s*([0-2](?:\.5|½)?)(?:\s*-\s*([0-2](?:\.5|½)?))?(?![\d/])")
+CODE_RE = re.compile(r"\b(" + "|".join(sorted(FREQUENCY_CODES, key=len, reverse=True)) + r")\b\.?", re.I)
+EVERY_HOURS_RE = re.compile(r"\b(?:q\s*(\d{1,2})\s*h(?:rs?)?|every\s+(\d{1,2})(?:\s*(?:-|to)\s*(\d{1,2}))?\s*(?:hours?|hrs?|h))\b", re.I)
+TIMES_DAILY_RE = re.compile(
+    r"\b(once|twice|thrice|one time|two times|three times|four times|(\d)\s*(?:times|x))\s*(?:a|per|in a)?\s*(day|daily|week|weekly)\b"
+    r"|\b(daily|every day|weekly|every morning|every night|at night|at bedtime|in the morning)\b",
+    re.I
+)
+DURATION_RE = re.compile(
+    r"(?:\b(?:for|x|×|\*)\s*)?(?<![\d/])(\d{1,3})\s*(days?|d|weeks?|wks?|w|months?|mo|m)\b(?!\s*(?:of|old|gestation|pregnan))"
+    r"|(?:\b(?:x|×|for)\s*)(\d{1,2})\s*/\s*(7|52|12)\b",
+    re.I
+)
+DURATION_UNTIL_RE = re.compile(
+    r"\b(?:till|until)\s+(?:delivery|\d{1,2}\s*weeks?(?:\s+of\s+pregnancy)?|further (?:orders|advice)|review)\b", re.I
+)
+DURATION_OPEN_RE = re.compile(r"\b(?:continue|long[- ]term|ongoing|as needed|when required)\b", re.I)
+ROUTE_RE = re.compile(r"(?<![\w/])(" + "|".join(sorted(map(re.escape, ROUTES), key=len, reverse=True)) + r")(?![\w/])", re.I)
+TIMING_RE = re.compile(
+    r"\b(before food|after food|with food|before meals?|after meals?|with meals?|empty stomach|"
+    r"before breakfast|after breakfast|after lunch|after dinner|before bed(?:time)?|at bedtime|"
+    r"a\.?c\.?|p\.?c\.?)(?![\w])",
+    re.I
+)
+PRESCRIBER_RE = re.compile(r"\bDr\.?\s*((?:[A-Z][A-Za-z.]*\.?\s?){1,4})")
+WORD_RE = re.compile(r"[a-z0-9][a-z0-9\-]*", re.I)
+FORM_NAME_RE = re.compile(r"\b(?i:" + "|".join(sorted(map(re.escape, FORMS), key=len, reverse=True)) + r")\b\.?\s*([A-Z][A-Za-z\-]{2,}(?:\s+[A-Z][A-Za-z\-]{2,})?)")
+DEGREES_RE = re.compile(r"\s*,?\s*\b(?:MBBS|MD|MS|DGO|DNB|FRCOG|MRCOG|FOGSI|OBG)\b.*$")
+
+
+def _build_lookup(dictionary: Dict[str, List[str]]) -> Tuple[Dict[str, str], int]:
+    lookup = {}
+    for generic, aliases in dictionary.items():
+        for name in [generic, *aliases]:
+            lookup[" ".join(WORD_RE.findall(name.lower()))] = generic
+    return lookup, max(len(key.split()) for key in lookup)
+
+
+def _load_dictionary() -> Dict[str, List[str]]:
+    dictionary = {name: list(aliases) for name, aliases in DRUG_DICTIONARY.items()}
+    if PRESCRIPTION_DRUG_DICTIONARY_PATH:
+        try:
+            with open(PRESCRIPTION_DRUG_DICTIONARY_PATH, encoding="utf-8") as f:
+                for name, aliases in json.load(f).items():
+                    dictionary.setdefault(name, []).extend(a.lower() for a in aliases)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not load drug dictionary {PRESCRIPTION_DRUG_DICTIONARY_PATH}: {e}")
+    return dictionary
+
+
+_DRUG_LOOKUP, _MAX_NAME_WORDS = _build_lookup(_load_dictionary())
+
+
+def _number(text: str) -> float:
+    text = text.lower()
+    if text in ("1/2", "½"):
+        return 0.5
+    if text in WORD_NUMBERS:
+        return WORD_NUMBERS[text]
+    return float(text.replace("½", ".5"))
+
+
+def find_drugs(line: str) -> List[Tuple[int, int, str, str]]:
+    """Dictionary hits in a line as (start, end, generic name, matched text), longest match first"""
+    words = [(m.start(), m.end(), m.group(0).lower()) for m in WORD_RE.finditer(line)]
+    hits, i = [], 0
+    while i < len(words):
+        for size in range(min(_MAX_NAME_WORDS, len(words) - i), 0, -1):
+            key = " ".join(w[2] for w in words[i:i + size])
+            generic = _DRUG_LOOKUP.get(key)
+            if generic:
+                start, end = words[i][0], words[i + size - 1][1]
+                if hits and hits[-1][2] == generic and not line[hits[-1][1]:start].strip():
+                    # "Insulin Actrapid": a generic followed by its brand is one drug
+                    start = hits.pop()[0]
+                hits.append((start, end, generic, line[start:end]))
+                i += size
+                break
+        else:
+            i += 1
+    return hits
+
+
+def _frequency(line: str) -> Optional[Dict[str, Any]]:
+    match = PATTERN_RE.search(line)
+    if match:
+        slots = [s for s in match.groups() if s is not None]
+        doses = [_number(s) for s in slots]
+        labels = ["morning", "afternoon", "night"] if len(slots) == 3 else ["morning", "afternoon", "evening", "night"]
+        times = sum(1 for d in doses if d)
+        return {"text": match.group(0).replace(" ", ""), "times_per_day": times,
+                "schedule": {label: dose for label, dose in zip(labels, doses)},
+                "normalized": _times_text(times), "confidence": 0.95}
+
+    match = EVERY_HOURS_RE.search(line)
+    if match:
+        hours = int(match.group(1) or match.group(2))
+        return {"text": match.group(0), "times_per_day": max(1, 24 // hours) if hours else None,
+                "normalized": f"Every {hours}{'-' + match.group(3) if match.group(3) else ''} hours", "confidence": 0.9}
+
+    match = CODE_RE.search(line)
+    if match:
+        normalized, times = FREQUENCY_CODES[match.group(1).lower()]
+        return {"text": match.group(1), "times_per_day": times, "normalized": normalized, "confidence": 0.95}
+
+    match = TIMES_DAILY_RE.search(line)
+    if match:
+        if match.group(1):
+            word = match.group(1).lower()
+            times = int(match.group(2)) if match.group(2) else FREQUENCY_WORDS.get(word, 1)
+            per_week = match.group(3).lower().startswith("week")
+            normalized = f"{_times_text(times).replace(' daily', '')} weekly" if per_week else _times_text(times)
+            return {"text": match.group(0), "times_per_day": None if per_week else times,
+                    "normalized": normalized, "confidence": 0.9}
+        phrase = match.group(4).lower()
+        if "week" in phrase:
+            return {"text": match.group(0), "times_per_day": None, "normalized": "Once weekly", "confidence": 0.85}
+        if "night" in phrase or "bedtime" in phrase:
+            normalized = "Once daily at night"
+        elif "morning" in phrase:
+            normalized = "Once daily in the morning"
+        else:
+            normalized = "Once daily"
+        return {"text": match.group(0), "times_per_day": 1, "normalized": normalized, "confidence": 0.8}
+    return None
+
+
+def parse_frequency(text: str) -> Optional[Dict[str, Any]]:
+    """Frequency fields (times_per_day, normalized, ...) of free text such as a dosage's "Twice daily" """
+    return _frequency(text or "")
+
+
+def _times_text(times: Optional[int]) -> str:
+    return {1: "Once daily", 2: "Twice daily", 3: "Three times daily", 4: "Four times daily"}.get(times, f"{times} times daily")
+
+
+def _duration(line: str) -> Optional[Dict[str, Any]]:
+    for match in DURATION_RE.finditer(line):
+        # "till 12 weeks" is a gestational age, not a course length
+        if line[:match.start()].rstrip().lower().endswith(("till", "until", "upto", "up to")):
+            continue
+        if match.group(1):
+            value, unit = int(match.group(1)), match.group(2).lower()
+            unit_key = next(key for key in ("day", "week", "wk", "month", "mo", "d", "w", "m") if unit.startswith(key))
+            days = value * DURATION_UNIT_DAYS[unit_key]
+            unit_name = {1: "day", 7: "week", 30: "month"}[DURATION_UNIT_DAYS[unit_key]]
+        else:
+            value, per = int(match.group(3)), match.group(4)
+            unit_name = {"7": "day", "52": "week", "12": "month"}[per]
+            days = value * {"day": 1, "week": 7, "month": 30}[unit_name]
+        return {"text": match.group(0).strip(), "value": value, "unit": unit_name + ("s" if value != 1 else ""),
+                "days": days, "normalized": f"{value} {unit_name}{'s' if value != 1 else ''}", "confidence": 0.95}
+
+    match = DURATION_UNTIL_RE.search(line) or DURATION_OPEN_RE.search(line)
+    if match:
+        text = match.group(0)
+        return {"text": text, "value": None, "unit": None, "days": None,
+                "normalized": text[0].upper() + text[1:], "confidence": 0.8}
+    return None
+
+
+def _strength(line: str) -> Optional[Dict[str, Any]]:
+    match = STRENGTH_RE.search(line)
+    if not match:
+        return None
+    amount, unit = match.group(1), match.group(2).lower().replace("gm", "g").replace("µg", "mcg")
+    text = f"{amount}{unit}" if unit != "%" else f"{amount}%"
+    if match.group(4):
+        text += f"/{match.group(3) or ''}{match.group(4).lower()}"
+    if match.group(5):
+        text += f" + {match.group(5)}{match.group(6).lower()}"
+    return {"text": text, "value": float(amount), "unit": unit, "confidence": 0.95}
+
+
+def _bare_strength(text: str, generic: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Strength of "Pan 40 BD": `text` is what follows a dictionary drug's name on its line"""
+    unit = DRUG_STRENGTH_UNITS.get(generic, "mg") if generic else None
+    match = BARE_STRENGTH_RE.match(text) if unit else None
+    if not match:
+        return None
+    amount = match.group(1)
+    return {"text": f"{amount}{unit}", "value": float(amount), "unit": unit, "confidence": 0.8}
+
+
+def _dose(line: str) -> Optional[Dict[str, Any]]:
+    match = DOSE_RE.search(line)
+    if not match:
+        return None
+    unit = match.group(2).lower()
+    if unit in FORMS:
+        unit = FORMS[unit]
+    elif unit.endswith("s") and len(unit) > 3:
+        unit = unit[:-1]
+    amount = _number(match.group(1))
+    return {"text": match.group(0), "amount": amount, "unit": unit, "confidence": 0.9}
+
+
+def _parse_fields(line: str) -> Dict[str, Any]:
+    fields = {}
+    form = FORM_RE.search(line)
+    if form:
+        fields["form"] = {"text": FORMS[form.group(1).lower()], "confidence": 0.95}
+    for name, extractor in (("strength", _strength), ("dose", _dose), ("frequency", _frequency), ("duration", _duration)):
+        value = extractor(line)
+        if value:
+            fields[name] = value
+    route = ROUTE_RE.search(line)
+    if route:
+        fields["route"] = {"text": ROUTES[route.group(1).lower()], "confidence": 0.9}
+    timing = TIMING_RE.findall(line)
+    if timing:
+        fields["instructions"] = {"text": ", ".join(t.lower() for t in timing), "confidence": 0.9}
+    return fields
+
+
+def _segment_start(line: str, previous_end: int, name_start: int) -> int:
+    """Where the next drug's text begins: at its form word ("Cap.") when one directly precedes the name"""
+    for match in FORM_RE.finditer(line, previous_end, name_start):
+        if not line[match.end():name_start].strip():
+            return match.start()
+    return name_start
+
+
+def _new_medication(name: str, generic: Optional[str], line: str, confidence: float) -> Dict[str, Any]:
+    return {"name": {"text": name, "generic": generic, "confidence": confidence}, "line": line, "fields": {}}
+
+
+def _merge(medication: Dict[str, Any], fields: Dict[str, Any], same_line: bool):
+    for name, value in fields.items():
+        if name in medication["fields"]:
+            if name == "instructions" and value["text"] not in medication["fields"][name]["text"]:
+                medication["fields"][name]["text"] += ", " + value["text"]
+            continue
+        if not same_line:
+            value = dict(value, confidence=round(value["confidence"] * 0.9, 3))
+        medication["fields"][name] = value
+
+
+FIELD_WEIGHTS = {"name": 0.4, "strength": 0.2, "frequency": 0.25, "duration": 0.15}
+
+
+def _finish(medication: Dict[str, Any]) -> Dict[str, Any]:
+    fields = medication["fields"]
+    if "route" not in fields and "form" in fields and fields["form"]["text"] in FORM_ROUTES:
+        fields["route"] = {"text": FORM_ROUTES[fields["form"]["text"]], "confidence": 0.7}
+
+    confidence = {"name": medication["name"]["confidence"]}
+    confidence.update({name: value["confidence"] for name, value in fields.items()})
+    overall = sum(weight * confidence.get(name, 0.0) for name, weight in FIELD_WEIGHTS.items())
+
+    return {
+        "medication_name": medication["name"]["generic"] or medication["name"]["text"],
+        "matched_name": medication["name"]["text"],
+        "generic_name": medication["name"]["generic"],
+        "form": fields.get("form", {}).get("text", ""),
+        "strength": fields.get("strength", {}).get("text", ""),
+        "dose": fields.get("dose", {}).get("text", ""),
+        "frequency": fields.get("frequency", {}).get("normalized", ""),
+        "times_per_day": fields.get("frequency", {}).get("times_per_day"),
+        "schedule": fields.get("frequency", {}).get("schedule"),
+        "duration": fields.get("duration", {}).get("normalized", ""),
+        "duration_days": fields.get("duration", {}).get("days"),
+        "route": fields.get("route", {}).get("text", ""),
+        "instructions": fields.get("instructions", {}).get("text", ""),
+        "source_line": medication["line"],
+        "field_confidence": {name: round(value, 3) for name, value in confidence.items()},
+        "confidence": round(overall, 3),
+    }
+
+
+def parse_prescription(text: str) -> Dict[str, Any]:
+    """Structured medications, prescriber and confidences for one prescription text"""
+    start = time.perf_counter()
+    medications, current = [], None
+    prescriber = None
+
+    for raw_line in (text or "").splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        if prescriber is None:
+            match = PRESCRIBER_RE.search(line)
+            if match:
+                prescriber = "Dr. " + DEGREES_RE.sub("", match.group(1)).strip()
+                if not find_drugs(line[match.end():]):
+                    continue
+
+        # A line can name several drugs ("Tab. Folic acid 5mg OD, Cap. Iron 100mg BD")
+        hits = find_drugs(line)
+        if not hits:
+            fallback = FORM_NAME_RE.search(line)
+            if fallback and fallback.group(1).lower() not in ROUTES:
+                hits = [(fallback.start(1), fallback.end(1), None, fallback.group(1))]
+
+        if hits:
+            bounds = [_segment_start(line, previous[1], hit[0]) for previous, hit in zip(hits, hits[1:])] + [len(line)]
+            segment_start = 0
+            for (hit_start, hit_end, generic, matched), segment_end in zip(hits, bounds):
+                if current is not None:
+                    medications.append(current)
+                current = _new_medication(matched, generic, line, 0.95 if generic else 0.6)
+                # Fields before the name (e.g. "Tab.") belong to it as well
+                _merge(current, _parse_fields(line[segment_start:segment_end]), same_line=True)
+                if "strength" not in current["fields"]:
+                    strength = _bare_strength(line[hit_end:segment_end], generic)
+                    if strength:
+                        current["fields"]["strength"] = strength
+                segment_start = segment_end
+        elif current is not None:
+            _merge(current, _parse_fields(line), same_line=False)
+
+    if current is not None:
+        medications.append(current)
+
+    results = [_finish(m) for m in medications]
+    confidence = round(sum(m["confidence"] for m in results) / len(results), 3) if results else 0.0
+    return {
+        "medications": results,
+        "prescribed_by": prescriber or "",
+        "confidence": confidence,
+        "parse_time_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+def parse_prescriptions(texts: List[str]) -> List[Dict[str, Any]]:
+    """Parse a batch of prescription texts"""
+    return [parse_prescription(text) for text in texts]
+
+
+def needs_remote_parse(result: Dict[str, Any], min_confidence: float = PRESCRIPTION_PARSER_MIN_CONFIDENCE) -> bool:
+    """True when the local parse is not good enough to answer without n8n/LLM"""
+    return not result["medications"] or result["confidence"] < min_confidence
+
+
+def to_extracted_info(result: Dict[str, Any], raw_text: str = "") -> Dict[str, Any]:
+    """Flat single-medication fields used by the existing prescription endpoints"""
+    first = result["medications"][0] if result["medications"] else {}
+    dosage = " ".join(part for part in (first.get("strength", ""), first.get("dose", "")) if part)
+    return {
+        "medication_name": first.get("medication_name", ""),
+        "dosage": dosage,
+        "frequency": first.get("frequency", ""),
+        "duration": first.get("duration", ""),
+        "instructions": first.get("instructions", ""),
+        "prescribed_by": result.get("prescribed_by", ""),
+        "raw_text": raw_text,
+    }
@@ -0,0 +1,166 @@
+# File: semantic_cache_service.py
+"""
+Semantic answer cache for /symptoms/assist.
+
+Paraphrased symptom queries ("feeling sick in the morning", "morning nausea")
+miss an exact-text cache, so answers are cached by query embedding instead.
+Each trimester has its own small in-memory index: a fixed-size numpy ring
+buffer of normalized query vectors next to the cached answers. A lookup is a
+single matrix-vector product; the best match is returned when its cosine
+similarity reaches SEMANTIC_CACHE_THRESHOLD.
+
+Only the retrieval + LLM part of the response is cached. Red-flag detection
+and keyword recommendations are cheap and always re-run on the new text.
+"""
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.90"))
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "512"))  # entries per trimester
+SEMANTIC_CACHE_TTL_SEC = int(os.getenv("SEMANTIC_CACHE_TTL_SEC", "86400"))
+SEMANTIC_CACHE_WARM_SIZE = int(os.getenv("SEMANTIC_CACHE_WARM_SIZE", "50"))
+
+
+class _TrimesterIndex:
+    """Ring buffer of query vectors and answers for one trimester"""
+
+    def __init__(self, dimension: int, capacity: int):
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.entries = [None] * capacity
+        self.stored_at = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+        self.next_slot = 0
+
+    def add(self, vector: np.ndarray, entry: Dict[str, Any]):
+        slot = self.next_slot
+        self.vectors[slot] = vector
+        self.entries[slot] = entry
+        self.stored_at[slot] = time.time()
+        self.next_slot = (slot + 1) % len(self.entries)
+        self.size = min(self.size + 1, len(self.entries))
+
+    def best_match(self, vector: np.ndarray, min_stored_at: float):
+        if self.size == 0:
+            return None, 0.0
+        similarities = self.vectors[:self.size] @ vector
+        similarities[self.stored_at[:self.size] < min_stored_at] = -1.0
+        best = int(np.argmax(similarities))
+        return best, float(similarities[best])
+
+
+class SemanticAnswerCache:
+    """Trimester-partitioned cache of (query embedding -> final answer)"""
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 capacity: int = SEMANTIC_CACHE_CAPACITY, ttl_seconds: int = SEMANTIC_CACHE_TTL_SEC):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.warmed = 0
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        if vector is None or len(vector) == 0:
+            return None
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        if norm == 0:
+            return None
+        return array / norm
+
+    def lookup(self, vector, trimester: str) -> Optional[Dict[str, Any]]:
+        """Cached answer for the closest earlier query in the same trimester, or None"""
+        query = self._normalize(vector)
+        if query is None:
+            return None
+
+        with self._lock:
+            index = self._indexes.get(trimester)
+            if index is None or index.vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            min_stored_at = time.time() - self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+            slot, similarity = index.best_match(query, min_stored_at)
+            if slot is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            entry = dict(index.entries[slot])
+        entry["similarity"] = round(similarity, 4)
+        return entry
+
+    def store(self, vector, trimester: str, query_text: str, answer: Dict[str, Any]):
+        """Remember the answer produced for a query"""
+        query = self._normalize(vector)
+        if query is None:
+            return
+
+        with self._lock:
+            index = self._indexes.get(trimester)
+            if index is None or index.vectors.shape[1] != query.shape[0]:
+                index = _TrimesterIndex(query.shape[0], self.capacity)
+                self._indexes[trimester] = index
+            index.add(query, {"cached_query": query_text, **answer})
+            self.stores += 1
+
+    def clear(self):
+        """Drop every cached answer (e.g. after the knowledge base changes)"""
+        with self._lock:
+            self._indexes = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": SEMANTIC_CACHE_ENABLED,
+                "threshold": self.threshold,
+                "capacity_per_trimester": self.capacity,
+                "ttl_seconds": self.ttl_seconds,
+                "entries": {trimester: index.size for trimester, index in self._indexes.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "warmed": self.warmed,
+            }
+
+
+def top_symptom_queries(patients_collection, limit: int = SEMANTIC_CACHE_WARM_SIZE) -> list:
+    """Most frequent historical symptom texts (normalized) with a representative pregnancy week"""
+    if patients_collection is None or limit <= 0:
+        return []
+
+    pipeline = [
+        {"$unwind": "$symptom_logs"},
+        {"$match": {"symptom_logs.symptom_text": {"$type": "string", "$ne": ""}}},
+        {"$group": {
+            "_id": {
+                "text": {"$toLower": {"$trim": {"input": "$symptom_logs.symptom_text"}}},
+                "trimester": "$symptom_logs.trimester",
+            },
+            "pregnancy_week": {"$max": "$symptom_logs.pregnancy_week"},
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
+    return [
+        {
+            "text": row["_id"]["text"],
+            "pregnancy_week": row.get("pregnancy_week") or 1,
+            "count": row["count"],
+        }
+        for row in patients_collection.aggregate(pipeline)
+    ]
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Local SMTP sink for testing email delivery without Gmail
+
+Speaks enough ESMTP for smtplib (EHLO/HELO, AUTH PLAIN/LOGIN, MAIL, RCPT,
+DATA, RSET, NOOP, QUIT; no STARTTLS) and accepts every message. Behaviour is
+configurable so connection reuse, reconnects and retries can be exercised:
+- connect latency: seconds before the greeting (TCP + TLS handshake cost)
+- auth latency: seconds before AUTH succeeds
+- message latency: seconds before a message is accepted
+- error rate: share of messages answered 451 (temporary failure)
+- disconnect every: close the connection after this many messages
+
+Usage:
+    python smtp_stub_server.py --port 2525 --connect-latency 0.1 --auth-latency 0.1
+    EMAIL_SMTP_HOST=127.0.0.1 EMAIL_SMTP_PORT=2525 EMAIL_SMTP_STARTTLS=false python app_simple.py
+"""
+
+import argparse
+import base64
+import json
+import random
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+
+
+class SmtpSinkState:
+    """Behaviour settings and counters shared by all connections"""
+
+    def __init__(self, connect_latency: float = 0.0, auth_latency: float = 0.0, message_latency: float = 0.0,
+                 error_rate: float = 0.0, disconnect_every: int = 0, keep_messages: bool = True, seed: int = None):
+        self.connect_latency = connect_latency
+        self.auth_latency = auth_latency
+        self.message_latency = message_latency
+        self.error_rate = error_rate
+        self.disconnect_every = disconnect_every
+        self.keep_messages = keep_messages
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.open_connections = 0
+        self.peak_connections = 0
+        self.logins = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.messages = []  # (recipients, subject)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "connections": self.connections,
+                "peak_connections": self.peak_connections,
+                "logins": self.logins,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+            }
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    state = None  # set by create_smtp_sink
+
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        state = self.state
+        with state.lock:
+            state.connections += 1
+            state.open_connections += 1
+            state.peak_connections = max(state.peak_connections, state.open_connections)
+        try:
+            if state.connect_latency:
+                time.sleep(state.connect_latency)
+            self.reply("220 smtp-stub ESMTP ready")
+            self._session()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with state.lock:
+                state.open_connections -= 1
+
+    def _session(self):
+        state = self.state
+        sent_here = 0
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb == "EHLO":
+                self.reply("250-smtp-stub")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 smtp-stub")
+            elif verb == "AUTH":
+                if command.upper().startswith("AUTH LOGIN"):
+                    for prompt in ("VXNlcm5hbWU6", "UGFzc3dvcmQ6"):  # "Username:", "Password:"
+                        self.reply(f"334 {prompt}")
+                        self.rfile.readline()
+                else:
+                    parts = command.split(" ")
+                    if len(parts) < 3:
+                        self.reply("334 ")
+                        self.rfile.readline()
+                    else:
+                        base64.b64decode(parts[2])
+                if state.auth_latency:
+                    time.sleep(state.auth_latency)
+                with state.lock:
+                    state.logins += 1
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 2.1.0 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip().strip("<>"))
+                self.reply("250 2.1.5 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                if state.message_latency:
+                    time.sleep(state.message_latency)
+                with state.lock:
+                    failed = state.random.random() < state.error_rate
+                    if failed:
+                        state.rejected += 1
+                    else:
+                        state.accepted += 1
+                        if state.keep_messages:
+                            subject = message_from_bytes(b"".join(data)).get("Subject", "")
+                            state.messages.append((recipients, subject))
+                if failed:
+                    self.reply("451 4.3.0 Temporary failure (stub injected)")
+                    continue
+                self.reply("250 2.0.0 OK queued")
+                sent_here += 1
+                if state.disconnect_every and sent_here >= state.disconnect_every:
+                    return  # drop the connection like a server enforcing a per-connection limit
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 2.0.0 OK")
+            elif verb == "QUIT":
+                self.reply("221 2.0.0 Bye")
+                return
+            else:
+                self.reply("502 5.5.2 Command not implemented")
+
+
+class SmtpSinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def create_smtp_sink(host: str = "127.0.0.1", port: int = 0, **state_kwargs):
+    """Create (but do not start) a sink; port 0 picks a free port"""
+    state = SmtpSinkState(**state_kwargs)
+    handler = type("BoundSmtpSinkHandler", (SmtpSinkHandler,), {"state": state})
+    server = SmtpSinkServer((host, port), handler)
+    server.state = state
+    return server
+
+
+def start_smtp_sink(**kwargs):
+    """Start a sink in a background thread and return it"""
+    server = create_smtp_sink(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="seconds before the greeting")
+    parser.add_argument("--auth-latency", type=float, default=0.0, help="seconds before AUTH succeeds")
+    parser.add_argument("--message-latency", type=float, default=0.0, help="seconds before a message is accepted")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of messages answered 451")
+    parser.add_argument("--disconnect-every", type=int, default=0, help="drop connections after this many messages")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server = create_smtp_sink(args.host, args.port, connect_latency=args.connect_latency,
+                              auth_latency=args.auth_latency, message_latency=args.message_latency,
+                              error_rate=args.error_rate, disconnect_every=args.disconnect_every,
+                              keep_messages=False, seed=args.seed)
+    print(f"🚀 SMTP stub listening on {args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n👋 SMTP stub stopped: {json.dumps(server.state.snapshot())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Test the shared asyncio loop thread
+(one loop across calls, HTTP session reuse, timeouts, clean shutdown)
+"""
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+
+from async_loop_service import AsyncCallTimeout, AsyncLoopThread, close_http_sessions
+
+
+class FakeWebhookService:
+    """Keeps one aiohttp session, created lazily on the loop it is first used from"""
+
+    def __init__(self, url):
+        self.url = url
+        self.session = None
+        self.sessions_created = 0
+
+    async def send_ocr_result(self, ocr_result, filename):
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+            self.sessions_created += 1
+        async with self.session.post(self.url, json={"filename": filename}) as response:
+            return [{"success": response.status == 200, "config_name": "n8n", "url": self.url}]
+
+
+def serve():
+    peers = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            peers.add(self.client_address)
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/webhook", peers
+
+
+def test_one_loop_and_session_reuse():
+    """Every call runs on the same loop thread, so the service's session and connection are reused"""
+    print("🔍 Testing loop and session reuse")
+    server, url, peers = serve()
+    loop_thread = AsyncLoopThread(name="test-loop")
+    service = FakeWebhookService(url)
+
+    async def where():
+        return threading.current_thread().name, id(asyncio.get_running_loop())
+
+    assert loop_thread.run(where()) == loop_thread.run(where())
+    assert loop_thread.run(where())[0] == "test-loop"
+
+    for i in range(5):
+        results = loop_thread.run(service.send_ocr_result({"success": True}, f"rx{i}.jpg"))
+        assert results[0]["success"]
+    print(f"   Sessions created: {service.sessions_created}, client connections: {len(peers)}")
+    assert service.sessions_created == 1
+    assert len(peers) == 1, "keep-alive connection not reused"
+
+    loop_thread.register_cleanup(close_http_sessions(service))
+    loop_thread.shutdown()
+    assert service.session.closed and not loop_thread.running
+    server.shutdown()
+    server.server_close()
+    print("✅ One loop, one session")
+
+
+def test_timeout_cancels_and_errors_propagate():
+    """A timed-out coroutine is cancelled; exceptions reach the caller"""
+    print("🔍 Testing timeouts and errors")
+    loop_thread = AsyncLoopThread(name="test-timeout")
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    try:
+        loop_thread.run(slow(), timeout=0.1)
+        assert False, "expected a timeout"
+    except AsyncCallTimeout:
+        pass
+    assert cancelled.wait(1), "timed-out coroutine kept running"
+
+    async def fail():
+        raise ValueError("webhook rejected")
+
+    try:
+        loop_thread.run(fail())
+        assert False, "expected the coroutine's exception"
+    except ValueError as e:
+        assert str(e) == "webhook rejected"
+
+    async def nested():
+        inner = asyncio.sleep(0)
+        try:
+            loop_thread.run(inner)
+        except RuntimeError:
+            return "refused"
+
+    assert loop_thread.run(nested()) == "refused", "run() from the loop thread must not deadlock"
+    loop_thread.shutdown()
+    print("✅ Timeouts cancel, errors propagate")
+
+
+def test_shutdown_cancels_outstanding_work():
+    """Shutdown runs cleanups, cancels pending tasks and refuses new work"""
+    print("🔍 Testing shutdown")
+    loop_thread = AsyncLoopThread(name="test-shutdown")
+    calls = []
+    loop_thread.register_cleanup(lambda: calls.append("sync"))
+
+    async def async_cleanup():
+        calls.append("async")
+
+    loop_thread.register_cleanup(async_cleanup)
+    pending = loop_thread.submit(asyncio.sleep(30))
+    loop_thread.shutdown(timeout=2)
+
+    assert calls == ["async", "sync"]
+    assert pending.cancelled()
+    try:
+        loop_thread.submit(asyncio.sleep(0))
+        assert False, "expected RuntimeError after shutdown"
+    except RuntimeError:
+        pass
+    loop_thread.shutdown()  # idempotent
+    print("✅ Clean shutdown")
+
+
+def main():
+    print("🧪 Testing Shared Async Loop")
+    print("=" * 50)
+
+    tests = [
+        ("Loop and session reuse", test_one_loop_and_session_reuse),
+        ("Timeouts and errors", test_timeout_cancels_and_errors_propagate),
+        ("Shutdown", test_shutdown_cancels_outstanding_work),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
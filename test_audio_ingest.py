@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Test the streaming audio ingest behind /nutrition/transcribe
+(raw / multipart / base64 bodies, chunked segment and stream sessions, upload overlapped
+with transcription or transcoding, retries and gaps, size limits, transcoding fallback)
+"""
+
+import base64
+import io
+import os
+import stat
+import tempfile
+import threading
+
+import audio_ingest_service
+from audio_ingest_service import (
+    AudioSessionError,
+    AudioSessionManager,
+    audio_filename,
+    read_audio_request,
+    transcribe_upload,
+)
+from upload_service import UploadTooLargeError, spool_stream
+
+
+class FakeRequest:
+    """The Flask request attributes read_audio_request uses"""
+
+    def __init__(self, body=b"", mimetype="", headers=None, args=None, json=None):
+        self.files, self.form = {}, {}
+        self.stream = io.BytesIO(body)
+        self.mimetype = mimetype
+        self.headers = headers or {}
+        self.args = args or {}
+        self._json = json
+
+    def get_json(self, silent=False):
+        return self._json
+
+
+class RecordingTranscriber:
+    """Returns the audio bytes as text; blocks until released when gated"""
+
+    def __init__(self, gated=False):
+        self.calls = []
+        self.release = threading.Event()
+        if not gated:
+            self.release.set()
+
+    def __call__(self, path, language):
+        with open(path, "rb") as f:
+            text = f.read().decode()
+        self.calls.append((text, language))
+        self.release.wait(5)
+        return f" {text} "
+
+
+def test_request_bodies():
+    """Raw bodies, base64 JSON and their options all end up as a spooled upload"""
+    print("🔍 Testing request bodies")
+    upload, options = read_audio_request(FakeRequest(
+        b"RIFF....", "audio/wav", headers={"X-Audio-Filename": "meal"}, args={"language": "ta"}))
+    assert (upload.filename, upload.size, options) == ("meal.wav", 8, {"language": "ta"})
+    upload.close()
+
+    upload, options = read_audio_request(FakeRequest(
+        json={"audio": base64.b64encode(b"webm-bytes").decode(), "method": "whisper"}), default_filename="audio.webm")
+    assert upload.filename == "audio.webm" and upload.read_bytes() == b"webm-bytes"
+    assert options == {"method": "whisper"}
+    upload.close()
+
+    assert audio_filename("", "audio/ogg; codecs=opus") == "audio.ogg"
+    for bad in (FakeRequest(json=None), FakeRequest(json={"language": "en"})):
+        try:
+            read_audio_request(bad)
+            assert False, "missing audio accepted"
+        except ValueError:
+            pass
+    try:
+        read_audio_request(FakeRequest(b"x" * 100, "application/octet-stream"), max_bytes=10)
+        assert False, "oversized body accepted"
+    except UploadTooLargeError:
+        pass
+    print("✅ Bodies spooled")
+
+
+def test_segments_transcribe_while_uploading():
+    """Each segment is transcribed as it arrives; complete() joins them in index order"""
+    print("🔍 Testing segment sessions")
+    transcriber = RecordingTranscriber(gated=True)
+    manager = AudioSessionManager(transcriber, workers=2)
+    session = manager.create("segments", language="ta", filename="meal.webm")
+
+    manager.add_chunk(session.id, 1, io.BytesIO(b"sambar"))
+    manager.add_chunk(session.id, 0, io.BytesIO(b"two idli"))
+    assert manager.add_chunk(session.id, 0, io.BytesIO(b"retry"))["duplicate"]
+    for _ in range(100):
+        if len(transcriber.calls) == 2:
+            break
+        threading.Event().wait(0.01)
+    print(f"   Transcribed before complete: {transcriber.calls}")
+    assert sorted(transcriber.calls) == [("sambar", "ta"), ("two idli", "ta")], "upload overlaps transcription"
+
+    transcriber.release.set()
+    result = manager.complete(session.id)
+    assert result["text"] == "two idli sambar" and result["chunks"] == 2
+    assert result["bytes_received"] == result["bytes_sent"] == 14 and result["transcoded_chunks"] == 0
+    try:
+        manager.get(session.id)
+        assert False, "completed session still open"
+    except AudioSessionError as e:
+        assert e.status == 404
+    manager.shutdown()
+    print("✅ Segments overlapped with the upload")
+
+
+def test_gaps_order_and_limits():
+    """Gaps keep the session open; stream chunks must arrive in order; sessions have a byte budget"""
+    print("🔍 Testing gaps and limits")
+    transcriber = RecordingTranscriber()
+    manager = AudioSessionManager(transcriber, max_bytes=12)
+
+    segments = manager.create("segments")
+    manager.add_chunk(segments.id, 0, io.BytesIO(b"rice"))
+    manager.add_chunk(segments.id, 2, io.BytesIO(b"curd"))
+    try:
+        manager.complete(segments.id)
+        assert False, "completed with a missing chunk"
+    except AudioSessionError as e:
+        assert e.status == 409 and "[1]" in str(e)
+    manager.add_chunk(segments.id, 1, io.BytesIO(b"dal"))
+    assert manager.complete(segments.id)["text"] == "rice dal curd"
+
+    stream = manager.create("stream", filename="long.wav")
+    manager.add_chunk(stream.id, 0, io.BytesIO(b"one "))
+    try:
+        manager.add_chunk(stream.id, 2, io.BytesIO(b"three"))
+        assert False, "out-of-order chunk accepted"
+    except AudioSessionError as e:
+        assert e.status == 409
+    assert manager.add_chunk(stream.id, 0, io.BytesIO(b"one "))["duplicate"]
+    try:
+        manager.add_chunk(stream.id, 1, io.BytesIO(b"two three four"))
+        assert False, "session budget exceeded"
+    except UploadTooLargeError:
+        pass
+    manager.add_chunk(stream.id, 1, io.BytesIO(b"two"))
+    result = manager.complete(stream.id)
+    assert result["text"] == "one two" and result["chunks"] == 2 and result["bytes_received"] == 7
+
+    try:
+        manager.create("chunks")
+        assert False, "unknown mode accepted"
+    except AudioSessionError:
+        pass
+    expired = AudioSessionManager(transcriber, ttl_seconds=-1)
+    session = expired.create()
+    try:
+        expired.add_chunk(session.id, 0, io.BytesIO(b"late"))
+        assert False, "expired session accepted a chunk"
+    except AudioSessionError as e:
+        assert e.status == 404
+    manager.shutdown()
+    expired.shutdown()
+    print("✅ Gaps, ordering and limits enforced")
+
+
+def test_transcoding_falls_back_to_the_original():
+    """Without ffmpeg (or when transcoding fails) the original upload is sent unchanged"""
+    print("🔍 Testing transcoding fallback")
+    transcriber = RecordingTranscriber()
+    upload = spool_stream(io.BytesIO(b"pcm audio"), "meal.wav", "audio/wav")
+    original = (audio_ingest_service.FFMPEG_AVAILABLE, audio_ingest_service.FFMPEG_PATH)
+    try:
+        audio_ingest_service.FFMPEG_AVAILABLE, audio_ingest_service.FFMPEG_PATH = True, "/nonexistent/ffmpeg"
+        assert audio_ingest_service.should_transcode("meal.wav", 9)
+        assert not audio_ingest_service.should_transcode("meal.ogg", 9)
+        assert not audio_ingest_service.should_transcode("meal.wav", 9, "never")
+        result = transcribe_upload(upload, transcriber, "en")
+    finally:
+        audio_ingest_service.FFMPEG_AVAILABLE, audio_ingest_service.FFMPEG_PATH = original
+        upload.close()
+    print(f"   Result: {result}")
+    assert result == {"text": "pcm audio", "bytes_received": 9, "bytes_sent": 9, "transcoded": False}
+    print("✅ Original audio sent when transcoding is unavailable")
+
+
+def test_stream_sessions_transcode_while_uploading():
+    """Stream chunks are piped into ffmpeg as they arrive; complete() sends its output"""
+    print("🔍 Testing stream transcoding")
+    transcriber = RecordingTranscriber()
+    # Stand-in for ffmpeg: copies stdin to the output file (the last argument) without vowels
+    handle, fake_ffmpeg = tempfile.mkstemp(suffix=".sh")
+    with os.fdopen(handle, "w") as f:
+        f.write('#!/bin/sh\nfor arg; do target="$arg"; done\ntr -d aeiou > "$target"\n')
+    os.chmod(fake_ffmpeg, stat.S_IRWXU)
+    original = (audio_ingest_service.FFMPEG_AVAILABLE, audio_ingest_service.FFMPEG_PATH)
+    manager = AudioSessionManager(transcriber)
+    try:
+        audio_ingest_service.FFMPEG_AVAILABLE, audio_ingest_service.FFMPEG_PATH = True, fake_ffmpeg
+        assert audio_ingest_service.should_transcode_stream("long.wav")
+        assert not audio_ingest_service.should_transcode_stream("long.m4a", "always")
+        assert not audio_ingest_service.should_transcode_stream("long.webm")
+
+        session = manager.create("stream", language="en", filename="long.wav")
+        manager.add_chunk(session.id, 0, io.BytesIO(b"one idli "))
+        assert session.encoder is not None and session.encoder.process.poll() is None, "encoder started"
+        manager.add_chunk(session.id, 1, io.BytesIO(b"and sambar"))
+        result = manager.complete(session.id)
+    finally:
+        audio_ingest_service.FFMPEG_AVAILABLE, audio_ingest_service.FFMPEG_PATH = original
+        manager.shutdown()
+        os.unlink(fake_ffmpeg)
+    print(f"   Result: {result}")
+    assert result["text"] == "n dl nd smbr" and result["transcoded_chunks"] == 1
+    assert (result["bytes_received"], result["bytes_sent"]) == (19, 12)
+    print("✅ Stream transcoded during the upload")
+
+
+def main():
+    print("🧪 Testing Audio Ingest")
+    print("=" * 50)
+
+    tests = [
+        ("Request bodies", test_request_bodies),
+        ("Segment sessions", test_segments_transcribe_while_uploading),
+        ("Gaps and limits", test_gaps_order_and_limits),
+        ("Transcoding fallback", test_transcoding_falls_back_to_the_original),
+        ("Stream transcoding", test_stream_sessions_transcode_while_uploading),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test the materialized dosage schedule behind /medication/get-upcoming-dosages
+(one dose per dosage entry, weekly doses, 24h / 7 day windows, already-taken suppression, taken updates)
+"""
+
+from datetime import datetime
+
+from dosage_schedule_service import (
+    DOSE_SCHEDULE_VERSION,
+    DoseScheduleStore,
+    build_dose_schedule,
+    upcoming_dosages,
+)
+from medication_reminder_service import dosing_interval_days, row_next_fire_at, schedule_rows
+
+NOW = datetime(2026, 10, 19, 12, 0)
+
+
+def patient(**tracking):
+    def dosage(time, frequency, enabled=True):
+        return {"dosage": "1 tab", "time": time, "frequency": frequency, "reminder_enabled": enabled}
+
+    return {
+        "patient_id": "PAT1",
+        "medication_logs": [
+            {"medication_name": "Folic Acid", "timestamp": "2026-10-01T09:00:00",
+             "dosages": [dosage("08:00", "Once daily"), dosage("13:00", "Once daily", enabled=False)]},
+            {"medication_name": "Iron", "timestamp": "2026-10-01T09:00:00",
+             "dosages": [dosage("09:00", "BD"), dosage("21:00", "BD")]},
+            {"medication_name": "Vitamin D3", "timestamp": "2026-10-01T09:00:00",
+             "dosages": [dosage("10:00", "Once weekly")]},
+            {"medication_name": "Antenatal plan", "is_prescription_mode": True,
+             "prescription_details": "Continue iron till delivery"},
+        ],
+        **tracking,
+    }
+
+
+def test_dose_plans():
+    """Each entry is one dose at its own time, as for reminders; only weekly frequencies change the days"""
+    print("🔍 Testing dose plans")
+    assert dosing_interval_days("Twice daily") == dosing_interval_days("TDS") == dosing_interval_days("q6h") == 1
+    assert dosing_interval_days("Once weekly") == 7 and dosing_interval_days("As prescribed") == 1
+
+    tds = {"patient_id": "PAT2", "medication_logs": [{"medication_name": "Calcium", "timestamp": "2026-10-01",
+           "dosages": [{"time": "08:00", "frequency": "TDS", "reminder_enabled": True}]}]}
+    doses = upcoming_dosages(build_dose_schedule(tds, NOW), datetime(2026, 10, 20), datetime(2026, 10, 21))
+    assert [d["next_dose_time"] for d in doses] == ["2026-10-20T08:00:00"], "no phantom 00:00 / 16:00 doses"
+
+    # The reminder scheduler fires for exactly the doses the schedule (and adherence) count
+    schedule = build_dose_schedule(patient(), NOW)
+    week = upcoming_dosages(schedule, NOW, datetime(2026, 10, 26, 12, 0), include_taken=True)
+    rows = schedule_rows(patient(), NOW, lead_minutes=0)
+    fired = []
+    for row in rows:
+        at = row["next_fire_at"]
+        while at < datetime(2026, 10, 26, 12, 0):
+            fired.append((row["medication_name"], at.isoformat()))
+            at = row_next_fire_at(row, at, lead_minutes=0)
+    assert sorted(fired) == sorted((d["medication_name"], d["next_dose_time"]) for d in week)
+    assert schedule["version"] == DOSE_SCHEDULE_VERSION
+    print("✅ Dose plans match the reminder schedule")
+
+
+def test_range_queries():
+    """24 hours and 7 days windows hold every dose occurrence in order"""
+    print("🔍 Testing range queries")
+    schedule = build_dose_schedule(patient(), NOW)
+    assert len(schedule["dosages"]) == 4 and len(schedule["prescription_medications"]) == 1
+
+    next_day = upcoming_dosages(schedule, NOW, datetime(2026, 10, 20, 12, 0))
+    print(f"   Next 24h: {[(d['medication_name'], d['next_dose_time']) for d in next_day]}")
+    assert [(d["medication_name"], d["next_dose_time"]) for d in next_day] == [
+        ("Iron", "2026-10-19T21:00:00"),
+        ("Folic Acid", "2026-10-20T08:00:00"),
+        ("Iron", "2026-10-20T09:00:00"),
+    ]
+    assert next_day[0]["dose_number"] == 2 and next_day[0]["doses_per_day"] == 2
+
+    week = upcoming_dosages(schedule, NOW, datetime(2026, 10, 26, 12, 0))
+    vitamin_d = [d["next_dose_time"] for d in week if d["medication_name"] == "Vitamin D3"]
+    print(f"   Next 7 days: {len(week)} doses, Vitamin D3 on {vitamin_d}")
+    assert len(week) == 7 + 14 + 1 and vitamin_d == ["2026-10-22T10:00:00"]
+    assert [d["next_dose_time"] for d in week] == sorted(d["next_dose_time"] for d in week)
+    print("✅ Windows answered from the schedule")
+
+
+def test_taken_doses_are_suppressed():
+    """Doses logged as taken today drop out of the upcoming list, earliest first"""
+    print("🔍 Testing already-taken suppression")
+    morning = {"tablet_name": "iron", "tablet_taken_today": True, "date_taken": "2026-10-19"}
+    schedule = build_dose_schedule(patient(medication_daily_tracking=[morning]), NOW)
+    names = [d["medication_name"] for d in upcoming_dosages(schedule, NOW, datetime(2026, 10, 20, 0, 0))]
+    assert names == ["Iron"], "one tablet taken covers the 09:00 dose, not the 21:00 one"
+
+    evening = {"tablet_name": "Iron", "date_taken": "19/10/2026", "type": "daily_tracking"}
+    schedule = build_dose_schedule(patient(medication_daily_tracking=[morning], tablet_tracking=[evening]), NOW)
+    assert upcoming_dosages(schedule, NOW, datetime(2026, 10, 20, 0, 0)) == []
+    shown = upcoming_dosages(schedule, NOW, datetime(2026, 10, 20, 0, 0), include_taken=True)
+    assert len(shown) == 1 and shown[0]["already_taken"]
+
+    skipped = {"tablet_name": "Iron", "tablet_taken_today": "false", "date_taken": "2026-10-19"}
+    schedule = build_dose_schedule(patient(medication_daily_tracking=[skipped]), NOW)
+    assert len(upcoming_dosages(schedule, NOW, datetime(2026, 10, 20, 0, 0))) == 1
+    print("✅ Taken doses suppressed")
+
+
+class ScheduleCollection:
+    """find_one / update_one (with upsert) by _id, counting reads"""
+
+    class Result:
+        def __init__(self, modified_count):
+            self.modified_count = modified_count
+
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+
+    def find_one(self, query):
+        self.reads += 1
+        return self.docs.get(query["_id"])
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            if not upsert:
+                return self.Result(0)
+            doc = self.docs[query["_id"]] = {"_id": query["_id"], **update.get("$setOnInsert", {})}
+        doc.update(update["$set"])
+        return self.Result(1)
+
+
+def test_store_updates_taken_counts():
+    """Tablet-taken events rewrite only the taken counts; a missing schedule is reported for a rebuild"""
+    print("🔍 Testing schedule store")
+    collection = ScheduleCollection()
+    store = DoseScheduleStore(collection)
+    assert not store.update_taken(patient(), NOW)
+
+    store.rebuild(patient(), NOW)
+    taken = patient(medication_daily_tracking=[
+        {"tablet_name": "Iron", "tablet_taken_today": True, "date_taken": "2026-10-19"},
+        {"tablet_name": "Iron", "tablet_taken_today": True, "date_taken": "2026-09-01"},
+    ])
+    assert store.update_taken(taken, NOW)
+    schedule = store.get("PAT1")
+    assert collection.reads == 1 and schedule["adherence_accounted_until"] == NOW
+    assert schedule["taken"] == [{"date": "2026-10-19", "name": "iron", "count": 1}], "old entries are trimmed"
+    assert len(schedule["dosages"]) == 4
+
+    store.rebuild(patient(), datetime(2026, 10, 20, 9, 0))
+    assert store.get("PAT1")["adherence_accounted_until"] == NOW, "a rebuild keeps the adherence position"
+    print("✅ Taken counts updated in place")
+
+
+def main():
+    print("🧪 Testing Dosage Schedule")
+    print("=" * 50)
+
+    tests = [
+        ("Dose plans", test_dose_plans),
+        ("Range queries", test_range_queries),
+        ("Already-taken suppression", test_taken_doses_are_suppressed),
+        ("Schedule store", test_store_updates_taken_counts),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
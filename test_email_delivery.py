@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Test pooled email delivery against the local SMTP sink
+(token bucket, connection reuse, reconnect and retry, OTP priority, queue bounds, mock mode,
+ delivery callbacks)
+"""
+
+import time
+
+from email_delivery_service import EmailDeliveryService, TokenBucket
+from smtp_stub_server import start_smtp_sink
+
+
+def make_service(sink, **kwargs):
+    settings = {"sender": "alerts@example.com", "password": "app-password", "starttls": False, "workers": 2,
+                "rate_per_sec": 0, "retry_delay": 0, "idle_timeout": 5}
+    settings.update(kwargs)
+    return EmailDeliveryService(host="127.0.0.1", port=sink.server_address[1], **settings)
+
+
+def close(sink):
+    sink.shutdown()
+    sink.server_close()
+
+
+def test_token_bucket():
+    """The bucket allows a burst, then one token per 1/rate seconds"""
+    print("🔍 Testing token bucket")
+    now = [100.0]
+    bucket = TokenBucket(rate=10, capacity=3, clock=lambda: now[0])
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert abs(bucket.try_acquire() - 0.1) < 1e-9
+    now[0] += 0.25
+    assert bucket.try_acquire() == 0.0 and bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() > 0
+    assert TokenBucket(rate=0, capacity=1).try_acquire() == 0.0, "rate 0 means unlimited"
+
+    sink = start_smtp_sink()
+    service = make_service(sink, workers=1, rate_per_sec=100, burst=5)
+    start = time.perf_counter()
+    for n in range(30):
+        service.enqueue(f"patient{n}@example.com", "Reminder", "Take your medication")
+    assert service.flush(10)
+    elapsed = time.perf_counter() - start
+    print(f"   30 emails at 100/s (burst 5): {elapsed:.2f}s")
+    assert elapsed >= 0.2
+    service.stop()
+    close(sink)
+    print("✅ Send rate limited")
+
+
+def test_connection_reuse():
+    """Each worker logs in once and sends every message over that connection"""
+    print("🔍 Testing connection reuse")
+    sink = start_smtp_sink(connect_latency=0.02, auth_latency=0.02)
+    service = make_service(sink, workers=2)
+    start = time.perf_counter()
+    assert all(service.enqueue(f"patient{n}@example.com", f"Reminder {n}", "Folic Acid 5mg", kind="reminder")
+               for n in range(100))
+    enqueue_ms = (time.perf_counter() - start) * 1000
+    assert service.flush(10)
+    stats = sink.state.snapshot()
+    print(f"   Enqueued 100 in {enqueue_ms:.1f} ms; sink saw {stats}")
+    assert enqueue_ms < 500, "enqueue must not wait on SMTP"
+    assert stats["accepted"] == 100 and stats["connections"] == 2 and stats["logins"] == 2
+    assert service.stats()["sent"] == 100 and service.stats()["pending"] == 0
+    service.stop()
+    close(sink)
+    print("✅ Two connections for 100 emails")
+
+
+def test_reconnect_and_retry():
+    """Dropped connections and 451s are retried on a fresh connection; nothing is lost or doubled"""
+    print("🔍 Testing reconnect and retry")
+    sink = start_smtp_sink(disconnect_every=7, error_rate=0.1, seed=5)
+    service = make_service(sink, workers=2, max_attempts=10, messages_per_connection=20)
+    for n in range(60):
+        service.enqueue(f"patient{n}@example.com", f"Reminder {n}", "Iron 200mg")
+    assert service.flush(10)
+    stats = sink.state.snapshot()
+    subjects = [subject for _, subject in sink.state.messages]
+    print(f"   Sink: {stats}; service: {service.stats()}")
+    assert stats["accepted"] == 60 and len(set(subjects)) == 60
+    assert stats["rejected"] > 0 and service.stats()["retries"] > 0
+    assert stats["connections"] >= 60 // 7
+    service.stop()
+    close(sink)
+    print("✅ Recovered from disconnects and temporary failures")
+
+
+def test_otp_jumps_the_queue():
+    """An OTP queued behind a reminder burst is sent next"""
+    print("🔍 Testing OTP priority")
+    sink = start_smtp_sink(message_latency=0.01)
+    service = make_service(sink, workers=1)
+    for n in range(30):
+        service.enqueue(f"patient{n}@example.com", f"Reminder {n}", "Folic Acid 5mg", kind="reminder")
+    service.enqueue("new.user@example.com", "OTP Verification", "Your OTP is 123456", kind="otp")
+    assert service.flush(10)
+    subjects = [subject for _, subject in sink.state.messages]
+    position = subjects.index("OTP Verification")
+    print(f"   OTP delivered at position {position} of {len(subjects)}")
+    assert position <= 2
+    service.stop()
+    close(sink)
+    print("✅ OTP sent ahead of reminders")
+
+
+def test_queue_bound_and_mock_mode():
+    """A full queue rejects new mail; without a sender the old mock behaviour is kept"""
+    print("🔍 Testing queue bound and mock mode")
+    sink = start_smtp_sink(message_latency=0.2)
+    service = make_service(sink, workers=1, queue_size=3)
+    accepted = [service.enqueue(f"patient{n}@example.com", "Reminder", "Folic Acid 5mg") for n in range(6)]
+    print(f"   Enqueue results with room for 3: {accepted}")
+    assert accepted[:3] == [True, True, True] and not accepted[-1]
+    assert service.stats()["dropped"] >= 2
+    service.stop()
+    close(sink)
+
+    mock = EmailDeliveryService(sender=None)
+    assert mock.enqueue("a@example.com", "s", "b") and mock.stats()["mocked"] == 1
+    assert mock.stats()["workers"] == 0
+    no_password = EmailDeliveryService(sender="alerts@example.com")
+    assert not no_password.is_configured(), "a sender without a password is still mock mode"
+    assert no_password.enqueue("a@example.com", "s", "b") and no_password.stats()["workers"] == 0
+    print("✅ Bounded queue and mock mode")
+
+
+def test_on_done_reports_the_smtp_result():
+    """on_done gets True once SMTP accepted the message and False once delivery gave up"""
+    print("🔍 Testing delivery callbacks")
+    sink = start_smtp_sink()
+    service = make_service(sink, workers=1)
+    results = []
+    assert service.enqueue("patient@example.com", "Reminder", "Iron 200mg", kind="reminder", on_done=results.append)
+    assert service.flush(10)
+    service.stop()
+    close(sink)
+
+    # Nothing listens on the closed sink's port any more
+    service = make_service(sink, workers=1, max_attempts=2, timeout=1)
+    assert service.enqueue("patient@example.com", "Reminder", "Iron 200mg", kind="reminder", on_done=results.append)
+    assert service.flush(10)
+    service.stop()
+
+    mocked = []
+    EmailDeliveryService(sender=None).enqueue("a@example.com", "s", "b", on_done=mocked.append)
+    print(f"   Results: {results}, mock: {mocked}")
+    assert results == [True, False] and mocked == [True]
+    print("✅ Callbacks carry the real delivery result")
+
+
+def main():
+    print("🧪 Testing Email Delivery")
+    print("=" * 50)
+
+    tests = [
+        ("Token bucket", test_token_bucket),
+        ("Connection reuse", test_connection_reuse),
+        ("Reconnect and retry", test_reconnect_and_retry),
+        ("OTP priority", test_otp_jumps_the_queue),
+        ("Queue bound and mock mode", test_queue_bound_and_mock_mode),
+        ("Delivery callbacks", test_on_done_reports_the_smtp_result),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
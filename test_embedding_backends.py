@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Test the pluggable embedding backends behind the pregnancy knowledge search
+(backend selection, one-time ONNX export and int8 quantization, cached reloads,
+ mean pooling, and the check_embedding_parity gate)
+
+The Hugging Face export is replaced by a tiny word-embedding ONNX graph and a
+word-level tokenizer, so no model download or PyTorch is needed.
+"""
+
+import functools
+import re
+import shutil
+import tempfile
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.normalizers import Lowercase
+from tokenizers.pre_tokenizers import Whitespace
+
+import embedding_service
+from embedding_service import (
+    EMBEDDING_PARITY_TEXTS,
+    OnnxEmbeddingBackend,
+    check_embedding_parity,
+    create_embedding_backend,
+)
+
+DIMENSION = 16
+VOCAB = ["[PAD]", "[UNK]"] + sorted({w for t in EMBEDDING_PARITY_TEXTS for w in re.findall(r"\w+|[^\w\s]", t.lower())})
+
+
+def fake_export(exports, seed=7):
+    """Stand-in for export_onnx_model: token embedding table followed by a projection"""
+    def export(model_name, onnx_path, tokenizer_dir, opset=14):
+        exports.append(model_name)
+        rng = np.random.default_rng(seed)
+        table = rng.normal(size=(len(VOCAB), DIMENSION)).astype(np.float32)
+        projection = rng.normal(size=(DIMENSION, DIMENSION)).astype(np.float32)
+        graph = helper.make_graph(
+            [helper.make_node("Gather", ["table", "input_ids"], ["token_vectors"]),
+             helper.make_node("MatMul", ["token_vectors", "projection"], ["last_hidden_state"])],
+            "fake_encoder",
+            [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+             helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"])],
+            [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", DIMENSION])],
+            [numpy_helper.from_array(table, "table"), numpy_helper.from_array(projection, "projection")],
+        )
+        onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", opset)], ir_version=8), onnx_path)
+
+        tokenizer = Tokenizer(WordLevel({word: i for i, word in enumerate(VOCAB)}, unk_token="[UNK]"))
+        tokenizer.normalizer = Lowercase()
+        tokenizer.pre_tokenizer = Whitespace()
+        tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        tokenizer.save(f"{tokenizer_dir}/tokenizer.json")
+    return export
+
+
+class ShuffledBackend:
+    """Wraps a backend and hands back each text's vector for a different text"""
+
+    name = "shuffled"
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32):
+        return np.roll(self.backend.encode(texts, normalize_embeddings=normalize_embeddings), 1, axis=0)
+
+
+def with_fake_export(test):
+    """Run `test(cache_dir, exports)` with the export mocked and ONNX backends using a private cache"""
+    exports = []
+    cache_dir = tempfile.mkdtemp(prefix="onnx_cache_")
+    original = (embedding_service.export_onnx_model, embedding_service.OnnxEmbeddingBackend)
+    embedding_service.export_onnx_model = fake_export(exports)
+    embedding_service.OnnxEmbeddingBackend = functools.partial(OnnxEmbeddingBackend, cache_dir=cache_dir)
+    try:
+        return test(cache_dir, exports)
+    finally:
+        embedding_service.export_onnx_model, embedding_service.OnnxEmbeddingBackend = original
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_backend_selection():
+    """EMBEDDING_BACKEND names map to the right backend; unknown names are rejected"""
+    print("🔍 Testing backend selection")
+
+    def run(cache_dir, exports):
+        fp32 = create_embedding_backend("onnx", "test/mini-encoder")
+        int8 = create_embedding_backend(" ONNX-Int8 ", "test/mini-encoder")
+        print(f"   Backends: {fp32.name}, {int8.name}; exports: {exports}")
+        assert (fp32.name, fp32.quantize, int8.name, int8.quantize) == ("onnx", False, "onnx-int8", True)
+        assert fp32.get_sentence_embedding_dimension() == int8.get_sentence_embedding_dimension() == DIMENSION
+        assert exports == ["test/mini-encoder"], "the fp32 export is reused for the int8 model"
+
+    with_fake_export(run)
+
+    try:
+        create_embedding_backend("tensorflow", "test/mini-encoder")
+        assert False, "unknown backend accepted"
+    except ValueError as e:
+        assert "onnx-int8" in str(e)
+
+    original = embedding_service.SENTENCE_TRANSFORMERS_AVAILABLE
+    embedding_service.SENTENCE_TRANSFORMERS_AVAILABLE = False
+    try:
+        create_embedding_backend("torch", "test/mini-encoder")
+        assert False, "sentence-transformers backend built without the package"
+    except ImportError:
+        pass
+    finally:
+        embedding_service.SENTENCE_TRANSFORMERS_AVAILABLE = original
+    print("✅ Backends selected by name")
+
+
+def test_onnx_export_is_cached_and_pools_tokens():
+    """The export runs once per model; encode() mean-pools real tokens and normalizes"""
+    print("🔍 Testing ONNX export cache and pooling")
+
+    def run(cache_dir, exports):
+        backend = OnnxEmbeddingBackend("test/mini-encoder", quantize=False, cache_dir=cache_dir)
+        reloaded = OnnxEmbeddingBackend("test/mini-encoder", quantize=False, cache_dir=cache_dir)
+        assert exports == ["test/mini-encoder"], "second start loads the cached export"
+
+        texts = ["leg cramps", "leg cramps wake me up at night"]
+        vectors = backend.encode(texts, batch_size=1)
+        assert vectors.shape == (2, DIMENSION) and vectors.dtype == np.float32
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+        # Padding in a shared batch must not change a text's vector
+        assert np.allclose(reloaded.encode(texts, batch_size=2), vectors, atol=1e-5)
+        assert backend.encode([]).shape == (0, DIMENSION)
+
+        raw = backend.encode(["leg cramps"], normalize_embeddings=False)[0]
+        ids = backend.tokenizer.encode("leg cramps").ids
+        table = np.asarray(backend.session.run(None, {
+            "input_ids": np.array([ids], dtype=np.int64),
+            "attention_mask": np.ones((1, len(ids)), dtype=np.int64),
+        })[0])[0]
+        assert np.allclose(raw, table.mean(axis=0), atol=1e-5)
+
+    with_fake_export(run)
+    print("✅ Export cached and tokens mean-pooled")
+
+
+def test_parity_gate():
+    """int8 stays within the cosine threshold of fp32; a backend that mixes up texts fails"""
+    print("🔍 Testing the parity gate")
+
+    def run(cache_dir, exports):
+        fp32 = OnnxEmbeddingBackend("test/mini-encoder", quantize=False, cache_dir=cache_dir)
+        int8 = OnnxEmbeddingBackend("test/mini-encoder", quantize=True, cache_dir=cache_dir)
+
+        report = check_embedding_parity(fp32, int8, min_cosine=0.95)
+        print(f"   fp32 vs int8: min cosine {report['min_cosine']:.4f}, "
+              f"neighbour agreement {report['neighbour_agreement']:.2f}")
+        assert report["passed"] and report["texts_checked"] == len(EMBEDDING_PARITY_TEXTS)
+        assert report["mean_cosine"] >= report["min_cosine"] >= 0.95
+
+        shuffled = check_embedding_parity(fp32, ShuffledBackend(fp32))
+        assert not shuffled["passed"] and shuffled["min_cosine"] < 0.99
+        assert shuffled["worst_text"] in EMBEDDING_PARITY_TEXTS
+
+        class Wider:
+            def encode(self, texts, normalize_embeddings=True):
+                return np.ones((len(texts), DIMENSION * 2), dtype=np.float32)
+
+        mismatch = check_embedding_parity(fp32, Wider())
+        assert not mismatch["passed"] and "Dimension mismatch" in mismatch["error"]
+
+    with_fake_export(run)
+    print("✅ Parity gate passes int8 and rejects mismatched backends")
+
+
+def main():
+    print("🧪 Testing Embedding Backends")
+    print("=" * 50)
+
+    tests = [
+        ("Backend selection", test_backend_selection),
+        ("ONNX export cache and pooling", test_onnx_export_is_cached_and_pools_tokens),
+        ("Parity gate", test_parity_gate),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test image pre-processing ahead of prescription OCR
+(EXIF orientation, grayscale, downscale, border crop, deskew, pass-through)
+"""
+
+import io
+
+from PIL import Image, ImageDraw, ImageFont
+
+from image_preprocessing_service import (
+    estimate_skew,
+    prepare_for_ocr,
+    preprocess_image,
+    settings_tag,
+)
+
+
+def prescription_page(skew=0):
+    page = Image.new("RGB", (1200, 1600), (250, 247, 238))
+    draw = ImageDraw.Draw(page)
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 40)
+    except OSError:
+        font = ImageFont.load_default()
+    for i in range(12):
+        draw.text((100, 150 + i * 90), "Tab. Folic Acid 5mg once daily", fill=(20, 20, 60), font=font)
+    return page.rotate(skew, expand=True, fillcolor=(250, 247, 238)) if skew else page
+
+
+def phone_photo(page, exif_orientation=6):
+    """12 MP JPEG with a dark border, stored sideways with an EXIF orientation tag"""
+    photo = Image.new("RGB", (3024, 4032), (60, 50, 40))
+    scaled = page.resize((page.width * 2, page.height * 2))
+    photo.paste(scaled, ((photo.width - scaled.width) // 2, (photo.height - scaled.height) // 2))
+    stored = photo.rotate(90, expand=True) if exif_orientation == 6 else photo
+    exif = Image.Exif()
+    exif[0x0112] = exif_orientation
+    output = io.BytesIO()
+    stored.save(output, format="JPEG", quality=90, exif=exif)
+    return output.getvalue()
+
+
+def test_orientation_grayscale_downscale_crop():
+    """A sideways 12 MP colour photo comes out upright, gray, small and cropped"""
+    print("🔍 Testing orientation, grayscale, downscale and crop")
+    png, info = preprocess_image(phone_photo(prescription_page()), max_side=2048)
+    image = Image.open(io.BytesIO(png))
+    print(f"   {info['original_size']} -> {info['output_size']} via {info['steps']} in {info['processing_time_ms']} ms")
+
+    assert info["original_size"] == [4032, 3024]
+    assert image.mode == "L"
+    assert image.height > image.width, "EXIF orientation not applied"
+    assert max(image.size) <= 2048
+    assert "crop_borders" in info["steps"]
+    # The dark table border is gone: corners are paper, not table
+    inset = max(image.size) // 100
+    assert min(image.getpixel((inset, inset)), image.getpixel((image.width - inset, image.height - inset))) > 200
+    print("✅ Photo normalised for OCR")
+
+
+def test_deskew():
+    """Skewed pages are detected and rotated back within half a degree"""
+    print("🔍 Testing deskew")
+    for skew in (-3, 2):
+        page = prescription_page(skew).convert("L")
+        angle = estimate_skew(page)
+        print(f"   Applied {skew}°, estimated correction {angle}°")
+        assert abs(angle + skew) <= 0.5
+
+    _, info = preprocess_image(phone_photo(prescription_page(-3)), deskew=True)
+    assert "deskew" in info["steps"] and abs(info["skew_angle"] - 3) <= 0.5
+
+    _, info = preprocess_image(phone_photo(prescription_page(-3)))
+    assert "deskew" not in info["steps"], "deskew must stay off unless enabled"
+    print("✅ Skew corrected when enabled")
+
+
+def test_prepare_for_ocr_pass_through():
+    """Non-images and unreadable images reach OCR unchanged; settings change the tag"""
+    print("🔍 Testing pass-through")
+    pdf = b"%PDF-1.4 not an image"
+    assert prepare_for_ocr(pdf, "rx.pdf") == (pdf, "rx.pdf", {})
+
+    content, filename, info = prepare_for_ocr(b"corrupt", "photo.jpg")
+    assert content == b"corrupt" and filename == "photo.jpg" and "error" in info
+
+    content, filename, info = prepare_for_ocr(phone_photo(prescription_page()), "photo.jpeg")
+    assert filename == "photo.png" and content.startswith(b"\x89PNG") and info["steps"]
+
+    assert settings_tag() == settings_tag()
+    assert settings_tag(max_side=1600) != settings_tag(max_side=2048)
+    print("✅ Only readable images are re-encoded")
+
+
+def main():
+    print("🧪 Testing Image Pre-processing")
+    print("=" * 50)
+
+    tests = [
+        ("Orientation, grayscale, downscale, crop", test_orientation_grayscale_downscale_crop),
+        ("Deskew", test_deskew),
+        ("Pass-through", test_prepare_for_ocr_pass_through),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
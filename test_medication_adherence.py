@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Test incremental medication adherence
+(taken events, passed doses from the dose schedule, missed doses, day / week reports, window-only reads)
+"""
+
+import copy
+from datetime import datetime
+
+from adherence_service import AdherenceStore, AdherenceTracker, summarize
+from dosage_schedule_service import DoseScheduleStore
+
+
+class UpdateResult:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class MemoryCollection:
+    """The pymongo collection methods the schedule and adherence stores use, in memory"""
+
+    def __init__(self):
+        self.docs = {}
+        self.returned = 0
+
+    @staticmethod
+    def _matches(doc, query):
+        for key, condition in query.items():
+            value = doc.get(key)
+            if isinstance(condition, dict):
+                for op, operand in condition.items():
+                    if op == "$ne" and value == operand:
+                        return False
+                    if op in ("$gte", "$lte", "$lt") and value is None:
+                        return False
+                    if op == "$gte" and not value >= operand:
+                        return False
+                    if op == "$lte" and not value <= operand:
+                        return False
+                    if op == "$lt" and not value < operand:
+                        return False
+            elif value != condition:
+                return False
+        return True
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find(self, query, projection=None):
+        found = [copy.deepcopy(d) for d in self.docs.values() if self._matches(d, query)]
+        self.returned += len(found)
+        return found
+
+    def find_one(self, query):
+        found = self.find(query)
+        return found[0] if found else None
+
+    def update_one(self, query, update, upsert=False):
+        doc = next((d for d in self.docs.values() if self._matches(d, query)), None)
+        if doc is None:
+            if not upsert:
+                return UpdateResult(0)
+            doc = self.docs[query["_id"]] = {"_id": query["_id"], **copy.deepcopy(update.get("$setOnInsert", {}))}
+        doc.update(copy.deepcopy(update.get("$set", {})))
+        for key, amount in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + amount
+        return UpdateResult(1)
+
+
+class Clock:
+    def __init__(self, start):
+        self.current = start
+
+    def __call__(self):
+        return self.current
+
+
+def patient():
+    def dosage(time, frequency):
+        return {"dosage": "1 tab", "time": time, "frequency": frequency, "reminder_enabled": True}
+
+    return {
+        "patient_id": "PAT1",
+        "medication_logs": [
+            {"medication_name": "Folic Acid", "timestamp": "2026-10-19T07:00:00", "dosages": [dosage("08:00", "OD")]},
+            {"medication_name": "Iron", "timestamp": "2026-10-19T07:00:00",
+             "dosages": [dosage("09:00", "BD"), dosage("21:00", "BD")]},
+        ],
+    }
+
+
+def make_stores():
+    schedules = DoseScheduleStore(MemoryCollection())
+    adherence = AdherenceStore(MemoryCollection())
+    schedules.rebuild(patient(), datetime(2026, 10, 19, 7, 0))
+    return schedules, adherence
+
+
+def test_passed_doses_and_taken_events():
+    """Passed doses count as scheduled once; doses without a taken tablet that day are missed"""
+    print("🔍 Testing adherence counters")
+    schedules, adherence = make_stores()
+    for day, name in [("2026-10-19", "Folic Acid"), ("2026-10-19", "iron"), ("2026-10-20", "Folic Acid"),
+                      ("2026-10-20", "Iron"), ("2026-10-20", "Iron")]:
+        adherence.record_taken("PAT1", name, day)
+
+    clock = Clock(datetime(2026, 10, 21, 7, 0))
+    tracker = AdherenceTracker(schedules.collection, adherence, now=clock, grace_hours=1)
+    assert tracker.account() == 6, "19th and 20th: Folic Acid once and Iron twice a day"
+    assert tracker.account() == 0, "a dose is only counted once"
+    other_process = AdherenceTracker(schedules.collection, adherence, now=clock, grace_hours=1)
+    assert other_process.account() == 0
+
+    report = adherence.report("PAT1", "2026-10-19", "2026-10-21")
+    print(f"   Overall: {report['overall']}")
+    assert report["overall"] == {"scheduled": 6, "taken": 5, "missed": 1, "adherence_percent": 83.3}
+    iron = next(m for m in report["medications"] if m["medication_name"] == "Iron")
+    assert iron["missed"] == 1 and iron["adherence_percent"] == 75.0
+    assert [p["period"] for p in report["periods"]] == ["2026-10-19", "2026-10-20"]
+    assert report["periods"][0]["missed"] == 1 and report["periods"][1]["adherence_percent"] == 100.0
+
+    # The 21st's 08:00 and 09:00 doses are counted after the grace period
+    clock.current = datetime(2026, 10, 21, 10, 30)
+    assert tracker.account() == 2
+    print("✅ Counters maintained incrementally")
+
+
+def test_extra_tablets_do_not_cover_missed_days():
+    """Two tablets on one day do not make up for none the day before; weeks add up daily misses"""
+    print("🔍 Testing missed dose arithmetic")
+    rows = [
+        {"date": "2026-10-19", "medication": "iron", "medication_name": "Iron", "scheduled": 2, "taken": 0},
+        {"date": "2026-10-20", "medication": "iron", "medication_name": "Iron", "scheduled": 2, "taken": 4},
+        {"date": "2026-10-26", "medication": "iron", "medication_name": "Iron", "scheduled": 2, "taken": 2},
+    ]
+    weekly = summarize(rows, group="week")
+    print(f"   Weeks: {[(p['period'], p['missed'], p['adherence_percent']) for p in weekly['periods']]}")
+    assert [(p["period"], p["missed"]) for p in weekly["periods"]] == [("2026-W43", 2), ("2026-W44", 0)]
+    assert weekly["overall"]["missed"] == 2 and weekly["overall"]["adherence_percent"] == round(4 * 100 / 6, 1)
+    assert summarize([])["overall"]["adherence_percent"] is None
+    print("✅ Missed doses counted per day")
+
+
+def test_report_reads_only_the_window():
+    """A report reads the buckets in its window, not the patient's whole history"""
+    print("🔍 Testing window reads")
+    _, adherence = make_stores()
+    for day in range(1, 29):
+        adherence.record_taken("PAT1", "Folic Acid", f"2026-09-{day:02d}")
+        adherence.record_taken("PAT2", "Folic Acid", f"2026-09-{day:02d}")
+    adherence.collection.returned = 0
+    report = adherence.report("PAT1", "2026-09-10", "2026-09-16", group="week")
+    print(f"   Read {adherence.collection.returned} buckets of {len(adherence.collection.docs)}")
+    assert adherence.collection.returned == 7
+    assert report["overall"]["taken"] == 7 and report["overall"]["scheduled"] == 0
+    print("✅ Window-only reads")
+
+
+def main():
+    print("🧪 Testing Medication Adherence")
+    print("=" * 50)
+
+    tests = [
+        ("Passed doses and taken events", test_passed_doses_and_taken_events),
+        ("Missed dose arithmetic", test_extra_tablets_do_not_cover_missed_days),
+        ("Window reads", test_report_reads_only_the_window),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Test the next-fire-time medication reminder scheduler
+(dose time parsing, schedule rows, heap firing and rescheduling, re-saves, late reminders,
+ sent-reminder ledger, queued email delivery results, scheduler lease failover)
+"""
+
+import copy
+from concurrent.futures import Future
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from medication_reminder_service import (
+    MedicationReminderScheduler,
+    ReminderLedger,
+    ReminderScheduleStore,
+    SchedulerLease,
+    nearest_dose_at,
+    next_fire_at,
+    parse_dose_time,
+)
+
+
+class UpdateResult:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class MemoryCollection:
+    """The few pymongo collection methods the schedule store uses, in memory"""
+
+    def __init__(self):
+        self.docs = {}
+        self.unique = []
+        self.queries = 0
+
+    def _matches(self, doc, query):
+        for key, condition in query.items():
+            if key == "$or":
+                if not any(self._matches(doc, sub) for sub in condition):
+                    return False
+                continue
+            value = doc.get(key)
+            if isinstance(condition, dict):
+                for op, operand in condition.items():
+                    if value is None and op != "$nin":
+                        return False
+                    if op == "$lte" and not value <= operand:
+                        return False
+                    if op == "$gte" and not value >= operand:
+                        return False
+                    if op == "$nin" and value in operand:
+                        return False
+            elif value != condition:
+                return False
+        return True
+
+    def create_index(self, keys, unique=False, **kwargs):
+        if unique:
+            self.unique.append([key for key, _ in keys])
+
+    def find(self, query=None, projection=None):
+        self.queries += 1
+        return [copy.deepcopy(d) for d in self.docs.values() if self._matches(d, query or {})]
+
+    def find_one(self, query):
+        found = self.find(query)
+        return found[0] if found else None
+
+    def insert_one(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", len(self.docs) + 1)
+        for fields in [["_id"]] + self.unique:
+            if any(all(other.get(f) == doc.get(f) for f in fields) for other in self.docs.values()):
+                raise DuplicateKeyError(f"E11000 duplicate key on {fields}")
+        self.docs[doc["_id"]] = doc
+
+    def replace_one(self, query, doc, upsert=False):
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    def update_one(self, query, update, upsert=False):
+        for doc in self.docs.values():
+            if self._matches(doc, query):
+                doc.update(copy.deepcopy(update["$set"]))
+                return UpdateResult(1)
+        if upsert:
+            fields = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            self.insert_one({**fields, **update["$set"]})
+        return UpdateResult(0)
+
+    def delete_one(self, query):
+        for key, doc in self.docs.items():
+            if self._matches(doc, query):
+                del self.docs[key]
+                return
+
+    def delete_many(self, query):
+        for key in [k for k, d in self.docs.items() if self._matches(d, query)]:
+            del self.docs[key]
+
+    def count_documents(self, query):
+        return len(self.find(query))
+
+
+class Clock:
+    def __init__(self, start):
+        self.current = start
+
+    def __call__(self):
+        return self.current
+
+
+def patient(patient_id, *dosages, prescription=False):
+    return {
+        "patient_id": patient_id,
+        "medication_logs": [{
+            "medication_name": "Folic Acid",
+            "timestamp": "2026-10-01T09:00:00",
+            "is_prescription_mode": prescription,
+            "dosages": [{"dosage": "5mg", "time": t, "frequency": "Once daily", "reminder_enabled": enabled}
+                        for t, enabled in dosages],
+        }],
+    }
+
+
+def test_parse_and_next_fire_time():
+    """24h and 12h times parse; the next fire time is always in the future"""
+    print("🔍 Testing dose time parsing")
+    assert parse_dose_time("08:30") == (8, 30)
+    assert parse_dose_time("8.05") == (8, 5)
+    assert parse_dose_time("8:30 PM") == (20, 30) and parse_dose_time("12:15 am") == (0, 15)
+    assert parse_dose_time("25:00") is None and parse_dose_time("morning") is None
+
+    now = datetime(2026, 10, 19, 8, 0)
+    assert next_fire_at(8, 30, now) == datetime(2026, 10, 19, 8, 30)
+    assert next_fire_at(8, 0, now) == datetime(2026, 10, 20, 8, 0), "a dose at exactly now is tomorrow's"
+    assert next_fire_at(9, 0, now, lead_minutes=10) == datetime(2026, 10, 19, 8, 50)
+    print("✅ Times parsed and scheduled")
+
+
+def test_fires_on_time_and_reschedules():
+    """Reminders fire when due, not before, and move to the next day"""
+    print("🔍 Testing heap firing")
+    clock = Clock(datetime(2026, 10, 19, 7, 0))
+    store = ReminderScheduleStore(MemoryCollection())
+    rows = store.sync_patient(patient("PAT1", ("08:00", True), ("20:00", True), ("13:00", False)), clock())
+    assert len(rows) == 2, "only reminder-enabled dosages are scheduled"
+
+    sent = []
+    scheduler = MedicationReminderScheduler(store, lambda row: sent.append((row["time"], clock())) or True, now=clock)
+    assert scheduler.refresh() == 2
+    assert scheduler.seconds_until_next() == 3600
+
+    assert scheduler.run_pending() == 0
+    clock.current = datetime(2026, 10, 19, 8, 0, 2)
+    assert scheduler.run_pending() == 1
+    assert sent == [("08:00", clock.current)]
+
+    row = store.get(rows[0]["_id"])
+    assert row["next_fire_at"] == datetime(2026, 10, 20, 8, 0) and row["last_fired_at"] == clock.current
+    assert scheduler.run_pending() == 0, "a fired reminder must not fire twice"
+
+    clock.current = datetime(2026, 10, 20, 8, 0, 1)
+    # Yesterday's 20:00 entry is 12 hours overdue (scheduler was not running): skipped, today's 08:00 sent
+    assert scheduler.run_pending() == 1 and scheduler.skipped_late == 1
+    print(f"   Stats: {scheduler.get_stats()}")
+    print("✅ Fired on time and rescheduled")
+
+
+def test_resave_and_late_reminders():
+    """Re-saving keeps pending fire times, changed times replace the queued entry, late ones are skipped"""
+    print("🔍 Testing re-saves and late reminders")
+    clock = Clock(datetime(2026, 10, 19, 7, 0))
+    store = ReminderScheduleStore(MemoryCollection())
+    sent = []
+    scheduler = MedicationReminderScheduler(store, lambda row: sent.append(row["time"]) or True, now=clock,
+                                            grace_minutes=15)
+    scheduler.notify(store.sync_patient(patient("PAT2", ("08:00", True)), clock()))
+
+    # The patient moves the dose to 07:30 before it fires: the 08:00 heap entry goes stale
+    clock.current = datetime(2026, 10, 19, 7, 10)
+    scheduler.notify(store.sync_patient(patient("PAT2", ("07:30", True)), clock()))
+    clock.current = datetime(2026, 10, 19, 7, 31)
+    assert scheduler.run_pending() == 1 and sent == ["07:30"]
+    clock.current = datetime(2026, 10, 19, 8, 5)
+    assert scheduler.run_pending() == 0 and scheduler.stale == 1
+
+    # Re-saving with an unchanged time keeps tomorrow's fire time
+    scheduler.notify(store.sync_patient(patient("PAT2", ("07:30", True)), clock()))
+    assert store.due_before(datetime(2026, 10, 20, 7, 30))[0]["next_fire_at"] == datetime(2026, 10, 20, 7, 30)
+
+    # Down for an hour past the dose time: skipped, not sent late, and rescheduled
+    clock.current = datetime(2026, 10, 20, 8, 45)
+    assert scheduler.run_pending() == 0 and scheduler.skipped_late == 1
+    assert store.due_before(datetime(2026, 10, 22))[0]["next_fire_at"] == datetime(2026, 10, 21, 7, 30)
+
+    # Disabling the reminder removes the row
+    store.sync_patient(patient("PAT2", ("07:30", False)), clock())
+    assert store.count() == 0
+    print("✅ Schedule follows medication writes")
+
+
+def test_database_load_scales_with_due_reminders():
+    """A refresh is one range query; rows outside the lookahead are never loaded"""
+    print("🔍 Testing database load")
+    clock = Clock(datetime(2026, 10, 19, 7, 0))
+    collection = MemoryCollection()
+    store = ReminderScheduleStore(collection)
+    for i in range(200):
+        store.sync_patient(patient(f"PAT{i}", (f"{8 + i % 10:02d}:00", True)), clock())
+    scheduler = MedicationReminderScheduler(store, lambda row: True, now=clock, lookahead_hours=2)
+    collection.queries = 0
+    loaded = scheduler.refresh()
+    queries = collection.queries
+    print(f"   Loaded {loaded} of {store.count()} rows with {queries} query")
+    assert queries == 1 and loaded == 40
+    print("✅ Only due reminders are loaded")
+
+
+def test_ledger_sends_each_dose_once():
+    """A dose already claimed in the ledger (e.g. by the manual trigger) is not emailed again"""
+    print("🔍 Testing the sent-reminder ledger")
+    clock = Clock(datetime(2026, 10, 19, 7, 50))
+    store = ReminderScheduleStore(MemoryCollection())
+    ledger_collection = MemoryCollection()
+    ledger = ReminderLedger(ledger_collection)
+    ledger.ensure_indexes()
+    rows = store.sync_patient(patient("PAT3", ("08:00", True)), clock())
+
+    # Manual trigger at 07:55 sends the 08:00 dose
+    clock.current = datetime(2026, 10, 19, 7, 55)
+    dose_at = nearest_dose_at(rows[0], clock())
+    assert dose_at == datetime(2026, 10, 19, 8, 0)
+    assert ledger.claim(rows[0], dose_at) and not ledger.claim(rows[0], dose_at)
+    ledger.mark(rows[0], dose_at, True)
+
+    sent = []
+    scheduler = MedicationReminderScheduler(store, lambda row: sent.append(row["time"]) or True, now=clock,
+                                            ledger=ledger)
+    scheduler.refresh()
+    clock.current = datetime(2026, 10, 19, 8, 0, 1)
+    assert scheduler.run_pending() == 0 and sent == [] and scheduler.already_sent == 1
+
+    # Tomorrow's dose is a new ledger key
+    clock.current = datetime(2026, 10, 20, 8, 0, 1)
+    assert scheduler.run_pending() == 1 and sent == ["08:00"]
+    statuses = sorted((d["dose_date"], d["status"]) for d in ledger_collection.docs.values())
+    print(f"   Ledger: {statuses}")
+    assert statuses == [("2026-10-19", "sent"), ("2026-10-20", "sent")]
+    print("✅ One email per dose")
+
+
+def test_ledger_records_queued_email_results():
+    """A reminder that is only queued stays 'queued' until the email worker reports the SMTP result"""
+    print("🔍 Testing queued reminder results")
+    clock = Clock(datetime(2026, 10, 19, 7, 50))
+    store = ReminderScheduleStore(MemoryCollection())
+    ledger_collection = MemoryCollection()
+    ledger = ReminderLedger(ledger_collection)
+    ledger.ensure_indexes()
+    store.sync_patient(patient("PAT4", ("08:00", True), ("09:00", True)), clock())
+
+    deliveries = []
+    def queue_reminder(row):
+        deliveries.append(Future())
+        return deliveries[-1]
+
+    scheduler = MedicationReminderScheduler(store, queue_reminder, now=clock, ledger=ledger)
+    scheduler.refresh()
+    for hour in (8, 9):
+        clock.current = datetime(2026, 10, 19, hour, 0, 1)
+        assert scheduler.run_pending() == 1
+
+    def statuses():
+        return sorted((d["dose_time"], d["status"]) for d in ledger_collection.docs.values())
+    assert statuses() == [("08:00", "queued"), ("09:00", "queued")], statuses()
+    deliveries[0].set_result(True)
+    deliveries[1].set_result(False)
+    print(f"   Ledger: {statuses()}")
+    assert statuses() == [("08:00", "sent"), ("09:00", "failed")]
+    print("✅ Ledger holds the SMTP result")
+
+
+def test_lease_failover():
+    """Only the lease holder fires; a standby takes over once the holder stops renewing"""
+    print("🔍 Testing scheduler lease failover")
+    clock = Clock(datetime(2026, 10, 19, 7, 59))
+    schedule, ledger = MemoryCollection(), ReminderLedger(MemoryCollection())
+    leases = MemoryCollection()
+    store = ReminderScheduleStore(schedule)
+    store.sync_patient(patient("PAT4", ("08:00", True)), clock())
+    store.sync_patient(patient("PAT5", ("08:02", True)), clock())
+
+    sent = {"a": [], "b": []}
+    schedulers = {}
+    for name in ("a", "b"):
+        lease = SchedulerLease(leases, "medication_reminders", owner=name, ttl_seconds=60, now=clock)
+        schedulers[name] = MedicationReminderScheduler(
+            store, lambda row, name=name: sent[name].append(row["patient_id"]) or True, now=clock,
+            ledger=ledger, lease=lease, poll_seconds=20)
+    a, b = schedulers["a"], schedulers["b"]
+
+    a.tick()
+    b.tick()
+    assert a.leader and not b.leader and leases.find_one({"_id": "medication_reminders"})["owner"] == "a"
+
+    clock.current = datetime(2026, 10, 19, 8, 0, 1)
+    a.tick()
+    b.tick()
+    assert sent == {"a": ["PAT4"], "b": []}
+
+    # "a" dies without releasing; "b" takes over after the lease expires and sends the next dose
+    clock.current = datetime(2026, 10, 19, 8, 1, 5)
+    b.tick()
+    assert b.leader
+    clock.current = datetime(2026, 10, 19, 8, 2, 1)
+    b.tick()
+    print(f"   Sent: {sent}")
+    assert sent == {"a": ["PAT4"], "b": ["PAT5"]}
+    assert not a.lease.acquire(), "a restarted process must not take a live lease"
+
+    b.stop()
+    assert a.lease.acquire(), "a released lease is free at once"
+    print("✅ Lease fails over")
+
+
+def main():
+    print("🧪 Testing Medication Reminder Scheduler")
+    print("=" * 50)
+
+    tests = [
+        ("Parse and next fire time", test_parse_and_next_fire_time),
+        ("Fire and reschedule", test_fires_on_time_and_reschedules),
+        ("Re-saves and late reminders", test_resave_and_late_reminders),
+        ("Database load", test_database_load_scales_with_due_reminders),
+        ("Sent-reminder ledger", test_ledger_sends_each_dose_once),
+        ("Queued reminder results", test_ledger_records_queued_email_results),
+        ("Lease failover", test_lease_failover),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
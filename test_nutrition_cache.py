@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Test the shared GPT-4 food analysis cache
+(food text normalization, week buckets, memory LRU + disk tier, food_data references,
+ durable archive of referenced analyses)
+"""
+
+import tempfile
+import time
+
+from nutrition_cache_service import (
+    NutritionAnalysisCache,
+    analysis_key,
+    normalize_food_text,
+    week_bucket,
+)
+from ocr_cache_service import DiskOCRStore
+
+ANALYSIS = {
+    "nutritional_breakdown": {"estimated_calories": 250, "protein_grams": 8},
+    "pregnancy_benefits": {"week_specific_advice": "Iron and folate matter in weeks 17-20"},
+}
+
+
+def test_equivalent_food_text_shares_a_key():
+    """Word order, filler words, case and spelled-out quantities do not change the key"""
+    print("🔍 Testing food text normalization")
+    same = ["Idli with sambar", "sambar and idli", "IDLI, Sambar!"]
+    assert len({normalize_food_text(text) for text in same}) == 1
+    assert normalize_food_text("two idli with sambar") == normalize_food_text("Sambar and 2 idli") == "2*idli sambar"
+    assert normalize_food_text("half a cup of dal") == normalize_food_text("0.5 cups dal") == "0.5cup*dal"
+    assert normalize_food_text("200 grams rice") == normalize_food_text("200g rice")
+    assert normalize_food_text("an apple") == normalize_food_text("apple")
+    assert normalize_food_text("2 idli") != normalize_food_text("3 idli")
+
+    assert week_bucket(17) == week_bucket("20") == (17, 20)
+    assert week_bucket(21) == (21, 24) and week_bucket(None) == (1, 4) and week_bucket(45) == (41, 42)
+    key, _, _ = analysis_key("idli with sambar", 20)
+    assert key == analysis_key("Sambar and idli", 18)[0]
+    assert key != analysis_key("idli with sambar", 21)[0]
+    assert analysis_key("!!", 20)[0] == "", "nothing to cache on"
+    print("✅ Equivalent inputs share a key")
+
+
+def test_memory_and_disk_tiers():
+    """Repeat foods come from memory; after a restart they come from disk and are promoted to memory"""
+    print("🔍 Testing cache tiers")
+    with tempfile.TemporaryDirectory() as tmp:
+        key, food_text, weeks = analysis_key("idli with sambar", 20)
+        cache = NutritionAnalysisCache(DiskOCRStore(tmp, max_bytes=1024 * 1024), memory_size=2)
+        assert cache.get_analysis(key) is None
+        cache.put(key, ANALYSIS, food_text, weeks)
+
+        start = time.perf_counter()
+        assert cache.get_analysis(analysis_key("Sambar and idli", 19)[0]) == ANALYSIS
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"   Repeat lookup: {elapsed_ms:.3f} ms")
+        assert elapsed_ms < 50 and cache.memory_hits == 1
+
+        restarted = NutritionAnalysisCache(DiskOCRStore(tmp, max_bytes=1024 * 1024), memory_size=2)
+        assert restarted.get_analysis(key) == ANALYSIS and restarted.store_hits == 1
+        assert restarted.get_analysis(key) == ANALYSIS and restarted.memory_hits == 1
+
+        for food in ("dosa", "pongal"):
+            food_key, text, food_weeks = analysis_key(food, 20)
+            restarted.put(food_key, ANALYSIS, text, food_weeks)
+        assert key not in restarted._memory, "least recently used entry is evicted from memory"
+        stats = restarted.get_stats()
+        print(f"   Stats: {stats['memory_hits']} memory / {stats['store_hits']} store / {stats['misses']} misses")
+        assert stats["backend"] == "disk" and stats["memory_entries"] == 2
+    print("✅ Memory LRU in front of the disk tier")
+
+
+def test_food_data_references_are_resolved():
+    """food_data entries keep only the reference; reads fill the analysis back in"""
+    print("🔍 Testing food_data references")
+    cache = NutritionAnalysisCache()
+    key, food_text, weeks = analysis_key("idli with sambar", 20)
+    cache.put(key, ANALYSIS, food_text, weeks)
+    food_data = [
+        {"type": "gpt4_analysis", "analysis_ref": key, "nutritional_breakdown": ANALYSIS["nutritional_breakdown"]},
+        {"type": "gpt4_analysis", "analysis_ref": "nutrition:v1:gone"},
+        {"type": "basic_entry", "food_input": "banana"},
+    ]
+    assert cache.resolve_entries(food_data) == 1
+    assert food_data[0]["analysis"] == ANALYSIS
+    assert food_data[1]["analysis_expired"] and "analysis" not in food_data[2]
+    print("✅ References resolved")
+
+
+class DictArchive:
+    """In-memory stand-in for the nutrition_analyses collection"""
+
+    name = "dict"
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, entry):
+        self.entries.setdefault(key, entry)
+
+    def stats(self):
+        return {"archived_analyses": len(self.entries)}
+
+
+def test_referenced_analyses_outlive_the_cache():
+    """Pinned analyses resolve after eviction and restarts; without an archive nothing may be referenced"""
+    print("🔍 Testing the analysis archive")
+    archive = DictArchive()
+    key, food_text, weeks = analysis_key("idli with sambar", 20)
+    cache = NutritionAnalysisCache(memory_size=1, archive=archive)
+    cache.put(key, ANALYSIS, food_text, weeks)
+    assert cache.pin(key) and archive.entries[key]["analysis"] == ANALYSIS
+
+    # Evicted from memory, and later a restart with an empty cache
+    other_key, other_text, _ = analysis_key("dosa", 20)
+    cache.put(other_key, {"other": True}, other_text, weeks)
+    restarted = NutritionAnalysisCache(archive=archive)
+    for reader in (cache, restarted):
+        food_data = [{"type": "basic_entry", "analysis_ref": key}]
+        assert reader.resolve_entries(food_data) == 1 and food_data[0]["analysis"] == ANALYSIS
+    assert restarted.get_stats()["archive_hits"] == 1
+
+    # Old clients send the analysis back in full: it is recognised by its key
+    assert cache.find_ref("Sambar and idli", 19, {"other": True}) == ""
+    assert restarted.find_ref("dosa", 20, ANALYSIS) == "", "not cached, so not referenced"
+    cache.put(key, ANALYSIS, food_text, weeks)
+    assert cache.find_ref("Sambar and idli", 19, ANALYSIS) == key
+
+    no_archive = NutritionAnalysisCache()
+    no_archive.put(key, ANALYSIS, food_text, weeks)
+    assert not no_archive.pin(key, ANALYSIS), "memory and TTL stores are not durable"
+    assert not cache.pin("nutrition:v1:unknown")
+    print("✅ Referenced analyses are archived")
+
+
+def main():
+    print("🧪 Testing Nutrition Analysis Cache")
+    print("=" * 50)
+
+    tests = [
+        ("Food text normalization", test_equivalent_food_text_shares_a_key),
+        ("Cache tiers", test_memory_and_disk_tiers),
+        ("food_data references", test_food_data_references_are_resolved),
+        ("Analysis archive", test_referenced_analyses_outlive_the_cache),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
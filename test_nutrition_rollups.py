@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Test the daily nutrition rollups behind /daily-calorie-summary and /nutrition/rollups
+(incremental updates, one-time seeding from food_data, date ranges, moving averages, weekly totals)
+"""
+
+import copy
+from datetime import date, datetime
+
+from nutrition_rollup_service import NutritionRollupStore, entry_counts, summarize_days
+
+
+class MemoryCollection:
+    """The pymongo collection methods the rollup store uses, in memory"""
+
+    def __init__(self):
+        self.docs = {}
+        self.returned = 0
+
+    @staticmethod
+    def _matches(doc, query):
+        for key, condition in query.items():
+            value = doc.get(key)
+            if isinstance(condition, dict):
+                if value is None:
+                    return False
+                if "$gte" in condition and not value >= condition["$gte"]:
+                    return False
+                if "$lte" in condition and not value <= condition["$lte"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find(self, query):
+        found = [copy.deepcopy(d) for d in self.docs.values() if self._matches(d, query)]
+        self.returned += len(found)
+        return found
+
+    def find_one(self, query):
+        found = [d for d in self.docs.values() if self._matches(d, query)]
+        return copy.deepcopy(found[0]) if found else None
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            doc = self.docs[query["_id"]] = {"_id": query["_id"], **update.get("$setOnInsert", {})}
+        doc.update(update.get("$set", {}))
+        for key, amount in update.get("$inc", {}).items():
+            *parents, field = key.split(".")
+            target = doc
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[field] = target.get(field, 0) + amount
+
+
+def meal(day, calories, protein=10):
+    return {"food_input": "idli", "created_at": datetime.fromisoformat(f"{day}T08:30:00"),
+            "nutritional_breakdown": {"estimated_calories": calories, "protein_grams": protein,
+                                      "carbohydrates_grams": "30", "fat_grams": None}}
+
+
+def test_entries_roll_up_incrementally():
+    """Each saved entry adds its nutrients and one meal to its day"""
+    print("🔍 Testing incremental rollups")
+    store = NutritionRollupStore(MemoryCollection())
+    store.record_entry("PAT1", meal("2026-10-19", 300))
+    store.record_entry("PAT1", meal("2026-10-19", 450, protein=20))
+    store.record_entry("PAT1", {"created_at": "2026-10-19T20:00:00", "entry_type": "basic",
+                                "gpt4_analysis": {"nutritional_breakdown": {"estimated_calories": 250}}})
+    today = store.day("PAT1", date(2026, 10, 19))
+    print(f"   2026-10-19: {today}")
+    assert today == {"calories": 1000, "protein_grams": 30.0, "carbohydrates_grams": 60.0,
+                     "fat_grams": 0.0, "fiber_grams": 0.0, "meals": 3}
+    assert store.day("PAT1", date(2026, 10, 20))["meals"] == 0
+    assert entry_counts({"nutritional_breakdown": "n/a"})["calories"] == 0
+    print("✅ Rollups updated per entry")
+
+
+def test_analyze_then_save_counts_the_meal_once():
+    """analyze-with-gpt4 stores an analysis record, then save-food-entry saves the meal; only the meal counts"""
+    print("🔍 Testing analyze-then-save")
+    analysis = {"nutritional_breakdown": {"estimated_calories": 300, "protein_grams": 12}}
+    analysis_records = [
+        # app_simple save_food_analysis_ref
+        {"type": "gpt4_analysis", "analysis_ref": "key", "nutritional_breakdown": analysis["nutritional_breakdown"],
+         "created_at": "2026-10-19T13:00:00"},
+        # nutrition_backend analyze-with-gpt4
+        {"entry_type": "gpt4_analyzed", "gpt4_analysis": analysis, "created_at": "2026-10-19T13:00:00"},
+    ]
+    saved_meal = {"type": "basic_entry", "entry_type": "basic", "food_input": "lemon rice",
+                  "gpt4_analysis": analysis, "created_at": "2026-10-19T13:01:00"}
+
+    store = NutritionRollupStore(MemoryCollection())
+    for record in analysis_records:
+        assert not store.record_entry("PAT1", record)
+        store.record_entry("PAT1", saved_meal)
+    assert store.day("PAT1", date(2026, 10, 19))["calories"] == 600, "two meals, 300 kcal each"
+    assert store.day("PAT1", date(2026, 10, 19))["meals"] == 2
+
+    rebuilt = NutritionRollupStore(MemoryCollection())
+    rebuilt.rebuild({"patient_id": "PAT1", "food_data": [analysis_records[0], saved_meal]})
+    assert rebuilt.day("PAT1", date(2026, 10, 19)) == {
+        "calories": 300, "protein_grams": 12.0, "carbohydrates_grams": 0.0,
+        "fat_grams": 0.0, "fiber_grams": 0.0, "meals": 1}
+    print("✅ Analysis records not counted as meals")
+
+
+def test_existing_history_is_seeded_once():
+    """The first read rolls up food_data; later reads never load the patient again"""
+    print("🔍 Testing seeding")
+    collection = MemoryCollection()
+    patient = {"patient_id": "PAT1", "food_data": [meal("2026-10-18", 500), meal("2026-10-18", 200),
+                                                   meal("2026-10-19", 400), {"food_input": "no date"}]}
+    loads = []
+
+    def load(patient_id):
+        loads.append(patient_id)
+        return patient if patient_id == "PAT1" else None
+
+    store = NutritionRollupStore(collection)
+    # An entry saved before the first read is already in food_data; seeding must not count it twice
+    store.record_entry("PAT1", patient["food_data"][2])
+    assert store.ensure_seeded("PAT1", load) and store.ensure_seeded("PAT1", load)
+    assert NutritionRollupStore(collection).ensure_seeded("PAT1", load), "marker survives a restart"
+    assert loads == ["PAT1"]
+    assert store.day("PAT1", date(2026, 10, 18))["calories"] == 700
+    assert store.day("PAT1", date(2026, 10, 19))["meals"] == 1
+    assert not store.ensure_seeded("NOPE", load)
+    print("✅ History seeded once")
+
+
+def test_meal_saved_while_seeding_is_kept():
+    """A meal saved between reading food_data and writing the seed survives, and is counted once"""
+    print("🔍 Testing a meal saved during seeding")
+    collection = MemoryCollection()
+    store = NutritionRollupStore(collection, now=lambda: datetime(2026, 10, 19, 12, 0))
+    other = NutritionRollupStore(collection)
+    lunch = {**meal("2026-10-19", 600), "created_at": datetime(2026, 10, 19, 12, 30)}
+    patient = {"patient_id": "PAT1", "food_data": [meal("2026-10-19", 400)]}
+
+    def load(patient_id):
+        # Another worker saves lunch after food_data was read, before the seed is written
+        loaded = copy.deepcopy(patient)
+        patient["food_data"].append(lunch)
+        other.record_entry("PAT1", lunch)
+        return loaded
+
+    assert store.ensure_seeded("PAT1", load)
+    assert store.day("PAT1", date(2026, 10, 19))["calories"] == 1000
+
+    # Seeding again (a crashed seed retried) reads lunch too, but only counts entries before the cutoff
+    collection.docs["PAT1:seeded"]["state"] = "seeding"
+    assert NutritionRollupStore(collection).ensure_seeded("PAT1", lambda patient_id: patient)
+    today = store.day("PAT1", date(2026, 10, 19))
+    print(f"   2026-10-19: {today}")
+    assert today["calories"] == 1000 and today["meals"] == 2
+    print("✅ Concurrent meal kept")
+
+
+def test_ranges_and_moving_averages():
+    """Missing days count as zero; moving averages reach back before the range; weeks add up days"""
+    print("🔍 Testing ranges")
+    store = NutritionRollupStore(MemoryCollection())
+    for day in range(1, 32):
+        store.record_entry("PAT1", meal(f"2026-08-{day:02d}", 2000))
+    for day, calories in [(1, 1400), (2, 2100), (4, 2800)]:
+        store.record_entry("PAT1", meal(f"2026-09-{day:02d}", calories))
+        store.record_entry("PAT2", meal(f"2026-09-{day:02d}", 9999))
+
+    store.collection.returned = 0
+    report = store.report("PAT1", date(2026, 9, 1), date(2026, 9, 4), window=3)
+    print(f"   Read {store.collection.returned} days, totals {report['totals']}")
+    assert store.collection.returned == 5, "days with rollups in the range and the two days before it"
+    assert report["days"] == 4 and report["totals"]["calories"] == 6300 and report["totals"]["meals"] == 3
+    assert [d["calories"] for d in report["series"]] == [1400, 2100, 0, 2800]
+    assert [d["moving_average"]["calories"] for d in report["series"]] == [
+        round((2000 + 2000 + 1400) / 3, 1), round((2000 + 1400 + 2100) / 3, 1), 1166.7, round(4900 / 3, 1)]
+    assert report["daily_average"]["calories"] == 1575.0
+
+    weekly = summarize_days(store.days("PAT1", date(2026, 8, 24), date(2026, 9, 6)),
+                            date(2026, 8, 24), date(2026, 9, 6), window=1, group="week")
+    assert [(w["period"], w["calories"], w["meals"]) for w in weekly["series"]] == [
+        ("2026-W35", 14000, 7), ("2026-W36", 2000 + 6300, 4)]
+    print("✅ Ranges answered from rollups")
+
+
+def main():
+    print("🧪 Testing Nutrition Rollups")
+    print("=" * 50)
+
+    tests = [
+        ("Incremental rollups", test_entries_roll_up_incrementally),
+        ("Analyze then save", test_analyze_then_save_counts_the_meal_once),
+        ("Seeding", test_existing_history_is_seeded_once),
+        ("Meal saved during seeding", test_meal_saved_while_seeding_is_kept),
+        ("Ranges and moving averages", test_ranges_and_moving_averages),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
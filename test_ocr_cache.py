@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test the content-addressed OCR result cache
+(disk store, LRU eviction, single-flight for concurrent identical uploads)
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+from ocr_cache_service import DiskOCRStore, OCRResultCache, document_digest
+
+PRESCRIPTION = b"%PDF-1.4 Rx: Paracetamol 500mg twice daily"
+
+
+def slow_ocr(counter, delay=0.3):
+    def compute():
+        counter.append(1)
+        time.sleep(delay)
+        return {"success": True, "extracted_text": "Paracetamol 500mg twice daily", "total_pages": 1}
+    return compute
+
+
+def test_duplicate_upload_returns_cached_result():
+    """The second upload of the same bytes does not run OCR"""
+    print("🔍 Testing duplicate upload")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OCRResultCache(DiskOCRStore(tmp, max_bytes=1024 * 1024))
+        calls = []
+
+        first, first_hit = cache.get_or_compute(PRESCRIPTION, "enhanced", slow_ocr(calls, 0))
+        start = time.perf_counter()
+        second, second_hit = cache.get_or_compute(PRESCRIPTION, "enhanced", slow_ocr(calls, 0))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        print(f"   OCR runs: {len(calls)}, cached lookup: {elapsed_ms:.2f} ms")
+        assert (first_hit, second_hit) == (False, True)
+        assert second == first
+        assert len(calls) == 1
+
+        # A different processor namespace does not share results
+        _, basic_hit = cache.get_or_compute(PRESCRIPTION, "basic", slow_ocr(calls, 0))
+        assert basic_hit is False and len(calls) == 2
+        assert cache.get(document_digest(PRESCRIPTION), "enhanced") == first
+        print("✅ Duplicate documents served from the cache")
+
+
+def test_single_flight():
+    """Concurrent uploads of the same file run OCR once"""
+    print("🔍 Testing single-flight")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OCRResultCache(DiskOCRStore(tmp, max_bytes=1024 * 1024))
+        calls, results = [], []
+
+        def upload():
+            result, hit = cache.get_or_compute(PRESCRIPTION, "enhanced", slow_ocr(calls))
+            if not hit:
+                # The route enriches the leader's result while followers copy theirs
+                for n in range(1000):
+                    result[f"enriched_{n}"] = n
+            results.append((result, hit))
+
+        threads = [threading.Thread(target=upload) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = cache.get_stats()
+        print(f"   OCR runs: {len(calls)}, stats: {stats}")
+        assert len(calls) == 1
+        assert len(results) == 8
+        assert all(result["success"] for result, _ in results)
+        assert sum(1 for _, hit in results if not hit) == 1
+        assert all("enriched_0" not in result for result, hit in results if hit), "followers copy a snapshot"
+        print("✅ Only one of the concurrent uploads ran OCR")
+
+
+def test_failures_are_not_cached():
+    """Failed OCR results and exceptions are never stored"""
+    print("🔍 Testing failure handling")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OCRResultCache(DiskOCRStore(tmp, max_bytes=1024 * 1024))
+
+        result, _ = cache.get_or_compute(PRESCRIPTION, "enhanced", lambda: {"success": False, "error": "blurry"})
+        assert result["success"] is False
+
+        def crash():
+            raise RuntimeError("worker crashed")
+
+        try:
+            cache.get_or_compute(PRESCRIPTION, "enhanced", crash)
+            assert False, "expected RuntimeError"
+        except RuntimeError:
+            pass
+
+        calls = []
+        _, hit = cache.get_or_compute(PRESCRIPTION, "enhanced", slow_ocr(calls, 0))
+        assert hit is False and len(calls) == 1
+        print("✅ Only successful results are cached")
+
+
+def test_disk_lru_eviction():
+    """The disk store stays under its size budget, evicting least recently used entries"""
+    print("🔍 Testing disk LRU eviction")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DiskOCRStore(tmp, max_bytes=3000)
+        text = "x" * 800
+        for i in range(3):
+            store.put(f"enhanced:doc{i}", {"success": True, "text": text})
+            time.sleep(0.01)
+
+        # Touch doc0 so doc1 becomes the least recently used entry
+        os.utime(os.path.join(tmp, "enhanced_doc0.json"), (time.time() + 5, time.time() + 5))
+        store.put("enhanced:doc3", {"success": True, "text": text})
+
+        remaining = sorted(os.listdir(tmp))
+        print(f"   Remaining: {remaining}, size: {store.stats()['size_mb']} MB")
+        assert store.get("enhanced:doc1") is None
+        assert store.get("enhanced:doc0") is not None
+        assert store.get("enhanced:doc3") is not None
+        assert sum(os.path.getsize(os.path.join(tmp, name)) for name in remaining) <= 3000
+        print("✅ Disk cache bounded with LRU eviction")
+
+
+def main():
+    print("🧪 Testing OCR Result Cache")
+    print("=" * 50)
+
+    tests = [
+        ("Duplicate upload", test_duplicate_upload_returns_cached_result),
+        ("Single-flight", test_single_flight),
+        ("Failures not cached", test_failures_are_not_cached),
+        ("Disk LRU eviction", test_disk_lru_eviction),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test the persistent OCR worker pool
+(models loaded once per worker, async processors, job table, backpressure)
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from ocr_worker_pool import OCRWorkerPool, OCRQueueFullError
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class FakeOCRProcessor:
+    """Stand-in for EnhancedOCRService: async process_file, expensive constructor"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.calls = 0
+
+    async def process_file(self, file_content: bytes, filename: str):
+        self.calls += 1
+        delay = float(file_content.decode() or 0) if file_content[:1].isdigit() else 0
+        await asyncio.sleep(delay)
+        if filename.endswith(".bad"):
+            raise ValueError("unreadable document")
+        return {
+            "success": True,
+            "filename": filename,
+            "results": [{"text": "Paracetamol 500mg", "confidence": 0.98}],
+            "worker_pid": self.pid,
+            "calls_in_worker": self.calls,
+        }
+
+
+def make_pool(**kwargs):
+    kwargs.setdefault("workers", 2)
+    kwargs.setdefault("max_queue", 2)
+    kwargs.setdefault("preprocess_images", False)
+    return OCRWorkerPool(factory_path="test_ocr_worker_pool:FakeOCRProcessor", extra_paths=[HERE], **kwargs)
+
+
+def test_models_loaded_once_per_worker():
+    """Many OCR calls reuse the processor built by each worker's initializer"""
+    print("🔍 Testing processor reuse")
+    pool = make_pool()
+    try:
+        assert pool.start()
+        results = [pool.process(b"0", f"page{i}.png") for i in range(8)]
+        pids = {r["worker_pid"] for r in results}
+        max_calls = max(r["calls_in_worker"] for r in results)
+        print(f"   Worker PIDs: {pids}, max calls on one processor: {max_calls}")
+        assert all(r["success"] for r in results)
+        assert os.getpid() not in pids
+        assert len(pids) <= 2
+        assert max_calls >= 4
+        print("✅ OCR processor constructed once per worker and reused")
+    finally:
+        pool.shutdown()
+
+
+def test_job_lifecycle():
+    """submit_job returns immediately; status moves to completed with the on_complete result"""
+    print("🔍 Testing job lifecycle")
+    pool = make_pool()
+    try:
+        job_id = pool.submit_job(
+            b"0.3", "prescription.pdf", metadata={"patient_id": "PAT1"},
+            on_complete=lambda job, ocr_result: {"success": True, "filename": job["filename"], "ocr_result": ocr_result}
+        )
+        assert pool.get_job(job_id)["status"] in ("queued", "processing")
+        assert pool.submit_job(b"0.3", "prescription.pdf", dedupe_key="sha") == \
+            pool.submit_job(b"0.3", "prescription.pdf", dedupe_key="sha")
+
+        failed_id = pool.submit_job(b"0", "broken.bad")
+
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            job = pool.get_job(job_id)
+            failed = pool.get_job(failed_id)
+            if job["status"] == "completed" and failed["status"] == "failed":
+                break
+            time.sleep(0.05)
+
+        print(f"   Job: {job['status']}, failed job error: {failed['error']}")
+        assert job["status"] == "completed"
+        assert job["result"]["ocr_result"]["results"][0]["text"] == "Paracetamol 500mg"
+        assert job["metadata"]["patient_id"] == "PAT1"
+        assert failed["status"] == "failed" and "unreadable" in failed["error"]
+        assert pool.get_stats()["completed_jobs"] >= 1
+        print("✅ Jobs report status and results")
+    finally:
+        pool.shutdown()
+
+
+def test_spooled_document_path():
+    """Workers read a spooled upload from its path; release_document runs afterwards"""
+    print("🔍 Testing spooled document path")
+    pool = make_pool()
+    released = []
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+            f.write(b"0")
+        job_id = pool.submit_job(f.name, "scan.png", release_document=lambda: released.append(f.name))
+
+        deadline = time.time() + 30
+        while pool.get_job(job_id)["status"] not in ("completed", "failed") and time.time() < deadline:
+            time.sleep(0.05)
+
+        job = pool.get_job(job_id)
+        assert job["status"] == "completed" and job["file_size"] == 1
+        assert job["result"]["results"][0]["text"] == "Paracetamol 500mg"
+        assert released == [f.name]
+        print("✅ Document passed by path and released after OCR")
+    finally:
+        os.unlink(f.name)
+        pool.shutdown()
+
+
+def test_backpressure():
+    """Submissions beyond workers + max_queue are rejected instead of piling up"""
+    print("🔍 Testing backpressure")
+    pool = make_pool(workers=1, max_queue=1)
+    try:
+        pool.start()
+        pool.submit_job(b"0.5", "a.png")
+        pool.submit_job(b"0.5", "b.png")
+        try:
+            pool.submit_job(b"0.5", "c.png")
+            assert False, "expected OCRQueueFullError"
+        except OCRQueueFullError as e:
+            print(f"   Rejected: {e}")
+
+        assert pool.get_stats()["rejected_jobs"] == 1
+
+        deadline = time.time() + 30
+        while pool.get_stats()["pending_jobs"] and time.time() < deadline:
+            time.sleep(0.05)
+        pool.submit_job(b"0", "d.png")
+        print("✅ Queue limit enforced and released as jobs finish")
+    finally:
+        pool.shutdown()
+
+
+def main():
+    print("🧪 Testing OCR Worker Pool")
+    print("=" * 50)
+
+    tests = [
+        ("Processor reuse", test_models_loaded_once_per_worker),
+        ("Job lifecycle", test_job_lifecycle),
+        ("Spooled document path", test_spooled_document_path),
+        ("Backpressure", test_backpressure),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test the shared OpenAI client registry against the local stub server
+(connection reuse, timeouts, retries and per-model metrics)
+"""
+
+import io
+
+from openai_client_service import OpenAIClientRegistry
+from openai_stub_server import start_stub_server
+
+
+def make_registry(server, **kwargs):
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("backoff_max", 0.05)
+    return OpenAIClientRegistry(api_key="stub-key", base_url=base_url, **kwargs)
+
+
+def test_connection_reuse():
+    """Sequential calls should share one keep-alive connection"""
+    print("🔍 Testing connection reuse")
+    server = start_stub_server()
+    registry = make_registry(server)
+    try:
+        for _ in range(5):
+            registry.chat_completion("chat", model="gpt-4o-mini",
+                                     messages=[{"role": "user", "content": "hello"}])
+        registry.chat_completion("analysis", model="gpt-4",
+                                 messages=[{"role": "user", "content": "idli"}])
+        print(f"   Requests: {server.state.requests}, TCP connections: {server.state.connections}")
+        assert server.state.requests == 6
+        assert server.state.connections == 1
+        print("✅ Connection pool reused across calls and call types")
+    finally:
+        registry.close()
+        server.shutdown()
+
+
+def test_retries_on_transient_errors():
+    """500 / 429 responses are retried up to max_retries"""
+    print("🔍 Testing bounded retries")
+    server = start_stub_server(fail_next=2, fail_status=500)
+    registry = make_registry(server, max_retries=2)
+    try:
+        response = registry.chat_completion("chat", model="gpt-4o-mini",
+                                            messages=[{"role": "user", "content": "hello"}])
+        assert response.choices[0].message.content
+        metrics = registry.get_metrics()["gpt-4o-mini"]
+        print(f"   Metrics: {metrics}")
+        assert metrics["retries"] == 2 and metrics["errors"] == 0
+
+        server.state.fail_next = 5
+        server.state.fail_status = 429
+        try:
+            registry.chat_completion("chat", model="gpt-4o-mini",
+                                     messages=[{"role": "user", "content": "hello"}])
+            assert False, "expected RateLimitError after exhausting retries"
+        except Exception as e:
+            print(f"   Gave up after retries: {type(e).__name__}")
+            assert type(e).__name__ == "RateLimitError"
+        assert registry.get_metrics()["gpt-4o-mini"]["errors"] == 1
+        print("✅ Retries are bounded")
+    finally:
+        registry.close()
+        server.shutdown()
+
+
+def test_call_type_timeout():
+    """A slow upstream fails fast with the call type's timeout instead of hanging"""
+    print("🔍 Testing per-call-type timeout")
+    server = start_stub_server(latency=1.0)
+    registry = make_registry(server, max_retries=0, timeouts={"chat": 0.2, "analysis": 5})
+    try:
+        try:
+            registry.chat_completion("chat", model="gpt-4o-mini",
+                                     messages=[{"role": "user", "content": "hello"}])
+            assert False, "expected APITimeoutError"
+        except Exception as e:
+            print(f"   chat call timed out: {type(e).__name__}")
+            assert type(e).__name__ == "APITimeoutError"
+
+        response = registry.chat_completion("analysis", model="gpt-4",
+                                            messages=[{"role": "user", "content": "idli"}])
+        assert response.usage.total_tokens > 0
+        print("✅ Timeouts applied per call type")
+    finally:
+        registry.close()
+        server.shutdown()
+
+
+def test_transcription_and_token_metrics():
+    """Transcriptions go through the same pool; chat usage is recorded per model"""
+    print("🔍 Testing transcription and token metrics")
+    server = start_stub_server(fail_next=1)
+    registry = make_registry(server, max_retries=1)
+    try:
+        audio = io.BytesIO(b"RIFF....WAVEfmt ")
+        audio.name = "clip.wav"
+        transcript = registry.transcription(model="whisper-1", file=audio)
+        assert "idli" in transcript.text
+
+        registry.chat_completion("chat", model="gpt-4o-mini",
+                                 messages=[{"role": "user", "content": "one two three"}])
+        metrics = registry.get_metrics()
+        print(f"   Metrics: {metrics}")
+        assert metrics["whisper-1"]["retries"] == 1
+        assert metrics["gpt-4o-mini"]["prompt_tokens"] == 3
+        print("✅ Transcription retried with rewound file; tokens recorded")
+    finally:
+        registry.close()
+        server.shutdown()
+
+
+def main():
+    print("🧪 Testing OpenAI Client Registry")
+    print("=" * 50)
+
+    tests = [
+        ("Connection reuse", test_connection_reuse),
+        ("Bounded retries", test_retries_on_transient_errors),
+        ("Per-call-type timeout", test_call_type_timeout),
+        ("Transcription and metrics", test_transcription_and_token_metrics),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Test page-parallel PDF extraction
+(native text pages, scanned pages sent to OCR, page ranges, streaming order)
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import fitz
+
+import pdf_extraction_service
+from ocr_cache_service import is_cacheable
+from ocr_worker_pool import OCRQueueFullError
+from pdf_extraction_service import (
+    SCANNED_PAGE_PLACEHOLDER,
+    extract_pdf,
+    iter_pdf_pages,
+    parse_page_range,
+)
+
+
+def make_pdf(pages):
+    """PDF where None entries become image-only (no text layer) pages"""
+    document = fitz.open()
+    for text in pages:
+        page = document.new_page()
+        if text is None:
+            page.draw_rect(fitz.Rect(50, 50, 300, 200), color=(0, 0, 0), fill=(0.2, 0.2, 0.2))
+        else:
+            page.insert_text((72, 72), text)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+class FakePageOCR:
+    """Stand-in for OCRWorkerPool.submit that records the rasterized pages"""
+
+    def __init__(self, full_for=0, fail=()):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.submitted = []
+        self.full_for = full_for  # submissions rejected as queue-full before accepting
+        self.rejected = 0
+        self.fail = fail
+
+    def submit(self, png_bytes, name):
+        if self.rejected < self.full_for:
+            self.rejected += 1
+            raise OCRQueueFullError("OCR queue is full")
+        self.submitted.append(name)
+        assert png_bytes.startswith(b"\x89PNG")
+
+        def run():
+            if name in self.fail:
+                raise RuntimeError("worker crashed")
+            return {"success": True, "results": [{"text": f"OCR text from {name}", "confidence": 0.9}]}
+        return self.executor.submit(run)
+
+
+def test_native_and_scanned_pages():
+    """Native pages use the text layer; only image-only pages go to OCR"""
+    print("🔍 Testing native and scanned pages")
+    pdf = make_pdf(["Discharge summary page 1", None, "Tab. Iron 100mg once daily", None])
+    ocr = FakePageOCR()
+
+    result = extract_pdf(pdf, "summary.pdf", ocr_submit=ocr.submit, max_workers=3, pages_per_task=1)
+
+    methods = [r["method"] for r in result["results"]]
+    print(f"   Methods: {methods}, OCR submissions: {ocr.submitted}")
+    assert [r["page"] for r in result["results"]] == [1, 2, 3, 4]
+    assert methods == ["native_text", "ocr", "native_text", "ocr"]
+    assert sorted(ocr.submitted) == ["summary_page2.png", "summary_page4.png"]
+    assert result["native_text_pages"] == 2 and result["ocr_pages"] == 2
+    assert "Tab. Iron 100mg" in result["full_text"]
+    assert "OCR text from summary_page2.png" in result["full_text"]
+    assert isinstance(pdf_extraction_service._page_pool, ProcessPoolExecutor), "PyMuPDF runs in processes"
+    assert not result["partial"] and is_cacheable(result)
+    print("✅ Scanned pages OCR'd, native pages read directly")
+
+
+def test_without_ocr_pool():
+    """Without an OCR submitter scanned pages keep the placeholder"""
+    print("🔍 Testing placeholder without OCR pool")
+    pdf = make_pdf(["Paracetamol 500mg", None])
+    result = extract_pdf(pdf, "rx.pdf")
+    assert result["results"][1]["text"] == SCANNED_PAGE_PLACEHOLDER
+    assert result["results"][1]["method"] == "scanned_page"
+    assert result["full_text"] == "Paracetamol 500mg"
+    print("✅ Same result shape as before when OCR is unavailable")
+
+
+def test_full_ocr_queue_never_drops_pages():
+    """Pages wait for OCR capacity; a queue that stays full fails the document; failed pages are not cached"""
+    print("🔍 Testing a full OCR queue")
+    pdf = make_pdf([None, "Tab. Iron 100mg", None])
+
+    ocr = FakePageOCR(full_for=3)
+    result = extract_pdf(pdf, "scan.pdf", ocr_submit=ocr.submit, pages_per_task=1)
+    print(f"   Rejected {ocr.rejected} submissions, methods {[r['method'] for r in result['results']]}")
+    assert [r["method"] for r in result["results"]] == ["ocr", "native_text", "ocr"]
+
+    try:
+        extract_pdf(pdf, "scan.pdf", ocr_submit=FakePageOCR(full_for=10 ** 6).submit, ocr_queue_wait=0.5)
+        assert False, "pages silently dropped"
+    except OCRQueueFullError as e:
+        assert "2 pages" in str(e)
+
+    result = extract_pdf(pdf, "scan.pdf", ocr_submit=FakePageOCR(fail=("scan_page3.png",)).submit)
+    assert result["failed_pages"] == [3] and result["partial"]
+    assert result["results"][2]["text"] == SCANNED_PAGE_PLACEHOLDER
+    assert not is_cacheable(result), "partial results are never cached"
+    print("✅ Scanned pages wait for OCR or fail the document")
+
+
+def test_page_range_and_streaming():
+    """Only requested pages are extracted and every page is yielded once"""
+    print("🔍 Testing page range and streaming")
+    pdf = make_pdf([f"Page {i} text" for i in range(1, 21)])
+
+    assert parse_page_range("2-4,10", 20) == [1, 2, 3, 9]
+    assert parse_page_range("18-", 20) == [17, 18, 19]
+    assert parse_page_range("", 3) == [0, 1, 2]
+    try:
+        parse_page_range("5-2", 20)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+    streamed = list(iter_pdf_pages(pdf, "long.pdf", parse_page_range("2-4,10", 20), max_workers=4, pages_per_task=1))
+    pages = sorted(page["page"] for page in streamed)
+    print(f"   Streamed pages: {[page['page'] for page in streamed]}")
+    assert pages == [2, 3, 4, 10]
+    assert all(page["text"] == f"Page {page['page']} text" for page in streamed)
+
+    result = extract_pdf(pdf, "long.pdf", page_spec="1-5")
+    assert result["total_pages"] == 20 and result["processed_pages"] == 5
+    print("✅ Page ranges respected")
+
+
+def main():
+    print("🧪 Testing Page-Parallel PDF Extraction")
+    print("=" * 50)
+
+    tests = [
+        ("Native and scanned pages", test_native_and_scanned_pages),
+        ("No OCR pool", test_without_ocr_pool),
+        ("Full OCR queue", test_full_ocr_queue_never_drops_pages),
+        ("Page range and streaming", test_page_range_and_streaming),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test multi-document prescription batches
+(bounded concurrency, upload order, page-order merge, failed documents, request body limit)
+"""
+
+import threading
+import time
+
+from pdf_extraction_service import SCANNED_PAGE_PLACEHOLDER
+from prescription_batch_service import (
+    PRESCRIPTION_BATCH_MAX_BYTES,
+    PRESCRIPTION_BATCH_MAX_FILES,
+    merge_ocr_results,
+    process_documents,
+)
+from prescription_parser import parse_prescription
+from upload_service import UPLOAD_MAX_BYTES
+
+
+def test_bounded_concurrency_keeps_order():
+    """No more than `concurrency` documents run at once; outcomes stay in upload order"""
+    print("🔍 Testing bounded concurrency")
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def process(index):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.02 * (6 - index))  # later documents finish first
+        with lock:
+            state["running"] -= 1
+        if index == 3:
+            raise ValueError("unreadable")
+        return f"doc-{index}"
+
+    outcomes = process_documents(list(range(6)), process, concurrency=2)
+    print(f"   Peak in flight: {state['peak']}")
+    assert state["peak"] <= 2
+    assert [result for result, _ in outcomes] == ["doc-0", "doc-1", "doc-2", None, "doc-4", "doc-5"]
+    assert isinstance(outcomes[3][1], ValueError)
+    assert process_documents([], process) == []
+    print("✅ Bounded and ordered")
+
+
+def test_merge_in_page_order():
+    """PDF pages are sorted, images count as one page, and pages are numbered across the batch"""
+    print("🔍 Testing page-order merge")
+    pdf = {
+        "success": True,
+        "results": [
+            {"page": 2, "text": "Cap. Omeprazole 20mg OD before breakfast", "confidence": 1.0, "method": "native_text"},
+            {"page": 3, "text": SCANNED_PAGE_PLACEHOLDER, "confidence": 0.0, "method": "scanned_page"},
+            {"page": 1, "text": "Dr. Priya Sundaram MBBS\nTab. Augmentin 625mg BD x 5 days", "confidence": 1.0,
+             "method": "native_text"},
+        ],
+    }
+    photo = {
+        "success": True,
+        "results": [{"text": "Syp. Cetirizine 5ml", "confidence": 0.9}, {"text": "HS", "confidence": 0.8}],
+    }
+    merged = merge_ocr_results([("page1-2.pdf", pdf), ("page3.jpg", photo)], batch_name="rx")
+
+    print(f"   Merged text: {merged['full_content']!r}")
+    assert merged["success"] and merged["file_type"] == "batch" and merged["filename"] == "rx"
+    assert [(p["page"], p["filename"], p["source_page"]) for p in merged["results"]] == [
+        (1, "page1-2.pdf", 1), (2, "page1-2.pdf", 2), (3, "page1-2.pdf", 3), (4, "page3.jpg", 1)
+    ]
+    assert SCANNED_PAGE_PLACEHOLDER not in merged["full_content"]
+    assert merged["full_content"].index("Augmentin") < merged["full_content"].index("Omeprazole") \
+        < merged["full_content"].index("Cetirizine")
+    assert merged["documents"][1]["first_page"] == 4
+
+    names = [m["medication_name"] for m in parse_prescription(merged["full_content"])["medications"]]
+    assert names == ["Amoxicillin + Clavulanic Acid", "Omeprazole", "Cetirizine"]
+    print("✅ One prescription text across all documents")
+
+
+def test_failed_documents_are_skipped():
+    """Failed documents are reported but do not break the merge; an all-failed batch is unsuccessful"""
+    print("🔍 Testing failed documents")
+    ok = {"success": True, "full_content": "Tab. Folic Acid 5mg OD", "results": []}
+    merged = merge_ocr_results([("a.jpg", None), ("b.jpg", {"success": False, "error": "bad"}), ("c.jpg", ok)])
+    assert merged["success"] and merged["total_documents"] == 3 and merged["total_pages"] == 1
+    assert [d["success"] for d in merged["documents"]] == [False, False, True]
+    assert merged["results"][0]["document"] == 3
+
+    empty = merge_ocr_results([("a.jpg", None)])
+    assert not empty["success"] and "error" in empty
+    print("✅ Partial batches still merge")
+
+
+def test_batch_body_limit_fits_every_file():
+    """A full batch of maximum-size files fits the batch request limit"""
+    print("🔍 Testing the batch request body limit")
+    full_batch = PRESCRIPTION_BATCH_MAX_FILES * UPLOAD_MAX_BYTES
+    print(f"   {PRESCRIPTION_BATCH_MAX_FILES} files x {UPLOAD_MAX_BYTES // (1024 * 1024)} MB "
+          f"-> limit {PRESCRIPTION_BATCH_MAX_BYTES // (1024 * 1024)} MB")
+    assert PRESCRIPTION_BATCH_MAX_BYTES > full_batch
+    print("✅ Batch limit covers the advertised file count")
+
+
+def main():
+    print("🧪 Testing Prescription Batches")
+    print("=" * 50)
+
+    tests = [
+        ("Bounded concurrency", test_bounded_concurrency_keeps_order),
+        ("Page-order merge", test_merge_in_page_order),
+        ("Failed documents", test_failed_documents_are_skipped),
+        ("Batch body limit", test_batch_body_limit_fits_every_file),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
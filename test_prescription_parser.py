@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Test the local prescription parser
+(frequency grammars, multi-drug prescriptions, confidence, corpus accuracy, speed)
+"""
+
+import json
+import time
+
+from benchmark_prescription_parser import CORPUS_PATH, field_accuracy
+from prescription_parser import (
+    needs_remote_parse,
+    parse_prescription,
+    parse_prescriptions,
+    to_extracted_info,
+)
+
+
+def test_frequency_and_duration_grammars():
+    """Abbreviations, dose patterns and durations normalise to the same values"""
+    print("🔍 Testing frequency and duration grammars")
+    cases = {
+        "Tab. Paracetamol 500mg BD x 5 days": ("Twice daily", 2, 5),
+        "Tab Paracetamol 500 mg 1-0-1 for 5 days": ("Twice daily", 2, 5),
+        "Tab. Paracetamol 500mg twice a day x 5/7": ("Twice daily", 2, 5),
+        "Tab Paracetamol 500mg TDS x 1 week": ("Three times daily", 3, 7),
+        "Tab Paracetamol 500mg 1-1-1-1 x 2 weeks": ("Four times daily", 4, 14),
+        "Tab Paracetamol 500mg q8h for 1 month": ("Every 8 hours", 3, 30),
+    }
+    for text, (frequency, times, days) in cases.items():
+        medication = parse_prescription(text)["medications"][0]
+        print(f"   {text!r} -> {medication['frequency']}, {medication['duration_days']} days")
+        assert medication["medication_name"] == "Paracetamol"
+        assert medication["frequency"] == frequency and medication["times_per_day"] == times
+        assert medication["duration_days"] == days
+
+    schedule = parse_prescription("Tab Iron 100mg 0-1-0")["medications"][0]["schedule"]
+    assert schedule == {"morning": 0, "afternoon": 1, "night": 0}
+    print("✅ Grammars normalise frequency and duration")
+
+
+def test_multi_drug_prescription():
+    """Drugs, brands, continuation lines and the prescriber are all picked up"""
+    print("🔍 Testing multi-drug prescription")
+    text = (
+        "Dr. Priya Sundaram MBBS DGO\n"
+        "Tab. Augmentin 625mg BD\n"
+        "for 5 days after food\n"
+        "Cap. Omeprazole 20mg OD before breakfast, Syp. Cetirizine 5ml HS"
+    )
+    result = parse_prescription(text)
+    names = [m["medication_name"] for m in result["medications"]]
+    print(f"   Medications: {names}, prescriber: {result['prescribed_by']}")
+    assert names == ["Amoxicillin + Clavulanic Acid", "Omeprazole", "Cetirizine"]
+    assert result["prescribed_by"] == "Dr. Priya Sundaram"
+
+    augmentin = result["medications"][0]
+    assert augmentin["matched_name"] == "Augmentin" and augmentin["route"] == "oral"
+    assert augmentin["duration"] == "5 days" and augmentin["instructions"] == "after food"
+    # Fields from a continuation line are trusted a little less than same-line fields
+    assert augmentin["field_confidence"]["duration"] < augmentin["field_confidence"]["frequency"]
+    assert result["medications"][2]["form"] == "syrup"
+
+    info = to_extracted_info(result, text)
+    assert info["medication_name"] == "Amoxicillin + Clavulanic Acid" and info["dosage"] == "625mg"
+    print("✅ Structured fields extracted for every medication")
+
+
+def test_bare_strength_after_drug_name():
+    """A unitless number right after a known drug is its strength; doses, schedules and durations are not"""
+    print("🔍 Testing bare strengths")
+    cases = {
+        "Pan 40 BD": "40mg",
+        "Dolo 650 SOS": "650mg",
+        "Tab Thyronorm 50 OD": "50mcg",
+        "Tab Paracetamol 1 tab BD": "",
+        "Tab Paracetamol 1-0-1": "",
+        "Tab Paracetamol 5 days": "",
+        "Tab Paracetamol 2 times a day": "",
+        "Tab Multivitamin 1 OD": "",
+        "Tab. Xyloprin 20 OD": "",
+    }
+    for text, strength in cases.items():
+        medication = parse_prescription(text)["medications"][0]
+        print(f"   {text!r} -> {medication['strength']!r}")
+        assert medication["strength"] == strength
+
+    pan = parse_prescription("Pan 40 BD")["medications"][0]
+    assert pan["field_confidence"]["strength"] < parse_prescription("Pan 40mg BD")["medications"][0]["field_confidence"]["strength"]
+    print("✅ Bare strengths read in the drug's usual unit")
+
+
+def test_confidence_and_remote_fallback():
+    """Unknown text needs the remote path; unknown drugs with a form prefix get low name confidence"""
+    print("🔍 Testing confidence")
+    assert needs_remote_parse(parse_prescription("Patient reviewed, come back next month"))
+    assert not needs_remote_parse(parse_prescription("Tab Labetalol 100mg BD x 2 weeks"))
+
+    unknown = parse_prescription("Tab. Xyloprin 20mg OD")["medications"][0]
+    assert unknown["medication_name"] == "Xyloprin" and unknown["generic_name"] is None
+    assert unknown["field_confidence"]["name"] < 0.9
+    print("✅ Confidence reflects how the fields were found")
+
+
+def test_corpus_accuracy_and_speed():
+    """The benchmark corpus parses accurately, in batch order, well under a millisecond each"""
+    print("🔍 Testing corpus accuracy and speed")
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    report = field_accuracy(corpus, lambda text: parse_prescription(text)["medications"])
+    print(f"   Accuracy: {report}")
+    assert report["overall"] >= 0.95
+
+    texts = [item["text"] for item in corpus]
+    batch = parse_prescriptions(texts)
+    assert [r["medications"] for r in batch] == [parse_prescription(t)["medications"] for t in texts]
+
+    start = time.perf_counter()
+    for _ in range(20):
+        parse_prescriptions(texts)
+    mean_ms = (time.perf_counter() - start) * 1000 / (20 * len(texts))
+    print(f"   Mean parse time: {mean_ms:.3f} ms")
+    assert mean_ms < 1.0
+    print("✅ Accurate and sub-millisecond")
+
+
+def main():
+    print("🧪 Testing Prescription Parser")
+    print("=" * 50)
+
+    tests = [
+        ("Frequency and duration grammars", test_frequency_and_duration_grammars),
+        ("Multi-drug prescription", test_multi_drug_prescription),
+        ("Bare strengths", test_bare_strength_after_drug_name),
+        ("Confidence and fallback", test_confidence_and_remote_fallback),
+        ("Corpus accuracy and speed", test_corpus_accuracy_and_speed),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test the semantic answer cache used by /symptoms/assist
+(threshold matching, trimester isolation, ring-buffer eviction, TTL and hit rate)
+"""
+
+import numpy as np
+
+from semantic_cache_service import SemanticAnswerCache
+
+ANSWER = {
+    "primary_recommendation": "Urgency level: mild\nEat small frequent meals",
+    "analysis_method": "quantum_llm_synthesis",
+    "knowledge_base_suggestions": 3,
+}
+
+
+def unit_vector(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_paraphrase_hit_and_miss():
+    """A close vector in the same trimester hits; a distant one misses"""
+    print("🔍 Testing threshold matching")
+    cache = SemanticAnswerCache(threshold=0.9, capacity=8, ttl_seconds=0)
+    cache.store(unit_vector(1, 0, 0), "First Trimester", "morning nausea", ANSWER)
+
+    hit = cache.lookup(unit_vector(0.95, 0.2, 0), "First Trimester")
+    print(f"   Paraphrase lookup: {hit and hit['similarity']}")
+    assert hit is not None
+    assert hit["cached_query"] == "morning nausea"
+    assert hit["primary_recommendation"] == ANSWER["primary_recommendation"]
+
+    miss = cache.lookup(unit_vector(0.5, 0.8, 0), "First Trimester")
+    assert miss is None
+
+    stats = cache.get_stats()
+    print(f"   Stats: {stats}")
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == 0.5
+    print("✅ Threshold respected and hit rate reported")
+
+
+def test_trimester_isolation():
+    """Answers never cross trimesters"""
+    print("🔍 Testing trimester isolation")
+    cache = SemanticAnswerCache(threshold=0.9, capacity=8, ttl_seconds=0)
+    cache.store(unit_vector(1, 0), "First Trimester", "morning nausea", ANSWER)
+    assert cache.lookup(unit_vector(1, 0), "Third Trimester") is None
+    assert cache.lookup(unit_vector(1, 0), "First Trimester") is not None
+    print("✅ Trimesters are cached separately")
+
+
+def test_ring_buffer_eviction():
+    """Oldest entries are overwritten once capacity is reached"""
+    print("🔍 Testing ring-buffer eviction")
+    cache = SemanticAnswerCache(threshold=0.99, capacity=2, ttl_seconds=0)
+    cache.store(unit_vector(1, 0, 0), "Second Trimester", "back pain", ANSWER)
+    cache.store(unit_vector(0, 1, 0), "Second Trimester", "heartburn", ANSWER)
+    cache.store(unit_vector(0, 0, 1), "Second Trimester", "leg cramps", ANSWER)
+
+    assert cache.lookup(unit_vector(1, 0, 0), "Second Trimester") is None
+    assert cache.lookup(unit_vector(0, 0, 1), "Second Trimester")["cached_query"] == "leg cramps"
+    assert cache.get_stats()["entries"]["Second Trimester"] == 2
+    print("✅ Capacity bounded per trimester")
+
+
+def test_ttl_and_clear():
+    """Expired entries are ignored and clear() empties the cache"""
+    print("🔍 Testing TTL and clear")
+    cache = SemanticAnswerCache(threshold=0.9, capacity=4, ttl_seconds=60)
+    cache.store(unit_vector(1, 1), "First Trimester", "tired all day", ANSWER)
+    assert cache.lookup(unit_vector(1, 1), "First Trimester") is not None
+
+    cache._indexes["First Trimester"].stored_at[:] -= 120
+    assert cache.lookup(unit_vector(1, 1), "First Trimester") is None
+
+    cache.store(unit_vector(1, 1), "First Trimester", "tired all day", ANSWER)
+    cache.clear()
+    assert cache.lookup(unit_vector(1, 1), "First Trimester") is None
+    print("✅ Stale and cleared entries are not served")
+
+
+def main():
+    print("🧪 Testing Semantic Answer Cache")
+    print("=" * 50)
+
+    tests = [
+        ("Threshold matching", test_paraphrase_hit_and_miss),
+        ("Trimester isolation", test_trimester_isolation),
+        ("Ring-buffer eviction", test_ring_buffer_eviction),
+        ("TTL and clear", test_ttl_and_clear),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test Batch Symptom Triage (/symptoms/assist-batch)
+Requires the backend running on BASE_URL
+"""
+
+import requests
+import json
+import time
+
+# Configuration
+BASE_URL = "http://127.0.0.1:5000"
+
+SAMPLE_ITEMS = [
+    {"patient_id": "PAT_BATCH_1", "text": "mild nausea in the morning", "weeks_pregnant": 8},
+    {"patient_id": "PAT_BATCH_2", "text": "lower back pain after walking", "weeks_pregnant": 24},
+    {"patient_id": "PAT_BATCH_3", "text": "heavy bleeding and severe headache", "weeks_pregnant": 33},
+    {"patient_id": "PAT_BATCH_4", "text": "mild nausea in the morning", "weeks_pregnant": 9},
+    {"patient_id": "PAT_BATCH_5", "text": "", "weeks_pregnant": 12},
+    {"patient_id": "PAT_BATCH_6", "text": "swollen ankles", "weeks_pregnant": "thirty"},
+    {"patient_id": "PAT_BATCH_7", "text": "Mild  nausea in the morning.", "weeks_pregnant": "10"},
+]
+
+def test_batch_in_order():
+    """Results come back in request order, one per item"""
+    print("🔍 Testing Batch Triage (ordered JSON)")
+    print("=" * 40)
+
+    try:
+        items = SAMPLE_ITEMS * 40  # 200 entries
+        start = time.time()
+        response = requests.post(f"{BASE_URL}/symptoms/assist-batch", json={"items": items}, timeout=300)
+        elapsed = time.time() - start
+
+        print(f"📡 Response Status: {response.status_code} in {elapsed:.1f}s")
+        if response.status_code != 200:
+            print(f"❌ HTTP Error: {response.text}")
+            return False
+
+        data = response.json()
+        results = data['results']
+        print(f"📊 Items: {data['total_items']}, unique LLM summaries: {data['unique_summaries']}, "
+              f"red flag items: {data['red_flag_items']}")
+
+        in_order = [r['index'] for r in results] == list(range(len(items)))
+        empty_rejected = not results[4]['success']
+        bad_week_rejected = not results[5]['success'] and results[6]['success'] and results[6]['pregnancy_week'] == 10
+        red_flag_found = bool(results[2].get('red_flags_detected'))
+        # Repeats of the same report share a summary; different symptom texts never do
+        texts = {" ".join(r['symptom_text'].lower().split()).strip(" .!?") for r in results if r['success']}
+        deduplicated = len(texts) <= data['unique_summaries'] < len(items)
+
+        if in_order and empty_rejected and bad_week_rejected and red_flag_found and deduplicated:
+            print("✅ Batch results ordered, empty entry and bad week rejected, red flags detected")
+            return True
+        print(f"❌ Unexpected results: ordered={in_order}, empty_rejected={empty_rejected}, "
+              f"bad_week_rejected={bad_week_rejected}, red_flags={red_flag_found}, deduplicated={deduplicated}")
+        return False
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
+
+def test_batch_streaming():
+    """stream=true returns newline-delimited JSON in request order"""
+    print("\n🔍 Testing Batch Triage (NDJSON stream)")
+    print("=" * 40)
+
+    try:
+        response = requests.post(
+            f"{BASE_URL}/symptoms/assist-batch",
+            json={"items": SAMPLE_ITEMS, "stream": True},
+            stream=True,
+            timeout=300
+        )
+        print(f"📡 Response Status: {response.status_code}")
+
+        indexes = []
+        for line in response.iter_lines():
+            if line:
+                result = json.loads(line)
+                indexes.append(result['index'])
+                print(f"   #{result['index']}: {result.get('analysis_method', result.get('message'))}")
+
+        if indexes == list(range(len(SAMPLE_ITEMS))):
+            print("✅ Streamed results arrived in order")
+            return True
+        print(f"❌ Unexpected stream order: {indexes}")
+        return False
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
+
+def main():
+    print("🧪 Testing Batch Symptom Triage")
+    print("=" * 50)
+
+    results = [
+        ("Ordered batch", test_batch_in_order()),
+        ("Streaming batch", test_batch_streaming()),
+    ]
+
+    print("\n📊 Test Summary")
+    print("=" * 30)
+    for name, passed in results:
+        print(f"{'✅ PASS' if passed else '❌ FAIL'} - {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test the speech-to-text backend selection behind /nutrition/transcribe
+(per-request and default backends, fallback between local and remote Whisper,
+restricted language detection, word error rate for Tamil and English)
+"""
+
+from types import SimpleNamespace
+
+import transcription_service
+from transcription_service import (
+    LocalWhisperBackend,
+    RemoteWhisperBackend,
+    TranscriptionRouter,
+    TranscriptionUnavailableError,
+    word_error_rate,
+)
+
+
+class FakeBackend:
+    def __init__(self, name, text="", available=True, error=None):
+        self.name = name
+        self.text = text
+        self.available = available
+        self.error = error
+        self.calls = []
+
+    def is_available(self):
+        return self.available
+
+    def transcribe(self, path, language=None):
+        self.calls.append((path, language))
+        if self.error:
+            raise self.error
+        return {"text": self.text, "language": language or "en"}
+
+
+class FakeRegistry:
+    def __init__(self):
+        self.kwargs = None
+
+    def is_configured(self):
+        return True
+
+    def transcription(self, call_type="transcription", **kwargs):
+        self.kwargs = {k: v for k, v in kwargs.items() if k != "file"}
+        return SimpleNamespace(text=" two idli and sambar ")
+
+
+class FakeLocalModel:
+    """faster-whisper WhisperModel.transcribe: a segment generator and the detection info"""
+
+    def __init__(self):
+        self.languages = []
+
+    def transcribe(self, path, language=None, **kwargs):
+        self.languages.append(language)
+        info = SimpleNamespace(language=language or "ml", language_probability=0.61, duration=3.2,
+                               all_language_probs=[("ml", 0.61), ("ta", 0.35), ("en", 0.02)])
+        text = "ரெண்டு இட்லி சாம்பார்" if language == "ta" else "garbled"
+        return (SimpleNamespace(text=f" {word}") for word in text.split()), info
+
+
+def test_backend_selection():
+    """Per-request backends override the default; auto prefers local when it is installed"""
+    print("🔍 Testing backend selection")
+    local, remote = FakeBackend("local", "local text"), FakeBackend("remote", "remote text")
+    router = TranscriptionRouter({"remote": remote, "local": local}, default="auto")
+    assert router.resolve() == ["local", "remote"]
+    assert router.resolve("whisper") == ["remote", "local"] and router.resolve("faster-whisper")[0] == "local"
+
+    result = router.transcribe("clip.ogg", "auto", backend="remote")
+    assert (result["text"], result["backend"], result["fallback_from"]) == ("remote text", "remote", None)
+    assert remote.calls == [("clip.ogg", None)], "'auto' language means detect"
+
+    local.available = False
+    assert router.resolve() == ["remote", "local"] and router.available() == ["remote"]
+    assert TranscriptionRouter({"remote": remote, "local": local}, fallback=False).resolve("local") == ["local"]
+    try:
+        router.resolve("google")
+        assert False, "unknown backend accepted"
+    except ValueError:
+        pass
+    print("✅ Backends selected")
+
+
+def test_fallback_between_backends():
+    """A failing or missing backend falls back to the other; when all fail the errors are reported"""
+    print("🔍 Testing fallback")
+    local = FakeBackend("local", error=RuntimeError("model download failed"))
+    remote = FakeBackend("remote", "dosa and chutney")
+    router = TranscriptionRouter({"remote": remote, "local": local}, default="local")
+
+    result = router.transcribe("clip.ogg", "ta")
+    print(f"   Result: {result}")
+    assert result["backend"] == "remote" and result["fallback_from"] == "local" and result["language"] == "ta"
+    stats = router.get_stats()["backends"]
+    assert stats["local"]["errors"] == 1 and stats["remote"]["served_as_fallback"] == 1
+
+    remote.available = False
+    try:
+        router.transcribe("clip.ogg")
+        assert False, "no backend left"
+    except TranscriptionUnavailableError as e:
+        assert "model download failed" in str(e) and "remote: not available" in str(e)
+
+    registry = FakeRegistry()
+    result = RemoteWhisperBackend(registry).transcribe(__file__, "en")
+    assert result == {"text": "two idli and sambar", "language": "en"}
+    assert registry.kwargs == {"model": "whisper-1", "language": "en"}
+    print("✅ Fallback works")
+
+
+def test_local_language_detection_is_restricted():
+    """Detected languages outside LOCAL_WHISPER_LANGUAGES are retried as the likeliest allowed one"""
+    print("🔍 Testing local language detection")
+    model = FakeLocalModel()
+    backend = LocalWhisperBackend(model_name="fake", languages=["en", "ta"])
+    original = transcription_service._local_models.copy()
+    transcription_service._local_models[("fake", backend.compute_type, backend.cpu_threads)] = model
+    saved_flag = transcription_service.FASTER_WHISPER_AVAILABLE
+    try:
+        transcription_service.FASTER_WHISPER_AVAILABLE = True
+        result = backend.transcribe("clip.ogg")
+        assert model.languages == [None, "ta"], "Malayalam detection retried as Tamil"
+        assert result["text"] == "ரெண்டு இட்லி சாம்பார்" and result["language"] == "ta"
+        assert backend.transcribe("clip.ogg", "ta")["language"] == "ta" and model.languages[-1] == "ta"
+    finally:
+        transcription_service.FASTER_WHISPER_AVAILABLE = saved_flag
+        transcription_service._local_models.clear()
+        transcription_service._local_models.update(original)
+    print("✅ Detection restricted to Tamil and English")
+
+
+def test_word_error_rate():
+    """Case and punctuation are ignored; Tamil words are kept whole"""
+    print("🔍 Testing word error rate")
+    assert word_error_rate("Two idli, sambar.", "two idli sambar") == 0.0
+    assert word_error_rate("two idli and sambar", "to idli sambar") == 0.5
+    assert word_error_rate("ரெண்டு இட்லி சாம்பார்", "ரெண்டு இட்லி") == 1 / 3
+    assert word_error_rate("", "") == 0.0 and word_error_rate("", "noise") == 1.0
+    print("✅ Word error rate computed")
+
+
+def main():
+    print("🧪 Testing Transcription Backends")
+    print("=" * 50)
+
+    tests = [
+        ("Backend selection", test_backend_selection),
+        ("Fallback", test_fallback_between_backends),
+        ("Local language detection", test_local_language_detection_is_restricted),
+        ("Word error rate", test_word_error_rate),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
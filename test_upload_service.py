@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Test spooled, size-bounded upload handling
+(memory/disk spooling, limits, base64 audio, zero-copy views, bounded memory)
+"""
+
+import base64
+import hashlib
+import io
+import os
+import tempfile
+import tracemalloc
+
+import fitz
+
+from upload_service import (
+    UploadTooLargeError,
+    spool_base64,
+    spool_stream,
+)
+
+
+class ChunkedBody(io.RawIOBase):
+    """A request body of `size` bytes generated on the fly, never held in memory"""
+
+    def __init__(self, size, chunk=b"0123456789abcdef" * 4096):
+        self.remaining = size
+        self.chunk = chunk
+        self.sha256 = hashlib.sha256()
+
+    def read(self, n=-1):
+        n = self.remaining if n is None or n < 0 else min(n, self.remaining)
+        data = (self.chunk * (n // len(self.chunk) + 1))[:n]
+        self.remaining -= n
+        self.sha256.update(data)
+        return data
+
+
+def test_spooling_and_digest():
+    """Small uploads stay in memory, large ones roll over to disk; digest matches"""
+    print("🔍 Testing spooling and digest")
+    small = spool_stream(io.BytesIO(b"Rx: Iron 100mg"), "rx.txt", max_memory_bytes=1024)
+    assert not small.on_disk and small.size == 14
+    assert small.digest == hashlib.sha256(b"Rx: Iron 100mg").hexdigest()
+    assert bytes(small.getbuffer()) == b"Rx: Iron 100mg"
+
+    body = ChunkedBody(3 * 1024 * 1024)
+    large = spool_stream(body, "scan.pdf", max_memory_bytes=1024)
+    path = large.path
+    print(f"   Spooled {large.size} bytes to {path}")
+    assert large.on_disk and path.endswith(".pdf")
+    assert os.path.getsize(path) == large.size == 3 * 1024 * 1024
+    assert large.digest == body.sha256.hexdigest()
+
+    large.close()
+    small.close()
+    assert not os.path.exists(path)
+    print("✅ Spooled content and digest correct, temp file removed on close")
+
+
+def test_size_limit():
+    """Uploads past the limit are rejected mid-stream and leave no temp file"""
+    print("🔍 Testing size limit")
+    before = set(os.listdir(tempfile.gettempdir()))
+    try:
+        spool_stream(ChunkedBody(5 * 1024 * 1024), "huge.pdf", max_bytes=1024 * 1024, max_memory_bytes=1024)
+        assert False, "expected UploadTooLargeError"
+    except UploadTooLargeError as e:
+        print(f"   Rejected: {e}")
+        assert e.max_bytes == 1024 * 1024
+    after = set(os.listdir(tempfile.gettempdir()))
+    assert not [name for name in after - before if name.startswith("upload_")]
+
+    try:
+        spool_base64(base64.b64encode(b"x" * 4096).decode(), max_bytes=1024)
+        assert False, "expected UploadTooLargeError"
+    except UploadTooLargeError:
+        pass
+    print("✅ Oversized uploads rejected")
+
+
+def test_base64_audio():
+    """Base64 audio (wrapped lines, data: URLs) decodes chunk by chunk to a file path"""
+    print("🔍 Testing base64 audio")
+    audio = os.urandom(300 * 1024 + 7)
+    encoded = base64.encodebytes(audio).decode()  # 76-character lines
+    with spool_base64(encoded, "audio.wav", max_memory_bytes=1024) as upload:
+        assert upload.path.endswith(".wav")
+        with open(upload.path, "rb") as f:
+            assert f.read() == audio
+        assert upload.digest == hashlib.sha256(audio).hexdigest()
+
+    with spool_base64("data:audio/wav;base64," + base64.b64encode(b"RIFF").decode()) as upload:
+        assert upload.read_bytes() == b"RIFF"
+    print("✅ Base64 audio decoded without holding a second copy")
+
+
+def test_pdf_from_memory_map():
+    """PyMuPDF opens the memory-mapped view of a spooled PDF"""
+    print("🔍 Testing memory-mapped PDF view")
+    document = fitz.open()
+    document.new_page().insert_text((72, 72), "Folic acid 5mg daily")
+    pdf = document.tobytes()
+    document.close()
+
+    with spool_stream(io.BytesIO(pdf), "rx.pdf", max_memory_bytes=16) as upload:
+        assert upload.on_disk
+        view = upload.getbuffer()
+        assert isinstance(view, memoryview) and len(view) == len(pdf)
+        with fitz.open(stream=view, filetype="pdf") as doc:
+            assert "Folic acid" in doc[0].get_text()
+        path = upload.detach()
+    assert os.path.exists(path)
+    os.unlink(path)
+    print("✅ PDF read through the memory map; detached file outlives the upload")
+
+
+def test_memory_stays_bounded():
+    """Peak Python allocations while spooling 32 MB stay near the chunk size"""
+    print("🔍 Testing bounded memory")
+    tracemalloc.start()
+    try:
+        with spool_stream(ChunkedBody(32 * 1024 * 1024), "big.pdf", max_bytes=64 * 1024 * 1024) as upload:
+            _, peak = tracemalloc.get_traced_memory()
+            assert upload.size == 32 * 1024 * 1024
+    finally:
+        tracemalloc.stop()
+    print(f"   Peak traced memory: {peak / 1024:.0f} KB for a 32768 KB upload")
+    assert peak < 4 * 1024 * 1024
+    print("✅ Memory use independent of upload size")
+
+
+def main():
+    print("🧪 Testing Spooled Upload Handling")
+    print("=" * 50)
+
+    tests = [
+        ("Spooling and digest", test_spooling_and_digest),
+        ("Size limit", test_size_limit),
+        ("Base64 audio", test_base64_audio),
+        ("Memory-mapped PDF", test_pdf_from_memory_map),
+        ("Bounded memory", test_memory_stays_bounded),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
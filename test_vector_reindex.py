@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Test the zero-downtime reindex job against an in-memory Qdrant
+(alias creation, shadow collection build, resume, recall check, alias swap and
+ the persisted active model)
+"""
+
+import os
+import tempfile
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+
+from vector_reindex_service import VectorReindexJob, ensure_alias, load_embedding_config, resolve_alias
+
+ALIAS = "pregnancy_knowledge"
+KNOWLEDGE = [
+    "Morning sickness is common in the first trimester",
+    "Eat small frequent meals to ease nausea",
+    "Lower back pain can be eased with gentle stretching",
+    "Heartburn often gets worse in the third trimester",
+    "Leg cramps at night may improve with hydration",
+    "Heavy bleeding needs urgent medical attention",
+    "Severe headache with vision changes needs urgent care",
+    "Swelling of the feet is common late in pregnancy",
+]
+
+
+class HashEmbeddingBackend:
+    """Deterministic bag-of-words embeddings so tests do not need a real model"""
+
+    name = "hash"
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, sum(ord(c) for c in word) % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+
+def seed_collection(client, backend):
+    ensure_alias(client, ALIAS, backend.dimension)
+    vectors = backend.encode(KNOWLEDGE)
+    client.upsert(ALIAS, points=[
+        PointStruct(id=i + 1, vector=vector.tolist(), payload={"text": text, "trimester": "all"})
+        for i, (text, vector) in enumerate(zip(KNOWLEDGE, vectors))
+    ])
+
+
+def test_reindex_and_swap():
+    """The alias moves to a new collection with the new vector size; searches work throughout"""
+    print("🔍 Testing reindex with a new vector size")
+    client = QdrantClient(":memory:")
+    old_backend, new_backend = HashEmbeddingBackend(64), HashEmbeddingBackend(128)
+    seed_collection(client, old_backend)
+    old_collection = resolve_alias(client, ALIAS)
+    assert load_embedding_config(client, ALIAS) is None, "never reindexed: EMBEDDING_MODEL applies"
+
+    swapped = []
+    with tempfile.TemporaryDirectory() as tmp:
+        job = VectorReindexJob(
+            client, ALIAS, new_backend, "hash-128", reference_backend=old_backend,
+            batch_size=3, checkpoint_path=os.path.join(tmp, "checkpoint.json"),
+            recall_k=3, min_recall=0.5, verify_queries=["nausea in the morning"],
+            on_swap=swapped.append,
+        )
+        job.run()
+
+    status = job.get_status()
+    print(f"   Status: {status['status']}, recall {status['recall']}, progress {status['progress']}")
+    assert status["status"] == "swapped"
+    assert status["processed_points"] == len(KNOWLEDGE)
+    assert resolve_alias(client, ALIAS) == status["target_collection"] != old_collection
+    assert swapped == [job]
+
+    # What a restarted (or another) process finds for the alias
+    active = load_embedding_config(client, ALIAS)
+    assert (active["embedding_model"], active["vector_size"], active["embedding_backend"]) == ("hash-128", 128, "hash")
+
+    hits = client.search(ALIAS, query_vector=new_backend.encode(["heavy bleeding"])[0].tolist(), limit=1, with_payload=True)
+    assert hits[0].payload["text"] == "Heavy bleeding needs urgent medical attention"
+    print("✅ Alias swapped to the re-embedded collection")
+
+
+def test_resume_from_checkpoint():
+    """An interrupted copy resumes from the saved scroll offset"""
+    print("🔍 Testing resume from checkpoint")
+    client = QdrantClient(":memory:")
+    backend = HashEmbeddingBackend(64)
+    seed_collection(client, backend)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "checkpoint.json")
+
+        class FailingBackend(HashEmbeddingBackend):
+            calls = 0
+
+            def encode(self, texts, **kwargs):
+                FailingBackend.calls += 1
+                if FailingBackend.calls == 2:
+                    raise RuntimeError("simulated crash")
+                return super().encode(texts, **kwargs)
+
+        first = VectorReindexJob(client, ALIAS, FailingBackend(96), "hash-96", reference_backend=backend,
+                                 batch_size=3, checkpoint_path=checkpoint, min_recall=0.0)
+        first.run()
+        assert first.state["status"] == "failed"
+        assert first.state["processed_points"] == 3
+
+        second = VectorReindexJob(client, ALIAS, HashEmbeddingBackend(96), "hash-96", reference_backend=backend,
+                                  batch_size=3, checkpoint_path=checkpoint, min_recall=0.0)
+        assert second.load_checkpoint()
+        second.run(resumed=True)
+
+    print(f"   Resumed job: {second.state['status']}, {second.state['processed_points']} points")
+    assert second.state["status"] == "swapped"
+    assert second.state["processed_points"] == len(KNOWLEDGE)
+    assert second.state["target_collection"] == first.state["target_collection"]
+    assert client.count(ALIAS, exact=True).count == len(KNOWLEDGE)
+    print("✅ Reindex resumed without starting over")
+
+
+def test_low_recall_blocks_swap():
+    """A model that disagrees with the old one is not swapped in automatically"""
+    print("🔍 Testing recall gate")
+    client = QdrantClient(":memory:")
+    old_backend = HashEmbeddingBackend(64)
+    seed_collection(client, old_backend)
+    old_collection = resolve_alias(client, ALIAS)
+
+    class ShuffledBackend(HashEmbeddingBackend):
+        def encode(self, texts, **kwargs):
+            return super().encode([t[::-1] + " x" * len(t) for t in texts], **kwargs)
+
+    job = VectorReindexJob(client, ALIAS, ShuffledBackend(64), "shuffled", reference_backend=old_backend,
+                           checkpoint_path=None, recall_k=3, min_recall=0.99)
+    job.run()
+    print(f"   Status: {job.state['status']}, recall {job.state['recall']}")
+    assert job.state["status"] == "verification_failed"
+    assert resolve_alias(client, ALIAS) == old_collection
+
+    job.swap_alias(force=True)
+    assert resolve_alias(client, ALIAS) == job.state["target_collection"]
+    print("✅ Low recall blocks the automatic swap; forced swap still possible")
+
+
+def test_legacy_collection_migration():
+    """A pre-alias collection named like the alias is replaced by the alias on swap"""
+    print("🔍 Testing legacy collection migration")
+    client = QdrantClient(":memory:")
+    backend = HashEmbeddingBackend(64)
+    from vector_reindex_service import create_knowledge_collection
+    create_knowledge_collection(client, ALIAS, 64)
+    client.upsert(ALIAS, points=[
+        PointStruct(id=i + 1, vector=v.tolist(), payload={"text": t})
+        for i, (t, v) in enumerate(zip(KNOWLEDGE, backend.encode(KNOWLEDGE)))
+    ])
+    assert ensure_alias(client, ALIAS, 64) == ALIAS
+
+    job = VectorReindexJob(client, ALIAS, backend, "hash-64", reference_backend=backend,
+                           checkpoint_path=None, min_recall=0.9)
+    job.run()
+    assert job.state["status"] == "swapped"
+    assert resolve_alias(client, ALIAS) == job.state["target_collection"]
+    assert client.count(ALIAS, exact=True).count == len(KNOWLEDGE)
+    print("✅ Legacy collection migrated behind the alias")
+
+
+def main():
+    print("🧪 Testing Vector Reindex Job")
+    print("=" * 50)
+
+    tests = [
+        ("Reindex and swap", test_reindex_and_swap),
+        ("Resume from checkpoint", test_resume_from_checkpoint),
+        ("Recall gate", test_low_recall_blocks_swap),
+        ("Legacy migration", test_legacy_collection_migration),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
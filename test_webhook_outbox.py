@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Test the durable webhook outbox
+(immediate enqueue, backoff and dead-lettering, restart recovery, per-endpoint concurrency,
+ delivery to the flaky n8n stand-in)
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import webhook_outbox_service
+from n8n_stub_server import sink_url, start_sink_server
+from webhook_outbox_service import DEAD, DELIVERED, DELIVERING, PENDING, WebhookOutbox, build_ocr_payload
+
+
+class Receiver:
+    """Local webhook endpoint answering with queued status codes (200 once they run out)"""
+
+    def __init__(self, statuses=(), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        self.running = 0
+        self.peak = 0
+        lock = threading.Lock()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with lock:
+                    receiver.running += 1
+                    receiver.peak = max(receiver.peak, receiver.running)
+                    status = receiver.statuses.pop(0) if receiver.statuses else 200
+                    receiver.requests.append((dict(self.headers), json.loads(body)))
+                time.sleep(receiver.delay)
+                with lock:
+                    receiver.running -= 1
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/webhook"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_outbox(path, url, **kwargs):
+    endpoints = [{"id": "n8n", "name": "N8N Prescription Processor", "url": url, "timeout": 5}]
+    return WebhookOutbox(path=path, endpoint_loader=lambda: endpoints, backoff=lambda attempts: 0.0, **kwargs)
+
+
+def test_enqueue_and_deliver():
+    """Enqueue persists and returns at once; the dispatcher delivers with an idempotency key"""
+    print("🔍 Testing enqueue and delivery")
+    receiver = Receiver()
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = make_outbox(os.path.join(tmp, "outbox.sqlite3"), receiver.url)
+        payload = build_ocr_payload({"success": True, "full_content": "Tab. Folic Acid 5mg OD"}, "rx.jpg",
+                                    {"patient_id": "PAT1"})
+        queued = outbox.enqueue(payload)
+        assert queued["status"] == PENDING and len(queued["deliveries"]) == 1
+        assert not receiver.requests, "enqueue must not wait on the endpoint"
+
+        assert outbox.dispatch_once() == 1
+        status = outbox.message_status(queued["message_id"])
+        print(f"   Status after dispatch: {status['status']}")
+        assert status["status"] == DELIVERED and status["deliveries"][0]["attempts"] == 1
+
+        headers, body = receiver.requests[0]
+        assert headers["Idempotency-Key"] == queued["deliveries"][0]["id"]
+        assert body["extracted_text"] == "Tab. Folic Acid 5mg OD" and body["metadata"]["patient_id"] == "PAT1"
+        assert outbox.stats()["counts"][DELIVERED] == 1
+        outbox.close()
+    receiver.close()
+    print("✅ Delivered in the background")
+
+
+def test_backoff_and_dead_letter():
+    """5xx retries with backoff until the budget runs out; non-retryable 4xx dead-letters at once"""
+    print("🔍 Testing retries and dead-lettering")
+    receiver = Receiver(statuses=[503, 503, 503, 400])
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = make_outbox(os.path.join(tmp, "outbox.sqlite3"), receiver.url, max_attempts=3)
+        outbox.backoff = lambda attempts: 60.0
+        first = outbox.enqueue({"n": 1})
+        outbox.dispatch_once()
+        delivery = outbox.message_status(first["message_id"])["deliveries"][0]
+        assert delivery["status"] == PENDING and delivery["attempts"] == 1
+        assert delivery["next_attempt_at"] > time.time() + 30, "backoff not applied"
+        assert outbox.dispatch_once() == 0, "not due yet"
+
+        outbox.backoff = lambda attempts: 0.0
+        outbox._execute("UPDATE webhook_deliveries SET next_attempt_at = 0")
+        outbox.dispatch_once()
+        outbox.dispatch_once()
+        delivery = outbox.get_delivery(delivery["id"])
+        print(f"   After {delivery['attempts']} attempts: {delivery['status']} ({delivery['last_error']})")
+        assert delivery["status"] == DEAD and delivery["attempts"] == 3 and delivery["last_status_code"] == 503
+
+        second = outbox.enqueue({"n": 2})
+        outbox.dispatch_once()
+        assert outbox.message_status(second["message_id"])["status"] == DEAD, "400 must not be retried"
+
+        assert outbox.retry(delivery["id"]) and not outbox.retry(delivery["id"])
+        outbox.dispatch_once()
+        assert outbox.get_delivery(delivery["id"])["status"] == DELIVERED
+        assert len(outbox.list_deliveries(status=DEAD)) == 1
+        outbox.close()
+    receiver.close()
+    print("✅ Retries bounded, failures dead-lettered")
+
+
+def test_survives_restart():
+    """Queued and interrupted deliveries are still delivered after the process restarts"""
+    print("🔍 Testing restart recovery")
+    receiver = Receiver()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "outbox.sqlite3")
+        before = make_outbox(path, receiver.url)
+        queued = [before.enqueue({"n": n}) for n in range(3)]
+        # Simulate a crash while the first delivery was in flight, long enough ago for its lease to run out
+        before._execute("UPDATE webhook_deliveries SET status = ?, updated_at = 0 WHERE message_id = ?",
+                        (DELIVERING, queued[0]["message_id"]))
+        before.close()
+
+        after = make_outbox(path, receiver.url)
+        assert after.stats()["counts"][PENDING] == 3
+        after.start()
+        deadline = time.time() + 5
+        while after.stats()["counts"][DELIVERED] < 3 and time.time() < deadline:
+            time.sleep(0.05)
+        assert all(after.message_status(q["message_id"])["status"] == DELIVERED for q in queued)
+        assert sorted(body["n"] for _, body in receiver.requests) == [0, 1, 2]
+        after.close()
+    receiver.close()
+    print("✅ Nothing lost across restarts")
+
+
+def test_one_dispatcher_across_processes():
+    """Two outboxes on one file (two app processes): one dispatcher, no double claims, live sends left alone"""
+    print("🔍 Testing several processes on one outbox")
+    receiver = Receiver()
+    saved_retry = webhook_outbox_service.WEBHOOK_DISPATCHER_LOCK_RETRY_SEC
+    webhook_outbox_service.WEBHOOK_DISPATCHER_LOCK_RETRY_SEC = 0.05
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "outbox.sqlite3")
+        first, second = make_outbox(path, receiver.url), make_outbox(path, receiver.url)
+        try:
+            queued = first.enqueue({"n": 1})
+            claimed = first._claim_due()
+            assert len(claimed) == 1 and second._claim_due() == [], "a row is claimed by one process only"
+
+            # A third process starting up must not requeue a delivery that is still being sent
+            third = make_outbox(path, receiver.url)
+            assert third.get_delivery(claimed[0]["id"])["status"] == DELIVERING
+            third.close()
+            first._deliver(claimed[0])
+            assert first.message_status(queued["message_id"])["status"] == DELIVERED
+
+            first.start()
+            second.start()
+            time.sleep(0.2)
+            leaders = [outbox.stats()["dispatcher_leader"] for outbox in (first, second)]
+            print(f"   Dispatcher leaders: {leaders}")
+            assert leaders == [True, False]
+
+            first.stop()
+            second.enqueue({"n": 2})
+            deadline = time.time() + 5
+            while second.stats()["counts"][DELIVERED] < 2 and time.time() < deadline:
+                time.sleep(0.05)
+            assert second.stats()["dispatcher_leader"], "the dispatcher moves to a surviving process"
+            assert sorted(body["n"] for _, body in receiver.requests) == [1, 2]
+        finally:
+            webhook_outbox_service.WEBHOOK_DISPATCHER_LOCK_RETRY_SEC = saved_retry
+            first.close()
+            second.close()
+    receiver.close()
+    print("✅ One dispatcher, each delivery sent once")
+
+
+def test_per_endpoint_concurrency():
+    """The dispatcher never has more than endpoint_concurrency requests open to one endpoint"""
+    print("🔍 Testing per-endpoint concurrency")
+    receiver = Receiver(delay=0.1)
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = make_outbox(os.path.join(tmp, "outbox.sqlite3"), receiver.url, endpoint_concurrency=2, workers=8)
+        outbox.start()
+        start = time.perf_counter()
+        queued = [outbox.enqueue({"n": n}) for n in range(8)]
+        enqueue_ms = (time.perf_counter() - start) * 1000 / len(queued)
+        deadline = time.time() + 5
+        while outbox.stats()["counts"][DELIVERED] < 8 and time.time() < deadline:
+            time.sleep(0.02)
+        print(f"   Enqueue: {enqueue_ms:.2f} ms each, peak in flight: {receiver.peak}")
+        assert outbox.stats()["counts"][DELIVERED] == 8
+        assert receiver.peak <= 2
+        outbox.close()
+    receiver.close()
+    print("✅ Endpoint concurrency bounded")
+
+
+def test_against_flaky_n8n_stub():
+    """Against the n8n stand-in with injected 500s and 429s every message lands exactly once"""
+    print("🔍 Testing against the n8n stand-in")
+    sink = start_sink_server(latency=0.01, error_rate=0.2, rate_429=0.2, seed=3)
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = make_outbox(os.path.join(tmp, "outbox.sqlite3"), sink_url(sink), max_attempts=20)
+        outbox.start()
+        for n in range(20):
+            outbox.enqueue({"n": n})
+        deadline = time.time() + 10
+        while outbox.stats()["counts"][DELIVERED] < 20 and time.time() < deadline:
+            time.sleep(0.05)
+        stats = sink.state.snapshot()
+        print(f"   n8n stand-in saw {stats['requests']} requests for 20 messages: {stats['statuses']}")
+        assert outbox.stats()["counts"][DELIVERED] == 20
+        assert stats["accepted"] == 20 and stats["duplicates"] == 0
+        assert stats["requests"] > 20, "failures were injected, so retries are expected"
+        outbox.close()
+    sink.shutdown()
+    sink.server_close()
+    print("✅ Retries absorb n8n errors")
+
+
+def main():
+    print("🧪 Testing Webhook Outbox")
+    print("=" * 50)
+
+    tests = [
+        ("Enqueue and deliver", test_enqueue_and_deliver),
+        ("Backoff and dead-letter", test_backoff_and_dead_letter),
+        ("Restart recovery", test_survives_restart),
+        ("One dispatcher across processes", test_one_dispatcher_across_processes),
+        ("Per-endpoint concurrency", test_per_endpoint_concurrency),
+        ("Flaky n8n stand-in", test_against_flaky_n8n_stub),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ PASS - {test_name}\n")
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAIL - {test_name}: {e}\n")
+        except Exception as e:
+            print(f"❌ {test_name} crashed: {e}\n")
+
+    print(f"🎯 Results: {passed}/{len(tests)} tests passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# File: transcription_service.py
+"""
+Pluggable speech-to-text backends for voice food logging.
+
+Backends (TRANSCRIPTION_BACKEND env var, or 'backend' per request):
+- remote : OpenAI whisper-1 through the shared openai_client_service registry
+- local  : faster-whisper (CTranslate2) on the CPU, int8-quantized by default.
+           Each worker process loads the model once and keeps it.
+- auto   : local when faster-whisper is installed, otherwise remote (default)
+
+TranscriptionRouter tries the selected backend first. When
+TRANSCRIPTION_FALLBACK is on, it falls back to the other available backend,
+so a failing local model still reaches remote Whisper and an offline server
+still transcribes locally.
+
+LOCAL_WHISPER_MODEL must be a multilingual model ("small", not "small.en")
+for Tamil. When the language is not given, detection is restricted to
+LOCAL_WHISPER_LANGUAGES. If Whisper detects another language (Tamil is
+sometimes heard as Malayalam), the clip is transcribed again in the most
+likely allowed language.
+"""
+import importlib.util
+import os
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+# faster_whisper pulls in CTranslate2 and PyAV, so it is only imported when the model loads
+FASTER_WHISPER_AVAILABLE = importlib.util.find_spec("faster_whisper") is not None
+
+TRANSCRIPTION_BACKENDS = ["remote", "local"]
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "auto").strip().lower()
+TRANSCRIPTION_FALLBACK = os.getenv("TRANSCRIPTION_FALLBACK", "true").lower() == "true"
+REMOTE_WHISPER_MODEL = os.getenv("REMOTE_WHISPER_MODEL", "whisper-1")
+LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "small")
+LOCAL_WHISPER_COMPUTE_TYPE = os.getenv("LOCAL_WHISPER_COMPUTE_TYPE", "int8")
+LOCAL_WHISPER_CPU_THREADS = int(os.getenv("LOCAL_WHISPER_CPU_THREADS", "0"))  # 0 = CTranslate2 default
+LOCAL_WHISPER_BEAM_SIZE = int(os.getenv("LOCAL_WHISPER_BEAM_SIZE", "1"))
+LOCAL_WHISPER_MODEL_DIR = os.getenv("LOCAL_WHISPER_MODEL_DIR") or None
+LOCAL_WHISPER_LANGUAGES = [code.strip() for code in os.getenv("LOCAL_WHISPER_LANGUAGES", "en,ta").split(",")
+                           if code.strip()]
+LOCAL_WHISPER_PRELOAD = os.getenv("LOCAL_WHISPER_PRELOAD", "false").lower() == "true"
+
+BACKEND_ALIASES = {
+    "remote": "remote", "openai": "remote", "whisper": "remote", "whisper-1": "remote", "api": "remote",
+    "local": "local", "cpu": "local", "faster-whisper": "local", "faster_whisper": "local",
+    "auto": "auto",
+}
+LATENCY_WINDOW = 200  # recent samples kept per backend for percentiles
+
+
+class TranscriptionUnavailableError(Exception):
+    """No backend could transcribe the clip (not installed, not configured, or every attempt failed)"""
+
+
+def normalize_language(language: Optional[str]) -> Optional[str]:
+    """Whisper language code, or None to auto-detect"""
+    language = (language or "").strip().lower()
+    return None if language in ("", "auto") else language
+
+
+class RemoteWhisperBackend:
+    """OpenAI Whisper API (original behaviour)"""
+
+    name = "remote"
+
+    def __init__(self, registry, model: str = REMOTE_WHISPER_MODEL):
+        self.registry = registry
+        self.model = model
+
+    def is_available(self) -> bool:
+        return self.registry.is_configured()
+
+    def transcribe(self, path: str, language: Optional[str] = None) -> Dict[str, Any]:
+        with open(path, "rb") as audio_file:
+            response = self.registry.transcription(
+                "transcription",
+                model=self.model,
+                file=audio_file,
+                language=language
+            )
+        text = response if isinstance(response, str) else response.text
+        return {"text": text.strip(), "language": language or "auto"}
+
+
+_local_models: Dict[tuple, Any] = {}
+_local_models_lock = threading.Lock()
+
+
+class LocalWhisperBackend:
+    """faster-whisper on the CPU; the model is shared by every instance in the process"""
+
+    name = "local"
+
+    def __init__(self, model_name: str = LOCAL_WHISPER_MODEL, compute_type: str = LOCAL_WHISPER_COMPUTE_TYPE,
+                 cpu_threads: int = LOCAL_WHISPER_CPU_THREADS, beam_size: int = LOCAL_WHISPER_BEAM_SIZE,
+                 languages: Optional[List[str]] = None, model_dir: Optional[str] = LOCAL_WHISPER_MODEL_DIR):
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.beam_size = beam_size
+        self.languages = LOCAL_WHISPER_LANGUAGES if languages is None else languages
+        self.model_dir = model_dir
+
+    def is_available(self) -> bool:
+        return FASTER_WHISPER_AVAILABLE
+
+    def load(self):
+        """Load (or download into LOCAL_WHISPER_MODEL_DIR) the model once per process"""
+        if not FASTER_WHISPER_AVAILABLE:
+            raise ImportError("faster-whisper not available. Install with: pip install faster-whisper")
+        key = (self.model_name, self.compute_type, self.cpu_threads)
+        with _local_models_lock:
+            model = _local_models.get(key)
+            if model is None:
+                from faster_whisper import WhisperModel
+                start = time.perf_counter()
+                model = WhisperModel(self.model_name, device="cpu", compute_type=self.compute_type,
+                                     cpu_threads=self.cpu_threads, download_root=self.model_dir)
+                _local_models[key] = model
+                print(f"✅ Local Whisper model '{self.model_name}' ({self.compute_type}) loaded "
+                      f"in {time.perf_counter() - start:.1f}s")
+        return model
+
+    def _run(self, model, path: str, language: Optional[str]):
+        segments, info = model.transcribe(path, language=language, beam_size=self.beam_size,
+                                          vad_filter=True, condition_on_previous_text=False)
+        # segments is a generator; decoding happens while it is consumed
+        return " ".join(segment.text.strip() for segment in segments).strip(), info
+
+    def transcribe(self, path: str, language: Optional[str] = None) -> Dict[str, Any]:
+        model = self.load()
+        text, info = self._run(model, path, language)
+        detected = info.language
+        if language is None and self.languages and detected not in self.languages:
+            probabilities = dict(getattr(info, "all_language_probs", None) or [])
+            allowed = [code for code in self.languages if code in probabilities]
+            if allowed:
+                retry_language = max(allowed, key=probabilities.get)
+                print(f"🔤 Local Whisper detected '{detected}', transcribing as '{retry_language}'")
+                text, info = self._run(model, path, retry_language)
+                detected = retry_language
+        return {
+            "text": text,
+            "language": detected,
+            "language_probability": round(float(getattr(info, "language_probability", 0) or 0), 3),
+            "audio_seconds": round(float(getattr(info, "duration", 0) or 0), 2),
+        }
+
+
+class BackendMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.fallbacks = 0
+        self.latencies_ms: List[float] = []
+
+    def record(self, latency_ms: float):
+        self.requests += 1
+        self.latencies_ms.append(latency_ms)
+        del self.latencies_ms[:-LATENCY_WINDOW]
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies_ms)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "served_as_fallback": self.fallbacks,
+            "latency_p50_ms": round(latencies[len(latencies) // 2], 1) if latencies else None,
+            "latency_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1) if len(latencies) >= 20 else None,
+        }
+
+
+class TranscriptionRouter:
+    """Picks a backend per request and falls back to the others when it is unavailable or fails"""
+
+    def __init__(self, backends: Dict[str, Any], default: str = TRANSCRIPTION_BACKEND,
+                 fallback: bool = TRANSCRIPTION_FALLBACK):
+        self.backends = backends
+        self.default = default
+        self.fallback = fallback
+        self._metrics = {name: BackendMetrics() for name in backends}
+        self._lock = threading.Lock()
+
+    def resolve(self, requested: Optional[str] = None) -> List[str]:
+        """Backends to try, in order; raises ValueError for an unknown name"""
+        name = BACKEND_ALIASES.get((requested or self.default or "auto").strip().lower())
+        if name is None or (name != "auto" and name not in self.backends):
+            raise ValueError(f"Unknown transcription backend '{requested or self.default}'. "
+                             f"Supported backends: {', '.join(['auto'] + list(self.backends))}")
+        if name == "auto":
+            local = self.backends.get("local")
+            name = "local" if local is not None and local.is_available() else "remote"
+        order = [name]
+        if self.fallback:
+            order += [other for other in self.backends if other != name]
+        return order
+
+    def available(self, requested: Optional[str] = None) -> List[str]:
+        return [name for name in self.resolve(requested) if self.backends[name].is_available()]
+
+    def transcribe(self, path: str, language: Optional[str] = None, backend: Optional[str] = None) -> Dict[str, Any]:
+        order = self.resolve(backend)
+        language = normalize_language(language)
+        errors = []
+        for name in order:
+            engine = self.backends[name]
+            if not engine.is_available():
+                errors.append(f"{name}: not available")
+                continue
+            start = time.perf_counter()
+            try:
+                result = engine.transcribe(path, language)
+            except Exception as e:
+                print(f"⚠️ {name} transcription failed: {e}")
+                errors.append(f"{name}: {e}")
+                with self._lock:
+                    self._metrics[name].errors += 1
+                continue
+            latency_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._metrics[name].record(latency_ms)
+                if name != order[0]:
+                    self._metrics[name].fallbacks += 1
+            result.update({
+                "backend": name,
+                "latency_ms": round(latency_ms, 1),
+                "fallback_from": order[0] if name != order[0] else None,
+            })
+            return result
+        raise TranscriptionUnavailableError("; ".join(errors) or "No transcription backend configured")
+
+    def warm_up(self):
+        """Load the local model ahead of the first request (LOCAL_WHISPER_PRELOAD)"""
+        local = self.backends.get("local")
+        if local is not None and local.is_available():
+            try:
+                local.load()
+            except Exception as e:
+                print(f"⚠️ Local Whisper preload failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = {name: m.to_dict() for name, m in self._metrics.items()}
+        return {
+            "default": self.default,
+            "resolved_default": self.resolve()[0],
+            "fallback": self.fallback,
+            "backends": {
+                name: {"available": engine.is_available(), **metrics[name]}
+                for name, engine in self.backends.items()
+            },
+            "local_model": LOCAL_WHISPER_MODEL,
+            "local_compute_type": LOCAL_WHISPER_COMPUTE_TYPE,
+        }
+
+
+def create_transcription_router(registry, default: str = TRANSCRIPTION_BACKEND,
+                                fallback: bool = TRANSCRIPTION_FALLBACK) -> TranscriptionRouter:
+    """Router over remote Whisper (through `registry`) and the local faster-whisper model"""
+    return TranscriptionRouter(
+        {"remote": RemoteWhisperBackend(registry), "local": LocalWhisperBackend()},
+        default=default,
+        fallback=fallback
+    )
+
+
+def _words(text: str) -> List[str]:
+    # Only punctuation is removed: Tamil vowel signs are combining marks, which \w would split on
+    cleaned = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in (text or "").lower())
+    return cleaned.split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """(substitutions + deletions + insertions) / reference words, case and punctuation ignored"""
+    ref, hyp = _words(reference), _words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
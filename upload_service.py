@@ -0,0 +1,197 @@
+# File: upload_service.py
+"""
+Spooled, size-bounded upload handling.
+
+Uploads used to be loaded whole with file.read() (documents) or decoded from
+base64 JSON (audio), then copied again into temp files or worker payloads.
+SpooledUpload copies an incoming stream in fixed-size chunks, keeping small
+files in memory and rolling larger ones over to a named temp file. The size
+limit is enforced while copying and the SHA-256 digest is computed on the
+way, so nothing needs a second pass over the data.
+
+Consumers take whichever view needs no copy:
+
+- path          a file on local disk (audio clients, OCR worker processes)
+- getbuffer()   a memoryview, memory-mapped for disk files (PyMuPDF streams)
+- open()        a fresh read-only file object
+
+Flask's MAX_CONTENT_LENGTH (REQUEST_MAX_BYTES) rejects oversized bodies from
+their Content-Length before anything is parsed.
+"""
+import binascii
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+from typing import Optional, BinaryIO
+
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "25"))
+AUDIO_UPLOAD_MAX_MB = float(os.getenv("AUDIO_UPLOAD_MAX_MB", "25"))
+UPLOAD_SPOOL_MEMORY_KB = int(os.getenv("UPLOAD_SPOOL_MEMORY_KB", "512"))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+UPLOAD_MAX_BYTES = int(UPLOAD_MAX_MB * 1024 * 1024)
+AUDIO_UPLOAD_MAX_BYTES = int(AUDIO_UPLOAD_MAX_MB * 1024 * 1024)
+# Whole request body: the largest file (base64 JSON audio grows by 4/3) plus form fields
+REQUEST_MAX_BYTES = max(UPLOAD_MAX_BYTES, AUDIO_UPLOAD_MAX_BYTES * 4 // 3) + 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds its size limit while being spooled"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"Upload exceeds the {max_bytes / (1024 * 1024):.1f} MB limit")
+
+
+class SpooledUpload:
+    """An upload held in memory while small and in a named temp file once large"""
+
+    def __init__(self, filename: str = "", content_type: str = "",
+                 max_memory_bytes: int = UPLOAD_SPOOL_MEMORY_KB * 1024, tmp_dir: Optional[str] = UPLOAD_TMP_DIR):
+        self.filename = filename or ""
+        self.content_type = content_type or ""
+        self.max_memory_bytes = max_memory_bytes
+        self.tmp_dir = tmp_dir
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._memory = io.BytesIO()
+        self._file = None
+        self._path = None
+        self._mmap = None
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 hex digest of the content (same value as ocr_cache_service.document_digest)"""
+        return self._sha256.hexdigest()
+
+    @property
+    def on_disk(self) -> bool:
+        return self._path is not None
+
+    def write(self, chunk: bytes):
+        if self._mmap is not None:
+            raise ValueError("Upload is already being read")
+        self._sha256.update(chunk)
+        self.size += len(chunk)
+        if self._file is None and self.size > self.max_memory_bytes:
+            self._rollover()
+        (self._file or self._memory).write(chunk)
+
+    def _rollover(self):
+        suffix = os.path.splitext(self.filename)[1].lower()
+        self._file = tempfile.NamedTemporaryFile(prefix="upload_", suffix=suffix, dir=self.tmp_dir, delete=False)
+        self._path = self._file.name
+        self._file.write(self._memory.getbuffer())
+        self._memory = io.BytesIO()
+
+    @property
+    def path(self) -> str:
+        """Path of the content on local disk (small uploads are written out on first use)"""
+        if self._file is None:
+            self._rollover()
+        self._file.flush()
+        return self._path
+
+    def getbuffer(self) -> memoryview:
+        """Read-only view of the content without copying it (memory-mapped when on disk)"""
+        if self._file is None:
+            return self._memory.getbuffer().toreadonly()
+        if self.size == 0:
+            return memoryview(b"")
+        if self._mmap is None:
+            self._file.flush()
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
+
+    def read_bytes(self) -> bytes:
+        """A bytes copy, for APIs that require one"""
+        return bytes(self.getbuffer())
+
+    def open(self) -> BinaryIO:
+        """A new file object positioned at the start of the content"""
+        if self._file is None:
+            return io.BytesIO(self._memory.getvalue())
+        self._file.flush()
+        return open(self._path, "rb")
+
+    def detach(self) -> str:
+        """
+        Hand the on-disk file to another owner (e.g. a background OCR job) and
+        return its path; close() will no longer delete it.
+        """
+        path = self.path
+        self._path = None
+        self.close()
+        return path
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # a memoryview is still exported; the map closes with the file
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._path is not None:
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+            self._path = None
+        self._memory = io.BytesIO()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def spool_stream(stream: BinaryIO, filename: str = "", content_type: str = "",
+                 max_bytes: int = UPLOAD_MAX_BYTES, **kwargs) -> SpooledUpload:
+    """Copy a readable stream into a SpooledUpload, raising UploadTooLargeError past max_bytes"""
+    upload = SpooledUpload(filename, content_type, **kwargs)
+    try:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if upload.size + len(chunk) > max_bytes:
+                raise UploadTooLargeError(max_bytes)
+            upload.write(chunk)
+    except Exception:
+        upload.close()
+        raise
+    return upload
+
+
+def spool_file_storage(file_storage, max_bytes: int = UPLOAD_MAX_BYTES, **kwargs) -> SpooledUpload:
+    """Spool a werkzeug FileStorage from a multipart request"""
+    return spool_stream(file_storage.stream, file_storage.filename, file_storage.content_type,
+                        max_bytes=max_bytes, **kwargs)
+
+
+def spool_base64(encoded: str, filename: str = "", content_type: str = "",
+                 max_bytes: int = UPLOAD_MAX_BYTES, **kwargs) -> SpooledUpload:
+    """Decode base64 text (optionally a data: URL) chunk by chunk into a SpooledUpload"""
+    if encoded.startswith("data:") and "," in encoded[:256]:
+        encoded = encoded.split(",", 1)[1]
+    if any(ch in encoded for ch in " \r\n\t"):
+        encoded = "".join(encoded.split())
+    if (len(encoded) * 3) // 4 - encoded[-2:].count("=") > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+
+    upload = SpooledUpload(filename, content_type, **kwargs)
+    step = (UPLOAD_CHUNK_SIZE // 3) * 4  # a multiple of 4 characters decodes independently
+    try:
+        for start in range(0, len(encoded), step):
+            upload.write(binascii.a2b_base64(encoded[start:start + step]))
+    except binascii.Error as e:
+        upload.close()
+        raise ValueError(f"Invalid base64 data: {e}")
+    return upload
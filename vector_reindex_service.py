@@ -0,0 +1,426 @@
+# File: vector_reindex_service.py
+"""
+Zero-downtime re-embedding of the pregnancy knowledge base.
+
+QDRANT_COLLECTION is used as a Qdrant *alias* that points at a versioned
+physical collection (for example pregnancy_knowledge_20250101T120000).
+Changing EMBEDDING_MODEL or VECTOR_SIZE no longer means dropping the
+collection: a reindex job builds a shadow collection in the background,
+
+1. scrolls every payload from the collection currently behind the alias,
+2. re-embeds the payload text with the new model and upserts it with the
+   same point id (progress is checkpointed to disk so the job can resume),
+3. verifies recall@k of the new collection against the old one, and
+4. atomically moves the alias to the new collection.
+
+Searches keep working against the old collection the whole time. Knowledge
+added while a job is running is mirrored into the shadow collection.
+
+The model and vector size each physical collection was built with are kept
+in Qdrant next to it (a "<alias>_embedding_config" collection, one point per
+physical collection), written before the alias moves. Every process loads
+the entry for the collection behind the alias at startup, so a swap
+survives restarts and reaches all workers, whatever EMBEDDING_MODEL says.
+
+A pre-alias deployment has a real collection named QDRANT_COLLECTION. The
+first swap deletes that collection and creates the alias in its place; that
+is two calls rather than one, so searches can fail for a moment during that
+one-time migration.
+"""
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+try:
+    from qdrant_client.http.models import (
+        Distance, VectorParams, PointStruct, PayloadSchemaType,
+        CreateAliasOperation, CreateAlias, DeleteAliasOperation, DeleteAlias,
+    )
+    QDRANT_AVAILABLE = True
+except ImportError:
+    QDRANT_AVAILABLE = False
+
+REINDEX_BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", "64"))
+REINDEX_CHECKPOINT_PATH = os.getenv(
+    "REINDEX_CHECKPOINT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".reindex_checkpoint.json")
+)
+REINDEX_RECALL_K = int(os.getenv("REINDEX_RECALL_K", "5"))
+REINDEX_MIN_RECALL = float(os.getenv("REINDEX_MIN_RECALL", "0.80"))
+REINDEX_VERIFY_SAMPLE = int(os.getenv("REINDEX_VERIFY_SAMPLE", "50"))
+
+EMBEDDING_CONFIG_SUFFIX = "_embedding_config"
+
+
+def resolve_alias(client, alias: str) -> Optional[str]:
+    """Physical collection behind an alias, or None if the alias does not exist"""
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def versioned_collection_name(client, alias: str) -> str:
+    """Unused physical collection name of the form <alias>_<timestamp>[_n]"""
+    names = {c.name for c in client.get_collections().collections}
+    base = f"{alias}_{datetime.now().strftime('%Y%m%dT%H%M%S')}"
+    name, suffix = base, 1
+    while name in names:
+        suffix += 1
+        name = f"{base}_{suffix}"
+    return name
+
+
+def create_knowledge_collection(client, collection_name: str, vector_size: int):
+    """Create a knowledge collection with the trimester payload index"""
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+    )
+    try:
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name="trimester",
+            field_schema=PayloadSchemaType.KEYWORD,
+        )
+    except Exception:
+        pass  # Local mode / older servers may not support payload indexes
+
+
+def ensure_alias(client, alias: str, vector_size: int) -> str:
+    """
+    Make sure `alias` can be searched and return the physical collection behind it.
+    Fresh installs get a versioned collection plus the alias; a legacy collection
+    named like the alias is left in place until the first reindex migrates it.
+    """
+    target = resolve_alias(client, alias)
+    if target:
+        return target
+
+    names = {c.name for c in client.get_collections().collections}
+    if alias in names:
+        return alias
+
+    collection_name = versioned_collection_name(client, alias)
+    create_knowledge_collection(client, collection_name, vector_size)
+    client.update_collection_aliases(change_aliases_operations=[
+        CreateAliasOperation(create_alias=CreateAlias(collection_name=collection_name, alias_name=alias))
+    ])
+    print(f"✅ Created Qdrant collection {collection_name} behind alias {alias}")
+    return collection_name
+
+
+def _config_point_id(collection_name: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, collection_name))
+
+
+def save_embedding_config(client, alias: str, collection_name: str, model_name: str, vector_size: int,
+                          backend_name: Optional[str] = None):
+    """Record the embedding model a physical collection behind `alias` was built with"""
+    config_collection = alias + EMBEDDING_CONFIG_SUFFIX
+    if config_collection not in {c.name for c in client.get_collections().collections}:
+        # Payload-only store; the 1-d vector is required by Qdrant and never searched
+        client.create_collection(collection_name=config_collection,
+                                 vectors_config=VectorParams(size=1, distance=Distance.DOT))
+    client.upsert(collection_name=config_collection, points=[PointStruct(
+        id=_config_point_id(collection_name),
+        vector=[0.0],
+        payload={
+            "collection": collection_name,
+            "embedding_model": model_name,
+            "embedding_backend": backend_name,
+            "vector_size": vector_size,
+            "updated_at": datetime.now().isoformat(),
+        },
+    )])
+
+
+def load_embedding_config(client, alias: str) -> Optional[Dict[str, Any]]:
+    """Model and vector size of the collection behind `alias`, or None if it was never reindexed"""
+    collection_name = resolve_alias(client, alias) or alias
+    config_collection = alias + EMBEDDING_CONFIG_SUFFIX
+    if config_collection not in {c.name for c in client.get_collections().collections}:
+        return None
+    points = client.retrieve(collection_name=config_collection, ids=[_config_point_id(collection_name)],
+                             with_payload=True)
+    return dict(points[0].payload) if points else None
+
+
+def collection_vector_size(client, collection_name: str) -> Optional[int]:
+    try:
+        vectors = client.get_collection(collection_name).config.params.vectors
+        return getattr(vectors, "size", None)
+    except Exception:
+        return None
+
+
+class VectorReindexJob:
+    """Builds a shadow collection with a new embedding model and swaps the alias to it"""
+
+    def __init__(self, client, alias: str, embedding_backend, model_name: str,
+                 reference_backend=None, vector_size: Optional[int] = None,
+                 batch_size: int = REINDEX_BATCH_SIZE, checkpoint_path: str = REINDEX_CHECKPOINT_PATH,
+                 recall_k: int = REINDEX_RECALL_K, min_recall: float = REINDEX_MIN_RECALL,
+                 verify_queries: Optional[List[str]] = None, auto_swap: bool = True, on_swap=None):
+        self.client = client
+        self.alias = alias
+        self.embedding_backend = embedding_backend
+        self.reference_backend = reference_backend
+        self.vector_size = vector_size or embedding_backend.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.recall_k = recall_k
+        self.min_recall = min_recall
+        self.verify_queries = list(verify_queries or [])
+        self.auto_swap = auto_swap
+        self.on_swap = on_swap
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = {
+            "status": "pending",
+            "alias": alias,
+            "embedding_model": model_name,
+            "vector_size": self.vector_size,
+            "source_collection": None,
+            "target_collection": None,
+            "total_points": 0,
+            "processed_points": 0,
+            "mirrored_points": 0,
+            "next_offset": None,
+            "copy_complete": False,
+            "recall": None,
+            "error": None,
+            "started_at": None,
+            "updated_at": None,
+            "swapped_at": None,
+        }
+
+    # ---- checkpointing ----
+
+    def _save_checkpoint(self):
+        self.state["updated_at"] = datetime.now().isoformat()
+        if not self.checkpoint_path:
+            return
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, default=str)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def load_checkpoint(self) -> bool:
+        """Resume state from an interrupted job for the same alias and model"""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return False
+        try:
+            with open(self.checkpoint_path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read reindex checkpoint: {e}")
+            return False
+
+        if (saved.get("alias") != self.alias or saved.get("embedding_model") != self.state["embedding_model"]
+                or saved.get("status") in ("swapped", "pending")):
+            return False
+
+        names = {c.name for c in self.client.get_collections().collections}
+        if saved.get("target_collection") not in names:
+            return False
+
+        self.state.update(saved)
+        print(f"🔁 Resuming reindex into {saved['target_collection']} "
+              f"at {saved.get('processed_points', 0)}/{saved.get('total_points', 0)} points")
+        return True
+
+    # ---- job control ----
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, resume: bool = True):
+        """Run the job in a background thread"""
+        resumed = self.load_checkpoint() if resume else False
+        if not resumed:
+            self.state["started_at"] = datetime.now().isoformat()
+        self._thread = threading.Thread(target=self.run, kwargs={"resumed": resumed}, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def run(self, resumed: bool = False):
+        self.state["error"] = None
+        try:
+            if not self.state["copy_complete"]:
+                self._prepare(resumed)
+                self._copy_points()
+            self.verify_recall()
+            if self.state["status"] == "ready" and self.auto_swap:
+                self.swap_alias()
+        except Exception as e:
+            self.state["status"] = "failed"
+            self.state["error"] = str(e)
+            print(f"❌ Reindex job failed: {e}")
+        finally:
+            try:
+                self._save_checkpoint()
+            except OSError as e:
+                print(f"⚠️ Could not write reindex checkpoint: {e}")
+
+    def _prepare(self, resumed: bool):
+        if resumed and self.state["target_collection"]:
+            self.state["status"] = "copying"
+            return
+
+        source = resolve_alias(self.client, self.alias)
+        if source is None:
+            names = {c.name for c in self.client.get_collections().collections}
+            source = self.alias if self.alias in names else None
+        self.state["source_collection"] = source
+        self.state["total_points"] = self.client.count(source, exact=True).count if source else 0
+
+        target = versioned_collection_name(self.client, self.alias)
+        create_knowledge_collection(self.client, target, self.vector_size)
+        self.state["target_collection"] = target
+        self.state["status"] = "copying"
+        self._save_checkpoint()
+        print(f"🔄 Reindexing {self.state['total_points']} points from {source} into {target} "
+              f"with {self.state['embedding_model']}")
+
+    def _embed(self, texts: List[str]) -> List[list]:
+        vectors = self.embedding_backend.encode(texts, normalize_embeddings=True)
+        return [vector.tolist() if hasattr(vector, "tolist") else list(vector) for vector in vectors]
+
+    def _copy_points(self):
+        source = self.state["source_collection"]
+        target = self.state["target_collection"]
+        if not source:
+            self.state["copy_complete"] = True
+            return
+
+        offset = self.state["next_offset"]
+        while True:
+            records, next_offset = self.client.scroll(
+                collection_name=source,
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            if records:
+                vectors = self._embed([(r.payload or {}).get("text", "") for r in records])
+                self.client.upsert(
+                    collection_name=target,
+                    points=[
+                        PointStruct(id=r.id, vector=vector, payload=r.payload or {})
+                        for r, vector in zip(records, vectors)
+                    ],
+                )
+                with self._lock:
+                    self.state["processed_points"] += len(records)
+
+            offset = next_offset
+            self.state["next_offset"] = next_offset
+            if next_offset is None:
+                self.state["copy_complete"] = True
+            self._save_checkpoint()
+            if next_offset is None:
+                break
+
+    def mirror_upsert(self, point_id, payload: Dict[str, Any]) -> bool:
+        """Copy a newly added knowledge point into the shadow collection while a job is active"""
+        if self.state["status"] not in ("copying", "verifying", "ready", "verification_failed"):
+            return False
+        target = self.state["target_collection"]
+        if not target:
+            return False
+
+        vector = self._embed([payload.get("text", "")])[0]
+        self.client.upsert(collection_name=target, points=[PointStruct(id=point_id, vector=vector, payload=payload)])
+        with self._lock:
+            self.state["mirrored_points"] += 1
+        return True
+
+    # ---- verification and swap ----
+
+    def _sample_texts(self, limit: int) -> List[str]:
+        source = self.state["source_collection"]
+        if not source or limit <= 0:
+            return []
+        records, _ = self.client.scroll(collection_name=source, limit=limit, with_payload=True, with_vectors=False)
+        return [(r.payload or {}).get("text", "") for r in records if (r.payload or {}).get("text")]
+
+    def verify_recall(self) -> Optional[float]:
+        """Mean recall@k of new-collection results against old-collection results"""
+        source = self.state["source_collection"]
+        target = self.state["target_collection"]
+        self.state["status"] = "verifying"
+
+        if not source or self.reference_backend is None or self.state["total_points"] == 0:
+            # Nothing to compare against (empty or brand-new knowledge base)
+            self.state["recall"] = None
+            self.state["status"] = "ready"
+            return None
+
+        queries = self.verify_queries + self._sample_texts(REINDEX_VERIFY_SAMPLE)
+        old_vectors = self.reference_backend.encode(queries, normalize_embeddings=True)
+        new_vectors = self._embed(queries)
+
+        recalls = []
+        for old_vector, new_vector in zip(old_vectors, new_vectors):
+            old_vector = old_vector.tolist() if hasattr(old_vector, "tolist") else list(old_vector)
+            old_ids = {str(hit.id) for hit in self.client.search(collection_name=source, query_vector=old_vector, limit=self.recall_k)}
+            if not old_ids:
+                continue
+            new_ids = {str(hit.id) for hit in self.client.search(collection_name=target, query_vector=new_vector, limit=self.recall_k)}
+            recalls.append(len(old_ids & new_ids) / len(old_ids))
+
+        recall = round(sum(recalls) / len(recalls), 4) if recalls else None
+        self.state["recall"] = recall
+        self.state["recall_queries"] = len(recalls)
+        if recall is None or recall >= self.min_recall:
+            self.state["status"] = "ready"
+            print(f"✅ Reindex recall@{self.recall_k}: {recall}")
+        else:
+            self.state["status"] = "verification_failed"
+            print(f"⚠️ Reindex recall@{self.recall_k} {recall} below {self.min_recall}; alias not swapped")
+        self._save_checkpoint()
+        return recall
+
+    def swap_alias(self, force: bool = False) -> bool:
+        """Point the alias at the shadow collection in one alias update"""
+        if self.state["status"] != "ready" and not (force and self.state["status"] == "verification_failed"):
+            raise ValueError(f"Reindex job is not ready to swap (status: {self.state['status']})")
+
+        target = self.state["target_collection"]
+        # Written first: once the alias moves, every process must find the model to query it with
+        save_embedding_config(self.client, self.alias, target, self.state["embedding_model"], self.vector_size,
+                              getattr(self.embedding_backend, "name", None))
+        current = resolve_alias(self.client, self.alias)
+        operations = []
+        if current:
+            operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=self.alias)))
+        else:
+            names = {c.name for c in self.client.get_collections().collections}
+            if self.alias in names:
+                # One-time migration from a pre-alias deployment
+                print(f"⚠️ Replacing legacy collection {self.alias} with an alias")
+                self.client.delete_collection(self.alias)
+        operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=self.alias)))
+        self.client.update_collection_aliases(change_aliases_operations=operations)
+
+        self.state["status"] = "swapped"
+        self.state["swapped_at"] = datetime.now().isoformat()
+        self._save_checkpoint()
+        print(f"✅ Alias {self.alias} now points at {target}")
+
+        if self.on_swap:
+            self.on_swap(self)
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = dict(self.state)
+        total = status["total_points"]
+        status["progress"] = round(status["processed_points"] / total, 4) if total else (1.0 if status["status"] != "copying" else 0.0)
+        status["running"] = self.is_running()
+        return status
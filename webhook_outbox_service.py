@@ -0,0 +1,483 @@
+# File: webhook_outbox_service.py
+"""
+Durable outbox for outbound webhooks (n8n and friends).
+
+Routes used to call webhook_service.send_ocr_result() inline, so every
+request waited on n8n (30 s timeout, up to three retries). Now the payload is
+written to a local SQLite outbox, one row per endpoint, and the request
+returns straight away. A background dispatcher delivers due rows:
+
+- exponential backoff with jitter between attempts (WEBHOOK_BACKOFF_*)
+- at most WEBHOOK_ENDPOINT_CONCURRENCY requests in flight per endpoint URL
+- rows that exhaust WEBHOOK_MAX_ATTEMPTS, or get a non-retryable 4xx, move
+  to the "dead" state and stay there until retried through the API
+
+Rows survive restarts; a row left "delivering" by a crash is picked up again
+once its lease (WEBHOOK_DELIVERY_LEASE_SEC since it was claimed) has run out,
+so delivery is at-least-once. Every request carries the delivery ID in
+X-Webhook-Delivery-Id / Idempotency-Key for receivers that deduplicate.
+
+Any process may enqueue, but only one process per outbox file runs the
+dispatcher: it holds an exclusive lock on "<outbox>.lock" (the Flask reloader
+and pre-fork workers all import the app). The others keep trying for the lock
+and take over if the holder exits. Claims are conditional updates, so a row is
+never sent by two dispatchers even without the lock.
+
+Endpoints are the enabled entries of webhook_configs.json (the file the
+medication folder's WebhookConfigService keeps) unless a loader is passed in.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows: no dispatcher lock, the conditional claims still hold
+    FCNTL_AVAILABLE = False
+
+WEBHOOK_OUTBOX_ENABLED = os.getenv("WEBHOOK_OUTBOX_ENABLED", "true").lower() == "true"
+WEBHOOK_OUTBOX_PATH = os.getenv(
+    "WEBHOOK_OUTBOX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".webhook_outbox.sqlite3")
+)
+WEBHOOK_CONFIGS_PATH = os.getenv(
+    "WEBHOOK_CONFIGS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhook_configs.json")
+)
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_BACKOFF_BASE_SEC = float(os.getenv("WEBHOOK_BACKOFF_BASE_SEC", "2"))
+WEBHOOK_BACKOFF_MAX_SEC = float(os.getenv("WEBHOOK_BACKOFF_MAX_SEC", "600"))
+WEBHOOK_ENDPOINT_CONCURRENCY = int(os.getenv("WEBHOOK_ENDPOINT_CONCURRENCY", "2"))
+WEBHOOK_DISPATCH_WORKERS = int(os.getenv("WEBHOOK_DISPATCH_WORKERS", "8"))
+WEBHOOK_DEFAULT_TIMEOUT_SEC = float(os.getenv("WEBHOOK_DEFAULT_TIMEOUT_SEC", "30"))
+WEBHOOK_OUTBOX_RETENTION_DAYS = int(os.getenv("WEBHOOK_OUTBOX_RETENTION_DAYS", "7"))
+# Longer than any endpoint timeout: a "delivering" row older than this has lost its dispatcher
+WEBHOOK_DELIVERY_LEASE_SEC = float(os.getenv("WEBHOOK_DELIVERY_LEASE_SEC", "300"))
+WEBHOOK_DISPATCHER_LOCK_RETRY_SEC = 5.0
+
+PENDING = "pending"
+DELIVERING = "delivering"
+DELIVERED = "delivered"
+DEAD = "dead"
+DELIVERY_STATUSES = (PENDING, DELIVERING, DELIVERED, DEAD)
+
+# 4xx responses worth retrying; any other 4xx means the payload will never be accepted
+RETRYABLE_CLIENT_ERRORS = {408, 409, 425, 429}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_deliveries (
+    id TEXT PRIMARY KEY,
+    message_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    endpoint_id TEXT NOT NULL,
+    endpoint_name TEXT NOT NULL,
+    url TEXT NOT NULL,
+    method TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    timeout REAL NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    last_status_code INTEGER,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    delivered_at REAL
+);
+CREATE INDEX IF NOT EXISTS webhook_deliveries_due ON webhook_deliveries (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS webhook_deliveries_message ON webhook_deliveries (message_id);
+"""
+
+PUBLIC_COLUMNS = ("id", "message_id", "event", "endpoint_id", "endpoint_name", "url", "status", "attempts",
+                  "max_attempts", "next_attempt_at", "last_status_code", "last_error", "created_at",
+                  "updated_at", "delivered_at")
+
+
+def load_webhook_endpoints(path: str = WEBHOOK_CONFIGS_PATH) -> List[Dict[str, Any]]:
+    """Enabled endpoints from a webhook_configs.json file"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            configs = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if isinstance(configs, dict):
+        configs = list(configs.values())
+    return [config for config in configs if config.get("enabled", True) and config.get("url")]
+
+
+def build_ocr_payload(ocr_result: Dict[str, Any], filename: str,
+                      metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Webhook body for an OCR result"""
+    extracted_text = (ocr_result.get("full_text_content") or ocr_result.get("full_content")
+                      or ocr_result.get("extracted_text") or "")
+    return {
+        "event": "ocr_result",
+        "filename": filename,
+        "success": bool(ocr_result.get("success")),
+        "extracted_text": extracted_text,
+        "ocr_result": ocr_result,
+        "metadata": metadata or {},
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def backoff_delay(attempts: int, base: float = WEBHOOK_BACKOFF_BASE_SEC,
+                  maximum: float = WEBHOOK_BACKOFF_MAX_SEC) -> float:
+    """Seconds before the next attempt after `attempts` failures (full jitter on the upper half)"""
+    delay = min(maximum, base * (2 ** max(0, attempts - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class WebhookOutbox:
+    """SQLite-backed outbox with a background dispatcher thread"""
+
+    def __init__(self, path: str = WEBHOOK_OUTBOX_PATH,
+                 endpoint_loader: Optional[Callable[[], List[Dict[str, Any]]]] = None,
+                 max_attempts: int = WEBHOOK_MAX_ATTEMPTS,
+                 endpoint_concurrency: int = WEBHOOK_ENDPOINT_CONCURRENCY,
+                 workers: int = WEBHOOK_DISPATCH_WORKERS,
+                 backoff: Callable[[int], float] = backoff_delay,
+                 session: Optional[requests.Session] = None,
+                 lease_seconds: float = WEBHOOK_DELIVERY_LEASE_SEC):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.endpoint_loader = endpoint_loader or load_webhook_endpoints
+        self.max_attempts = max_attempts
+        self.endpoint_concurrency = max(1, endpoint_concurrency)
+        self.workers = max(1, workers)
+        self.backoff = backoff
+        self.session = session or requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # FULL: an acknowledged webhook must survive a power loss, not just a process restart
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+        self.recover_expired()
+
+        self._in_flight: Dict[str, int] = {}
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def _query(self, sql: str, params=()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params).fetchall()]
+
+    # ---- producer side ----
+
+    def endpoints(self) -> List[Dict[str, Any]]:
+        try:
+            return self.endpoint_loader() or []
+        except Exception as e:
+            print(f"⚠️ Could not load webhook endpoints: {e}")
+            return []
+
+    def is_configured(self) -> bool:
+        return bool(self.endpoints())
+
+    def enqueue(self, payload: Dict[str, Any], event: str = "ocr_result") -> Dict[str, Any]:
+        """Persist one delivery per enabled endpoint and wake the dispatcher"""
+        message_id = uuid.uuid4().hex
+        now = time.time()
+        body = json.dumps(payload, default=str)
+        rows = []
+        for endpoint in self.endpoints():
+            rows.append((
+                uuid.uuid4().hex, message_id, event,
+                str(endpoint.get("id") or endpoint["url"]),
+                endpoint.get("name") or endpoint["url"],
+                endpoint["url"],
+                (endpoint.get("method") or "POST").upper(),
+                json.dumps(endpoint.get("headers") or {}),
+                body,
+                float(endpoint.get("timeout") or WEBHOOK_DEFAULT_TIMEOUT_SEC),
+                PENDING, 0, self.max_attempts, now, now, now
+            ))
+        if rows:
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._db.executemany(
+                        "INSERT INTO webhook_deliveries (id, message_id, event, endpoint_id, endpoint_name, url,"
+                        " method, headers, payload, timeout, status, attempts, max_attempts, next_attempt_at,"
+                        " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+                    self._db.execute("COMMIT")
+                except Exception:
+                    self._db.execute("ROLLBACK")
+                    raise
+            self._wake.set()
+        return self.message_status(message_id) if rows else {"message_id": message_id, "status": "no_endpoints",
+                                                              "deliveries": []}
+
+    # ---- status API ----
+
+    def get_delivery(self, delivery_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query(f"SELECT {', '.join(PUBLIC_COLUMNS)} FROM webhook_deliveries WHERE id = ?", (delivery_id,))
+        return rows[0] if rows else None
+
+    def message_status(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """Deliveries of one enqueued payload and their overall state"""
+        deliveries = self._query(
+            f"SELECT {', '.join(PUBLIC_COLUMNS)} FROM webhook_deliveries WHERE message_id = ? ORDER BY endpoint_name",
+            (message_id,)
+        )
+        if not deliveries:
+            return None
+        statuses = {d["status"] for d in deliveries}
+        if statuses == {DELIVERED}:
+            status = DELIVERED
+        elif statuses <= {DELIVERED, DEAD}:
+            status = DEAD if statuses == {DEAD} else "partially_delivered"
+        else:
+            status = PENDING
+        return {"message_id": message_id, "status": status, "deliveries": deliveries}
+
+    def list_deliveries(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        sql = f"SELECT {', '.join(PUBLIC_COLUMNS)} FROM webhook_deliveries"
+        params: tuple = ()
+        if status:
+            sql += " WHERE status = ?"
+            params = (status,)
+        return self._query(sql + " ORDER BY created_at DESC LIMIT ?", params + (max(1, min(limit, 500)),))
+
+    def retry(self, delivery_id: str) -> bool:
+        """Move a dead delivery back to pending with a fresh attempt budget"""
+        updated = self._execute(
+            "UPDATE webhook_deliveries SET status = ?, attempts = 0, next_attempt_at = ?, updated_at = ?"
+            " WHERE id = ? AND status = ?",
+            (PENDING, time.time(), time.time(), delivery_id, DEAD)
+        ).rowcount
+        if updated:
+            self._wake.set()
+        return bool(updated)
+
+    def recover_expired(self) -> int:
+        """Queue again the deliveries whose dispatcher died mid-request (lease run out)"""
+        now = time.time()
+        recovered = self._execute(
+            "UPDATE webhook_deliveries SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+            (PENDING, now, DELIVERING, now - self.lease_seconds)
+        ).rowcount
+        if recovered:
+            print(f"🔄 Webhook outbox: {recovered} interrupted deliveries queued again")
+        return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status: 0 for status in DELIVERY_STATUSES}
+        for row in self._query("SELECT status, COUNT(*) AS count FROM webhook_deliveries GROUP BY status"):
+            counts[row["status"]] = row["count"]
+        oldest = self._query("SELECT MIN(created_at) AS oldest FROM webhook_deliveries WHERE status IN (?, ?)",
+                             (PENDING, DELIVERING))[0]["oldest"]
+        return {
+            "counts": counts,
+            "oldest_pending_age_sec": round(time.time() - oldest, 1) if oldest else 0.0,
+            "endpoints": len(self.endpoints()),
+            "in_flight": dict(self._in_flight),
+            "dispatcher_running": bool(self._thread and self._thread.is_alive()),
+            "dispatcher_leader": self._lock_file is not None,
+        }
+
+    def purge(self, older_than_days: int = WEBHOOK_OUTBOX_RETENTION_DAYS) -> int:
+        """Drop delivered rows older than the retention window"""
+        return self._execute(
+            "DELETE FROM webhook_deliveries WHERE status = ? AND delivered_at < ?",
+            (DELIVERED, time.time() - older_than_days * 86400)
+        ).rowcount
+
+    # ---- dispatcher ----
+
+    def _acquire_dispatcher_lock(self) -> bool:
+        """Become the one dispatching process for this outbox file"""
+        if self._lock_file is not None:
+            return True
+        if not FCNTL_AVAILABLE:
+            self._lock_file = True
+            return True
+        lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release_dispatcher_lock(self):
+        if self._lock_file not in (None, True):
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+        self._lock_file = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="webhook")
+        self._thread = threading.Thread(target=self._run, name="webhook-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        self._release_dispatcher_lock()
+
+    def _claim_due(self) -> List[Dict[str, Any]]:
+        """Mark due rows delivering, respecting the per-endpoint in-flight limit"""
+        now = time.time()
+        claimed = []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM webhook_deliveries WHERE status = ? AND next_attempt_at <= ?"
+                " ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, self.workers * 4)
+            ).fetchall()
+            for row in rows:
+                if self._in_flight.get(row["url"], 0) >= self.endpoint_concurrency:
+                    continue
+                # Conditional claim: another process may have taken the row since the SELECT
+                taken = self._db.execute(
+                    "UPDATE webhook_deliveries SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                    (DELIVERING, now, row["id"], PENDING)
+                ).rowcount
+                if not taken:
+                    continue
+                self._in_flight[row["url"]] = self._in_flight.get(row["url"], 0) + 1
+                claimed.append(dict(row))
+        return claimed
+
+    def _next_due_in(self) -> float:
+        row = self._query("SELECT MIN(next_attempt_at) AS due FROM webhook_deliveries WHERE status = ?", (PENDING,))[0]
+        if not row["due"]:
+            return 5.0
+        # Due rows that could not be claimed are waiting on a busy endpoint; completions wake the loop
+        due_in = row["due"] - time.time()
+        return min(5.0, due_in) if due_in > 0 else 5.0
+
+    def _run(self):
+        if not self._acquire_dispatcher_lock():
+            print(f"ℹ️ Webhook outbox dispatcher runs in another process ({self.path})")
+            # Take over when that process exits
+            while not self._acquire_dispatcher_lock():
+                if self._stopping.wait(WEBHOOK_DISPATCHER_LOCK_RETRY_SEC):
+                    return
+        purged = self.purge()
+        if purged:
+            print(f"🧹 Webhook outbox: removed {purged} delivered rows past retention")
+        print(f"✅ Webhook outbox dispatcher started ({self.path})")
+
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                self.recover_expired()
+                for delivery in self._claim_due():
+                    self._executor.submit(self._deliver, delivery)
+                wait = self._next_due_in()
+            except Exception as e:
+                print(f"❌ Webhook outbox dispatcher error: {e}")
+                wait = 1.0
+            self._wake.wait(wait)
+
+    def dispatch_once(self) -> int:
+        """Deliver everything due right now on the calling thread (tests and benchmarks)"""
+        self.recover_expired()
+        claimed = self._claim_due()
+        for delivery in claimed:
+            self._deliver(delivery)
+        return len(claimed)
+
+    def _deliver(self, delivery: Dict[str, Any]):
+        attempts = delivery["attempts"] + 1
+        status_code = None
+        # The lease runs from the start of the request, not from the claim (it may have queued for a worker)
+        self._execute("UPDATE webhook_deliveries SET updated_at = ? WHERE id = ? AND status = ?",
+                      (time.time(), delivery["id"], DELIVERING))
+        try:
+            headers = {"Content-Type": "application/json", **json.loads(delivery["headers"]),
+                       "X-Webhook-Delivery-Id": delivery["id"], "Idempotency-Key": delivery["id"]}
+            response = self.session.request(delivery["method"], delivery["url"], data=delivery["payload"],
+                                            headers=headers, timeout=delivery["timeout"])
+            status_code = response.status_code
+            error = None if response.ok else f"HTTP {status_code}: {response.text[:200]}"
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+        finally:
+            with self._lock:
+                self._in_flight[delivery["url"]] -= 1
+                if not self._in_flight[delivery["url"]]:
+                    del self._in_flight[delivery["url"]]
+
+        now = time.time()
+        if error is None:
+            self._execute(
+                "UPDATE webhook_deliveries SET status = ?, attempts = ?, last_status_code = ?, last_error = NULL,"
+                " updated_at = ?, delivered_at = ? WHERE id = ?",
+                (DELIVERED, attempts, status_code, now, now, delivery["id"])
+            )
+            print(f"✅ Webhook delivered to {delivery['endpoint_name']} (attempt {attempts})")
+        else:
+            permanent = status_code is not None and 400 <= status_code < 500 and status_code not in RETRYABLE_CLIENT_ERRORS
+            if permanent or attempts >= delivery["max_attempts"]:
+                status, next_attempt_at = DEAD, now
+                print(f"💀 Webhook to {delivery['endpoint_name']} dead-lettered after {attempts} attempts: {error}")
+            else:
+                status, next_attempt_at = PENDING, now + self.backoff(attempts)
+                print(f"⚠️ Webhook to {delivery['endpoint_name']} failed (attempt {attempts}), "
+                      f"retrying in {next_attempt_at - now:.1f}s: {error}")
+            self._execute(
+                "UPDATE webhook_deliveries SET status = ?, attempts = ?, next_attempt_at = ?, last_status_code = ?,"
+                " last_error = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, next_attempt_at, status_code, error, now, delivery["id"])
+            )
+        self._wake.set()
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._db.close()
+
+
+def create_webhook_outbox(endpoint_loader: Optional[Callable[[], List[Dict[str, Any]]]] = None) -> Optional[WebhookOutbox]:
+    """Open the outbox and start its dispatcher, or None when WEBHOOK_OUTBOX_ENABLED is off"""
+    if not WEBHOOK_OUTBOX_ENABLED:
+        print("⚠️ Webhook outbox disabled, webhooks are sent inline")
+        return None
+    try:
+        outbox = WebhookOutbox(endpoint_loader=endpoint_loader)
+        outbox.start()
+        return outbox
+    except Exception as e:
+        print(f"⚠️ Webhook outbox unavailable, webhooks are sent inline: {e}")
+        return None